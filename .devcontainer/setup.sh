@@ -14,7 +14,7 @@ sudo mv ./bin/akash /usr/local/bin/
 # Install Python dependencies
 echo "Installing Python dependencies..."
 pip install --upgrade pip
-pip install fastapi uvicorn pytest pytest-mock stripe python-multipart
+pip install fastapi uvicorn websockets httpx pytest pytest-mock stripe python-multipart
 
 # Install development tools
 pip install black pylint pytest-cov
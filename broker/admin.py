@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional
+import requests
+from .bulk import ACTIONS, FAILED
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> float:
+    """Seconds in a duration like 90, 90s, 30m, 2h or 1d"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd]?)", value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value!r}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+
+
+def bulk_request(args: argparse.Namespace) -> Dict[str, Any]:
+    body: Dict[str, Any] = {"concurrency": args.concurrency, "dry_run": args.dry_run}
+    if args.session:
+        body["session_ids"] = args.session
+    if args.provider:
+        body["provider"] = args.provider
+    if args.tier:
+        body["tier"] = args.tier
+    if args.older_than is not None:
+        body["older_than_seconds"] = args.older_than
+    if args.action == "extend":
+        body["threshold_blocks"] = args.threshold_blocks
+        if args.deposit_uakt:
+            body["deposit_uakt"] = args.deposit_uakt
+    return body
+
+
+def describe(record: Dict[str, Any]) -> str:
+    if record["type"] == "selected":
+        plan = "would act on" if record["dry_run"] else "acting on"
+        return f"{record['action']}: {plan} {record['count']} item(s)"
+    detail = f" - {record['message']}" if record.get("message") else ""
+    return f"{record['status']:>7}  {record['key']}  {record['seconds']:.1f}s{detail}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Close, extend or migrate many sessions through the broker's admin API"
+    )
+    parser.add_argument("action", choices=ACTIONS)
+    parser.add_argument(
+        "--url", default=os.getenv("BROKER_URL", "http://localhost:8000")
+    )
+    parser.add_argument(
+        "--token",
+        default=os.getenv("ADMIN_API_TOKEN", ""),
+        help="Defaults to $ADMIN_API_TOKEN",
+    )
+    parser.add_argument(
+        "--session", action="append", help="Session id; repeat for a list"
+    )
+    parser.add_argument("--provider", help="Sessions on this provider's leases")
+    parser.add_argument("--tier", help="Sessions of this tier")
+    parser.add_argument(
+        "--older-than",
+        type=parse_duration,
+        help="Sessions created longer ago than this, e.g. 2h",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--threshold-blocks",
+        type=int,
+        default=300,
+        help="extend: top up leases with fewer blocks left than this",
+    )
+    parser.add_argument(
+        "--deposit-uakt",
+        type=int,
+        help="extend: deposit per lease (LEASE_PRICE_UAKT by default)",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list what would be acted on"
+    )
+    args = parser.parse_args(argv)
+
+    response = requests.post(
+        f"{args.url.rstrip('/')}/admin/sessions/{args.action}",
+        json=bulk_request(args),
+        headers={"Authorization": f"Bearer {args.token}"},
+        stream=True,
+        timeout=(10, None),
+    )
+    if response.status_code != 200:
+        print(f"error: {response.status_code} {response.text}", file=sys.stderr)
+        return 2
+
+    report = None
+    for line in response.iter_lines():
+        if not line:
+            continue
+        record = json.loads(line)
+        if record["type"] == "report":
+            report = record
+        else:
+            # Progress to stderr keeps stdout to the machine-readable report
+            print(describe(record), file=sys.stderr, flush=True)
+
+    if report is None:
+        if args.dry_run:
+            return 0
+        print("error: the broker stopped streaming before the report", file=sys.stderr)
+        return 2
+    print(json.dumps(report, indent=2))
+    return 1 if report["by_status"].get(FAILED) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
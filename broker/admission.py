@@ -0,0 +1,174 @@
+import asyncio
+import math
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class QueueFullError(Exception):
+    """Raised when the pending-session queue is at capacity"""
+
+    def __init__(self, queue_depth: int, estimated_wait_seconds: float):
+        self.queue_depth = queue_depth
+        self.estimated_wait_seconds = estimated_wait_seconds
+        super().__init__(f"Session queue is full ({queue_depth} waiting)")
+
+
+@dataclass
+class AdmissionTicket:
+    ticket_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    admitted_at: Optional[float] = None
+    queue_position: int = 0
+    estimated_wait_seconds: float = 0.0
+    # Resolved when a slot is handed to this ticket while it is queued
+    admission: Optional[asyncio.Future] = field(default=None, repr=False, compare=False)
+
+    @property
+    def queue_wait_seconds(self) -> float:
+        if self.admitted_at is None:
+            return time.monotonic() - self.enqueued_at
+        return self.admitted_at - self.enqueued_at
+
+
+class AdmissionController:
+    """Bounds concurrent provisioning and queues the overflow in FIFO order.
+
+    Runs on the worker's event loop: a finished provision hands its slot
+    straight to the oldest waiter, so requests are admitted strictly in
+    arrival order. The estimated wait comes from an EWMA of recent
+    provisioning durations.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        initial_provision_seconds: float = 90.0,
+        smoothing: float = 0.2,
+    ):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.smoothing = smoothing
+        self.average_provision_seconds = initial_provision_seconds
+        self.active = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self._waiters: Deque[Tuple[AdmissionTicket, asyncio.Future]] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def estimate_wait(self, position: int) -> float:
+        """Expected wait for the waiter at a 0-based queue position"""
+        if position < 0:
+            return 0.0
+        rounds = math.floor(position / self.max_concurrent) + 1
+        return rounds * self.average_provision_seconds
+
+    def estimated_wait_for_new_request(self) -> float:
+        if self.active < self.max_concurrent and not self._waiters:
+            return 0.0
+        return self.estimate_wait(len(self._waiters))
+
+    def position(self, ticket: AdmissionTicket) -> Optional[int]:
+        for index, (waiting, _) in enumerate(self._waiters):
+            if waiting is ticket:
+                return index
+        return None
+
+    def waiting(self) -> List[AdmissionTicket]:
+        """Queued tickets, oldest first"""
+        return [ticket for ticket, _ in self._waiters]
+
+    def reserve(self) -> AdmissionTicket:
+        """Take a slot now or a place in line; raise QueueFullError to shed load.
+
+        The returned ticket is admitted when `admitted_at` is set; otherwise
+        it is queued and `wait` must be awaited before provisioning.
+        """
+        ticket = AdmissionTicket()
+
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return self._admit(ticket)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_total += 1
+            raise QueueFullError(
+                len(self._waiters), self.estimate_wait(len(self._waiters))
+            )
+
+        ticket.queue_position = len(self._waiters)
+        ticket.estimated_wait_seconds = self.estimate_wait(ticket.queue_position)
+        ticket.admission = asyncio.get_running_loop().create_future()
+        self._waiters.append((ticket, ticket.admission))
+        return ticket
+
+    async def wait(self, ticket: AdmissionTicket) -> AdmissionTicket:
+        """Wait until a reserved ticket reaches the front of the line"""
+        future = ticket.admission
+        if ticket.admitted_at is not None or future is None:
+            return ticket
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Client went away: give up the place in line, or pass on a slot
+            # that was handed over just as the cancellation landed
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            else:
+                self._remove(ticket)
+            raise
+
+        return self._admit(ticket)
+
+    async def acquire(self) -> AdmissionTicket:
+        """Wait for a provisioning slot, or raise QueueFullError to shed load"""
+        return await self.wait(self.reserve())
+
+    def _admit(self, ticket: AdmissionTicket) -> AdmissionTicket:
+        ticket.admitted_at = time.monotonic()
+        self.admitted_total += 1
+        return ticket
+
+    def _remove(self, ticket: AdmissionTicket) -> None:
+        for entry in self._waiters:
+            if entry[0] is ticket:
+                self._waiters.remove(entry)
+                return
+
+    def release(self, ticket: AdmissionTicket, record_duration: bool = True) -> None:
+        """Return a slot, handing it to the oldest waiter if there is one"""
+        if record_duration and ticket.admitted_at is not None:
+            duration = time.monotonic() - ticket.admitted_at
+            self.average_provision_seconds += self.smoothing * (
+                duration - self.average_provision_seconds
+            )
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            _, future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active_provisions": self.active,
+            "max_concurrent_provisions": self.max_concurrent,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "average_provision_seconds": round(self.average_provision_seconds, 2),
+            "estimated_wait_seconds": round(self.estimated_wait_for_new_request(), 2),
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+        }
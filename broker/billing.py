@@ -3,6 +3,7 @@ import requests
 from typing import Dict, Optional
 from decimal import Decimal
 from .settings import settings
+from . import metrics
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -22,14 +23,15 @@ class BillingManager:
         amount_cents = int(amount_usd * 100)
         
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency="usd",
-                metadata={
-                    "session_hours": str(session_hours),
-                    "service": "cloud-gaming"
-                }
-            )
+            with metrics.EXTERNAL_CALL_SECONDS.labels("stripe", "create_payment_intent").time():
+                intent = stripe.PaymentIntent.create(
+                    amount=amount_cents,
+                    currency="usd",
+                    metadata={
+                        "session_hours": str(session_hours),
+                        "service": "cloud-gaming"
+                    }
+                )
             
             return {
                 "client_secret": intent.client_secret,
@@ -42,7 +44,8 @@ class BillingManager:
     def process_payment(self, payment_intent_id: str) -> Dict[str, str]:
         """Process payment and convert to AKT tokens"""
         try:
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            with metrics.EXTERNAL_CALL_SECONDS.labels("stripe", "retrieve_payment_intent").time():
+                intent = stripe.PaymentIntent.retrieve(payment_intent_id)
             
             if intent.status != "succeeded":
                 raise Exception(f"Payment not completed: {intent.status}")
@@ -109,12 +112,13 @@ class BillingManager:
             }
             
             # Simulate API call to Osmosis
-            response = requests.post(
-                f"{self.osmosis_api_url}/osmosis/gamm/v1beta1/pools/{self.osmosis_pool_id}/swap_exact_amount_in",
-                json=swap_msg,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
+            with metrics.EXTERNAL_CALL_SECONDS.labels("osmosis", "swap_exact_amount_in").time():
+                response = requests.post(
+                    f"{self.osmosis_api_url}/osmosis/gamm/v1beta1/pools/{self.osmosis_pool_id}/swap_exact_amount_in",
+                    json=swap_msg,
+                    headers={"Content-Type": "application/json"},
+                    timeout=30
+                )
             
             if response.status_code != 200:
                 raise Exception(f"Osmosis swap failed: {response.text}")
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+from starlette.concurrency import run_in_threadpool
+from . import tracing
+
+CLOSE = "close"
+EXTEND = "extend"
+MIGRATE = "migrate"
+ACTIONS = (CLOSE, EXTEND, MIGRATE)
+
+# Item outcomes; "skipped" covers items the action doesn't apply to
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class SessionSelector:
+    """Which sessions a bulk operation applies to; set criteria must all match"""
+
+    session_ids: Optional[List[str]] = None
+    provider: Optional[str] = None
+    tier: Optional[str] = None
+    older_than_seconds: Optional[float] = None
+
+    @property
+    def empty(self) -> bool:
+        return (
+            not self.session_ids
+            and self.provider is None
+            and self.tier is None
+            and self.older_than_seconds is None
+        )
+
+    def matches(self, session: Dict[str, Any], now: float) -> bool:
+        if self.session_ids and session.get("session_id") not in self.session_ids:
+            return False
+        if self.provider is not None and session.get("provider") != self.provider:
+            return False
+        if self.tier is not None and session.get("tier") != self.tier:
+            return False
+        if (
+            self.older_than_seconds is not None
+            and now - session.get("created_at", now) < self.older_than_seconds
+        ):
+            return False
+        return True
+
+    def select(self, sessions: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [session for session in sessions if self.matches(session, now)]
+
+
+@dataclass
+class BulkReport:
+    action: str
+    selected: int
+    started_at: float = field(default_factory=time.monotonic)
+    by_status: Dict[str, int] = field(default_factory=dict)
+    failures: List[Dict[str, Any]] = field(default_factory=list)
+    slowest_seconds: float = 0.0
+
+    def record(self, item: Dict[str, Any]) -> None:
+        self.by_status[item["status"]] = self.by_status.get(item["status"], 0) + 1
+        self.slowest_seconds = max(self.slowest_seconds, item["seconds"])
+        if item["status"] == FAILED:
+            self.failures.append(
+                {"key": item["key"], "message": item.get("message", "")}
+            )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "type": "report",
+            "action": self.action,
+            "selected": self.selected,
+            "completed": sum(self.by_status.values()),
+            "by_status": self.by_status,
+            "failures": self.failures,
+            "slowest_seconds": round(self.slowest_seconds, 3),
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 3),
+        }
+
+
+async def run_bulk(
+    action: str,
+    keys: List[str],
+    operation: Callable[[str], Dict[str, Any]],
+    concurrency: int,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run a blocking per-item operation over keys, yielding each result as it lands, then the report.
+
+    At most `concurrency` items run at once on the threadpool. `operation`
+    returns a dict with at least "status"; an exception marks the item
+    failed without stopping the rest. Items not yet started are dropped if
+    the consumer goes away; started ones finish in their threads.
+    """
+    report = BulkReport(action, len(keys))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(key: str) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.monotonic()
+            with tracing.span(f"bulk.{action}", key=key) as span:
+                try:
+                    result = await run_in_threadpool(tracing.wrap(operation), key)
+                except Exception as e:
+                    result = {"status": FAILED, "message": str(e)}
+                span.set_attributes(status=result["status"])
+            return {
+                "type": "item",
+                "key": key,
+                **result,
+                "seconds": round(time.monotonic() - started, 3),
+            }
+
+    tasks = [asyncio.ensure_future(run_one(key)) for key in keys]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            report.record(item)
+            yield item
+        yield report.to_dict()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,261 @@
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+from urllib.parse import urlparse
+from websockets.exceptions import WebSocketException
+from websockets.sync.client import connect
+
+# Event type and actions the Akash deployment and market modules emit
+EVENT_TYPE = "akash.v1"
+DEPLOYMENT_CREATED = "deployment-created"
+DEPLOYMENT_CLOSED = "deployment-closed"
+BID_CREATED = "bid-created"
+BID_CLOSED = "bid-closed"
+LEASE_CREATED = "lease-created"
+LEASE_CLOSED = "lease-closed"
+
+SUBSCRIBED_MODULES = ("deployment", "market")
+
+
+def websocket_url(node: str) -> str:
+    """Tendermint websocket endpoint for an RPC node URL"""
+    parsed = urlparse(node)
+    scheme = "wss" if parsed.scheme in ("https", "wss") else "ws"
+    return f"{scheme}://{parsed.netloc}/websocket"
+
+
+@dataclass
+class ChainEvent:
+    action: str
+    module: str
+    owner: str
+    dseq: str
+    gseq: int = 1
+    oseq: int = 1
+    provider: str = ""
+    price_denom: str = ""
+    price_amount: str = ""
+    # Account that signed the transaction; empty for closures made by the chain itself
+    sender: str = ""
+    height: int = 0
+    received_at: float = field(default_factory=time.time)
+
+    def to_bid(self) -> Dict[str, Any]:
+        """The bid in the shape `akash query market bid list` returns"""
+        return {
+            "bid": {
+                "bid_id": {
+                    "owner": self.owner,
+                    "dseq": self.dseq,
+                    "gseq": self.gseq,
+                    "oseq": self.oseq,
+                    "provider": self.provider,
+                },
+                "price": {"denom": self.price_denom, "amount": self.price_amount},
+            }
+        }
+
+
+def parse_events(result: Dict[str, Any]) -> List[ChainEvent]:
+    """Akash events in one subscription result, in the order the transaction emitted them"""
+    tx_result = result.get("data", {}).get("value", {}).get("TxResult", {})
+    height = int(tx_result.get("height") or 0)
+    sender = ""
+    parsed = []
+    for event in tx_result.get("result", {}).get("events", []):
+        attributes = {
+            attribute.get("key"): attribute.get("value")
+            for attribute in event.get("attributes", [])
+        }
+        if event.get("type") == "message" and attributes.get("sender"):
+            sender = attributes["sender"]
+            continue
+        if event.get("type") != EVENT_TYPE or not attributes.get("dseq"):
+            continue
+        parsed.append(
+            ChainEvent(
+                action=attributes.get("action", ""),
+                module=attributes.get("module", ""),
+                owner=attributes.get("owner", ""),
+                dseq=attributes["dseq"],
+                gseq=int(attributes.get("gseq") or 1),
+                oseq=int(attributes.get("oseq") or 1),
+                provider=attributes.get("provider", ""),
+                price_denom=attributes.get("price-denom", ""),
+                price_amount=attributes.get("price-amount", ""),
+                height=height,
+            )
+        )
+    for event in parsed:
+        event.sender = sender
+    return parsed
+
+
+class ChainEventSubscriber:
+    """Streams our account's deployment and market events from the node's websocket.
+
+    One background thread holds the subscription and reconnects when the
+    node drops it. Events are handed to listeners (the session registry) and
+    kept per dseq for a short while, so a provisioning flow that starts
+    waiting just after its bid arrived still sees it. Waiters block on a
+    condition variable and wake when a matching event lands.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        owner: Union[str, Sequence[str]],
+        reconnect_seconds: float = 5.0,
+        retention_seconds: float = 600.0,
+    ):
+        self.url = url
+        # One address, or every key of the broker's signer pool
+        self.owners = [owner] if isinstance(owner, str) else list(owner)
+        self.reconnect_seconds = reconnect_seconds
+        self.retention_seconds = retention_seconds
+        self.connected = False
+        self.events_received = 0
+        self._recent: Dict[str, List[ChainEvent]] = {}
+        self._listeners: List[Callable[[ChainEvent], None]] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._connection = None
+
+    def queries(self) -> List[str]:
+        return [
+            f"tm.event='Tx' AND {EVENT_TYPE}.module='{module}' AND {EVENT_TYPE}.owner='{owner}'"
+            for owner in self.owners
+            for module in SUBSCRIBED_MODULES
+        ]
+
+    def add_listener(self, listener: Callable[[ChainEvent], None]) -> None:
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="chain-events", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        connection = self._connection
+        if connection is not None:
+            connection.close()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def wait_until_connected(self, timeout: float) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: self.connected, timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with connect(self.url, open_timeout=10, close_timeout=1) as connection:
+                    self._connection = connection
+                    for request_id, query in enumerate(self.queries(), start=1):
+                        connection.send(
+                            json.dumps(
+                                {
+                                    "jsonrpc": "2.0",
+                                    "method": "subscribe",
+                                    "id": request_id,
+                                    "params": {"query": query},
+                                }
+                            )
+                        )
+                    self._set_connected(True)
+                    for message in connection:
+                        self.handle_message(message)
+            except (OSError, TimeoutError, WebSocketException):
+                pass
+            finally:
+                self._connection = None
+                self._set_connected(False)
+            # Flows waiting on bids fall back to querying while disconnected
+            self._stop.wait(self.reconnect_seconds)
+
+    def _set_connected(self, connected: bool) -> None:
+        with self._condition:
+            self.connected = connected
+            self._condition.notify_all()
+
+    def handle_message(self, message: str) -> List[ChainEvent]:
+        try:
+            payload = json.loads(message)
+        except json.JSONDecodeError:
+            return []
+        # Subscription acknowledgements carry an empty result
+        received = parse_events(payload.get("result") or {})
+        for event in received:
+            self.dispatch(event)
+        return received
+
+    def dispatch(self, event: ChainEvent) -> None:
+        with self._condition:
+            self.events_received += 1
+            self._recent.setdefault(event.dseq, []).append(event)
+            self._prune(event.received_at - self.retention_seconds)
+            self._condition.notify_all()
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception:
+                continue
+
+    def _prune(self, cutoff: float) -> None:
+        for dseq in [
+            dseq
+            for dseq, events in self._recent.items()
+            if events[-1].received_at < cutoff
+        ]:
+            del self._recent[dseq]
+
+    def events_for(self, dseq: str) -> List[ChainEvent]:
+        with self._condition:
+            return list(self._recent.get(dseq, ()))
+
+    def wait_for(
+        self, dseq: str, predicate: Callable[[ChainEvent], bool], timeout: float
+    ) -> List[ChainEvent]:
+        """Block until an event for the deployment matches; every match so far, or [] on timeout"""
+
+        def matches() -> List[ChainEvent]:
+            return [event for event in self._recent.get(dseq, ()) if predicate(event)]
+
+        with self._condition:
+            self._condition.wait_for(matches, timeout)
+            return matches()
+
+    def collect_bids(
+        self, dseq: str, timeout: float, window: float
+    ) -> List[Dict[str, Any]]:
+        """Bids on a deployment: wait for the first, then give others `window` seconds to arrive"""
+        if not self.wait_for(dseq, lambda event: event.action == BID_CREATED, timeout):
+            return []
+        self._stop.wait(window)
+
+        bids: Dict[tuple, ChainEvent] = {}
+        for event in self.events_for(dseq):
+            key = (event.provider, event.gseq, event.oseq)
+            if event.action == BID_CREATED:
+                bids[key] = event
+            elif event.action == BID_CLOSED:
+                bids.pop(key, None)
+        return [event.to_bid() for event in bids.values()]
+
+    def status(self) -> Dict[str, Any]:
+        with self._condition:
+            tracked = len(self._recent)
+        return {
+            "url": self.url,
+            "connected": self.connected,
+            "events_received": self.events_received,
+            "tracked_deployments": tracked,
+        }
@@ -0,0 +1,283 @@
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any
+from .settings import settings
+from .endpoints import SSH_PORT, ssh_command
+
+STEAM_COMPATDATA_PATH = "/home/gamer/.steam/steam/steamapps/compatdata"
+CHECKPOINT_AWS_CONFIG = "/tmp/aws-checkpoint.cfg"
+
+
+class CheckpointAgent:
+    """Incrementally ships changed Steam save data from a lease to S3"""
+
+    def __init__(
+        self,
+        session_id: str,
+        host: str,
+        s3_path: str,
+        s3_region: str = "us-east-1",
+        interval_seconds: int = 30,
+        bandwidth_kbps: int = 1024,
+        is_active: Optional[Callable[[], bool]] = None,
+        ssh_port: int = SSH_PORT,
+        lease_id: Optional[str] = None,
+    ):
+        self.session_id = session_id
+        self.host = host
+        self.lease_id = lease_id
+        self.ssh_port = ssh_port
+        self.s3_path = s3_path
+        self.s3_region = s3_region
+        self.interval_seconds = interval_seconds
+        self.bandwidth_kbps = bandwidth_kbps
+        self.is_active = is_active
+
+        self.checkpoints = 0
+        self.failures = 0
+        self.last_checkpoint_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+        self._stop_event = threading.Event()
+        self._sync_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def build_sync_command(self, throttled: bool = True) -> List[str]:
+        """Build the remote sync command run on the lease over SSH"""
+        # `aws s3 sync` only uploads files whose size or mtime changed, so each
+        # run ships the delta since the previous checkpoint. Without --delete a
+        # save directory caught mid-rewrite can't wipe the copy already in S3.
+        sync = (
+            f"aws s3 sync {STEAM_COMPATDATA_PATH} {self.s3_path}/compatdata "
+            f"--region {self.s3_region} --only-show-errors"
+        )
+
+        if throttled:
+            # Cap upload bandwidth through a dedicated AWS config file and run at
+            # idle CPU/IO priority so the checkpoint never competes with the stream.
+            # The cap is configured in kilobits; the AWS CLI takes bytes.
+            max_bandwidth = max(1, self.bandwidth_kbps // 8)
+            remote_cmd = (
+                f"printf '[default]\\ns3 =\\n  max_bandwidth = {max_bandwidth}KB/s\\n' "
+                f"> {CHECKPOINT_AWS_CONFIG} && "
+                f"AWS_CONFIG_FILE={CHECKPOINT_AWS_CONFIG} nice -n 19 ionice -c 3 {sync}"
+            )
+        else:
+            remote_cmd = sync
+
+        return ssh_command(self.host, remote_cmd, self.ssh_port, connect_timeout=5)
+
+    def checkpoint(self, throttled: bool = True, timeout: int = 300) -> Dict[str, Any]:
+        """Run a single incremental checkpoint"""
+        with self._sync_lock:
+            started = time.monotonic()
+            try:
+                result = subprocess.run(
+                    self.build_sync_command(throttled),
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout,
+                )
+            except subprocess.TimeoutExpired:
+                self.failures += 1
+                self.last_error = "Checkpoint timed out"
+                return {
+                    "status": "error",
+                    "message": self.last_error,
+                    "session_id": self.session_id,
+                }
+
+            duration = time.monotonic() - started
+            if result.returncode != 0:
+                self.failures += 1
+                self.last_error = result.stderr
+                return {
+                    "status": "error",
+                    "message": f"Checkpoint failed: {result.stderr}",
+                    "session_id": self.session_id,
+                }
+
+            self.checkpoints += 1
+            self.last_checkpoint_at = time.time()
+            self.last_duration = duration
+            self.last_error = None
+
+            return {
+                "status": "ok",
+                "session_id": self.session_id,
+                "s3_path": self.s3_path,
+                "duration_seconds": duration,
+            }
+
+    def start(self) -> None:
+        """Start checkpointing in the background on the configured cadence"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"checkpoint-{self.session_id}", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def exited(self) -> bool:
+        """The background loop was started and has since returned"""
+        return self._thread is not None and not self._thread.is_alive()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background loop; an in-progress checkpoint is allowed to finish"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval_seconds):
+            # The session may have been closed or migrated by another worker process
+            if self.is_active is not None and not self.is_active():
+                return
+            self.checkpoint()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "host": self.host,
+            "lease_id": self.lease_id,
+            "s3_path": self.s3_path,
+            "checkpoints": self.checkpoints,
+            "failures": self.failures,
+            "last_checkpoint_at": self.last_checkpoint_at,
+            "last_duration_seconds": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+class CheckpointManager:
+    """Owns one CheckpointAgent per running session"""
+
+    def __init__(
+        self,
+        s3_bucket: Optional[str] = None,
+        s3_region: Optional[str] = None,
+        interval_seconds: Optional[int] = None,
+        bandwidth_kbps: Optional[int] = None,
+        session_lookup: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+    ):
+        self.s3_bucket = (
+            settings.CHECKPOINT_S3_BUCKET if s3_bucket is None else s3_bucket
+        )
+        self.s3_region = s3_region or settings.CHECKPOINT_S3_REGION
+        self.interval_seconds = interval_seconds or settings.CHECKPOINT_INTERVAL_SECONDS
+        self.bandwidth_kbps = bandwidth_kbps or settings.CHECKPOINT_BANDWIDTH_KBPS
+        self.session_lookup = session_lookup
+        self._agents: Dict[str, CheckpointAgent] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.s3_bucket)
+
+    def checkpoint_path(self, session_id: str) -> str:
+        return f"s3://{self.s3_bucket}/session-checkpoints/{session_id}"
+
+    def _serving(self, session_id: str, host: str, lease_id: Optional[str]) -> bool:
+        """Whether the shared session record still puts the session on this host and lease"""
+        session = self.session_lookup(session_id)
+        return (
+            session is not None
+            and session.get("host") == host
+            and (lease_id is None or session.get("lease_id") == lease_id)
+        )
+
+    def start(
+        self,
+        session_id: str,
+        host: str,
+        s3_path: Optional[str] = None,
+        ssh_port: int = SSH_PORT,
+        lease_id: Optional[str] = None,
+    ) -> Optional[CheckpointAgent]:
+        """Start checkpointing a session; `s3_path` lets a migrated session keep its prefix.
+
+        The agent exits on its own once the session record no longer puts the
+        session on `host` and `lease_id`.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            agent = self._agents.get(session_id)
+            if agent is not None and (
+                (agent.host, agent.lease_id) != (host, lease_id) or agent.exited
+            ):
+                # Left behind by a migration or already exited
+                agent.stop(timeout=0)
+                agent = None
+            if agent is None:
+                agent = CheckpointAgent(
+                    session_id=session_id,
+                    host=host,
+                    s3_path=s3_path or self.checkpoint_path(session_id),
+                    s3_region=self.s3_region,
+                    interval_seconds=self.interval_seconds,
+                    bandwidth_kbps=self.bandwidth_kbps,
+                    is_active=(
+                        (lambda: self._serving(session_id, host, lease_id))
+                        if self.session_lookup
+                        else None
+                    ),
+                    ssh_port=ssh_port,
+                    lease_id=lease_id,
+                )
+                self._agents[session_id] = agent
+
+        agent.start()
+        return agent
+
+    def get(self, session_id: str) -> Optional[CheckpointAgent]:
+        return self._agents.get(session_id)
+
+    def stop(
+        self,
+        session_id: str,
+        final_checkpoint: bool = False,
+        host: Optional[str] = None,
+        s3_path: Optional[str] = None,
+        ssh_port: int = SSH_PORT,
+    ) -> Optional[Dict[str, Any]]:
+        """Stop a session's agent, optionally shipping the last changes unthrottled.
+
+        With `host` set, a final checkpoint still runs when the agent lives in
+        another worker process.
+        """
+        with self._lock:
+            agent = self._agents.pop(session_id, None)
+
+        if agent is None:
+            if final_checkpoint and host and self.enabled:
+                agent = CheckpointAgent(
+                    session_id,
+                    host,
+                    s3_path or self.checkpoint_path(session_id),
+                    self.s3_region,
+                    ssh_port=ssh_port,
+                )
+                return agent.checkpoint(throttled=False)
+            return None
+
+        agent.stop()
+        if final_checkpoint:
+            return agent.checkpoint(throttled=False)
+        return agent.status()
+
+    def stop_all(self) -> None:
+        for session_id in list(self._agents):
+            self.stop(session_id)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            session_id: agent.status()
+            for session_id, agent in list(self._agents.items())
+        }
@@ -0,0 +1,139 @@
+import json
+import math
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class ClientNetwork:
+    downlink_kbps: float
+    rtt_ms: float = 0.0
+    loss_percent: float = 0.0
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    fps: int
+    bitrate_kbps: int
+    resolution: str
+    fec_percentage: int
+
+    def sdl_parameters(self) -> Dict[str, str]:
+        """Template parameters for the SUNSHINE_* env vars the entrypoint applies"""
+        return {
+            "encoder_fps": str(self.fps),
+            "encoder_bitrate_kbps": str(self.bitrate_kbps),
+            "encoder_resolution": self.resolution,
+            "encoder_fec_percentage": str(self.fec_percentage),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class PolicyRule:
+    min_downlink_kbps: float
+    max_rtt_ms: float
+    max_loss_percent: float
+    profile: EncoderProfile
+
+    def matches(self, network: ClientNetwork) -> bool:
+        return (
+            network.downlink_kbps >= self.min_downlink_kbps
+            and network.rtt_ms <= self.max_rtt_ms
+            and network.loss_percent <= self.max_loss_percent
+        )
+
+
+# What images/ubuntu-sunshine/sunshine.conf ships with; used when the client
+# sends no measurements
+DEFAULT_PROFILE = EncoderProfile(
+    fps=120, bitrate_kbps=20000, resolution="1920x1080", fec_percentage=20
+)
+
+# Best profile first; the first rule a link satisfies wins
+DEFAULT_RULES = [
+    PolicyRule(35000, 40, 0.5, EncoderProfile(120, 20000, "1920x1080", 10)),
+    PolicyRule(20000, 60, 1.0, EncoderProfile(60, 15000, "1920x1080", 15)),
+    PolicyRule(10000, 100, 2.0, EncoderProfile(60, 8000, "1600x900", 20)),
+    PolicyRule(5000, 150, 5.0, EncoderProfile(60, 4000, "1280x720", 25)),
+]
+FALLBACK_PROFILE = EncoderProfile(30, 2000, "1280x720", 30)
+
+
+class EncoderPolicy:
+    """Maps a client's measured link to a Sunshine encoder profile.
+
+    The rule table picks fps, resolution and a bitrate ceiling. The bitrate
+    is then capped to a share of the measured downlink, and FEC grows with
+    measured loss. Values are quantized so sessions on similar links share a
+    rendered manifest.
+    """
+
+    BITRATE_STEP_KBPS = 500
+    MIN_BITRATE_KBPS = 1000
+    MAX_FEC_PERCENTAGE = 50
+
+    def __init__(
+        self,
+        rules: Optional[List[PolicyRule]] = None,
+        fallback: EncoderProfile = FALLBACK_PROFILE,
+        bandwidth_headroom: float = 0.75,
+        fec_per_loss_percent: float = 5.0,
+    ):
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.fallback = fallback
+        self.bandwidth_headroom = bandwidth_headroom
+        self.fec_per_loss_percent = fec_per_loss_percent
+
+    @classmethod
+    def from_file(cls, path: str) -> "EncoderPolicy":
+        """Load a tuned policy table from JSON"""
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        rules = [
+            PolicyRule(
+                rule["min_downlink_kbps"],
+                rule["max_rtt_ms"],
+                rule["max_loss_percent"],
+                EncoderProfile(**rule["profile"]),
+            )
+            for rule in config["rules"]
+        ]
+        return cls(
+            rules=rules,
+            fallback=(
+                EncoderProfile(**config["fallback"])
+                if "fallback" in config
+                else FALLBACK_PROFILE
+            ),
+            bandwidth_headroom=config.get("bandwidth_headroom", 0.75),
+            fec_per_loss_percent=config.get("fec_per_loss_percent", 5.0),
+        )
+
+    def select(self, network: Optional[ClientNetwork]) -> EncoderProfile:
+        if network is None:
+            return DEFAULT_PROFILE
+
+        base = next(
+            (rule.profile for rule in self.rules if rule.matches(network)),
+            self.fallback,
+        )
+
+        budget = network.downlink_kbps * self.bandwidth_headroom
+        bitrate = min(base.bitrate_kbps, budget)
+        bitrate = max(
+            self.MIN_BITRATE_KBPS,
+            math.floor(bitrate / self.BITRATE_STEP_KBPS) * self.BITRATE_STEP_KBPS,
+        )
+
+        fec = base.fec_percentage + network.loss_percent * self.fec_per_loss_percent
+        fec = min(self.MAX_FEC_PERCENTAGE, int(math.ceil(fec / 5) * 5))
+
+        return EncoderProfile(
+            fps=base.fps,
+            bitrate_kbps=int(bitrate),
+            resolution=base.resolution,
+            fec_percentage=fec,
+        )
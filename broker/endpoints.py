@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+from .state import StateStore
+
+SUNSHINE_SERVICE = "sunshine"
+# The image's sshd runs as gamer on an unprivileged port the SDL exposes globally
+SSH_PORT = 2222
+
+
+class EndpointDiscoveryError(Exception):
+    """Raised when a provider rejects a lease's manifest or never reports its forwarded ports"""
+
+
+def port_key(port: int, proto: str = "tcp") -> str:
+    return f"{port}/{proto.lower()}"
+
+
+def ssh_command(
+    host: str, command: str, port: int = SSH_PORT, connect_timeout: Optional[int] = None
+) -> List[str]:
+    """ssh into a lease's container as gamer, on the port the provider forwards to its sshd"""
+    options = ["-o", "StrictHostKeyChecking=no"]
+    if connect_timeout is not None:
+        options += ["-o", f"ConnectTimeout={connect_timeout}"]
+    return ["ssh", *options, "-p", str(port), f"gamer@{host}", command]
+
+
+@dataclass
+class LeaseEndpoint:
+    """Where clients reach a lease: the provider's hostname and each exposed port's external port"""
+
+    host: str
+    ports: Dict[str, int] = field(default_factory=dict)
+
+    def external_port(self, port: int, proto: str = "tcp") -> int:
+        """The forwarded port for a container port; the port itself if the provider maps it 1:1"""
+        return self.ports.get(port_key(port, proto), port)
+
+    @property
+    def ssh_port(self) -> int:
+        return self.external_port(SSH_PORT)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def parse_lease_status(
+    status: Dict[str, Any], service: str = SUNSHINE_SERVICE
+) -> Optional[LeaseEndpoint]:
+    """The endpoint in `akash provider lease-status` output once its ports are forwarded"""
+    forwarded = (status.get("forwarded_ports") or {}).get(service) or []
+    host = ""
+    ports = {}
+    for entry in forwarded:
+        host = host or entry.get("host", "")
+        ports[port_key(entry["port"], entry.get("proto", "tcp"))] = int(
+            entry.get("externalPort") or entry["port"]
+        )
+    if not host:
+        return None
+    return LeaseEndpoint(host, ports)
+
+
+class EndpointCache:
+    """Discovered lease endpoints, shared by all workers until the lease closes"""
+
+    NAMESPACE = "lease_endpoints"
+
+    def __init__(self, store: StateStore):
+        self.store = store
+
+    def get(self, lease_id: str) -> Optional[LeaseEndpoint]:
+        value = self.store.get(self.NAMESPACE, lease_id)
+        return LeaseEndpoint(**value) if value else None
+
+    def put(self, lease_id: str, endpoint: LeaseEndpoint) -> None:
+        self.store.put(self.NAMESPACE, lease_id, endpoint.to_dict())
+
+    def forget(self, lease_id: str) -> None:
+        self.store.delete(self.NAMESPACE, lease_id)
@@ -0,0 +1,214 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+from .state import StateStore
+
+# Lifecycle transitions pushed to watching clients
+BID_ACCEPTED = "bid_accepted"
+LEASE_CREATED = "lease_created"
+SLOT_ASSIGNED = "slot_assigned"
+LEASE_REUSED = "lease_reused"
+SUNSHINE_READY = "sunshine_ready"
+READY_TIMEOUT = "ready_timeout"
+GAME_INSTALLED = "game_installed"
+GAME_INSTALL_FAILED = "game_install_failed"
+EXTENDED = "extended"
+MIGRATING = "migrating"
+MIGRATED = "migrated"
+CLOSED = "closed"
+FAILED = "failed"
+
+TERMINAL_EVENTS = {CLOSED, FAILED}
+
+
+@dataclass
+class SessionEvent:
+    session_id: str
+    event: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+    sequence: int = 0
+
+    @property
+    def terminal(self) -> bool:
+        return self.event in TERMINAL_EVENTS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "event": self.event,
+            "data": self.data,
+            "timestamp": self.timestamp,
+            "sequence": self.sequence,
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "SessionEvent":
+        return cls(
+            session_id=payload["session_id"],
+            event=payload["event"],
+            data=payload.get("data", {}),
+            timestamp=payload.get("timestamp", time.time()),
+            sequence=payload.get("sequence", 0),
+        )
+
+
+class Subscription:
+    """A client's bounded view of one session's events.
+
+    If a client stops reading, the oldest undelivered events are dropped
+    rather than letting the queue grow or stalling the publisher.
+    """
+
+    def __init__(self, bus: "EventBus", session_id: str, max_queue_size: int):
+        self.bus = bus
+        self.session_id = session_id
+        self.queue: "asyncio.Queue[SessionEvent]" = asyncio.Queue(max_queue_size)
+        self.dropped = 0
+
+    def offer(self, event: SessionEvent) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[SessionEvent]:
+        """Next event, or None if `timeout` elapses first"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Single in-process fan-out point for session lifecycle events.
+
+    Publishers may run on any thread; delivery to subscribers always happens
+    on the event loop. With a StateStore attached, events are also appended
+    to the shared log and a relay thread tails it, so clients connected to
+    any worker see transitions published by every worker.
+    """
+
+    def __init__(self, subscriber_queue_size: int = 64, max_latest: int = 10000):
+        self.subscriber_queue_size = subscriber_queue_size
+        # Sessions whose provisioning failed never publish a terminal event,
+        # so the replay state is capped, forgetting the least recently updated
+        self.max_latest = max_latest
+        self.origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._latest: "OrderedDict[str, SessionEvent]" = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._store: Optional[StateStore] = None
+        self._relay_thread: Optional[threading.Thread] = None
+        self._relay_stop = threading.Event()
+        self._last_relayed_id = 0
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def attach_store(self, store: StateStore, poll_interval: float = 0.5) -> None:
+        """Share events with other workers through the store's event log"""
+        self._store = store
+        self._last_relayed_id = store.last_event_id()
+        self._relay_stop.clear()
+        self._relay_thread = threading.Thread(
+            target=self._relay, args=(poll_interval,), name="event-relay", daemon=True
+        )
+        self._relay_thread.start()
+
+    def stop(self) -> None:
+        self._relay_stop.set()
+        if self._relay_thread:
+            self._relay_thread.join(timeout=5)
+            self._relay_thread = None
+
+    def publish(self, session_id: str, event: str, **data: Any) -> SessionEvent:
+        session_event = SessionEvent(session_id=session_id, event=event, data=data)
+        if self._store is not None:
+            session_event.sequence = self._store.append_event(
+                self.origin, session_event.to_dict()
+            )
+        else:
+            session_event.sequence = next(self._sequence)
+        self._deliver(session_event)
+        return session_event
+
+    def latest(self, session_id: str) -> Optional[SessionEvent]:
+        return self._latest.get(session_id)
+
+    def subscribe(self, session_id: str) -> Subscription:
+        """Must be called on the event loop; replays the latest known state"""
+        subscription = Subscription(self, session_id, self.subscriber_queue_size)
+        self._subscribers.setdefault(session_id, set()).add(subscription)
+        latest = self._latest.get(session_id)
+        if latest is not None:
+            subscription.offer(latest)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.session_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.session_id]
+
+    def subscriber_count(self, session_id: Optional[str] = None) -> int:
+        if session_id is not None:
+            return len(self._subscribers.get(session_id, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _deliver(self, session_event: SessionEvent) -> None:
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+            if not on_loop:
+                loop.call_soon_threadsafe(self._dispatch, session_event)
+                return
+        self._dispatch(session_event)
+
+    def _dispatch(self, session_event: SessionEvent) -> None:
+        if session_event.terminal:
+            self._latest.pop(session_event.session_id, None)
+        else:
+            self._latest[session_event.session_id] = session_event
+            self._latest.move_to_end(session_event.session_id)
+            while len(self._latest) > self.max_latest:
+                self._latest.popitem(last=False)
+        for subscription in list(self._subscribers.get(session_event.session_id, ())):
+            subscription.offer(session_event)
+
+    def _relay(self, poll_interval: float) -> None:
+        # One store query per interval per worker, however many clients watch
+        while not self._relay_stop.wait(poll_interval):
+            try:
+                self.relay_once()
+            except Exception:
+                continue
+
+    def relay_once(self) -> List[SessionEvent]:
+        """Deliver events published by other workers since the last poll"""
+        relayed = []
+        for event_id, origin, payload in self._store.events_after(
+            self._last_relayed_id
+        ):
+            self._last_relayed_id = event_id
+            if origin == self.origin:
+                continue
+            session_event = SessionEvent.from_dict(payload)
+            session_event.sequence = event_id
+            self._deliver(session_event)
+            relayed.append(session_event)
+        return relayed
@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from .settings import settings
+from .state import StateStore
+
+# Fixed-size chunks keep offsets implicit (chunk i starts at i * CHUNK_SIZE),
+# so a lease can write chunks in any order as they arrive
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+@dataclass
+class ManifestFile:
+    path: str
+    size: int
+    mode: int
+    chunks: List[str]
+
+
+@dataclass
+class GameManifest:
+    app_id: str
+    name: str
+    chunk_size: int
+    files: List[ManifestFile] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def total_size(self) -> int:
+        return sum(f.size for f in self.files)
+
+    @property
+    def unique_chunks(self) -> int:
+        return len({digest for f in self.files for digest in f.chunks})
+
+    def to_dict(self) -> Dict[str, Any]:
+        manifest = asdict(self)
+        manifest["total_size"] = self.total_size
+        return manifest
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "GameManifest":
+        return cls(
+            app_id=payload["app_id"],
+            name=payload["name"],
+            chunk_size=payload["chunk_size"],
+            files=[ManifestFile(**f) for f in payload["files"]],
+            created_at=payload.get("created_at", time.time()),
+        )
+
+
+class ChunkStore:
+    """Content-addressed chunk files on a cache node, named by SHA-256"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, "chunks", digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def open(self, digest: str):
+        return open(self.path(digest), "rb")
+
+
+def _walk_files(source_dir: str) -> Iterator[str]:
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+
+def ingest_game(
+    app_id: str,
+    name: str,
+    source_dir: str,
+    chunk_store: ChunkStore,
+    chunk_size: int = CHUNK_SIZE,
+) -> GameManifest:
+    """Chunk an installed game into the store; chunks shared with other games are stored once
+
+    `source_dir` is a Steam library (steamapps) containing the game's install
+    directory and app manifest; paths in the result are relative to it.
+    """
+    manifest = GameManifest(app_id=app_id, name=name, chunk_size=chunk_size)
+    for path in _walk_files(source_dir):
+        chunks = []
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                chunks.append(chunk_store.put(data))
+        stat = os.stat(path)
+        manifest.files.append(
+            ManifestFile(
+                path=os.path.relpath(path, source_dir),
+                size=stat.st_size,
+                mode=stat.st_mode & 0o777,
+                chunks=chunks,
+            )
+        )
+    return manifest
+
+
+class ManifestIndex:
+    """App ID to manifest map, shared by every broker worker"""
+
+    NAMESPACE = "game_manifests"
+
+    def __init__(self, store: StateStore):
+        self.store = store
+
+    def put(self, manifest: GameManifest) -> None:
+        self.store.put(self.NAMESPACE, manifest.app_id, manifest.to_dict())
+
+    def get(self, app_id: str) -> Optional[GameManifest]:
+        payload = self.store.get(self.NAMESPACE, app_id)
+        return GameManifest.from_dict(payload) if payload else None
+
+    def delete(self, app_id: str) -> bool:
+        return self.store.delete(self.NAMESPACE, app_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "app_id": app_id,
+                "name": manifest["name"],
+                "total_size": manifest["total_size"],
+                "files": len(manifest["files"]),
+            }
+            for app_id, manifest in self.store.items(self.NAMESPACE)
+        ]
+
+
+class CacheNodeHandler(BaseHTTPRequestHandler):
+    """Serves GET /chunks/<sha256> and GET /health from a ChunkStore"""
+
+    chunk_store: ChunkStore = None
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._respond(200, b"ok")
+            return
+
+        parts = self.path.strip("/").split("/")
+        if (
+            len(parts) != 2
+            or parts[0] != "chunks"
+            or len(parts[1]) != 64
+            or not all(c in "0123456789abcdef" for c in parts[1])
+        ):
+            self._respond(404, b"not found")
+            return
+
+        digest = parts[1]
+        if not self.chunk_store.has(digest):
+            self._respond(404, b"not found")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header(
+            "Content-Length", str(os.path.getsize(self.chunk_store.path(digest)))
+        )
+        # Chunks are immutable, so any proxy in front may cache them forever
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.end_headers()
+        with self.chunk_store.open(digest) as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _respond(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_cache_node(
+    chunk_store: ChunkStore, host: str = "0.0.0.0", port: int = 8090
+) -> ThreadingHTTPServer:
+    handler = type(
+        "BoundCacheNodeHandler", (CacheNodeHandler,), {"chunk_store": chunk_store}
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Game content cache tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subcommands.add_parser(
+        "ingest", help="Chunk an installed game and index it"
+    )
+    ingest.add_argument("--app-id", required=True)
+    ingest.add_argument("--name", required=True)
+    ingest.add_argument(
+        "--source", required=True, help="Steam library (steamapps) holding the game"
+    )
+    ingest.add_argument("--root", default=settings.GAME_CACHE_ROOT)
+
+    serve = subcommands.add_parser("serve", help="Run a cache node")
+    serve.add_argument("--root", default=settings.GAME_CACHE_ROOT)
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8090)
+
+    args = parser.parse_args(argv)
+    if args.command == "ingest":
+        manifest = ingest_game(
+            args.app_id, args.name, args.source, ChunkStore(args.root)
+        )
+        ManifestIndex(StateStore(settings.STATE_DB_PATH)).put(manifest)
+        print(
+            json.dumps(
+                {
+                    "app_id": manifest.app_id,
+                    "total_size": manifest.total_size,
+                    "unique_chunks": manifest.unique_chunks,
+                }
+            )
+        )
+    else:
+        make_cache_node(ChunkStore(args.root), args.host, args.port).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import json
+import re
+import subprocess
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from . import metrics
+
+# Asking the node to simulate the tx first; what every tx used before the cache
+SIMULATE_GAS_FLAGS = ["--gas", "auto", "--gas-adjustment", "1.4"]
+SIMULATE_GAS_ADJUSTMENT = 1.4
+# Printed to stderr by the Cosmos SDK CLI after simulating, already adjusted
+GAS_ESTIMATE_PATTERN = re.compile(r"gas estimate:\s*(\d+)")
+# sdkerrors.ErrOutOfGas
+OUT_OF_GAS_CODE = 11
+
+
+def size_bucket(size_bytes: int) -> str:
+    """Coarse shape of a message whose gas grows with its payload, e.g. an SDL"""
+    return f"{max(1, (size_bytes + 1023) // 1024)}kb"
+
+
+def out_of_gas(result: subprocess.CompletedProcess) -> bool:
+    """Whether a broadcast was rejected for running out of gas"""
+    if "out of gas" in (result.stderr or ""):
+        return True
+    try:
+        tx = json.loads(result.stdout)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(tx, dict) and (
+        tx.get("code") == OUT_OF_GAS_CODE or "out of gas" in tx.get("raw_log", "")
+    )
+
+
+def gas_used(result: subprocess.CompletedProcess) -> Optional[int]:
+    """Gas a tx needed: the tx's gas_used, else the node's simulation.
+
+    Sync broadcasts report gas_used as 0, so most samples come from the
+    simulation a cache miss runs, with the CLI's adjustment taken back off.
+    """
+    try:
+        used = int(json.loads(result.stdout).get("gas_used", 0))
+    except (TypeError, ValueError, AttributeError):
+        used = 0
+    if used > 0:
+        return used
+    match = GAS_ESTIMATE_PATTERN.search(result.stderr or "")
+    if match:
+        return int(int(match.group(1)) / SIMULATE_GAS_ADJUSTMENT)
+    return None
+
+
+class GasEstimator:
+    """Gas limits learned from recent txs, keyed by message type and shape.
+
+    A key's limit is the most gas any of its last `window` samples used,
+    times `margin`. Until a key has a sample, or after a tx runs out of gas
+    under its limit, callers simulate with --gas auto instead.
+    """
+
+    def __init__(self, margin: float = 1.3, window: int = 20):
+        self.margin = margin
+        self.window = window
+        self._samples: Dict[str, Deque[int]] = {}
+        self._lock = threading.Lock()
+
+    def limit(self, key: str) -> Optional[int]:
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples:
+                return None
+            return int(max(samples) * self.margin)
+
+    def flags(self, key: str) -> List[str]:
+        """Gas flags for the next tx of this kind"""
+        limit = self.limit(key)
+        if limit is None:
+            metrics.GAS_ESTIMATES.labels("simulated").inc()
+            return list(SIMULATE_GAS_FLAGS)
+        metrics.GAS_ESTIMATES.labels("cached").inc()
+        return ["--gas", str(limit)]
+
+    def observe(self, key: str, result: subprocess.CompletedProcess) -> None:
+        """Learn from a broadcast's output; failed or silent ones teach nothing"""
+        if result.returncode != 0:
+            return
+        used = gas_used(result)
+        if used is not None:
+            self.record(key, used)
+
+    def record(self, key: str, used: int) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(used)
+
+    def invalidate(self, key: str) -> None:
+        """Forget a key whose limit turned out too low; the next tx simulates"""
+        metrics.GAS_ESTIMATES.labels("out_of_gas").inc()
+        with self._lock:
+            self._samples.pop(key, None)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                key: {"samples": len(samples), "limit": int(max(samples) * self.margin)}
+                for key, samples in self._samples.items()
+            }
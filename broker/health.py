@@ -0,0 +1,228 @@
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# How much each failing signal contributes to a scan's raw score, capped at 1.
+# A readiness probe failing on its own crosses the default degraded score on
+# the third scan in a row; a lease the chain no longer shows active, on the
+# second. The provider signal is the share of the provider's other leases failing.
+PROBE_WEIGHT = 0.7
+STATUS_WEIGHT = 1.0
+ESCROW_WEIGHT = 0.5
+PROVIDER_WEIGHT = 0.5
+# Share of each new scan in the smoothed score
+SMOOTHING = 0.5
+
+# Escrow risk rises from 0 at the extension threshold to 1 near depletion
+ESCROW_WARNING_BLOCKS = 300
+ESCROW_CRITICAL_BLOCKS = 50
+
+
+def escrow_risk(blocks_remaining: Optional[int]) -> float:
+    if blocks_remaining is None:
+        return 0.0
+    if blocks_remaining <= ESCROW_CRITICAL_BLOCKS:
+        return 1.0
+    if blocks_remaining >= ESCROW_WARNING_BLOCKS:
+        return 0.0
+    return (ESCROW_WARNING_BLOCKS - blocks_remaining) / (
+        ESCROW_WARNING_BLOCKS - ESCROW_CRITICAL_BLOCKS
+    )
+
+
+def port_open(host: str, port: int, timeout: float) -> bool:
+    """Whether the lease's forwarded Sunshine port accepts a TCP connection"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def lease_status_ok(status: Optional[Dict[str, Any]]) -> Optional[bool]:
+    """Whether `akash query deployment get` still shows the deployment active and funded.
+
+    None when the query itself failed: an RPC outage says nothing about the lease.
+    """
+    if status is None:
+        return None
+    deployment_state = status.get("deployment", {}).get("state", "active")
+    escrow_state = status.get("escrow_account", {}).get("state", "open")
+    return deployment_state == "active" and escrow_state == "open"
+
+
+@dataclass
+class HealthSignals:
+    """One scan's view of a lease; a `status_ok` of None keeps the last known status"""
+
+    probe_ok: bool
+    status_ok: Optional[bool] = True
+
+
+@dataclass
+class LeaseHealth:
+    lease_id: str
+    provider: str
+    session_id: str
+    score: float = 0.0
+    degraded: bool = False
+    migrating: bool = False
+    retry_after: float = 0.0
+    escrow_risk: float = 0.0
+    signals: Dict[str, float] = field(default_factory=dict)
+
+
+class DegradationDetector:
+    """Scores lease health from periodic scans and picks which sessions to migrate.
+
+    Each scan's signals give a raw score: probe failures, lease status
+    anomalies, escrow depletion risk and the share of the provider's other
+    leases failing their probe. The raw score is smoothed into the lease's score. A
+    lease turns degraded at `degraded_score` and only recovers below
+    `recovered_score`, so a flapping probe neither triggers a migration nor
+    ends one. Migrations of degraded leases are capped overall and per
+    provider. A provider failing outright then moves its sessions a few at a
+    time rather than all at once onto whatever bids first. A failed migration
+    is retried after `retry_seconds`.
+    """
+
+    def __init__(
+        self,
+        degraded_score: float = 0.6,
+        recovered_score: float = 0.2,
+        max_concurrent: int = 4,
+        max_per_provider: int = 2,
+        retry_seconds: float = 300.0,
+    ):
+        self.degraded_score = degraded_score
+        self.recovered_score = recovered_score
+        self.max_concurrent = max_concurrent
+        self.max_per_provider = max_per_provider
+        self.retry_seconds = retry_seconds
+        self.leases: Dict[str, LeaseHealth] = {}
+        self._lock = threading.Lock()
+
+    def note_escrow(self, lease_id: str, blocks_remaining: Optional[int]) -> None:
+        """Escrow left on a lease, as the extension sweep last saw it"""
+        with self._lock:
+            if lease_id in self.leases:
+                self.leases[lease_id].escrow_risk = escrow_risk(blocks_remaining)
+
+    def update(
+        self, observations: Dict[str, Tuple[str, str, HealthSignals]]
+    ) -> List[LeaseHealth]:
+        """Fold in a scan of every tracked lease: lease_id -> (provider, session_id, signals).
+
+        Leases missing from the scan have ended and are forgotten, unless a
+        migration is still moving them. Returns the leases that turned degraded.
+        """
+        failing: Dict[str, List[int]] = {}
+        for provider, _, signals in observations.values():
+            counts = failing.setdefault(provider, [0, 0])
+            counts[0] += not signals.probe_ok
+            counts[1] += 1
+
+        newly_degraded = []
+        with self._lock:
+            for lease_id in [
+                lease_id
+                for lease_id, lease in self.leases.items()
+                if lease_id not in observations and not lease.migrating
+            ]:
+                del self.leases[lease_id]
+            for lease_id, (provider, session_id, signals) in observations.items():
+                lease = self.leases.get(lease_id)
+                if lease is None:
+                    lease = self.leases[lease_id] = LeaseHealth(
+                        lease_id, provider, session_id
+                    )
+                # The provider signal counts the other leases, so one lease isn't evidence twice
+                failed, total = failing[provider]
+                failed -= not signals.probe_ok
+                if signals.status_ok is None:
+                    status = lease.signals.get("status", 0.0)
+                else:
+                    status = 0.0 if signals.status_ok else 1.0
+                lease.signals = {
+                    "probe": 0.0 if signals.probe_ok else 1.0,
+                    "status": status,
+                    "escrow": lease.escrow_risk,
+                    "provider": failed / (total - 1) if total > 1 else 0.0,
+                }
+                raw = min(
+                    1.0,
+                    PROBE_WEIGHT * lease.signals["probe"]
+                    + STATUS_WEIGHT * lease.signals["status"]
+                    + ESCROW_WEIGHT * lease.signals["escrow"]
+                    + PROVIDER_WEIGHT * lease.signals["provider"],
+                )
+                lease.score = SMOOTHING * raw + (1 - SMOOTHING) * lease.score
+                if not lease.degraded and lease.score >= self.degraded_score:
+                    lease.degraded = True
+                    newly_degraded.append(lease)
+                elif lease.degraded and lease.score <= self.recovered_score:
+                    lease.degraded = False
+        return newly_degraded
+
+    def select_migrations(self, now: Optional[float] = None) -> List[LeaseHealth]:
+        """Degraded leases to migrate now, worst first, within the budgets; marks them migrating"""
+        now = time.time() if now is None else now
+        with self._lock:
+            in_flight = [lease for lease in self.leases.values() if lease.migrating]
+            per_provider: Dict[str, int] = {}
+            for lease in in_flight:
+                per_provider[lease.provider] = per_provider.get(lease.provider, 0) + 1
+            candidates = sorted(
+                (
+                    lease
+                    for lease in self.leases.values()
+                    if lease.degraded
+                    and not lease.migrating
+                    and lease.retry_after <= now
+                ),
+                key=lambda lease: lease.score,
+                reverse=True,
+            )
+            selected = []
+            for lease in candidates:
+                if len(in_flight) + len(selected) >= self.max_concurrent:
+                    break
+                if per_provider.get(lease.provider, 0) >= self.max_per_provider:
+                    continue
+                per_provider[lease.provider] = per_provider.get(lease.provider, 0) + 1
+                lease.migrating = True
+                selected.append(lease)
+            return selected
+
+    def finish(self, lease_id: str, migrated: bool) -> None:
+        with self._lock:
+            lease = self.leases.get(lease_id)
+            if lease is None:
+                return
+            if migrated:
+                # The session lives on a new lease, which the next scan picks up afresh
+                del self.leases[lease_id]
+            else:
+                lease.migrating = False
+                lease.retry_after = time.time() + self.retry_seconds
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tracked": len(self.leases),
+                "migrating": sum(lease.migrating for lease in self.leases.values()),
+                "degraded": [
+                    {
+                        "lease_id": lease.lease_id,
+                        "provider": lease.provider,
+                        "session_id": lease.session_id,
+                        "score": round(lease.score, 3),
+                        "migrating": lease.migrating,
+                        "signals": lease.signals,
+                    }
+                    for lease in self.leases.values()
+                    if lease.degraded
+                ],
+            }
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from .state import StateStore
+from . import metrics
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+
+class IdempotencyKeyReused(Exception):
+    """Raised when an Idempotency-Key comes back with a different request"""
+
+    def __init__(self, key: str):
+        self.key = key
+        super().__init__(
+            f"Idempotency-Key {key!r} was already used for a different request"
+        )
+
+
+def fingerprint(payload: Dict[str, Any]) -> str:
+    """Stable digest of a request body, to tell retries from key reuse"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Runs the operation for an Idempotency-Key once and hands every retry its result.
+
+    The key is claimed in the shared StateStore before the operation starts,
+    so only one worker provisions for it. Retries reaching the same worker
+    meanwhile await the same future; retries on another worker poll the
+    claim until the response is recorded. Completed responses are replayed
+    for `ttl` seconds and at most `max_entries` are kept. A failed operation
+    releases its key so the client's next retry starts afresh.
+    """
+
+    NAMESPACE = "idempotency"
+
+    def __init__(
+        self,
+        store: StateStore,
+        ttl: float,
+        max_entries: int,
+        in_flight_ttl: float,
+        poll_seconds: float = 0.5,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.in_flight_ttl = in_flight_ttl
+        self.poll_seconds = poll_seconds
+        self.worker_id = uuid.uuid4().hex
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def run(
+        self,
+        key: str,
+        request_fingerprint: str,
+        operation: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[Dict[str, Any], bool]:
+        """The operation's response for this key, and whether it came from an earlier request"""
+        while True:
+            running = self._in_flight.get(key)
+            if running is not None:
+                self._check(key, running[0], request_fingerprint)
+                metrics.IDEMPOTENT_REQUESTS.labels("in_flight").inc()
+                # Shielded: a retry giving up must not cancel the provisioning others wait on
+                return await asyncio.shield(running[1]), True
+
+            claim = {
+                "state": IN_PROGRESS,
+                "fingerprint": request_fingerprint,
+                "worker": self.worker_id,
+                "claimed_at": time.time(),
+            }
+            if self.store.put_if_absent(
+                self.NAMESPACE, key, claim, ttl=self.in_flight_ttl
+            ):
+                metrics.IDEMPOTENT_REQUESTS.labels("new").inc()
+                return await self._start(key, request_fingerprint, operation), False
+
+            record = self.store.get(self.NAMESPACE, key)
+            if record is None:
+                # Released by a failed attempt or expired since the claim was tried
+                continue
+            self._check(key, record["fingerprint"], request_fingerprint)
+            if record["state"] == COMPLETED:
+                metrics.IDEMPOTENT_REQUESTS.labels("replayed").inc()
+                return record["response"], True
+            # Another worker is provisioning this key
+            await asyncio.sleep(self.poll_seconds)
+
+    @staticmethod
+    def _check(key: str, stored: str, request_fingerprint: str) -> None:
+        if stored != request_fingerprint:
+            metrics.IDEMPOTENT_REQUESTS.labels("conflict").inc()
+            raise IdempotencyKeyReused(key)
+
+    async def _start(
+        self,
+        key: str,
+        request_fingerprint: str,
+        operation: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        future = asyncio.ensure_future(operation())
+        self._in_flight[key] = (request_fingerprint, future)
+        # Registered before any waiter, so the response is stored before they wake
+        future.add_done_callback(
+            lambda done: self._finish(key, request_fingerprint, done)
+        )
+        return await asyncio.shield(future)
+
+    def _finish(
+        self, key: str, request_fingerprint: str, future: asyncio.Future
+    ) -> None:
+        self._in_flight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            self.store.delete(self.NAMESPACE, key)
+            return
+        self.store.put(
+            self.NAMESPACE,
+            key,
+            {
+                "state": COMPLETED,
+                "fingerprint": request_fingerprint,
+                "response": future.result(),
+                "completed_at": time.time(),
+            },
+            ttl=self.ttl,
+        )
+
+    def trim(self) -> int:
+        """Drop expired responses and the oldest beyond the cap"""
+        self.store.purge_expired()
+        return self.store.trim(self.NAMESPACE, self.max_entries)
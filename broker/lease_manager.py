@@ -1,10 +1,50 @@
 import subprocess
 import json
+import math
+import os
 import uuid
+import threading
 import time
-from typing import Dict, Optional, Any
-from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from .settings import settings
+from .checkpoint import CheckpointAgent, CheckpointManager, STEAM_COMPATDATA_PATH
+from .encoder import EncoderProfile
+from .events import EventBus
+from .chain_events import ChainEventSubscriber
+from .gas import GasEstimator, SIMULATE_GAS_FLAGS, out_of_gas, size_bucket
+from .sequence import (
+    SequenceManager,
+    check_tx_failure,
+    delivered_result,
+    sequence_mismatch,
+    tx_response,
+)
+from .signers import SignerPool, plan_transfers
+from .market_history import MarketHistory, FAILED
+from .endpoints import (
+    EndpointCache,
+    EndpointDiscoveryError,
+    LeaseEndpoint,
+    SSH_PORT,
+    parse_lease_status,
+    port_key,
+    ssh_command,
+)
+from . import events
+from . import metrics
+from . import tracing
+
+STEAM_LIBRARY_PATH = "/home/gamer/.steam/steam/steamapps"
+# Written by the image entrypoint once boot finishes
+BOOT_REPORT_PATH = "/tmp/boot-report.json"
+# Leases are billed per block; Akash produces one roughly every six seconds
+AKASH_BLOCK_SECONDS = 6.0
+# Broadcast attempts per tx across sequence resyncs and out-of-gas retries
+TX_ATTEMPTS = 3
+
 
 @dataclass
 class LeaseInfo:
@@ -13,53 +53,352 @@ class LeaseInfo:
     ip_address: str
     port: int
     status: str
+    # External port for each exposed "port/proto" of the Sunshine service
+    ports: Dict[str, int] = field(default_factory=dict)
+    # Deployments raced against this one by a hedged create, all closed
+    hedge_lease_ids: List[str] = field(default_factory=list)
+    
+    @property
+    def ssh_port(self) -> int:
+        return self.ports.get(port_key(SSH_PORT), SSH_PORT)
 
 class LeaseManager:
-    def __init__(self):
+    def __init__(self, checkpoint_manager: Optional[CheckpointManager] = None,
+                 event_bus: Optional[EventBus] = None,
+                 chain_events: Optional[ChainEventSubscriber] = None,
+                 runner: Optional[Callable[..., subprocess.CompletedProcess]] = None,
+                 sleep: Optional[Callable[[float], None]] = None,
+                 gas_estimator: Optional[GasEstimator] = None,
+                 sequences: Optional[SequenceManager] = None,
+                 signers: Optional[SignerPool] = None,
+                 market_history: Optional[MarketHistory] = None,
+                 endpoints: Optional[EndpointCache] = None):
+        self.checkpoint_manager = checkpoint_manager
+        self.event_bus = event_bus
+        self.chain_events = chain_events
+        # Every tx simulates its gas on the node first when the cache is off
+        if gas_estimator is None and settings.GAS_CACHE_ENABLED:
+            gas_estimator = GasEstimator(settings.GAS_SAFETY_MARGIN, settings.GAS_SAMPLE_WINDOW)
+        self.gas_estimator = gas_estimator
+        # Without one each tx has the CLI look up the account's sequence
+        self.sequences = sequences
+        self._addresses: Dict[str, str] = {}
+        # Every deployment is signed for by AKASH_FROM without a pool
+        self.signers = signers
+        # Bids and lease failures are recorded for placement analytics
+        self.market_history = market_history
+        # Endpoints are discovered for every new lease; kept for later lookups when set
+        self.endpoints = endpoints
+        # Without a shared cache, this process's own leases are still remembered
+        self._endpoints: Dict[str, LeaseEndpoint] = {}
+        # Stand-ins for subprocess.run and time.sleep, e.g. the market simulator
+        self.runner = runner
+        self.sleep = sleep
         self.akash_cmd_base = [
             "akash",
             "--node", settings.AKASH_NODE,
             "--chain-id", settings.AKASH_CHAIN_ID,
             "--keyring-backend", settings.AKASH_KEYRING_BACKEND,
+            # Last, so _cmd_base can swap in a deployment's own key
             "--from", settings.AKASH_FROM
         ]
     
-    def create_lease(self, sdl_path: str = "sdl/sunshine.yaml") -> LeaseInfo:
-        """Create a new Akash lease for gaming session"""
+    def _run(self, cmd: List[str], **kwargs: Any) -> subprocess.CompletedProcess:
+        if self.runner is not None:
+            return self.runner(cmd, **kwargs)
+        return subprocess.run(cmd, **kwargs)
+    
+    def _sleep(self, seconds: float) -> None:
+        if self.sleep is not None:
+            self.sleep(seconds)
+        else:
+            time.sleep(seconds)
+    
+    def _run_akash(self, cmd: List[str]) -> subprocess.CompletedProcess:
+        """Run an akash CLI command, recording its latency by subcommand"""
+        subcommand = metrics.akash_subcommand(cmd[len(self.akash_cmd_base):])
+        with tracing.span(f"akash {subcommand}", subcommand=subcommand) as span:
+            with metrics.AKASH_COMMAND_SECONDS.labels(subcommand).time():
+                result = self._run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                metrics.AKASH_COMMAND_FAILURES.labels(subcommand).inc()
+                span.set_error(result.stderr)
+        return result
+    
+    def _signer(self, dseq: str) -> str:
+        return self.signers.owner(dseq) if self.signers else settings.AKASH_FROM
+    
+    def _cmd_base(self, dseq: str) -> List[str]:
+        """akash_cmd_base acting as the key that owns a deployment"""
+        key = self._signer(dseq)
+        if key == settings.AKASH_FROM:
+            return self.akash_cmd_base
+        return self.akash_cmd_base[:-1] + [key]
+    
+    def _owner_address(self, dseq: str) -> str:
+        key = self._signer(dseq)
+        return key if key == settings.AKASH_FROM else self._signer_address(key)
+    
+    def _broadcast(self, cmd: List[str], gas_key: str, wait_for_block: bool = False) -> subprocess.CompletedProcess:
+        """Run an akash tx with a learned gas limit and, when pipelining, a locally allocated sequence.
+
+        Retries a tx rejected for a stale sequence, and one that ran out of gas
+        under a cached limit with simulation instead. A pipelined tx only
+        reaches the mempool; with wait_for_block the tx is looked up until it
+        is in a block, and one that failed there fails the command.
+        """
+        for _ in range(TX_ATTEMPTS):
+            gas_flags = self.gas_estimator.flags(gas_key) if self.gas_estimator else list(SIMULATE_GAS_FLAGS)
+            signer = cmd[cmd.index("--from") + 1]
+            reservation = (self.sequences.reserve(self._signer_address(signer), self._account_sequence)
+                           if self.sequences else None)
+            result = self._run_akash(cmd + gas_flags + (reservation.flags() if reservation else []))
+            expected = sequence_mismatch(result) if reservation else None
+            if expected is not None:
+                self.sequences.resync(reservation, expected)
+                continue
+            delivered = None
+            if reservation and wait_for_block and check_tx_failure(result).returncode == 0:
+                delivered = self._await_block(result)
+                if delivered is not None:
+                    result = delivered_result(result, delivered)
+            if self.gas_estimator and gas_flags != SIMULATE_GAS_FLAGS and out_of_gas(result):
+                self.gas_estimator.invalidate(gas_key)
+                # A tx that failed in a block still used up its sequence
+                if reservation and delivered is None:
+                    self.sequences.release(reservation)
+                continue
+            break
+        
+        result = check_tx_failure(result)
+        # A tx found in a block is settled here instead of by confirm_transactions
+        if reservation and expected is None and delivered is None:
+            if result.returncode != 0:
+                self.sequences.release(reservation)
+            elif (tx_response(result) or {}).get("txhash"):
+                self.sequences.track(tx_response(result)["txhash"], reservation, gas_key=gas_key)
+                if wait_for_block:
+                    # Never showed up; confirm_transactions settles it if it lands later
+                    result = subprocess.CompletedProcess(
+                        result.args, 1, result.stdout,
+                        f"tx {tx_response(result)['txhash']} not in a block after "
+                        f"{settings.TX_CONFIRM_TIMEOUT_SECONDS:.0f}s")
+        if self.gas_estimator:
+            self.gas_estimator.observe(gas_key, result)
+        return result
+    
+    def _await_block(self, result: subprocess.CompletedProcess) -> Optional[Dict[str, Any]]:
+        """Look a sync broadcast up until a block includes it; None if none does in time"""
+        txhash = (tx_response(result) or {}).get("txhash")
+        if not txhash:
+            return None
+        waited = 0.0
+        while True:
+            tx = self._query_tx(txhash)
+            if tx is not None:
+                return tx
+            if waited >= settings.TX_CONFIRM_TIMEOUT_SECONDS:
+                return None
+            self._sleep(settings.TX_CONFIRM_INTERVAL_SECONDS)
+            waited += settings.TX_CONFIRM_INTERVAL_SECONDS
+    
+    def _signer_address(self, key: str) -> str:
+        """Address of a keyring key; AKASH_FROM may name the key or be its address"""
+        if key.startswith("akash1"):
+            return key
+        if key not in self._addresses:
+            # keys commands don't take the node flags in akash_cmd_base
+            result = self._run(["akash", "keys", "show", key, "-a",
+                                "--keyring-backend", settings.AKASH_KEYRING_BACKEND],
+                               capture_output=True, text=True)
+            if result.returncode != 0:
+                raise Exception(f"Failed to look up key {key}: {result.stderr}")
+            self._addresses[key] = result.stdout.strip()
+        return self._addresses[key]
+    
+    def owner_addresses(self) -> List[str]:
+        """Addresses of the keys we sign with; the chain names accounts by address, not key name"""
+        keys = self.signers.keys if self.signers else [settings.AKASH_FROM]
+        return [self._signer_address(key) for key in keys]
+    
+    def _account_sequence(self, address: str) -> Tuple[int, int]:
+        """Account number and next sequence of an address, as the chain has them"""
+        account_cmd = self.akash_cmd_base + ["query", "auth", "account", address, "--output", "json"]
+        result = self._run_akash(account_cmd)
+        if result.returncode != 0:
+            raise Exception(f"Failed to query account {address}: {result.stderr}")
+        account = json.loads(result.stdout)
+        # Newer nodes wrap the account; vesting accounts nest a base account
+        account = account.get("account", account)
+        account = account.get("base_account", account)
+        return int(account.get("account_number", 0)), int(account.get("sequence", 0))
+    
+    def _query_tx(self, txhash: str) -> Optional[Dict[str, Any]]:
+        result = self._run_akash(self.akash_cmd_base + ["query", "tx", txhash, "--output", "json"])
+        if result.returncode != 0:
+            # Not in a block yet
+            return None
+        return json.loads(result.stdout)
+    
+    def _tx_delivered(self, pending: Dict[str, Any], tx: Dict[str, Any]) -> None:
+        if self.gas_estimator is None:
+            return
+        if int(tx.get("code", 0)) and "out of gas" in tx.get("raw_log", ""):
+            self.gas_estimator.invalidate(pending["gas_key"])
+        elif int(tx.get("gas_used", 0)):
+            self.gas_estimator.record(pending["gas_key"], int(tx["gas_used"]))
+    
+    def confirm_transactions(self) -> Dict[str, int]:
+        """Settle pipelined broadcasts that made it into a block or never will"""
+        if self.sequences is None:
+            return {}
+        return self.sequences.confirm(self._query_tx, self._tx_delivered)
+    
+    def _publish(self, session_id: str, event: str, **data: Any) -> None:
+        if self.event_bus is not None:
+            self.event_bus.publish(session_id, event, **data)
+    
+    @contextmanager
+    def _phase(self, operation: str, phase: str):
+        """Time and trace one phase of a multi-step lease operation"""
+        with tracing.span(f"{operation}.{phase}"):
+            with metrics.LEASE_PHASE_SECONDS.labels(operation, phase).time():
+                yield
+    
+    @tracing.traced("create_lease")
+    def create_lease(self, sdl_path: str = "sdl/sunshine.yaml", tier: Optional[str] = None,
+                     region: Optional[str] = None, session_id: Optional[str] = None) -> LeaseInfo:
+        """Create a new Akash lease for gaming session.
+
+        Lifecycle events go to `session_id`, or to the new lease's id when the
+        session will be known by it.
+        """
+        tracing.set_attributes(sdl_path=sdl_path)
+        metrics.INFLIGHT_PROVISIONS.inc()
+        try:
+            return self._provision_lease(sdl_path, tier, region, session_id)
+        finally:
+            metrics.INFLIGHT_PROVISIONS.dec()
+    
+    def _provision_lease(self, sdl_path: str, tier: Optional[str], region: Optional[str],
+                         session_id: Optional[str]) -> LeaseInfo:
         deployment_id = str(uuid.uuid4())
+        session_id = session_id or deployment_id
+        tracing.set_attributes(dseq=deployment_id)
+        
+        self._create_deployment(sdl_path, deployment_id, "create_lease")
+        try:
+            bids = self._query_bids(deployment_id, "create_lease")
+        except Exception:
+            # An order nobody bid on still holds its deposit in escrow
+            self.close_lease(deployment_id)
+            raise
         
-        # Create deployment
-        deploy_cmd = self.akash_cmd_base + [
+        if self.market_history is not None and settings.MARKET_HISTORY_RANKING_ENABLED:
+            # Cheapest per lease that actually came up, going by history
+            bids = self.market_history.rank_bids(bids, tier, region)
+        # Otherwise accept first bid (simplified)
+        bid = bids[0]
+        tracing.set_attributes(provider=bid["bid"]["bid_id"]["provider"], bid_count=len(bids))
+        self._record_bids(bids, [bid], tier, region)
+        self._publish(session_id, events.BID_ACCEPTED,
+                      provider=bid["bid"]["bid_id"]["provider"],
+                      price=bid["bid"].get("price", {}).get("amount"))
+        try:
+            lease_info = self._accept_bid(sdl_path, deployment_id, bid, "create_lease")
+        except Exception as e:
+            self._record_lease_failure(bid["bid"]["bid_id"]["provider"], tier, region)
+            if isinstance(e, EndpointDiscoveryError):
+                # The lease bills from here on, but no client could reach it
+                self.close_lease(deployment_id)
+            raise
+        self._publish(session_id, events.LEASE_CREATED, provider=lease_info.provider)
+        return lease_info
+    
+    def _record_bids(self, bids: List[Dict[str, Any]], accepted: List[Dict[str, Any]],
+                     tier: Optional[str], region: Optional[str]) -> None:
+        if self.market_history is None:
+            return
+        # History is for analytics; a full disk must not fail the lease
+        try:
+            self.market_history.record_bids(
+                [(bid["bid"]["bid_id"]["provider"], self._bid_price(bid), any(bid is chosen for chosen in accepted))
+                 for bid in bids],
+                tier=tier or "", region=region or ""
+            )
+        except OSError as e:
+            tracing.set_attributes(market_history_error=str(e))
+    
+    def _record_lease_failure(self, provider: str, tier: Optional[str], region: Optional[str]) -> None:
+        if self.market_history is None:
+            return
+        try:
+            self.market_history.record_lease(provider, FAILED, tier=tier or "", region=region or "")
+        except OSError as e:
+            tracing.set_attributes(market_history_error=str(e))
+    
+    def _create_deployment(self, sdl_path: str, deployment_id: str, operation: str) -> None:
+        if self.signers is not None:
+            tracing.set_attributes(signer=self.signers.assign(deployment_id))
+        deploy_cmd = self._cmd_base(deployment_id) + [
             "tx", "deployment", "create", sdl_path,
             "--dseq", deployment_id,
-            "--gas", "auto",
-            "--gas-adjustment", "1.4",
             "--yes"
         ]
+        # Gas grows with the manifest, so size classes don't share a limit
+        try:
+            shape = size_bucket(os.path.getsize(sdl_path))
+        except OSError:
+            shape = "unknown"
         
-        result = subprocess.run(deploy_cmd, capture_output=True, text=True)
+        with self._phase(operation, "deployment"):
+            result = self._broadcast(deploy_cmd, f"deployment create/{shape}", wait_for_block=True)
         if result.returncode != 0:
+            if self.signers is not None:
+                self.signers.release(deployment_id)
             raise Exception(f"Failed to create deployment: {result.stderr}")
+    
+    def _query_bids(self, deployment_id: str, operation: str) -> List[Dict[str, Any]]:
+        # Providers bid in the blocks after the order lands, so the list is polled for a while
+        wait = settings.BID_WAIT_SECONDS
+        if self.chain_events is not None and self.chain_events.connected:
+            # Bids are pushed by the node as providers submit them
+            with self._phase(operation, "bids"):
+                bids = self.chain_events.collect_bids(
+                    deployment_id,
+                    timeout=settings.CHAIN_EVENT_BID_TIMEOUT_SECONDS,
+                    window=settings.CHAIN_EVENT_BID_WINDOW_SECONDS
+                )
+            if bids:
+                tracing.set_attributes(bid_source="chain_events")
+                return bids
+            # The stream may have dropped while waiting; ask the node directly
+            wait = 0
         
-        # Query market for bids (simplified)
         market_cmd = self.akash_cmd_base + [
             "query", "market", "bid", "list",
-            "--owner", settings.AKASH_FROM,
+            "--owner", self._owner_address(deployment_id),
             "--dseq", deployment_id,
             "--output", "json"
         ]
         
-        result = subprocess.run(market_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Failed to query market: {result.stderr}")
-        
-        bids = json.loads(result.stdout)
-        if not bids.get("bids"):
-            raise Exception("No bids available")
-        
-        # Accept first bid (simplified)
-        bid = bids["bids"][0]
-        lease_cmd = self.akash_cmd_base + [
+        waited = 0.0
+        with self._phase(operation, "bids"):
+            while True:
+                result = self._run_akash(market_cmd)
+                if result.returncode != 0:
+                    raise Exception(f"Failed to query market: {result.stderr}")
+                bids = json.loads(result.stdout).get("bids")
+                if bids:
+                    return bids
+                if waited >= wait:
+                    raise Exception("No bids available")
+                self._sleep(settings.BID_POLL_INTERVAL_SECONDS)
+                waited += settings.BID_POLL_INTERVAL_SECONDS
+    
+    def _accept_bid(self, sdl_path: str, deployment_id: str, bid: Dict[str, Any],
+                    operation: str) -> LeaseInfo:
+        lease_cmd = self._cmd_base(deployment_id) + [
             "tx", "market", "lease", "create",
             "--dseq", deployment_id,
             "--gseq", str(bid["bid"]["bid_id"]["gseq"]),
@@ -68,34 +407,342 @@ class LeaseManager:
             "--yes"
         ]
         
-        result = subprocess.run(lease_cmd, capture_output=True, text=True)
+        with self._phase(operation, "lease"):
+            result = self._broadcast(lease_cmd, "lease create", wait_for_block=True)
         if result.returncode != 0:
             raise Exception(f"Failed to create lease: {result.stderr}")
         
+        with self._phase(operation, "manifest"):
+            self.send_manifest(sdl_path, deployment_id, bid)
+        
+        with self._phase(operation, "endpoint"):
+            endpoint = self.discover_endpoint(deployment_id, bid)
         return LeaseInfo(
             lease_id=deployment_id,
             provider=bid["bid"]["bid_id"]["provider"],
-            ip_address="127.0.0.1",  # Placeholder - would query actual IP
-            port=settings.SUNSHINE_PORT,
-            status="active"
+            ip_address=endpoint.host,
+            port=endpoint.external_port(settings.SUNSHINE_PORT),
+            status="active",
+            ports=endpoint.ports
         )
     
+    def send_manifest(self, sdl_path: str, deployment_id: str, bid: Dict[str, Any]) -> None:
+        """Hand the provider the manifest for a new lease; until it has one nothing is deployed"""
+        bid_id = bid["bid"]["bid_id"]
+        manifest_cmd = self._cmd_base(deployment_id) + [
+            "provider", "send-manifest", sdl_path,
+            "--dseq", deployment_id,
+            "--gseq", str(bid_id["gseq"]),
+            "--oseq", str(bid_id["oseq"]),
+            "--provider", bid_id["provider"]
+        ]
+        result = self._run_akash(manifest_cmd)
+        if result.returncode != 0:
+            # The lease is billing but will never forward a port
+            raise EndpointDiscoveryError(
+                f"Failed to send manifest for lease {deployment_id} to {bid_id['provider']}: {result.stderr.strip()}"
+            )
+    
+    def discover_endpoint(self, deployment_id: str, bid: Dict[str, Any],
+                          timeout: Optional[float] = None,
+                          interval: Optional[float] = None) -> LeaseEndpoint:
+        """Poll the provider's lease status until it reports the hostname and forwarded ports.
+        
+        Providers expose global ports on their own hostname under randomly
+        assigned external ports, so the only place clients learn them is here.
+        """
+        timeout = settings.ENDPOINT_DISCOVERY_TIMEOUT_SECONDS if timeout is None else timeout
+        interval = settings.ENDPOINT_DISCOVERY_INTERVAL_SECONDS if interval is None else interval
+        bid_id = bid["bid"]["bid_id"]
+        status_cmd = self._cmd_base(deployment_id) + [
+            "provider", "lease-status",
+            "--dseq", deployment_id,
+            "--gseq", str(bid_id["gseq"]),
+            "--oseq", str(bid_id["oseq"]),
+            "--provider", bid_id["provider"]
+        ]
+        
+        elapsed = 0.0
+        error = "no forwarded ports"
+        while True:
+            result = self._run_akash(status_cmd)
+            if result.returncode == 0:
+                endpoint = parse_lease_status(json.loads(result.stdout))
+                if endpoint is not None:
+                    tracing.set_attributes(endpoint_host=endpoint.host)
+                    if self.endpoints is not None:
+                        self.endpoints.put(deployment_id, endpoint)
+                    else:
+                        self._endpoints[deployment_id] = endpoint
+                    return endpoint
+            else:
+                error = result.stderr.strip()
+            if elapsed >= timeout:
+                raise EndpointDiscoveryError(
+                    f"Failed to discover endpoint for lease {deployment_id} on {bid_id['provider']}: {error}"
+                )
+            self._sleep(interval)
+            elapsed += interval
+    
+    def endpoint(self, lease_id: str) -> Optional[LeaseEndpoint]:
+        """The endpoint discovered when the lease was created, if it is cached"""
+        return self.endpoints.get(lease_id) if self.endpoints is not None else self._endpoints.get(lease_id)
+    
+    def ssh_port(self, lease_id: str) -> int:
+        """The provider's external port for a lease's sshd"""
+        endpoint = self.endpoint(lease_id)
+        return endpoint.ssh_port if endpoint is not None else SSH_PORT
+    
+    @staticmethod
+    def _bid_price(bid: Dict[str, Any]) -> float:
+        """Bid price in uakt per block"""
+        return float(bid["bid"].get("price", {}).get("amount", 0))
+    
+    @classmethod
+    def select_hedge_bids(cls, bids: List[Dict[str, Any]], hedge_count: int,
+                          max_extra_cost_uakt: float, race_seconds: float) -> List[Dict[str, Any]]:
+        """Cheapest bid plus up to hedge_count - 1 backups from other providers.
+        
+        A backup lease costs its price for every block until the race ends.
+        Backups are added cheapest first while their combined worst-case cost
+        stays within the cap.
+        """
+        race_blocks = max(1, math.ceil(race_seconds / AKASH_BLOCK_SECONDS))
+        selected: List[Dict[str, Any]] = []
+        providers = set()
+        extra_cost = 0.0
+        for bid in sorted(bids, key=cls._bid_price):
+            provider = bid["bid"]["bid_id"]["provider"]
+            if provider in providers:
+                continue
+            if selected:
+                cost = cls._bid_price(bid) * race_blocks
+                if extra_cost + cost > max_extra_cost_uakt:
+                    break
+                extra_cost += cost
+            selected.append(bid)
+            providers.add(provider)
+            if len(selected) >= hedge_count:
+                break
+        return selected
+    
+    @tracing.traced("create_hedged_lease")
+    def create_hedged_lease(self, sdl_path: str, hedge_count: int,
+                            max_extra_cost_uakt: Optional[float] = None,
+                            ready_timeout: Optional[float] = None,
+                            poll_interval: float = 2.0, tier: Optional[str] = None,
+                            region: Optional[str] = None) -> LeaseInfo:
+        """Lease from the best few bidders at once and keep whichever starts Sunshine first"""
+        tracing.set_attributes(sdl_path=sdl_path, hedge_count=hedge_count)
+        metrics.INFLIGHT_PROVISIONS.inc()
+        try:
+            return self._provision_hedged_lease(
+                sdl_path, hedge_count,
+                settings.HEDGE_MAX_EXTRA_COST_UAKT if max_extra_cost_uakt is None else max_extra_cost_uakt,
+                settings.HEDGE_READY_TIMEOUT_SECONDS if ready_timeout is None else ready_timeout,
+                poll_interval, tier, region
+            )
+        finally:
+            metrics.INFLIGHT_PROVISIONS.dec()
+    
+    def _provision_hedged_lease(self, sdl_path: str, hedge_count: int, max_extra_cost_uakt: float,
+                                ready_timeout: float, poll_interval: float, tier: Optional[str],
+                                region: Optional[str]) -> LeaseInfo:
+        operation = "create_hedged_lease"
+        deployment_id = str(uuid.uuid4())
+        tracing.set_attributes(dseq=deployment_id)
+        
+        self._create_deployment(sdl_path, deployment_id, operation)
+        try:
+            bids = self._query_bids(deployment_id, operation)
+        except Exception:
+            self.close_lease(deployment_id)
+            raise
+        selected = self.select_hedge_bids(bids, hedge_count, max_extra_cost_uakt, ready_timeout)
+        tracing.set_attributes(bid_count=len(bids), hedged_leases=len(selected))
+        self._record_bids(bids, selected, tier, region)
+        
+        # One Akash order takes one lease, so each backup provider gets its
+        # own deployment of the same manifest. Their ids are fixed up front so
+        # the session can account for every one, including late closes.
+        deployment_ids = [deployment_id] + [str(uuid.uuid4()) for _ in selected[1:]]
+        race_over = threading.Event()
+        
+        def accept(index: int) -> Optional[Tuple[LeaseInfo, Dict[str, Any]]]:
+            bid = selected[index]
+            if index == 0:
+                try:
+                    return self._accept_bid(sdl_path, deployment_id, bid, operation), bid
+                except Exception:
+                    self.close_lease(deployment_id)
+                    raise
+            if race_over.is_set():
+                # Another lease already won; don't deploy one just to close it
+                return None
+            return self._lease_from_provider(sdl_path, bid["bid"]["bid_id"]["provider"], operation,
+                                             deployment_ids[index])
+        
+        # Creations and readiness probes share the pool, so probes never
+        # queue behind a backup that is still being created
+        pool = ThreadPoolExecutor(max_workers=2 * len(selected))
+        creations = [pool.submit(tracing.wrap(self._attempt(accept)), index) for index in range(len(selected))]
+        created: Dict[Future, Tuple[LeaseInfo, Dict[str, Any]]] = {}
+        try:
+            with self._phase(operation, "race"):
+                winner = self._race_to_ready(pool, creations, created, ready_timeout, poll_interval)
+            losers = [lease for lease, _ in created.values() if lease is not winner]
+            list(pool.map(tracing.wrap(self.close_lease), [lease.lease_id for lease in losers]))
+        except Exception:
+            list(pool.map(tracing.wrap(self.close_lease), [lease.lease_id for lease, _ in created.values()]))
+            raise
+        finally:
+            race_over.set()
+            # Backups still being created are closed as soon as they exist
+            for creation in creations:
+                if creation not in created:
+                    creation.add_done_callback(self._close_late_hedge)
+            pool.shutdown(wait=False)
+        if winner is None:
+            raise Exception(f"Failed to create lease: no hedged lease could be created for {deployment_id}")
+        
+        metrics.HEDGED_LEASES.labels("kept").inc()
+        metrics.HEDGED_LEASES.labels("closed").inc(len(losers))
+        bid = next(bid for lease, bid in created.values() if lease is winner)
+        winner.hedge_lease_ids = [lease_id for lease_id in deployment_ids if lease_id != winner.lease_id]
+        tracing.set_attributes(winner_dseq=winner.lease_id, provider=winner.provider)
+        self._publish(winner.lease_id, events.BID_ACCEPTED, provider=winner.provider,
+                      price=bid["bid"].get("price", {}).get("amount"), hedged=len(created))
+        self._publish(winner.lease_id, events.LEASE_CREATED, provider=winner.provider)
+        return winner
+    
+    def _close_late_hedge(self, creation: Future) -> None:
+        attempt = creation.result()
+        if attempt is not None:
+            self.close_lease(attempt[0].lease_id)
+            metrics.HEDGED_LEASES.labels("closed").inc()
+    
+    @staticmethod
+    def _attempt(function):
+        """Wrap a hedge step so one failed provider doesn't sink the others"""
+        def attempt(*args):
+            try:
+                return function(*args)
+            except Exception as e:
+                tracing.set_attributes(hedge_error=str(e))
+                return None
+        return attempt
+    
+    def _lease_from_provider(self, sdl_path: str, provider: str, operation: str,
+                             deployment_id: str) -> Optional[Tuple[LeaseInfo, Dict[str, Any]]]:
+        with tracing.span(f"{operation}.hedge", dseq=deployment_id, provider=provider):
+            self._create_deployment(sdl_path, deployment_id, operation)
+            try:
+                bid = next((bid for bid in self._query_bids(deployment_id, operation)
+                            if bid["bid"]["bid_id"]["provider"] == provider), None)
+                if bid is None:
+                    raise Exception(f"Provider {provider} did not bid on {deployment_id}")
+                return self._accept_bid(sdl_path, deployment_id, bid, operation), bid
+            except Exception:
+                self.close_lease(deployment_id)
+                raise
+    
+    def _race_to_ready(self, pool: ThreadPoolExecutor, creations: List[Future],
+                       created: Dict[Future, Tuple[LeaseInfo, Dict[str, Any]]],
+                       ready_timeout: float, poll_interval: float) -> Optional[LeaseInfo]:
+        """First lease whose Sunshine answers; the cheapest if none does in time.
+        
+        Each lease is probed as soon as it exists rather than once every
+        backup has been created. `creations` are in price order and fill
+        `created` as they finish.
+        """
+        deadline = time.monotonic() + ready_timeout
+        pending = list(creations)
+        while True:
+            for creation in [creation for creation in pending if creation.done()]:
+                pending.remove(creation)
+                if creation.result() is not None:
+                    created[creation] = creation.result()
+            leases = [created[creation][0] for creation in creations if creation in created]
+            probes = [pool.submit(self.is_sunshine_ready, lease.ip_address, ssh_port=lease.ssh_port)
+                      for lease in leases]
+            # Leases are in price order, so a tie goes to the cheaper one
+            for lease, probe in zip(leases, probes):
+                if probe.result():
+                    tracing.set_attributes(race_won=True)
+                    return lease
+            if (not pending and not leases) or time.monotonic() + poll_interval > deadline:
+                break
+            if leases:
+                self._sleep(poll_interval)
+            else:
+                wait(pending, timeout=max(poll_interval, 0.1), return_when=FIRST_COMPLETED)
+        
+        # Nobody answered in time: keep the cheapest lease, waiting only for
+        # cheaper ones that are still being created
+        tracing.set_attributes(race_won=False)
+        for creation in creations:
+            if creation in pending and creation.result() is not None:
+                created[creation] = creation.result()
+            if creation in created:
+                return created[creation][0]
+        return None
+    
     def extend_lease(self, lease_id: str, hours: int = 1) -> bool:
         """Extend an existing lease"""
         # Implementation would send more tokens to lease
         return True
     
+    def iter_leases(self, page_size: int = 100, state: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Every lease we own with its escrow payment, one page of the chain query at a time"""
+        for owner in self.owner_addresses():
+            page_key = None
+            while True:
+                list_cmd = self.akash_cmd_base + [
+                    "query", "market", "lease", "list",
+                    "--owner", owner,
+                    "--limit", str(page_size),
+                    "--output", "json"
+                ]
+                if state:
+                    list_cmd += ["--state", state]
+                if page_key:
+                    list_cmd += ["--page-key", page_key]
+                
+                result = self._run_akash(list_cmd)
+                if result.returncode != 0:
+                    raise Exception(f"Failed to list leases: {result.stderr}")
+                
+                page = json.loads(result.stdout)
+                yield from page.get("leases", [])
+                page_key = (page.get("pagination") or {}).get("next_key")
+                if not page_key:
+                    break
+    
+    def blocks_remaining_by_lease(self) -> Dict[str, int]:
+        """Blocks of escrow left on every active lease, from one paged lease list rather than a query per lease"""
+        remaining = {}
+        for entry in self.iter_leases(state="active"):
+            try:
+                price = float(entry["lease"]["price"]["amount"])
+                balance = float(entry["escrow_payment"]["balance"]["amount"])
+                dseq = str(entry["lease"]["lease_id"]["dseq"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if price > 0:
+                remaining[dseq] = max(0, int(balance // price))
+        return remaining
+    
     def get_lease_blocks_remaining(self, lease_id: str) -> Optional[int]:
         """Get remaining blocks until lease expires"""
         try:
             # Query lease info
-            lease_cmd = self.akash_cmd_base + [
+            lease_cmd = self._cmd_base(lease_id) + [
                 "query", "market", "lease", "get",
                 "--dseq", lease_id,
                 "--output", "json"
             ]
             
-            result = subprocess.run(lease_cmd, capture_output=True, text=True)
+            result = self._run_akash(lease_cmd)
             if result.returncode != 0:
                 return None
             
@@ -106,7 +753,7 @@ class LeaseManager:
                 "query", "block"
             ]
             
-            result = subprocess.run(status_cmd, capture_output=True, text=True)
+            result = self._run_akash(status_cmd)
             if result.returncode != 0:
                 return None
             
@@ -122,11 +769,20 @@ class LeaseManager:
         except (KeyError, ValueError, json.JSONDecodeError):
             return None
     
-    def extend_if_needed(self, lease_id: str, provider: str, gseq: int = 1, oseq: int = 1) -> Dict[str, Any]:
-        """Check remaining blocks and extend lease if needed (< 300 blocks)"""
+    @tracing.traced("extend_if_needed")
+    def extend_if_needed(self, lease_id: str, provider: str, gseq: int = 1, oseq: int = 1,
+                         threshold_blocks: int = 300, deposit_uakt: Optional[int] = None,
+                         blocks_remaining: Optional[int] = None) -> Dict[str, Any]:
+        """Check remaining blocks and extend lease if needed (< threshold_blocks)
+
+        A sweep that already has blocks_remaining from blocks_remaining_by_lease passes it in to skip the query.
+        """
+        tracing.set_attributes(dseq=lease_id, provider=provider)
         try:
             # Check remaining blocks
-            blocks_remaining = self.get_lease_blocks_remaining(lease_id)
+            if blocks_remaining is None:
+                blocks_remaining = self.get_lease_blocks_remaining(lease_id)
+            tracing.set_attributes(blocks_remaining=blocks_remaining)
             
             if blocks_remaining is None:
                 return {
@@ -136,8 +792,8 @@ class LeaseManager:
                     "extended": False
                 }
             
-            # If more than 300 blocks remaining, no extension needed
-            if blocks_remaining >= 300:
+            # If enough blocks remaining, no extension needed
+            if blocks_remaining >= threshold_blocks:
                 return {
                     "status": "ok",
                     "message": "Lease has sufficient time remaining",
@@ -145,20 +801,20 @@ class LeaseManager:
                     "extended": False
                 }
             
+            deposit_uakt = deposit_uakt or settings.LEASE_PRICE_UAKT
+            
             # Create bid to extend lease
-            bid_cmd = self.akash_cmd_base + [
+            bid_cmd = self._cmd_base(lease_id) + [
                 "tx", "market", "lease", "create-bid",
                 "--dseq", lease_id,
                 "--gseq", str(gseq),
                 "--oseq", str(oseq),
                 "--provider", provider,
-                "--deposit", f"{settings.LEASE_PRICE_UAKT}uakt",
-                "--gas", "auto",
-                "--gas-adjustment", "1.4",
+                "--deposit", f"{deposit_uakt}uakt",
                 "--yes"
             ]
             
-            result = subprocess.run(bid_cmd, capture_output=True, text=True)
+            result = self._broadcast(bid_cmd, "lease create-bid", wait_for_block=True)
             
             if result.returncode != 0:
                 return {
@@ -177,7 +833,7 @@ class LeaseManager:
                 "blocks_remaining": blocks_remaining,
                 "extended": True,
                 "tx_hash": tx_result.get("txhash", ""),
-                "deposit_amount": f"{settings.LEASE_PRICE_UAKT}uakt"
+                "deposit_amount": f"{deposit_uakt}uakt"
             }
             
         except json.JSONDecodeError as e:
@@ -195,40 +851,201 @@ class LeaseManager:
                 "extended": False
             }
     
+    @tracing.traced("close_lease")
     def close_lease(self, lease_id: str) -> bool:
         """Close an existing lease"""
-        close_cmd = self.akash_cmd_base + [
+        tracing.set_attributes(dseq=lease_id)
+        close_cmd = self._cmd_base(lease_id) + [
             "tx", "deployment", "close",
             "--dseq", lease_id,
             "--yes"
         ]
         
-        result = subprocess.run(close_cmd, capture_output=True, text=True)
+        result = self._broadcast(close_cmd, "deployment close")
+        if result.returncode != 0:
+            return False
+        if self.signers is not None:
+            self.signers.release(lease_id)
+        if self.endpoints is not None:
+            self.endpoints.forget(lease_id)
+        self._endpoints.pop(lease_id, None)
+        return True
+    
+    def signer_balances(self) -> Dict[str, int]:
+        """uakt held by each key of the signer pool"""
+        balances = {}
+        for key in self.signers.keys:
+            balance_cmd = self.akash_cmd_base + [
+                "query", "bank", "balances", self._signer_address(key),
+                "--output", "json"
+            ]
+            result = self._run_akash(balance_cmd)
+            if result.returncode != 0:
+                raise Exception(f"Failed to query balance of {key}: {result.stderr}")
+            coins = json.loads(result.stdout).get("balances", [])
+            balances[key] = sum(int(coin["amount"]) for coin in coins if coin["denom"] == "uakt")
+        return balances
+    
+    def rebalance_signers(self, minimum_uakt: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Move uakt from the best-funded signer keys to those running low"""
+        if self.signers is None or len(self.signers.keys) < 2:
+            return []
+        minimum_uakt = minimum_uakt or settings.SIGNER_MIN_BALANCE_UAKT
+        transfers = []
+        for source, target, amount in plan_transfers(self.signer_balances(), minimum_uakt):
+            send_cmd = self.akash_cmd_base[:-1] + [source] + [
+                "tx", "bank", "send", source, self._signer_address(target), f"{amount}uakt",
+                "--yes"
+            ]
+            result = self._broadcast(send_cmd, "bank send")
+            transfers.append({"from": source, "to": target, "amount_uakt": amount,
+                              "status": "sent" if result.returncode == 0 else "error",
+                              **({"message": result.stderr} if result.returncode != 0 else {})})
+        return transfers
+    
+    def is_sunshine_ready(self, ip_address: str, web_port: int = 47990, ssh_port: int = SSH_PORT) -> bool:
+        """Check whether the Sunshine API answers on a lease"""
+        health_cmd = ssh_command(
+            ip_address, f"curl -f http://localhost:{web_port}/api/config --max-time 5",
+            ssh_port, connect_timeout=5
+        )
+        
+        health_result = self._run(health_cmd, capture_output=True, text=True)
+        return health_result.returncode == 0
+    
+    def wait_for_sunshine(self, ip_address: str, max_wait_time: int = 120, wait_interval: int = 10,
+                          web_port: int = 47990, ssh_port: int = SSH_PORT) -> bool:
+        """Poll Sunshine on a lease until it is ready or the timeout elapses"""
+        elapsed_time = 0
+        while elapsed_time < max_wait_time:
+            if self.is_sunshine_ready(ip_address, web_port, ssh_port):
+                return True
+            self._sleep(wait_interval)
+            elapsed_time += wait_interval
+        return False
+    
+    def _run_on_lease(self, ip_address: str, command: str, timeout: int = 60,
+                      ssh_port: int = SSH_PORT) -> bool:
+        """Run a management script in the lease's container over ssh"""
+        ssh_cmd = ssh_command(ip_address, command, ssh_port)
+        
+        result = self._run(ssh_cmd, capture_output=True, text=True, timeout=timeout)
         return result.returncode == 0
     
+    @staticmethod
+    def _encoder_env(encoder_profile: Optional[EncoderProfile]) -> str:
+        if encoder_profile is None:
+            return ""
+        return (f"SUNSHINE_FPS={encoder_profile.fps} "
+                f"SUNSHINE_BITRATE={encoder_profile.bitrate_kbps} "
+                f"SUNSHINE_RESOLUTION={encoder_profile.resolution} "
+                f"SUNSHINE_FEC_PERCENTAGE={encoder_profile.fec_percentage} ")
+    
+    def restart_slot(self, ip_address: str, slot_index: int,
+                     encoder_profile: Optional[EncoderProfile] = None, ssh_port: int = SSH_PORT) -> bool:
+        """(Re)start one Sunshine slot of a packed lease with a session's encoder profile"""
+        return self._run_on_lease(
+            ip_address, f"{self._encoder_env(encoder_profile)}sunshine-slot restart {slot_index}",
+            ssh_port=ssh_port
+        )
+    
+    def stop_slot(self, ip_address: str, slot_index: int, ssh_port: int = SSH_PORT) -> bool:
+        """Stop one Sunshine slot of a packed lease"""
+        return self._run_on_lease(ip_address, f"sunshine-slot stop {slot_index}", ssh_port=ssh_port)
+    
+    def reset_slot(self, ip_address: str, slot_index: int, ssh_port: int = SSH_PORT) -> bool:
+        """Stop a packed slot and wipe its player's state"""
+        return self._run_on_lease(ip_address, f"sunshine-slot reset {slot_index}", ssh_port=ssh_port)
+    
+    def reset_session(self, ip_address: str, ssh_port: int = SSH_PORT) -> bool:
+        """Wipe the player's state on a dedicated lease and restart Sunshine"""
+        return self._run_on_lease(ip_address, "sunshine-session reset", timeout=120, ssh_port=ssh_port)
+    
+    def restart_sunshine(self, ip_address: str, encoder_profile: Optional[EncoderProfile] = None,
+                         ssh_port: int = SSH_PORT) -> bool:
+        """Restart Sunshine on a dedicated lease with a session's encoder profile"""
+        return self._run_on_lease(
+            ip_address, f"{self._encoder_env(encoder_profile)}sunshine-session restart", timeout=120,
+            ssh_port=ssh_port
+        )
+    
+    def install_game(self, ip_address: str, manifest: Dict[str, Any], cache_nodes: List[str],
+                     workers: int = 16, timeout: int = 1800, ssh_port: int = SSH_PORT) -> Dict[str, Any]:
+        """Install a game on a lease from the content cache; the manifest goes over stdin"""
+        fetch_cmd = ssh_command(
+            ip_address,
+            f"game-cache-fetch --nodes {','.join(cache_nodes)} "
+            f"--dest {STEAM_LIBRARY_PATH} --workers {workers}",
+            ssh_port
+        )
+        
+        try:
+            result = self._run(fetch_cmd, input=json.dumps(manifest), capture_output=True,
+                                    text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {"status": "error", "message": "Game install timed out"}
+        
+        lines = result.stdout.strip().splitlines()
+        try:
+            report = json.loads(lines[-1]) if lines else {}
+        except json.JSONDecodeError:
+            report = {}
+        if result.returncode != 0:
+            return {"status": "error", "message": report.get("error") or result.stderr, **report}
+        return {"status": "installed", **report}
+    
+    def get_boot_report(self, ip_address: str, ssh_port: int = SSH_PORT) -> Optional[Dict[str, Any]]:
+        """Fetch the per-phase boot timings the container entrypoint recorded"""
+        ssh_cmd = ssh_command(ip_address, f"cat {BOOT_REPORT_PATH}", ssh_port)
+        
+        try:
+            result = self._run(ssh_cmd, capture_output=True, text=True, timeout=30)
+            if result.returncode != 0:
+                return None
+            return json.loads(result.stdout)
+        except (subprocess.TimeoutExpired, json.JSONDecodeError):
+            return None
+    
     def get_lease_status(self, lease_id: str) -> Optional[Dict[str, Any]]:
         """Get current lease status"""
-        status_cmd = self.akash_cmd_base + [
+        status_cmd = self._cmd_base(lease_id) + [
             "query", "deployment", "get",
             "--dseq", lease_id,
             "--output", "json"
         ]
         
-        result = subprocess.run(status_cmd, capture_output=True, text=True)
+        result = self._run_akash(status_cmd)
         if result.returncode != 0:
             return None
         
         return json.loads(result.stdout)
     
+    @tracing.traced("migrate_session")
     def migrate_session(self, current_lease_id: str, current_provider: str, 
-                       s3_bucket: str, s3_region: str = "us-east-1") -> Dict[str, Any]:
-        """Migrate session to new lease with zero downtime via S3 backup"""
+                       s3_bucket: str, s3_region: str = "us-east-1",
+                       session_id: Optional[str] = None, sdl_path: str = "sdl/sunshine.yaml",
+                       tier: Optional[str] = None, region: Optional[str] = None,
+                       checkpoint_path: Optional[str] = None) -> Dict[str, Any]:
+        """Migrate session to new lease with zero downtime via S3 backup
+
+        The new lease is created from sdl_path, the session's rendered tier manifest.
+        A session checkpointed into checkpoint_path moves through that prefix, which
+        is kept for the new lease's agent; the caller starts that agent.
+        """
         migration_id = str(uuid.uuid4())[:8]
+        session_id = session_id or current_lease_id
+        tracing.set_attributes(session_id=session_id, dseq=current_lease_id,
+                               provider=current_provider, migration_id=migration_id)
         s3_backup_path = f"s3://{s3_bucket}/session-backups/{current_lease_id}-{migration_id}"
+        # A new lease the session hasn't moved to yet is closed if the
+        # migration fails, rather than left billing
+        new_lease_id = None
+        moved = False
         
         try:
             # Step 1: Get current lease IP for SSH access
-            current_lease_status = self.get_lease_status(current_lease_id)
+            with self._phase("migrate_session", "lease_status"):
+                current_lease_status = self.get_lease_status(current_lease_id)
             if not current_lease_status:
                 return {
                     "status": "error",
@@ -236,7 +1053,10 @@ class LeaseManager:
                     "migration_id": migration_id
                 }
             
-            current_ip = current_lease_status.get("lease", {}).get("services", {}).get("sunshine", {}).get("external_ip", "")
+            # The endpoint discovered at creation; leases from before discovery fall back to the status
+            current_endpoint = self.endpoint(current_lease_id)
+            current_ip = (current_endpoint.host if current_endpoint else
+                          current_lease_status.get("lease", {}).get("services", {}).get("sunshine", {}).get("external_ip", ""))
             if not current_ip:
                 return {
                     "status": "error", 
@@ -244,24 +1064,49 @@ class LeaseManager:
                     "migration_id": migration_id
                 }
             
-            # Step 2: Backup Steam data to S3
-            backup_cmd = [
-                "ssh", "-o", "StrictHostKeyChecking=no", 
-                f"gamer@{current_ip}",
-                f"aws s3 sync /home/gamer/.steam/steam/steamapps/compatdata {s3_backup_path}/compatdata --region {s3_region} --delete"
-            ]
+            self._publish(session_id, events.MIGRATING, from_provider=current_provider,
+                          migration_id=migration_id)
             
-            backup_result = subprocess.run(backup_cmd, capture_output=True, text=True, timeout=300)
-            if backup_result.returncode != 0:
-                return {
-                    "status": "error",
-                    "message": f"Steam data backup failed: {backup_result.stderr}",
-                    "migration_id": migration_id
-                }
+            # Step 2: Backup Steam data to S3. When the session is being
+            # checkpointed in the background, only the changes since the last
+            # checkpoint are left to ship. Its agent may run in another worker,
+            # so the prefix comes from the session record.
+            if checkpoint_path:
+                s3_backup_path = checkpoint_path
+                checkpoint_agent = (self.checkpoint_manager.get(session_id)
+                                    if self.checkpoint_manager is not None else None)
+                if checkpoint_agent is None or checkpoint_agent.s3_path != checkpoint_path:
+                    checkpoint_agent = CheckpointAgent(session_id, current_ip, checkpoint_path, s3_region,
+                                                       ssh_port=self.ssh_port(current_lease_id))
+                with self._phase("migrate_session", "backup"):
+                    final_checkpoint = checkpoint_agent.checkpoint(throttled=False)
+                if final_checkpoint["status"] != "ok":
+                    return {
+                        "status": "error",
+                        "message": f"Steam data backup failed: {final_checkpoint['message']}",
+                        "migration_id": migration_id
+                    }
+            else:
+                backup_cmd = ssh_command(
+                    current_ip,
+                    f"aws s3 sync {STEAM_COMPATDATA_PATH} {s3_backup_path}/compatdata --region {s3_region} --delete",
+                    self.ssh_port(current_lease_id)
+                )
+                
+                with self._phase("migrate_session", "backup"):
+                    backup_result = self._run(backup_cmd, capture_output=True, text=True, timeout=300)
+                if backup_result.returncode != 0:
+                    return {
+                        "status": "error",
+                        "message": f"Steam data backup failed: {backup_result.stderr}",
+                        "migration_id": migration_id
+                    }
             
             # Step 3: Create new lease (hot standby)
             try:
-                new_lease = self.create_lease()
+                with self._phase("migrate_session", "provision"):
+                    new_lease = self.create_lease(sdl_path, tier=tier, region=region)
+                tracing.set_attributes(new_dseq=new_lease.lease_id, new_provider=new_lease.provider)
                 new_lease_id = new_lease.lease_id
                 new_ip = new_lease.ip_address
             except Exception as e:
@@ -274,27 +1119,11 @@ class LeaseManager:
                 }
             
             # Step 4: Wait for new lease to be ready
-            max_wait_time = 120  # 2 minutes
-            wait_interval = 10
-            elapsed_time = 0
-            
-            while elapsed_time < max_wait_time:
-                # Check if Sunshine is running on new lease
-                health_cmd = [
-                    "ssh", "-o", "StrictHostKeyChecking=no",
-                    "-o", "ConnectTimeout=5",
-                    f"gamer@{new_ip}",
-                    "curl -f http://localhost:47990/api/config --max-time 5"
-                ]
-                
-                health_result = subprocess.run(health_cmd, capture_output=True, text=True)
-                if health_result.returncode == 0:
-                    break
-                    
-                time.sleep(wait_interval)
-                elapsed_time += wait_interval
+            with self._phase("migrate_session", "ready_wait"):
+                new_lease_ready = self.wait_for_sunshine(new_ip, max_wait_time=120, wait_interval=10,
+                                                         ssh_port=new_lease.ssh_port)
             
-            if elapsed_time >= max_wait_time:
+            if not new_lease_ready:
                 # Cleanup new lease if it didn't come up
                 self.close_lease(new_lease_id)
                 return {
@@ -306,67 +1135,80 @@ class LeaseManager:
                 }
             
             # Step 5: Restore Steam data from S3 to new lease
-            restore_cmd = [
-                "ssh", "-o", "StrictHostKeyChecking=no",
-                f"gamer@{new_ip}",
-                f"aws s3 sync {s3_backup_path}/compatdata /home/gamer/.steam/steam/steamapps/compatdata --region {s3_region} --delete"
-            ]
+            restore_cmd = ssh_command(
+                new_ip,
+                f"aws s3 sync {s3_backup_path}/compatdata {STEAM_COMPATDATA_PATH} --region {s3_region} --delete",
+                new_lease.ssh_port
+            )
             
-            restore_result = subprocess.run(restore_cmd, capture_output=True, text=True, timeout=300)
+            with self._phase("migrate_session", "restore"):
+                restore_result = self._run(restore_cmd, capture_output=True, text=True, timeout=300)
             if restore_result.returncode != 0:
-                # Don't cleanup new lease yet - data might be partially restored
+                # The session stays on the old lease and the backup in S3
                 return {
                     "status": "error",
                     "message": f"Steam data restore failed: {restore_result.stderr}",
                     "migration_id": migration_id,
                     "new_lease_id": new_lease_id,
-                    "new_ip": new_ip,
+                    "new_lease_closed": self.close_lease(new_lease_id),
                     "cleanup_required": True,
                     "s3_backup_path": s3_backup_path
                 }
             
             # Step 6: Verify Steam data integrity on new lease
-            verify_cmd = [
-                "ssh", "-o", "StrictHostKeyChecking=no",
-                f"gamer@{new_ip}",
-                "find /home/gamer/.steam/steam/steamapps/compatdata -name 'pfx' -type d | wc -l"
-            ]
+            verify_cmd = ssh_command(
+                new_ip, f"find {STEAM_COMPATDATA_PATH} -name 'pfx' -type d | wc -l", new_lease.ssh_port
+            )
             
-            verify_result = subprocess.run(verify_cmd, capture_output=True, text=True)
-            if verify_result.returncode != 0:
-                return {
-                    "status": "warning",
-                    "message": "Could not verify Steam data integrity, but migration completed",
-                    "migration_id": migration_id,
-                    "old_lease_id": current_lease_id,
-                    "new_lease_id": new_lease_id,
-                    "new_ip": new_ip,
-                    "s3_backup_path": s3_backup_path
-                }
+            with self._phase("migrate_session", "verify"):
+                verify_result = self._run(verify_cmd, capture_output=True, text=True)
+            # An unverified restore still finishes the move; the caller is told with a warning
+            steam_data_verified = verify_result.returncode == 0
             
             # Step 7: Close old lease
-            old_lease_closed = self.close_lease(current_lease_id)
+            moved = True
+            with self._phase("migrate_session", "close_old"):
+                old_lease_closed = self.close_lease(current_lease_id)
             
-            # Step 8: Cleanup S3 backup (optional - keep for safety)
-            cleanup_cmd = [
-                "aws", "s3", "rm", s3_backup_path, "--recursive", "--region", s3_region
-            ]
-            subprocess.run(cleanup_cmd, capture_output=True, text=True)
+            # Step 8: Cleanup S3 backup (optional - keep for safety). A
+            # checkpoint prefix stays live: the new lease keeps checkpointing
+            # into it so the next migration is incremental too. Agents on the
+            # old lease in other workers exit once the record is repointed.
+            if checkpoint_path:
+                if self.checkpoint_manager is not None:
+                    self.checkpoint_manager.stop(session_id)
+                s3_backup_cleaned = False
+            else:
+                cleanup_cmd = [
+                    "aws", "s3", "rm", s3_backup_path, "--recursive", "--region", s3_region
+                ]
+                with self._phase("migrate_session", "cleanup"):
+                    self._run(cleanup_cmd, capture_output=True, text=True)
+                s3_backup_cleaned = True
+            
+            self._publish(session_id, events.MIGRATED, migration_id=migration_id,
+                          new_lease_id=new_lease_id, new_ip=new_ip, new_provider=new_lease.provider)
             
             return {
-                "status": "success",
-                "message": f"Session migrated successfully from {current_lease_id} to {new_lease_id}",
+                "status": "success" if steam_data_verified else "warning",
+                "message": (f"Session migrated successfully from {current_lease_id} to {new_lease_id}"
+                            if steam_data_verified else
+                            "Could not verify Steam data integrity, but migration completed"),
                 "migration_id": migration_id,
                 "old_lease_id": current_lease_id,
                 "old_lease_closed": old_lease_closed,
                 "new_lease_id": new_lease_id,
                 "new_ip": new_ip,
+                "new_port": new_lease.port,
+                "new_ports": new_lease.ports,
                 "new_provider": new_lease.provider,
-                "steam_data_verified": True,
-                "s3_backup_cleaned": True
+                "steam_data_verified": steam_data_verified,
+                "s3_backup_cleaned": s3_backup_cleaned,
+                "checkpoint_path": checkpoint_path
             }
             
         except subprocess.TimeoutExpired:
+            self._close_unused_lease(new_lease_id, moved)
             return {
                 "status": "error",
                 "message": "Migration timed out during backup/restore operation",
@@ -374,9 +1216,14 @@ class LeaseManager:
                 "cleanup_required": True
             }
         except Exception as e:
+            self._close_unused_lease(new_lease_id, moved)
             return {
                 "status": "error",
                 "message": f"Migration failed: {str(e)}",
                 "migration_id": migration_id,
                 "cleanup_required": True
-            }
\ No newline at end of file
+            }
+    
+    def _close_unused_lease(self, lease_id: Optional[str], moved: bool) -> None:
+        if lease_id is not None and not moved:
+            self.close_lease(lease_id)
\ No newline at end of file
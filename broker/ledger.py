@@ -0,0 +1,70 @@
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional
+from .state import StateStore
+
+
+class SessionLedger:
+    """What each session was charged and which leases it ran on.
+
+    Session records are deleted when a session closes. Ledger entries are
+    kept so reconciliation can compare charges against Stripe and the chain
+    after the fact.
+    """
+
+    NAMESPACE = "session_ledger"
+
+    def __init__(self, store: StateStore):
+        self.store = store
+
+    def open(
+        self,
+        session_id: str,
+        lease_id: str,
+        payment_intent_id: Optional[str],
+        amount_usd: str,
+        charged_uakt: str,
+        tier: str,
+        hours: int,
+        hedge_lease_ids: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        entry = {
+            "session_id": session_id,
+            "lease_ids": [lease_id],
+            # Raced against the session's lease and closed; never charged for
+            "hedge_lease_ids": list(hedge_lease_ids or []),
+            "payment_intent_id": payment_intent_id,
+            "charged_cents": int(Decimal(amount_usd) * 100),
+            "charged_uakt": int(charged_uakt),
+            "tier": tier,
+            "hours": hours,
+            "created_at": time.time(),
+            "closed_at": None,
+        }
+        self.store.put(self.NAMESPACE, session_id, entry)
+        return entry
+
+    def add_lease(self, session_id: str, lease_id: str) -> None:
+        """Record a lease the session moved to, e.g. after migration"""
+
+        def append(entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if entry is not None and lease_id not in entry["lease_ids"]:
+                entry["lease_ids"].append(lease_id)
+            return entry
+
+        self.store.update(self.NAMESPACE, session_id, append)
+
+    def close(self, session_id: str) -> None:
+        def mark_closed(entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if entry is not None and entry["closed_at"] is None:
+                entry["closed_at"] = time.time()
+            return entry
+
+        self.store.update(self.NAMESPACE, session_id, mark_closed)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(self.NAMESPACE, session_id)
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        for _, entry in self.store.items(self.NAMESPACE):
+            yield entry
@@ -1,14 +1,344 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Optional
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
 import uvicorn
 import asyncio
+import functools
+import hmac
+import json
+import math
+import threading
+import time
+import uuid
 from .settings import settings
 from .lease_manager import LeaseManager, LeaseInfo
 from .billing import BillingManager
+from .checkpoint import CheckpointManager
+from .admission import AdmissionController, AdmissionTicket, QueueFullError
+from .state import StateStore
+from .scheduler import Scheduler
+from .sequence import SequenceManager
+from .signers import SignerPool
+from .telemetry import TelemetryAggregator
+from .endpoints import EndpointCache, SSH_PORT, port_key
+from .market_history import MarketHistory, GROUP_COLUMNS, READY, READY_TIMEOUT
+from .health import DegradationDetector, HealthSignals, LeaseHealth, lease_status_ok, port_open
+from .sdl import SDLTemplateRegistry, SDLTemplateError, SessionTier
+from .encoder import EncoderPolicy, EncoderProfile, ClientNetwork
+from .slots import SlotAllocator, SUNSHINE_WEB_PORT
+from .recycling import LeasePool
+from .game_cache import ManifestIndex
+from .ledger import SessionLedger
+from .idempotency import IdempotencyStore, IdempotencyKeyReused, fingerprint
+from .bulk import SessionSelector, run_bulk
+from .events import EventBus, SessionEvent
+from .chain_events import ChainEventSubscriber, ChainEvent, websocket_url
+from . import chain_events as chain
+from . import bulk
+from . import events
+from . import metrics
+from . import telemetry
+from . import tracing
 
-app = FastAPI(title="Cloud Gaming Broker", version="1.0.0")
+# All session and scheduler state lives in the shared store so any number of
+# worker processes agree on what is running
+state_store = StateStore(settings.STATE_DB_PATH)
+scheduler = Scheduler(state_store)
+
+# Agents follow the shared session record, so one started here stops when
+# another worker closes or migrates its session
+checkpoint_manager = CheckpointManager(
+    session_lookup=lambda session_id: state_store.get("sessions", session_id)
+)
+# Lifecycle transitions fan out to streaming clients from this one bus
+event_bus = EventBus()
+# Deployments are spread over the signer keys, each key's txs on its own sequence
+signer_pool = SignerPool([key.strip() for key in settings.AKASH_SIGNER_KEYS.split(",") if key.strip()]
+                         or [settings.AKASH_FROM], state_store, settings.AKASH_FROM)
+# Bids and lease closures for our accounts arrive from the node as they happen; the
+# keys' addresses are looked up at startup
+chain_events = (ChainEventSubscriber(websocket_url(settings.AKASH_NODE), [])
+                if settings.CHAIN_EVENTS_ENABLED else None)
+# Txs from the broker's key draw sequences from one counter shared by all workers
+sequence_manager = (SequenceManager(state_store, settings.TX_CONFIRM_TIMEOUT_SECONDS)
+                    if settings.TX_PIPELINING_ENABLED else None)
+# Every bid and lease outcome, for placement analytics and bid ranking
+market_history = (MarketHistory(settings.MARKET_HISTORY_DIR, settings.MARKET_HISTORY_RETENTION_DAYS)
+                  if settings.MARKET_HISTORY_DIR else None)
+# Provider hostnames and forwarded ports of every lease, found once at creation
+endpoint_cache = EndpointCache(state_store)
+lease_manager = LeaseManager(checkpoint_manager=checkpoint_manager, event_bus=event_bus,
+                             chain_events=chain_events, sequences=sequence_manager,
+                             signers=signer_pool, market_history=market_history,
+                             endpoints=endpoint_cache)
+billing_manager = BillingManager()
+sdl_registry = SDLTemplateRegistry(settings.SDL_TEMPLATE_DIR, settings.SDL_TIERS_PATH,
+                                   settings.SDL_RENDER_DIR,
+                                   defaults={"ssh_authorized_key": settings.LEASE_SSH_PUBLIC_KEY})
+slot_allocator = SlotAllocator(state_store)
+lease_pool = LeasePool(state_store, settings.RECYCLE_IDLE_TTL_SECONDS)
+game_index = ManifestIndex(state_store)
+session_ledger = SessionLedger(state_store)
+# Retried POST /sessions with the same Idempotency-Key share one provisioning
+idempotency_store = IdempotencyStore(state_store, settings.IDEMPOTENCY_TTL_SECONDS,
+                                     settings.IDEMPOTENCY_MAX_ENTRIES,
+                                     settings.IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS)
+# Stream-quality samples from lease agents and Moonlight clients, per worker
+telemetry_aggregator = TelemetryAggregator(settings.TELEMETRY_SESSION_SAMPLES,
+                                           settings.TELEMETRY_PROVIDER_SAMPLES,
+                                           settings.TELEMETRY_MAX_SESSIONS)
+# Sessions on failing leases are moved before the player gives up; the
+# detector's scores live on whichever worker runs the scan
+degradation_detector = DegradationDetector(settings.HEALTH_DEGRADED_SCORE, settings.HEALTH_RECOVERED_SCORE,
+                                           settings.AUTO_MIGRATION_MAX_CONCURRENT,
+                                           settings.AUTO_MIGRATION_MAX_PER_PROVIDER,
+                                           settings.AUTO_MIGRATION_RETRY_SECONDS)
+migration_executor = ThreadPoolExecutor(max_workers=settings.AUTO_MIGRATION_MAX_CONCURRENT,
+                                        thread_name_prefix="auto-migrate")
+# Scans run here rather than on the scheduler thread, one at a time
+health_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="degradation-scan")
+degradation_scan_running = threading.Lock()
+cache_nodes = [node.strip().rstrip("/") for node in settings.GAME_CACHE_NODES.split(",") if node.strip()]
+encoder_policy = (EncoderPolicy.from_file(settings.ENCODER_POLICY_PATH)
+                  if settings.ENCODER_POLICY_PATH else EncoderPolicy())
+
+# Admission limits are configured broker-wide and split across workers
+admission_controller = AdmissionController(
+    max_concurrent=max(1, math.ceil(settings.ADMISSION_MAX_CONCURRENT_PROVISIONS / settings.API_WORKERS)),
+    max_queue=max(1, math.ceil(settings.ADMISSION_MAX_QUEUE / settings.API_WORKERS)),
+    initial_provision_seconds=settings.ADMISSION_INITIAL_PROVISION_SECONDS
+)
+
+metrics.ACTIVE_SESSIONS.set_function(lambda: state_store.count("sessions"))
+metrics.QUEUE_DEPTH.set_function(lambda: admission_controller.queued, "admission")
+# Queued requests are answered with 202 and provisioned by these tasks
+queued_provisions: set = set()
+
+def sessions_by_lease(sessions) -> Dict[str, list]:
+    grouped: Dict[str, list] = {}
+    for session in sessions:
+        grouped.setdefault(session["lease_id"], []).append(session)
+    return grouped
+
+def extend_lease_of_sessions(lease_id: str, sessions: list, **options: Any) -> Dict[str, Any]:
+    """Top up a lease if it is low and tell each of its sessions"""
+    result = lease_manager.extend_if_needed(lease_id, sessions[0]["provider"], **options)
+    degradation_detector.note_escrow(lease_id, result.get("blocks_remaining"))
+    if result.get("extended"):
+        for session in sessions:
+            event_bus.publish(session["session_id"], events.EXTENDED,
+                              deposit_amount=result.get("deposit_amount"), tx_hash=result.get("tx_hash"))
+    return result
+
+def extension_sweep() -> None:
+    """Top up every active lease that is running low on escrow"""
+    # Packed leases carry several sessions but are only extended once
+    grouped = sessions_by_lease(session for _, session in state_store.items("sessions"))
+    if not grouped:
+        return
+    try:
+        remaining = lease_manager.blocks_remaining_by_lease()
+    except Exception:
+        # Each lease falls back to querying its own escrow
+        remaining = {}
+    for lease_id, sessions in grouped.items():
+        extend_lease_of_sessions(lease_id, sessions, blocks_remaining=remaining.get(lease_id))
+
+scheduler.register("extension_sweep", settings.EXTENSION_SWEEP_INTERVAL_SECONDS, extension_sweep)
+scheduler.register("event_log_prune", 600,
+                   lambda: state_store.prune_events(settings.EVENT_LOG_RETENTION_SECONDS))
+scheduler.register("idempotency_trim", 600, idempotency_store.trim)
+if market_history is not None:
+    scheduler.register("market_history_prune", 3600, market_history.prune)
+if sequence_manager is not None:
+    scheduler.register("tx_confirmation", settings.TX_CONFIRM_INTERVAL_SECONDS,
+                       lease_manager.confirm_transactions)
+if len(signer_pool.keys) > 1:
+    scheduler.register("signer_rebalance", settings.SIGNER_REBALANCE_INTERVAL_SECONDS,
+                       lease_manager.rebalance_signers)
+
+def probe_lease(lease_id: str, session: Dict[str, Any]) -> HealthSignals:
+    # The port players connect to, as the provider forwards it; no ssh round trip
+    if port_open(session["host"], session.get("port", settings.SUNSHINE_PORT),
+                 settings.HEALTH_PROBE_TIMEOUT_SECONDS):
+        return HealthSignals(probe_ok=True)
+    # Only a failing lease is worth a chain query
+    return HealthSignals(probe_ok=False, status_ok=lease_status_ok(lease_manager.get_lease_status(lease_id)))
+
+def auto_migrate(lease: LeaseHealth) -> None:
+    with tracing.span("auto_migrate", session_id=lease.session_id, dseq=lease.lease_id,
+                      provider=lease.provider, score=round(lease.score, 3)):
+        try:
+            result = migrate_session_lease(lease.session_id)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+    migrated = result["status"] in ("success", "warning")
+    metrics.AUTO_MIGRATIONS.labels("migrated" if migrated else "failed").inc()
+    degradation_detector.finish(lease.lease_id, migrated)
+
+def degradation_scan() -> Dict[str, int]:
+    """Probe every dedicated session's lease, rescore them and start the migrations the budget allows"""
+    now = time.time()
+    # Packed sessions share their lease and aren't migrated; new leases may still be booting
+    leases = {session["lease_id"]: session for _, session in state_store.items("sessions")
+              if "slot_index" not in session and session.get("host")
+              and now - session.get("created_at", now) >= settings.HEALTH_GRACE_SECONDS}
+    with ThreadPoolExecutor(max_workers=settings.HEALTH_PROBE_CONCURRENCY) as pool:
+        probes = pool.map(tracing.wrap(probe_lease), list(leases), list(leases.values()))
+        observations = {lease_id: (session["provider"], session["session_id"], signals)
+                        for (lease_id, session), signals in zip(leases.items(), probes)}
+    
+    degradation_detector.update(observations)
+    metrics.DEGRADED_LEASES.set(len(degradation_detector.status()["degraded"]))
+    started = degradation_detector.select_migrations() if settings.AUTO_MIGRATION_ENABLED else []
+    for lease in started:
+        migration_executor.submit(tracing.wrap(auto_migrate), lease)
+    return {"probed": len(leases), "migrations_started": len(started)}
+
+def start_degradation_scan() -> bool:
+    """Hand the scan to its own thread so probes timing out never delay extension_sweep"""
+    # A scan still probing when the next is due is not doubled up
+    if not degradation_scan_running.acquire(blocking=False):
+        return False
+    def run() -> None:
+        try:
+            degradation_scan()
+        finally:
+            degradation_scan_running.release()
+    health_executor.submit(tracing.wrap(run))
+    return True
+
+scheduler.register("degradation_scan", settings.HEALTH_SCAN_INTERVAL_SECONDS, start_degradation_scan)
+
+def reap_idle_leases() -> None:
+    """Close recycled and empty packed leases that have sat idle past the TTL"""
+    lease_pool.reap(lease_manager.close_lease)
+    slot_allocator.reap(settings.RECYCLE_IDLE_TTL_SECONDS, lease_manager.close_lease)
+
+scheduler.register("lease_reaper", 60, reap_idle_leases)
+
+def collect_boot_report(session_id: str, host: str, ssh_port: int = SSH_PORT) -> Optional[Dict[str, Any]]:
+    """Record the container's per-phase boot timings for a freshly booted lease"""
+    with tracing.span("create_session.boot_report", session_id=session_id) as span:
+        report = lease_manager.get_boot_report(host, ssh_port)
+        if report is None:
+            return None
+        span.set_attributes(boot_status=report.get("status"), boot_seconds=report.get("total_seconds"))
+        for phase in report.get("phases", []):
+            # Unknown names would add unbounded label values
+            if phase.get("phase") not in metrics.BOOT_PHASES:
+                continue
+            span.set_attribute(f"boot_{phase['phase']}_seconds", phase["seconds"])
+            if phase.get("status") == "ok":
+                metrics.BOOT_PHASE_SECONDS.labels(phase["phase"]).observe(phase["seconds"])
+    
+    state_store.update("sessions", session_id,
+                       lambda session: {**session, "boot_report": report} if session else session)
+    return report
+
+def watch_readiness(session_id: str, host: str, web_port: int = SUNSHINE_WEB_PORT,
+                    new_lease: bool = False, ssh_port: int = SSH_PORT) -> None:
+    """Tell streaming clients when Sunshine starts accepting connections"""
+    with tracing.span("create_session.ready_wait", session_id=session_id):
+        ready = lease_manager.wait_for_sunshine(host, web_port=web_port, ssh_port=ssh_port)
+    if new_lease:
+        record_lease_outcome(session_id, READY if ready else READY_TIMEOUT)
+    if ready:
+        # Reused leases and packed slots did not run the entrypoint for this session
+        boot_report = collect_boot_report(session_id, host, ssh_port) if new_lease else None
+        event_bus.publish(session_id, events.SUNSHINE_READY, host=host, boot_report=boot_report)
+    else:
+        event_bus.publish(session_id, events.READY_TIMEOUT, host=host)
+
+def record_lease_outcome(session_id: str, outcome: str) -> None:
+    """Add a new lease's time to ready, or its timeout, to the market history"""
+    session = state_store.get("sessions", session_id)
+    if market_history is None or session is None:
+        return
+    try:
+        market_history.record_lease(session["provider"], outcome,
+                                    ready_seconds=time.time() - session["created_at"] if outcome == READY else None,
+                                    tier=session.get("tier", ""), region=session.get("region") or "")
+    except OSError as e:
+        tracing.set_attributes(market_history_error=str(e))
+
+def install_game(session_id: str, host: str, app_id: str, ssh_port: int = SSH_PORT) -> None:
+    """Pull a game onto the lease from the content cache while Sunshine boots"""
+    manifest = game_index.get(app_id)
+    if manifest is None or not cache_nodes:
+        return
+    
+    with tracing.span("create_session.game_install", session_id=session_id, app_id=app_id) as span:
+        result = lease_manager.install_game(host, manifest.to_dict(), cache_nodes,
+                                            workers=settings.GAME_CACHE_FETCH_WORKERS, ssh_port=ssh_port)
+        span.set_attributes(**{key: value for key, value in result.items()
+                               if key in ("status", "bytes_downloaded", "seconds")})
+        if result["status"] != "installed":
+            span.set_error(result.get("message", ""))
+    
+    if result["status"] == "installed":
+        event_bus.publish(session_id, events.GAME_INSTALLED, app_id=app_id,
+                          seconds=result.get("seconds"), bytes_downloaded=result.get("bytes_downloaded"))
+    else:
+        event_bus.publish(session_id, events.GAME_INSTALL_FAILED, app_id=app_id,
+                          message=result.get("message"))
+
+def handle_chain_event(event: ChainEvent) -> None:
+    """Fail sessions whose lease was closed by its provider or by the chain"""
+    if event.action not in (chain.LEASE_CLOSED, chain.DEPLOYMENT_CLOSED):
+        return
+    if event.sender and event.sender in lease_manager.owner_addresses():
+        # Our own close_session, migration or reaper
+        return
+    
+    signer_pool.release(event.dseq)
+    endpoint_cache.forget(event.dseq)
+    lease_pool.discard(event.dseq)
+    slot_allocator.remove_lease(event.dseq)
+    for session_id, session in list(state_store.items("sessions")):
+        if session.get("lease_id") != event.dseq:
+            continue
+        # Only the worker that wins the delete reports the failure
+        if state_store.delete("sessions", session_id):
+            checkpoint_manager.stop(session_id)
+            session_ledger.close(session_id)
+            event_bus.publish(session_id, events.FAILED, reason="lease_closed",
+                              lease_id=event.dseq, provider=event.provider)
+
+if chain_events is not None:
+    chain_events.add_listener(handle_chain_event)
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Fail startup on a broken template rather than on the first session
+    sdl_registry.load()
+    event_bus.attach_loop(asyncio.get_running_loop())
+    event_bus.attach_store(state_store)
+    if settings.API_WORKERS > 1:
+        # A scrape lands on one worker; the others' metrics come from the store
+        metrics.registry.attach_store(state_store, settings.METRICS_PUBLISH_INTERVAL_SECONDS)
+    scheduler.start()
+    if chain_events is not None:
+        chain_events.owners = lease_manager.owner_addresses()
+        chain_events.start()
+    yield
+    if chain_events is not None:
+        chain_events.stop()
+    scheduler.stop()
+    # Export spans still queued in the batch processor before the worker exits
+    tracing.tracer.shutdown()
+    migration_executor.shutdown(wait=False)
+    health_executor.shutdown(wait=False)
+    event_bus.stop()
+    metrics.registry.stop()
+    checkpoint_manager.stop_all()
+
+app = FastAPI(title="Cloud Gaming Broker", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,91 +348,770 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-lease_manager = LeaseManager()
-billing_manager = BillingManager()
+class NetworkMeasurements(BaseModel):
+    downlink_kbps: float = Field(gt=0)
+    rtt_ms: float = Field(default=0.0, ge=0)
+    loss_percent: float = Field(default=0.0, ge=0, le=100)
 
 class SessionRequest(BaseModel):
     hours: int = 1
     payment_method: str = "stripe"
+    tier: str = settings.DEFAULT_SESSION_TIER
+    region: Optional[str] = None
+    network: Optional[NetworkMeasurements] = None
+    app_id: Optional[str] = None
 
 class SessionResponse(BaseModel):
     session_id: str
     moonlight_host: str
     moonlight_port: int
+    # External port for each of the lease's Sunshine "port/proto", as forwarded by the provider
+    moonlight_ports: Optional[Dict[str, int]] = None
     status: str
     expires_at: Optional[str] = None
     payment_info: Optional[Dict] = None
+    queue_position: Optional[int] = None
+    queue_wait_seconds: Optional[float] = None
+    tier: Optional[str] = None
+    encoder_profile: Optional[Dict] = None
 
-@app.post("/sessions", response_model=SessionResponse)
-async def create_session(request: SessionRequest, background_tasks: BackgroundTasks):
-    """Create a new cloud gaming session"""
-    try:
-        # Estimate cost
-        cost_estimate = billing_manager.estimate_session_cost(request.hours)
-        
-        # Create payment intent
-        payment_info = billing_manager.create_payment_intent(request.hours)
-        
-        # Create Akash lease
-        lease_info = lease_manager.create_lease()
-        
-        # In production, would wait for payment confirmation
-        # For now, simulate immediate success
+class QueuedSessionResponse(BaseModel):
+    ticket_id: str
+    status: str = "queued"
+    queue_position: int
+    estimated_wait_seconds: float
+
+class TelemetryBatch(BaseModel):
+    source: str = "agent"
+    # Values per signal, oldest first
+    samples: Dict[str, List[float]]
+
+def client_endpoint(lease_id: str, host: str, port: int, web_port: int) -> Dict[str, Any]:
+    """Host, Moonlight port and forwarded ports a client uses for one Sunshine instance on a lease.
+    
+    web_port stays the container port in the session: readiness probes
+    reach it from inside the container.
+    """
+    endpoint = lease_manager.endpoint(lease_id)
+    if endpoint is None:
+        return {"host": host, "port": port, "ports": {}}
+    instance_ports = {port_key(port), port_key(port + settings.SUNSHINE_UDP_PORT - settings.SUNSHINE_PORT, "udp"),
+                      port_key(web_port)}
+    return {"host": endpoint.host, "port": endpoint.external_port(port),
+            "ports": {key: external for key, external in endpoint.ports.items() if key in instance_ports}}
+
+def place_on_packed_lease(request: SessionRequest, tier: SessionTier,
+                          encoder_profile: EncoderProfile) -> Dict[str, Any]:
+    """Give a session a free slot on a shared lease, creating a lease only when the pool is full"""
+    pool = slot_allocator.pool_key(tier.name, request.region or tier.region)
+    session_id = uuid.uuid4().hex[:12]
+    
+    with tracing.span("create_session.slot_claim", pool=pool):
+        assignment = slot_allocator.claim(pool, session_id)
+    if assignment is not None:
+        # The slot's Sunshine restarts with this player's encoder profile
+        if not lease_manager.restart_slot(assignment.host, assignment.slot_index, encoder_profile,
+                                          ssh_port=lease_manager.ssh_port(assignment.lease_id)):
+            slot_allocator.release(assignment.lease_id, assignment.slot_index)
+            raise Exception(f"Failed to start Sunshine slot {assignment.slot_index} on lease {assignment.lease_id}")
+    else:
+        sdl_path = sdl_registry.render(tier.name, region=request.region,
+                                       **encoder_profile.sdl_parameters())
+        lease_info = lease_manager.create_lease(sdl_path, tier=tier.name, region=request.region or tier.region,
+                                                session_id=session_id)
+        assignment = slot_allocator.add_lease(pool, lease_info.lease_id, lease_info.provider,
+                                              lease_info.ip_address, tier.slot_count, session_id)
+    
+    event_bus.publish(session_id, events.SLOT_ASSIGNED, lease_id=assignment.lease_id,
+                      slot=assignment.slot_index, new_lease=assignment.new_lease)
+    return {
+        "session_id": session_id,
+        "lease_id": assignment.lease_id,
+        "provider": assignment.provider,
+        **client_endpoint(assignment.lease_id, assignment.host, assignment.port, assignment.web_port),
+        "web_port": assignment.web_port,
+        "slot_index": assignment.slot_index,
+        "pool": pool,
+        "new_lease": assignment.new_lease
+    }
+
+def place_on_dedicated_lease(request: SessionRequest, tier: SessionTier,
+                             encoder_profile: EncoderProfile) -> Dict[str, Any]:
+    """Reuse an idle recycled lease for the tier if there is one, otherwise create a lease"""
+    pool = slot_allocator.pool_key(tier.name, request.region or tier.region)
+    
+    if settings.LEASE_RECYCLING_ENABLED:
+        with tracing.span("create_session.recycled_lease", pool=pool) as span:
+            recycled = lease_pool.acquire(pool)
+            while recycled and not lease_manager.restart_sunshine(
+                    recycled["host"], encoder_profile, ssh_port=lease_manager.ssh_port(recycled["lease_id"])):
+                # Unhealthy container: give up on it rather than hand it out
+                lease_manager.close_lease(recycled["lease_id"])
+                recycled = lease_pool.acquire(pool)
+            span.set_attributes(reused=recycled is not None)
         
-        return SessionResponse(
-            session_id=lease_info.lease_id,
-            moonlight_host=lease_info.ip_address,
-            moonlight_port=lease_info.port,
-            status="provisioning",
-            payment_info={
-                "client_secret": payment_info["client_secret"],
-                "estimated_cost": cost_estimate
+        if recycled:
+            # A fresh id keeps the new player's events and checkpoints
+            # apart from the previous player's on the same lease
+            session_id = uuid.uuid4().hex[:12]
+            event_bus.publish(session_id, events.LEASE_REUSED, lease_id=recycled["lease_id"],
+                              provider=recycled["provider"])
+            return {
+                "session_id": session_id,
+                "lease_id": recycled["lease_id"],
+                "provider": recycled["provider"],
+                **client_endpoint(recycled["lease_id"], recycled["host"], settings.SUNSHINE_PORT, SUNSHINE_WEB_PORT),
+                "web_port": SUNSHINE_WEB_PORT,
+                "pool": pool,
+                "new_lease": False
             }
-        )
     
+    # Create Akash lease sized for the requested tier
+    sdl_path = sdl_registry.render(request.tier, region=request.region,
+                                   **encoder_profile.sdl_parameters())
+    if tier.hedged:
+        # Latency-sensitive tiers race several providers to a ready Sunshine
+        lease_info = lease_manager.create_hedged_lease(sdl_path, tier.hedge_count, tier=tier.name,
+                                                       region=request.region or tier.region)
+    else:
+        lease_info = lease_manager.create_lease(sdl_path, tier=tier.name, region=request.region or tier.region)
+    return {
+        "session_id": lease_info.lease_id,
+        "lease_id": lease_info.lease_id,
+        "provider": lease_info.provider,
+        "host": lease_info.ip_address,
+        "port": lease_info.port,
+        "ports": lease_info.ports,
+        "web_port": SUNSHINE_WEB_PORT,
+        "pool": pool,
+        "new_lease": True,
+        "hedge_lease_ids": lease_info.hedge_lease_ids
+    }
+
+def recycle_lease(session: Dict[str, Any]) -> bool:
+    """Reset a dedicated lease for the next player if enough escrow remains"""
+    if not settings.LEASE_RECYCLING_ENABLED or "pool" not in session:
+        return False
+    
+    with tracing.span("close_session.recycle", dseq=session["lease_id"]) as span:
+        blocks_remaining = lease_manager.get_lease_blocks_remaining(session["lease_id"])
+        span.set_attributes(blocks_remaining=blocks_remaining)
+        if blocks_remaining is None or blocks_remaining < settings.RECYCLE_MIN_BLOCKS_REMAINING:
+            return False
+        if not lease_manager.reset_session(session["host"], ssh_port=lease_manager.ssh_port(session["lease_id"])):
+            return False
+    
+    lease_pool.release(session["pool"], session["lease_id"], session["provider"], session["host"])
+    return True
+
+def provision_session(request: SessionRequest, ticket: AdmissionTicket) -> SessionResponse:
+    """Payment intent, lease and bookkeeping for an admitted session request"""
+    # Estimate cost
+    cost_estimate = billing_manager.estimate_session_cost(request.hours)
+    
+    # Create payment intent
+    with tracing.span("create_session.payment_intent"):
+        payment_info = billing_manager.create_payment_intent(request.hours)
+    
+    # Pick encoder settings for the client's link; they reach Sunshine
+    # through the deployment's env when the container starts
+    network = None
+    if request.network:
+        network = ClientNetwork(downlink_kbps=request.network.downlink_kbps,
+                                rtt_ms=request.network.rtt_ms,
+                                loss_percent=request.network.loss_percent)
+    encoder_profile = encoder_policy.select(network)
+    tracing.set_attributes(encoder_bitrate_kbps=encoder_profile.bitrate_kbps,
+                           encoder_resolution=encoder_profile.resolution)
+    
+    tier = sdl_registry.get_tier(request.tier)
+    if tier.packed:
+        placement = place_on_packed_lease(request, tier, encoder_profile)
+    else:
+        placement = place_on_dedicated_lease(request, tier, encoder_profile)
+    tracing.set_attributes(session_id=placement["session_id"], dseq=placement["lease_id"],
+                           provider=placement["provider"])
+    
+    state_store.put("sessions", placement["session_id"], {
+        **placement,
+        "hours": request.hours,
+        "tier": request.tier,
+        "region": request.region or tier.region,
+        "app_id": request.app_id,
+        "encoder_profile": encoder_profile.to_dict(),
+        "payment_intent_id": payment_info.get("payment_intent_id"),
+        # Any worker migrating or closing the session ships save data here
+        "checkpoint_path": (checkpoint_manager.checkpoint_path(placement["session_id"])
+                            if checkpoint_manager.enabled and not tier.packed else None),
+        "created_at": time.time()
+    })
+    session_ledger.open(placement["session_id"], placement["lease_id"],
+                        payment_info.get("payment_intent_id"), payment_info.get("amount_usd", "0"),
+                        cost_estimate["uakt_cost"], request.tier, request.hours,
+                        hedge_lease_ids=placement.get("hedge_lease_ids"))
+    
+    # Ship save data off the lease continuously so migration and crash
+    # recovery only have to move the last few seconds of changes. Packed
+    # slots share one save-data directory, so they are not checkpointed.
+    if not tier.packed:
+        checkpoint_manager.start(placement["session_id"], placement["host"],
+                                 ssh_port=lease_manager.ssh_port(placement["lease_id"]),
+                                 lease_id=placement["lease_id"])
+    
+    # In production, would wait for payment confirmation
+    # For now, simulate immediate success
+    
+    return SessionResponse(
+        session_id=placement["session_id"],
+        moonlight_host=placement["host"],
+        moonlight_port=placement["port"],
+        moonlight_ports=placement["ports"],
+        status="provisioning",
+        payment_info={
+            "client_secret": payment_info["client_secret"],
+            "estimated_cost": cost_estimate
+        },
+        queue_position=ticket.queue_position,
+        queue_wait_seconds=round(ticket.queue_wait_seconds, 3),
+        tier=request.tier,
+        encoder_profile=encoder_profile.to_dict()
+    )
+
+@app.post("/sessions", response_model=SessionResponse,
+          responses={202: {"model": QueuedSessionResponse}})
+@tracing.traced("create_session")
+async def create_session(request: SessionRequest, background_tasks: BackgroundTasks, response: Response,
+                         idempotency_key: Optional[str] = Header(default=None, max_length=255)):
+    """Create a new cloud gaming session, or queue it and answer 202 with its place in line"""
+    if idempotency_key is None:
+        result = await admit_and_provision(request, background_tasks)
+        return queued_response(result.model_dump()) if isinstance(result, QueuedSessionResponse) else result
+    
+    tracing.set_attributes(idempotency_key=idempotency_key)
+    
+    async def provision_once() -> Dict[str, Any]:
+        # Readiness and install tasks ride on the request that provisioned
+        session = await admit_and_provision(request, background_tasks)
+        return session.model_dump()
+    
+    try:
+        result, replayed = await idempotency_store.run(
+            idempotency_key, fingerprint(request.model_dump()), provision_once
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    tracing.set_attributes(idempotent_replay=replayed)
+    headers = {"Idempotent-Replayed": "true"} if replayed else {}
+    if "ticket_id" in result:
+        return queued_response(result, headers)
+    response.headers.update(headers)
+    return result
+
+def queued_response(ticket: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(status_code=202, content=ticket,
+                        headers={"Location": f"/admission/{ticket['ticket_id']}", **(headers or {})})
+
+def queued_status(position: int) -> Dict[str, Any]:
+    return {"status": "queued", "queue_position": position,
+            "estimated_wait_seconds": round(admission_controller.estimate_wait(position), 1)}
+
+def publish_queue_positions() -> None:
+    """Record where each request queued on this worker now stands"""
+    for position, ticket in enumerate(admission_controller.waiting()):
+        state_store.put("admission_tickets", ticket.ticket_id, queued_status(position),
+                        ttl=settings.IDEMPOTENCY_TTL_SECONDS)
+
+async def provision_queued(request: SessionRequest, ticket: AdmissionTicket) -> None:
+    """Provision a queued request once admitted and record the outcome under its ticket"""
+    background_tasks = BackgroundTasks()
+    try:
+        await admission_controller.wait(ticket)
+        session = await provision_admitted(request, ticket, background_tasks)
+        outcome = {"status": "provisioned", "session": session.model_dump()}
+    except HTTPException as e:
+        outcome = {"status": "failed", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        outcome = {"status": "failed", "status_code": 500, "detail": str(e)}
+    state_store.put("admission_tickets", ticket.ticket_id, outcome, ttl=settings.IDEMPOTENCY_TTL_SECONDS)
+    await background_tasks()
+
+async def provision_admitted(request: SessionRequest, ticket: AdmissionTicket,
+                             background_tasks: BackgroundTasks) -> SessionResponse:
+    """Provision with an admitted ticket and queue the post-provision tasks"""
+    try:
+        response = await run_in_threadpool(provision_session, request, ticket)
+    except SDLTemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        admission_controller.release(ticket)
+        publish_queue_positions()
+    
+    session = state_store.get("sessions", response.session_id)
+    ssh_port = lease_manager.ssh_port(session["lease_id"])
+    background_tasks.add_task(
+        run_in_threadpool, tracing.wrap(watch_readiness),
+        response.session_id, response.moonlight_host, session["web_port"],
+        session.get("new_lease", False), ssh_port
+    )
+    if request.app_id:
+        background_tasks.add_task(
+            run_in_threadpool, tracing.wrap(install_game),
+            response.session_id, response.moonlight_host, request.app_id, ssh_port
+        )
+    return response
+
+async def admit_and_provision(request: SessionRequest, background_tasks: BackgroundTasks):
+    """Admission, provisioning and post-provision tasks for one session request.
+
+    Returns the session when a provisioning slot was free; otherwise the
+    request is queued, provisioned in the background, and its ticket returned.
+    """
+    tracing.set_attributes(hours=request.hours, payment_method=request.payment_method,
+                           tier=request.tier)
+    
+    # Reject unknown tiers and malformed regions before taking a provisioning
+    # slot, let alone creating a payment intent
+    try:
+        sdl_registry.get_tier(request.tier)
+        sdl_registry.validate_overrides(region=request.region)
+    except SDLTemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Take a provisioning slot so concurrent requests don't flood the market
+    # with deployments that will never receive bids
+    with tracing.span("create_session.admission") as span:
+        try:
+            ticket = admission_controller.reserve()
+        except QueueFullError as e:
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "message": str(e),
+                    "queue_depth": e.queue_depth,
+                    "estimated_wait_seconds": round(e.estimated_wait_seconds, 1)
+                },
+                headers={"Retry-After": str(max(1, math.ceil(e.estimated_wait_seconds)))}
+            )
+        span.set_attributes(queue_position=ticket.queue_position,
+                            queued=ticket.admitted_at is None)
+    
+    if ticket.admitted_at is not None:
+        return await provision_admitted(request, ticket, background_tasks)
+    
+    # Don't hold the request open for the whole wait: the client polls
+    # GET /admission/{ticket_id} for its position, ETA and finally the session
+    state_store.put("admission_tickets", ticket.ticket_id,
+                    queued_status(ticket.queue_position), ttl=settings.IDEMPOTENCY_TTL_SECONDS)
+    task = asyncio.create_task(provision_queued(request, ticket))
+    queued_provisions.add(task)
+    task.add_done_callback(queued_provisions.discard)
+    return QueuedSessionResponse(ticket_id=ticket.ticket_id, queue_position=ticket.queue_position,
+                                 estimated_wait_seconds=round(ticket.estimated_wait_seconds, 1))
+
+@app.get("/admission")
+async def admission_status():
+    """Provisioning queue status and the expected wait for a new request"""
+    return admission_controller.status()
+
+@app.get("/admission/{ticket_id}")
+async def queued_request_status(ticket_id: str):
+    """Place in line and ETA of a queued session request, then its session or error"""
+    status = state_store.get("admission_tickets", ticket_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return {"ticket_id": ticket_id, **status}
 
 @app.get("/sessions/{session_id}")
 async def get_session(session_id: str):
     """Get session status"""
     try:
-        status = lease_manager.get_lease_status(session_id)
+        session = state_store.get("sessions", session_id)
+        lease_id = session["lease_id"] if session else session_id
+        status = lease_manager.get_lease_status(lease_id)
         if not status:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        return {"session_id": session_id, "status": status}
+        return {
+            "session_id": session_id,
+            "status": status,
+            "session": session
+        }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def end_session(session_id: str) -> bool:
+    """Free a session's slot or lease and drop its record; False if the lease could not be closed"""
+    session = state_store.get("sessions", session_id) or {}
+    lease_id = session.get("lease_id", session_id)
+    tracing.set_attributes(session_id=session_id, dseq=lease_id)
+    
+    if "slot_index" in session:
+        # Packed lease: wipe and free the slot. An empty lease stays up
+        # for new players until the reaper closes it after the idle TTL.
+        # A slot that couldn't be wiped is retired instead of freed.
+        reset = lease_manager.reset_slot(session["host"], session["slot_index"],
+                                         ssh_port=lease_manager.ssh_port(lease_id))
+        remaining = slot_allocator.release(lease_id, session["slot_index"], retire=not reset)
+        if not remaining and (not reset or not settings.LEASE_RECYCLING_ENABLED):
+            slot_allocator.remove_lease(lease_id)
+            lease_manager.close_lease(lease_id)
+    else:
+        # Flush the last changes before the player's state is wiped or
+        # the lease goes away
+        checkpoint_manager.stop(session_id, final_checkpoint=True, host=session.get("host"),
+                                s3_path=session.get("checkpoint_path"),
+                                ssh_port=lease_manager.ssh_port(lease_id))
+        if not recycle_lease(session) and not lease_manager.close_lease(lease_id):
+            return False
+    
+    state_store.delete("sessions", session_id)
+    session_ledger.close(session_id)
+    telemetry_aggregator.forget(session_id)
+    event_bus.publish(session_id, events.CLOSED)
+    return True
+
+def migrate_session_lease(session_id: str) -> Dict[str, Any]:
+    """Move a dedicated session to a new lease and point its record there"""
+    session = state_store.get("sessions", session_id)
+    if session is None:
+        return {"status": "error", "message": "Session not found"}
+    if "slot_index" in session:
+        return {"status": "skipped", "message": "Packed sessions share their lease and are not migrated"}
+    if not settings.CHECKPOINT_S3_BUCKET:
+        return {"status": "error", "message": "No checkpoint bucket configured to carry save data"}
+    
+    # The new lease gets the manifest the session was provisioned with
+    tier = session.get("tier") or settings.DEFAULT_SESSION_TIER
+    region = session.get("region") or None
+    encoder_profile = session.get("encoder_profile")
+    sdl_path = sdl_registry.render(tier, region=region,
+                                   **(EncoderProfile(**encoder_profile).sdl_parameters() if encoder_profile else {}))
+    
+    # Claim the session so a second migration (another worker, a bulk run, the
+    # degradation scan) can't lease a second replacement for the same lease
+    old_lease_id = session["lease_id"]
+    claimed = False
+    def claim(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        nonlocal claimed
+        if current is None or current.get("lease_id") != old_lease_id:
+            return current
+        if time.time() - current.get("migrating", 0) < settings.MIGRATION_CLAIM_TTL_SECONDS:
+            return current
+        current["migrating"] = time.time()
+        claimed = True
+        return current
+    
+    state_store.update("sessions", session_id, claim)
+    if not claimed:
+        return {"status": "error", "message": "Session is already being migrated"}
+    
+    def release(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if current is not None:
+            current.pop("migrating", None)
+        return current
+    
+    try:
+        result = lease_manager.migrate_session(old_lease_id, session["provider"],
+                                               settings.CHECKPOINT_S3_BUCKET, settings.CHECKPOINT_S3_REGION,
+                                               session_id=session_id, sdl_path=sdl_path, tier=tier, region=region,
+                                               checkpoint_path=session.get("checkpoint_path"))
+    except Exception:
+        state_store.update("sessions", session_id, release)
+        raise
+    if result["status"] not in ("success", "warning"):
+        state_store.update("sessions", session_id, release)
+        return result
+    
+    repointed = False
+    def repoint(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        nonlocal repointed
+        # The session was closed or moved elsewhere while this migration ran
+        if current is None or current.get("lease_id") != old_lease_id:
+            return current
+        current.pop("migrating", None)
+        current.update(lease_id=result["new_lease_id"], host=result["new_ip"],
+                       port=result.get("new_port", current.get("port")),
+                       ports=result.get("new_ports", {}),
+                       provider=result.get("new_provider", current["provider"]))
+        repointed = True
+        return current
+    
+    session = state_store.update("sessions", session_id, repoint)
+    if not repointed:
+        lease_manager.close_lease(result["new_lease_id"])
+        return {"status": "error", "message": "Session closed or moved while migrating; new lease closed",
+                "migration_id": result.get("migration_id"), "new_lease_closed": True}
+    session_ledger.add_lease(session_id, result["new_lease_id"])
+    # Checkpointing resumes on the new lease into the same prefix
+    if session.get("checkpoint_path"):
+        checkpoint_manager.start(session_id, session["host"], s3_path=session["checkpoint_path"],
+                                 ssh_port=lease_manager.ssh_port(session["lease_id"]),
+                                 lease_id=session["lease_id"])
+    return result
+
 @app.delete("/sessions/{session_id}")
+@tracing.traced("close_session")
 async def close_session(session_id: str):
     """Close a gaming session"""
     try:
-        success = lease_manager.close_lease(session_id)
-        if not success:
+        if not await run_in_threadpool(end_session, session_id):
             raise HTTPException(status_code=404, detail="Session not found")
-        
         return {"message": "Session closed successfully"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def require_admin(authorization: Optional[str] = Header(default=None)) -> None:
+    """Admin endpoints take ADMIN_API_TOKEN as a bearer token and are off while it is unset"""
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not hmac.compare_digest(authorization or "", f"Bearer {settings.ADMIN_API_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+class BulkRequest(BaseModel):
+    session_ids: Optional[List[str]] = None
+    provider: Optional[str] = None
+    tier: Optional[str] = None
+    older_than_seconds: Optional[float] = Field(default=None, ge=0)
+    concurrency: int = Field(default=settings.BULK_DEFAULT_CONCURRENCY, ge=1, le=settings.BULK_MAX_CONCURRENCY)
+    dry_run: bool = False
+    # extend only
+    threshold_blocks: int = Field(default=300, ge=0)
+    deposit_uakt: Optional[int] = Field(default=None, gt=0)
+
+def bulk_close(session_id: str) -> Dict[str, Any]:
+    if state_store.get("sessions", session_id) is None:
+        return {"status": bulk.SKIPPED, "message": "Session already closed"}
+    if not end_session(session_id):
+        return {"status": bulk.FAILED, "message": "Could not close lease"}
+    return {"status": bulk.OK}
+
+def bulk_migrate(session_id: str) -> Dict[str, Any]:
+    result = migrate_session_lease(session_id)
+    status = {"success": bulk.OK, "warning": bulk.OK, "skipped": bulk.SKIPPED}.get(result["status"], bulk.FAILED)
+    return {"status": status, "message": result.get("message", ""), "new_lease_id": result.get("new_lease_id")}
+
+def bulk_extend(grouped: Dict[str, list], threshold_blocks: int, deposit_uakt: Optional[int],
+                lease_id: str) -> Dict[str, Any]:
+    result = extend_lease_of_sessions(lease_id, grouped[lease_id], threshold_blocks=threshold_blocks,
+                                      deposit_uakt=deposit_uakt)
+    status = bulk.FAILED if result["status"] == "error" else bulk.OK
+    return {"status": status, "message": result.get("message", ""), "extended": result.get("extended", False),
+            "blocks_remaining": result.get("blocks_remaining")}
+
+@app.post("/admin/sessions/{action}", dependencies=[Depends(require_admin)])
+async def bulk_session_action(action: str, request: BulkRequest):
+    """Close, extend or migrate every selected session, streaming progress as NDJSON"""
+    if action not in bulk.ACTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown action: {action}")
+    selector = SessionSelector(request.session_ids, request.provider, request.tier, request.older_than_seconds)
+    if selector.empty:
+        raise HTTPException(status_code=400, detail="Refusing to act on every session; pass a selector")
+    
+    selected = selector.select(session for _, session in state_store.items("sessions"))
+    if action == bulk.EXTEND:
+        # Packed sessions share a lease, which is extended once
+        grouped = sessions_by_lease(selected)
+        keys = list(grouped)
+        operation = functools.partial(bulk_extend, grouped, request.threshold_blocks, request.deposit_uakt)
+    else:
+        keys = [session["session_id"] for session in selected]
+        operation = bulk_close if action == bulk.CLOSE else bulk_migrate
+    
+    async def stream():
+        yield json.dumps({"type": "selected", "action": action, "count": len(keys), "keys": keys,
+                          "dry_run": request.dry_run}) + "\n"
+        if request.dry_run:
+            return
+        async for record in run_bulk(action, keys, operation, request.concurrency):
+            yield json.dumps(record) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/sessions/{session_id}/telemetry", status_code=202)
+async def ingest_telemetry(session_id: str, batch: TelemetryBatch):
+    """Stream-quality samples from the lease agent or the player's Moonlight client"""
+    if batch.source not in telemetry.SOURCES:
+        raise HTTPException(status_code=422, detail=f"source must be one of {', '.join(telemetry.SOURCES)}")
+    session = state_store.get("sessions", session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        accepted = telemetry_aggregator.ingest(session_id, session.get("provider", ""), batch.samples)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    metrics.TELEMETRY_SAMPLES.labels(batch.source).inc(accepted)
+    return {"accepted": accepted}
+
+@app.get("/sessions/{session_id}/quality")
+async def session_quality(session_id: str):
+    """Rolling stream-quality percentiles for a session, from the samples this worker received"""
+    summary = telemetry_aggregator.session_summary(session_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No telemetry for this session")
+    return summary
+
+@app.get("/telemetry/providers")
+async def provider_quality():
+    """Rolling stream-quality percentiles across each provider's sessions"""
+    return telemetry_aggregator.provider_summaries()
+
+def format_sse(event: SessionEvent) -> str:
+    return f"id: {event.sequence}\nevent: {event.event}\ndata: {json.dumps(event.to_dict())}\n\n"
+
+@app.get("/sessions/{session_id}/events")
+async def stream_session_events(session_id: str):
+    """Server-Sent Events stream of a session's lifecycle transitions"""
+    if state_store.get("sessions", session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    subscription = event_bus.subscribe(session_id)
+    
+    async def stream():
+        try:
+            while True:
+                event = await subscription.get(timeout=settings.EVENT_STREAM_KEEPALIVE_SECONDS)
+                if event is None:
+                    # Comment frame keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+                if event.terminal:
+                    return
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/sessions/{session_id}/ws")
+async def session_events_websocket(websocket: WebSocket, session_id: str):
+    """WebSocket stream of a session's lifecycle transitions"""
+    if state_store.get("sessions", session_id) is None:
+        # Closing before the handshake completes rejects the upgrade
+        await websocket.close(code=4404, reason="Session not found")
+        return
+    await websocket.accept()
+    subscription = event_bus.subscribe(session_id)
+    try:
+        while True:
+            event = await subscription.get(timeout=settings.EVENT_STREAM_KEEPALIVE_SECONDS)
+            if event is None:
+                continue
+            await websocket.send_json(event.to_dict())
+            if event.terminal:
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+
+@app.get("/tiers")
+async def list_tiers():
+    """Session tiers and the resources each one leases"""
+    return sdl_registry.status()
+
+@app.get("/slots")
+async def slot_status():
+    """Occupancy of packed leases by tier and region"""
+    return slot_allocator.status()
+
+@app.get("/recycling")
+async def recycling_status():
+    """Idle recycled leases waiting for their next player"""
+    return lease_pool.status()
+
+@app.get("/games")
+async def list_games():
+    """Games available from the content cache"""
+    return {"cache_nodes": cache_nodes, "games": game_index.list()}
+
+@app.get("/chain-events")
+async def chain_event_status():
+    """Chain event subscription state for this worker"""
+    if chain_events is None:
+        return {"enabled": False}
+    return {"enabled": True, **chain_events.status()}
+
+@app.get("/transactions")
+async def transaction_status():
+    """Account sequences handed out, pipelined txs awaiting a block and learned gas limits"""
+    gas = lease_manager.gas_estimator.status() if lease_manager.gas_estimator else None
+    if sequence_manager is None:
+        return {"pipelining": False, "gas_limits": gas, "signers": signer_pool.status()}
+    return {"pipelining": True, **sequence_manager.status(), "gas_limits": gas,
+            "signers": signer_pool.status()}
+
+@app.get("/market/prices")
+async def market_prices(group_by: str = "provider", tier: Optional[str] = None, region: Optional[str] = None,
+                        provider: Optional[str] = None, hour: Optional[int] = None, days: float = 7):
+    """Bid price percentiles from the market history, grouped by any of provider, tier, region and hour (UTC)"""
+    if market_history is None:
+        raise HTTPException(status_code=404, detail="Market history is disabled")
+    columns = [column.strip() for column in group_by.split(",") if column.strip()]
+    try:
+        groups = await run_in_threadpool(market_history.price_percentiles, columns, days,
+                                         tier=tier, region=region, provider=provider, hour=hour)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"{e}; use {', '.join(GROUP_COLUMNS)}")
+    return {"days": days, "groups": groups}
+
+@app.get("/market/providers")
+async def market_providers(tier: Optional[str] = None, region: Optional[str] = None,
+                           hour: Optional[int] = None, days: float = 7):
+    """Per provider bids, wins, median price, ready rate and median time to ready"""
+    if market_history is None:
+        raise HTTPException(status_code=404, detail="Market history is disabled")
+    providers = await run_in_threadpool(market_history.provider_stats, days, tier=tier, region=region, hour=hour)
+    return {"days": days, "providers": providers}
+
+@app.get("/lease-health")
+async def lease_health():
+    """Degraded leases and the migrations the detector has in flight, on the worker running the scan"""
+    return {"auto_migration": settings.AUTO_MIGRATION_ENABLED, **degradation_detector.status()}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "cloud-gaming-broker"}
 
+@app.get("/scheduler")
+async def scheduler_status():
+    """Leader election and background job status for this worker"""
+    return scheduler.status()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics endpoint, covering every API worker"""
+    content = await run_in_threadpool(metrics.registry.render)
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     try:
         settings.validate()
-        uvicorn.run(
-            "main:app",
-            host=settings.API_HOST,
-            port=settings.API_PORT,
-            reload=True
-        )
+        if settings.API_WORKERS > 1:
+            # Production serving: N worker processes sharing STATE_DB_PATH,
+            # with background jobs run by the elected scheduler leader
+            uvicorn.run(
+                "broker.main:app",
+                host=settings.API_HOST,
+                port=settings.API_PORT,
+                workers=settings.API_WORKERS
+            )
+        else:
+            uvicorn.run(
+                "main:app",
+                host=settings.API_HOST,
+                port=settings.API_PORT,
+                reload=True
+            )
     except ValueError as e:
         print(f"Configuration error: {e}")
         exit(1)
\ No newline at end of file
@@ -0,0 +1,499 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Every bid seen, one row per bid; accepted marks the bids a lease was created from
+BIDS = "bids"
+BID_COLUMNS = (
+    ("time", "d"),
+    ("provider", "I"),
+    ("tier", "I"),
+    ("region", "I"),
+    ("price", "d"),
+    ("accepted", "B"),
+)
+# Lease outcomes: ready (with seconds from creation), ready_timeout or failed
+LEASES = "leases"
+LEASE_COLUMNS = (
+    ("time", "d"),
+    ("provider", "I"),
+    ("tier", "I"),
+    ("region", "I"),
+    ("outcome", "I"),
+    ("ready_seconds", "d"),
+)
+TABLES = {BIDS: BID_COLUMNS, LEASES: LEASE_COLUMNS}
+# Integer columns holding codes into the partition's string dictionary
+STRING_COLUMNS = ("provider", "tier", "region", "outcome")
+
+READY = "ready"
+READY_TIMEOUT = "ready_timeout"
+FAILED = "failed"
+
+GROUP_COLUMNS = ("provider", "tier", "region", "hour")
+PERCENTILES = (0.1, 0.5, 0.9)
+# Leases a provider needs before its ready rate counts against its bids
+MIN_RANKING_LEASES = 3
+# Floor on the ready rate, so a provider that never came up is still priced
+MIN_READY_RATE = 0.1
+STATS_CACHE_SECONDS = 60.0
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _hour(timestamp: float) -> int:
+    return int(timestamp // 3600 % 24)
+
+
+def _percentile(ordered: Sequence[float], fraction: float) -> float:
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+class Partition:
+    """One day of one table: a column file per column and the day's string dictionary"""
+
+    __slots__ = ("columns", "strings", "rows", "sizes")
+
+    def __init__(
+        self,
+        columns: Dict[str, array],
+        strings: List[str],
+        rows: int,
+        sizes: Tuple[int, ...],
+    ):
+        self.columns = columns
+        self.strings = strings
+        self.rows = rows
+        self.sizes = sizes
+
+    def code(self, value: str) -> Optional[int]:
+        try:
+            return self.strings.index(value)
+        except ValueError:
+            return None
+
+
+class MarketHistory:
+    """Append-only columnar store of market bids and lease outcomes, partitioned by UTC day.
+
+    Each column of a day is a file of fixed-width values, appended in
+    batches under a lock on the day's directory, so every API worker can
+    record into the same store. Strings are stored as codes into a
+    dictionary kept per day. Queries read only the columns they aggregate.
+    Past days never change and stay loaded; today's partition is reloaded
+    when its files grow.
+    """
+
+    def __init__(self, root: str, retention_days: int = 90):
+        self.root = root
+        self.retention_days = retention_days
+        self._partitions: Dict[Tuple[str, str], Partition] = {}
+        self._stats: Dict[
+            Tuple[Optional[str], Optional[str]], Tuple[float, Dict[str, Dict[str, Any]]]
+        ] = {}
+        # Leases and ready leases per provider for past days, which never change
+        self._day_counts: Dict[
+            Tuple[str, Optional[str], Optional[str]], Dict[str, List[int]]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def record_bids(
+        self,
+        bids: Iterable[Tuple[str, float, bool]],
+        tier: str = "",
+        region: str = "",
+        now: Optional[float] = None,
+    ) -> None:
+        """Record one deployment's bids as (provider, price in uakt per block, accepted)"""
+        now = time.time() if now is None else now
+        self._append(
+            BIDS,
+            [
+                {
+                    "time": now,
+                    "provider": provider,
+                    "tier": tier,
+                    "region": region,
+                    "price": price,
+                    "accepted": int(accepted),
+                }
+                for provider, price, accepted in bids
+            ],
+        )
+
+    def record_lease(
+        self,
+        provider: str,
+        outcome: str,
+        ready_seconds: Optional[float] = None,
+        tier: str = "",
+        region: str = "",
+        now: Optional[float] = None,
+    ) -> None:
+        now = time.time() if now is None else now
+        self._append(
+            LEASES,
+            [
+                {
+                    "time": now,
+                    "provider": provider,
+                    "tier": tier,
+                    "region": region,
+                    "outcome": outcome,
+                    "ready_seconds": (
+                        float("nan") if ready_seconds is None else ready_seconds
+                    ),
+                }
+            ],
+        )
+
+    def _append(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_day.setdefault(_day(row["time"]), []).append(row)
+        for day, day_rows in by_day.items():
+            path = os.path.join(self.root, day)
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, ".lock"), "w", encoding="utf-8") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                strings = self._read_strings(path)
+                index = {value: code for code, value in enumerate(strings)}
+                added = False
+                for row in day_rows:
+                    for column in STRING_COLUMNS:
+                        if column in row and row[column] not in index:
+                            index[row[column]] = len(strings)
+                            strings.append(row[column])
+                            added = True
+                self._truncate_torn_batch(path, table)
+                if added:
+                    # Written before the columns, so readers never see a code it lacks
+                    tmp_path = os.path.join(path, f"strings.json.{os.getpid()}.tmp")
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(strings, f)
+                    os.replace(tmp_path, os.path.join(path, "strings.json"))
+                for column, typecode in TABLES[table]:
+                    values = (
+                        index[row[column]] if column in STRING_COLUMNS else row[column]
+                        for row in day_rows
+                    )
+                    with open(os.path.join(path, f"{table}.{column}"), "ab") as f:
+                        array(typecode, values).tofile(f)
+
+    @staticmethod
+    def _truncate_torn_batch(path: str, table: str) -> None:
+        """Cut every column back to the rows all of them hold; the caller holds the day lock.
+
+        A writer that died part way through a batch leaves some columns
+        longer than others, and appending after them would shift every later
+        row out of line.
+        """
+        sizes = {}
+        for column, typecode in TABLES[table]:
+            try:
+                size = os.path.getsize(os.path.join(path, f"{table}.{column}"))
+            except FileNotFoundError:
+                size = 0
+            sizes[column] = (size, array(typecode).itemsize)
+        rows = min(size // itemsize for size, itemsize in sizes.values())
+        for column, (size, itemsize) in sizes.items():
+            if size != rows * itemsize:
+                os.truncate(os.path.join(path, f"{table}.{column}"), rows * itemsize)
+
+    @staticmethod
+    def _read_strings(path: str) -> List[str]:
+        try:
+            with open(os.path.join(path, "strings.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _days(self, since: float, until: float) -> Iterator[str]:
+        day = datetime.fromtimestamp(since, timezone.utc).date()
+        last = datetime.fromtimestamp(until, timezone.utc).date()
+        while day <= last:
+            yield day.strftime("%Y-%m-%d")
+            day += timedelta(days=1)
+
+    def _partition(self, table: str, day: str) -> Optional[Partition]:
+        path = os.path.join(self.root, day)
+        try:
+            sizes = tuple(
+                os.path.getsize(os.path.join(path, f"{table}.{column}"))
+                for column, _ in TABLES[table]
+            )
+        except OSError:
+            return None
+        key = (table, day)
+        with self._lock:
+            cached = self._partitions.get(key)
+        if cached is not None and cached.sizes == sizes:
+            return cached
+
+        columns = {}
+        for column, typecode in TABLES[table]:
+            values = array(typecode)
+            with open(os.path.join(path, f"{table}.{column}"), "rb") as f:
+                data = f.read()
+            values.frombytes(data[: len(data) - len(data) % values.itemsize])
+            columns[column] = values
+        # A writer may be part way through a batch; only whole rows count
+        rows = min(len(values) for values in columns.values())
+        strings = self._read_strings(path)
+        partition = Partition(columns, strings, rows, sizes)
+        with self._lock:
+            self._partitions[key] = partition
+        return partition
+
+    def _select(
+        self,
+        table: str,
+        since: float,
+        until: float,
+        columns: Sequence[str],
+        filters: Dict[str, Any],
+    ) -> Iterator[Tuple[Any, ...]]:
+        """Rows in the window matching the filters, as tuples of the requested columns with strings decoded"""
+        for day in self._days(since, until):
+            yield from self._select_day(table, day, columns, filters, since, until)
+
+    def _select_day(
+        self,
+        table: str,
+        day: str,
+        columns: Sequence[str],
+        filters: Dict[str, Any],
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Iterator[Tuple[Any, ...]]:
+        partition = self._partition(table, day)
+        if partition is None:
+            return
+        times = partition.columns["time"]
+        # Each filter narrows the surviving rows rather than rescanning the
+        # day, string codes first; a day wholly inside the window skips the
+        # time comparison
+        rows: Sequence[int] = range(partition.rows)
+        for column, value in filters.items():
+            if value is None or column == "hour":
+                continue
+            code = partition.code(value)
+            if code is None:
+                return
+            values = partition.columns[column]
+            rows = [row for row in rows if values[row] == code]
+        day_start = (
+            datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+        )
+        if (since is not None and since > day_start) or (
+            until is not None and until < day_start + 86400
+        ):
+            low = day_start if since is None else since
+            high = day_start + 86400 if until is None else until
+            rows = [row for row in rows if low <= times[row] <= high]
+        if filters.get("hour") is not None:
+            rows = [row for row in rows if _hour(times[row]) == filters["hour"]]
+
+        decoded = []
+        for column in columns:
+            if column == "hour":
+                decoded.append([_hour(times[row]) for row in rows])
+            elif column in STRING_COLUMNS:
+                values = partition.columns[column]
+                strings = partition.strings
+                decoded.append([strings[values[row]] for row in rows])
+            else:
+                values = partition.columns[column]
+                decoded.append([values[row] for row in rows])
+        yield from zip(*decoded)
+
+    @staticmethod
+    def _window(days: float, until: Optional[float]) -> Tuple[float, float]:
+        until = time.time() if until is None else until
+        return until - days * 86400, until
+
+    def price_percentiles(
+        self,
+        group_by: Sequence[str] = ("provider",),
+        days: float = 7,
+        until: Optional[float] = None,
+        percentiles: Sequence[float] = PERCENTILES,
+        **filters: Any,
+    ) -> List[Dict[str, Any]]:
+        """Bid price percentiles per group, e.g. by provider and hour for one tier and region, cheapest first"""
+        unknown = set(group_by) - set(GROUP_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot group bids by: {', '.join(sorted(unknown))}")
+        since, until = self._window(days, until)
+        groups: Dict[Tuple[Any, ...], List[float]] = {}
+        for row in self._select(
+            BIDS, since, until, list(group_by) + ["price"], filters
+        ):
+            groups.setdefault(row[:-1], []).append(row[-1])
+
+        results = []
+        for key, prices in groups.items():
+            prices.sort()
+            results.append(
+                {
+                    **dict(zip(group_by, key)),
+                    "bids": len(prices),
+                    **{
+                        f"p{round(fraction * 100)}": _percentile(prices, fraction)
+                        for fraction in percentiles
+                    },
+                    "min": round(prices[0], 2),
+                }
+            )
+        median = f"p{round(percentiles[len(percentiles) // 2] * 100)}"
+        return sorted(results, key=lambda result: result[median])
+
+    def provider_stats(
+        self, days: float = 7, until: Optional[float] = None, **filters: Any
+    ) -> Dict[str, Dict[str, Any]]:
+        """Per provider: bids, wins, median bid, leases, share that became ready and median time to ready"""
+        since, until = self._window(days, until)
+        stats: Dict[str, Dict[str, Any]] = {}
+        prices: Dict[str, List[float]] = {}
+        for provider, price, accepted in self._select(
+            BIDS, since, until, ("provider", "price", "accepted"), filters
+        ):
+            entry = stats.setdefault(
+                provider, {"bids": 0, "wins": 0, "leases": 0, "ready": 0}
+            )
+            entry["bids"] += 1
+            entry["wins"] += accepted
+            prices.setdefault(provider, []).append(price)
+        ready_seconds: Dict[str, List[float]] = {}
+        for provider, outcome, seconds in self._select(
+            LEASES, since, until, ("provider", "outcome", "ready_seconds"), filters
+        ):
+            entry = stats.setdefault(
+                provider, {"bids": 0, "wins": 0, "leases": 0, "ready": 0}
+            )
+            entry["leases"] += 1
+            if outcome == READY:
+                entry["ready"] += 1
+                ready_seconds.setdefault(provider, []).append(seconds)
+
+        for provider, entry in stats.items():
+            provider_prices = sorted(prices.get(provider, []))
+            seconds = sorted(ready_seconds.get(provider, []))
+            entry["median_price"] = (
+                _percentile(provider_prices, 0.5) if provider_prices else None
+            )
+            entry["ready_rate"] = (
+                round(entry["ready"] / entry["leases"], 3) if entry["leases"] else None
+            )
+            entry["median_ready_seconds"] = (
+                _percentile(seconds, 0.5) if seconds else None
+            )
+        return stats
+
+    def rank_bids(
+        self,
+        bids: List[Dict[str, Any]],
+        tier: Optional[str] = None,
+        region: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Bids by expected price per ready lease: the bid price divided by the provider's ready rate.
+
+        Providers with too few recorded leases are taken at their bid price.
+        Statistics are cached briefly, so ranking stays off the column files.
+        """
+        key = (tier, region)
+        now = time.time()
+        with self._lock:
+            cached = self._stats.get(key)
+        if cached is None or cached[0] < now:
+            cached = (
+                now + STATS_CACHE_SECONDS,
+                self._ready_counts(tier, region, now=now),
+            )
+            with self._lock:
+                self._stats[key] = cached
+        stats = cached[1]
+
+        def expected_price(bid: Dict[str, Any]) -> float:
+            price = float(bid["bid"].get("price", {}).get("amount", 0))
+            entry = stats.get(bid["bid"]["bid_id"]["provider"])
+            if entry is None or entry["leases"] < MIN_RANKING_LEASES:
+                return price
+            ready_rate = round(entry["ready"] / entry["leases"], 3)
+            return price / max(ready_rate, MIN_READY_RATE)
+
+        return sorted(bids, key=expected_price)
+
+    def _ready_counts(
+        self,
+        tier: Optional[str],
+        region: Optional[str],
+        days: float = 7,
+        now: Optional[float] = None,
+    ) -> Dict[str, Dict[str, int]]:
+        """Leases and ready leases per provider over the window, as ranking needs them.
+
+        Past days wholly inside the window are counted once and kept; only
+        today and the window's partial first day are read again.
+        """
+        since, until = self._window(days, now)
+        today = _day(until)
+        filters = {"tier": tier, "region": region}
+        counts: Dict[str, Dict[str, int]] = {}
+        for day in self._days(since, until):
+            whole = day != today and day > _day(since)
+            key = (day, tier, region)
+            with self._lock:
+                day_counts = self._day_counts.get(key) if whole else None
+            if day_counts is None:
+                day_counts = {}
+                for provider, outcome in self._select_day(
+                    LEASES,
+                    day,
+                    ("provider", "outcome"),
+                    filters,
+                    None if whole else since,
+                    None if whole else until,
+                ):
+                    entry = day_counts.setdefault(provider, [0, 0])
+                    entry[0] += 1
+                    entry[1] += outcome == READY
+                if whole:
+                    with self._lock:
+                        self._day_counts[key] = day_counts
+            for provider, (leases, ready) in day_counts.items():
+                entry = counts.setdefault(provider, {"leases": 0, "ready": 0})
+                entry["leases"] += leases
+                entry["ready"] += ready
+        return counts
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete partitions older than the retention period; returns how many"""
+        cutoff = _day(
+            (time.time() if now is None else now) - self.retention_days * 86400
+        )
+        try:
+            days = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        for day in days:
+            if len(day) == 10 and day < cutoff:
+                shutil.rmtree(os.path.join(self.root, day), ignore_errors=True)
+                with self._lock:
+                    for table in TABLES:
+                        self._partitions.pop((table, day), None)
+                    for key in [key for key in self._day_counts if key[0] == day]:
+                        del self._day_counts[key]
+                removed += 1
+        return removed
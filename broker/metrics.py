@@ -0,0 +1,580 @@
+import bisect
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from .state import StateStore
+
+# Upper bounds in seconds. Chain transactions and container boots sit in the
+# multi-second range, so the buckets extend well past typical web latencies.
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+# Subcommands the broker issues against the akash CLI. Children for each are
+# created up front so the request path never allocates a label set.
+AKASH_SUBCOMMANDS = (
+    ("tx", "deployment", "create"),
+    ("tx", "deployment", "close"),
+    ("tx", "market", "lease", "create"),
+    ("tx", "market", "lease", "create-bid"),
+    ("tx", "bank", "send"),
+    ("query", "market", "bid", "list"),
+    ("query", "market", "lease", "get"),
+    ("query", "market", "lease", "list"),
+    ("query", "deployment", "get"),
+    ("query", "block"),
+    ("query", "tx"),
+    ("query", "auth", "account"),
+    ("query", "bank", "balances"),
+    ("provider", "lease-status"),
+    ("provider", "send-manifest"),
+)
+
+CREATE_LEASE_PHASES = ("deployment", "bids", "lease", "manifest", "endpoint")
+CREATE_HEDGED_LEASE_PHASES = (
+    "deployment",
+    "bids",
+    "lease",
+    "manifest",
+    "endpoint",
+    "race",
+)
+MIGRATE_SESSION_PHASES = (
+    "lease_status",
+    "backup",
+    "provision",
+    "ready_wait",
+    "restore",
+    "verify",
+    "close_old",
+    "cleanup",
+)
+# Must match the run_phase names in images/ubuntu-sunshine/entrypoint.sh
+BOOT_PHASES = ("config", "xvfb", "pulseaudio", "nvenc", "sunshine")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(
+    names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None
+) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs)
+        + "}"
+    )
+
+
+class _Timer:
+    """Context manager that observes elapsed wall time into a histogram child"""
+
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: "_HistogramChild"):
+        self._child = child
+        self._start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _HistogramChild:
+    """Bucket counts for one label set.
+
+    Observations only touch pre-allocated list slots; there are no locks on
+    the hot path. Under heavy thread contention an increment can very rarely
+    be lost, which is acceptable for monitoring data.
+    """
+
+    __slots__ = ("_upper_bounds", "_counts", "_sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._upper_bounds = upper_bounds
+        self._counts = [0] * (len(upper_bounds) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self._upper_bounds, value)] += 1
+        self._sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def bucket_counts(self) -> List[int]:
+        """Per-bucket (not cumulative) counts, the last one for +Inf"""
+        return list(self._counts)
+
+
+class _ValueChild:
+    """A counter or gauge value for one label set.
+
+    Unlike histogram buckets, updates take a lock: gauges such as in-flight
+    counts are inc'd and dec'd from different threads, and a lost update
+    would leave them off for good rather than for one sample.
+    """
+
+    __slots__ = ("value", "updated_at", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+            self.updated_at = time.time()
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+            self.updated_at = time.time()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+            self.updated_at = time.time()
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Return the child for a label set, creating it on first use"""
+        child = self._children.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}, got {key}"
+                )
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def preallocate(self, label_sets: Iterable[Sequence[str]]) -> None:
+        for values in label_sets:
+            self.labels(*values)
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+
+    def _sample(self, values: Tuple[str, ...], child) -> Any:
+        raise NotImplementedError
+
+    def _combine(self, sample: Any, other: Any) -> Any:
+        raise NotImplementedError
+
+    def _format(self, values: Tuple[str, ...], sample: Any) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> List[list]:
+        """JSON-safe [label values, sample] pairs for merging into another worker's scrape"""
+        return [
+            [list(values), self._sample(values, child)]
+            for values, child in list(self._children.items())
+        ]
+
+    def render(self, others: Iterable[List[list]] = ()) -> List[str]:
+        samples = {tuple(values): sample for values, sample in self.snapshot()}
+        for snapshot in others:
+            for values, sample in snapshot:
+                key = tuple(values)
+                samples[key] = (
+                    self._combine(samples[key], sample) if key in samples else sample
+                )
+        lines = self._header()
+        for values, sample in samples.items():
+            lines.extend(self._format(values, sample))
+        return lines
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def _sample(self, values: Tuple[str, ...], child) -> float:
+        return child.value
+
+    def _combine(self, sample: float, other: float) -> float:
+        return sample + other
+
+    def _format(self, values: Tuple[str, ...], sample: float) -> List[str]:
+        labels = _format_labels(self.labelnames, values)
+        return [f"{self.name}_total{labels} {_format_value(sample)}"]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down.
+
+    Across workers, `sum` gauges add up per-process values such as in-flight
+    work; `latest` gauges describe shared state and take the most recently
+    updated worker's value.
+    """
+
+    metric_type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        multiprocess_mode: str = "sum",
+    ):
+        if multiprocess_mode not in ("sum", "latest"):
+            raise ValueError(f"Unknown multiprocess mode: {multiprocess_mode}")
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._children[()].dec(amount)
+
+    def set(self, value: float) -> None:
+        self._children[()].set(value)
+
+    def set_function(self, function: Callable[[], float], *values: str) -> None:
+        """Compute the gauge at scrape time instead of on every state change"""
+        key = tuple(str(value) for value in values)
+        self.labels(*key)
+        self._functions[key] = function
+
+    def _sample(self, values: Tuple[str, ...], child) -> List[float]:
+        function = self._functions.get(values)
+        if function:
+            return [function(), time.time()]
+        return [child.value, child.updated_at]
+
+    def _combine(self, sample: List[float], other: List[float]) -> List[float]:
+        if self.multiprocess_mode == "sum":
+            return [sample[0] + other[0], max(sample[1], other[1])]
+        return sample if sample[1] >= other[1] else other
+
+    def _format(self, values: Tuple[str, ...], sample: List[float]) -> List[str]:
+        labels = _format_labels(self.labelnames, values)
+        return [f"{self.name}{labels} {_format_value(sample[0])}"]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.upper_bounds = tuple(sorted(float(bucket) for bucket in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def time(self) -> _Timer:
+        return self._children[()].time()
+
+    def _sample(self, values: Tuple[str, ...], child) -> list:
+        return [child.bucket_counts(), child.sum]
+
+    def _combine(self, sample: list, other: list) -> list:
+        return [[a + b for a, b in zip(sample[0], other[0])], sample[1] + other[1]]
+
+    def _format(self, values: Tuple[str, ...], sample: list) -> List[str]:
+        counts, total = sample
+        lines = []
+        bounds = self.upper_bounds + (float("inf"),)
+        cumulative = 0
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            labels = _format_labels(
+                self.labelnames, values, ("le", _format_value(bound))
+            )
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics for this process, merged with other workers' once a store is attached"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self.origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._store: Optional[StateStore] = None
+        self._publish_interval = 0.0
+        self._publish_thread: Optional[threading.Thread] = None
+        self._publish_stop = threading.Event()
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        multiprocess_mode: str = "sum",
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, multiprocess_mode))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def attach_store(self, store: StateStore, publish_interval: float = 5.0) -> None:
+        """Share this worker's metrics through the store so any worker's scrape covers all"""
+        self._store = store
+        self._publish_interval = publish_interval
+        self._publish_stop.clear()
+        self._publish_thread = threading.Thread(
+            target=self._publish, name="metrics-publish", daemon=True
+        )
+        self._publish_thread.start()
+
+    def stop(self) -> None:
+        self._publish_stop.set()
+        if self._publish_thread:
+            self._publish_thread.join(timeout=5)
+            self._publish_thread = None
+
+    def publish_once(self) -> None:
+        # Entries of workers that exited expire; their counters then reset,
+        # which Prometheus rate() already handles
+        self._store.put(
+            "metrics",
+            self.origin,
+            self.snapshot(),
+            ttl=max(3 * self._publish_interval, 30.0),
+        )
+
+    def _publish(self) -> None:
+        while not self._publish_stop.wait(self._publish_interval):
+            try:
+                self.publish_once()
+            except Exception:
+                continue
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        others: List[Dict[str, List[list]]] = []
+        if self._store is not None:
+            others = [
+                snapshot
+                for origin, snapshot in self._store.items("metrics")
+                if origin != self.origin
+            ]
+        lines: List[str] = []
+        for name, metric in list(self._metrics.items()):
+            lines.extend(metric.render([other.get(name, []) for other in others]))
+        return "\n".join(lines) + "\n"
+
+
+def akash_subcommand(args: Sequence[str]) -> str:
+    """Map akash CLI arguments (after the global flags) to a bounded label value"""
+    for subcommand in AKASH_SUBCOMMANDS:
+        if tuple(args[: len(subcommand)]) == subcommand:
+            return " ".join(subcommand)
+    return "other"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = MetricsRegistry()
+
+AKASH_COMMAND_SECONDS = registry.histogram(
+    "broker_akash_command_seconds",
+    "Latency of akash CLI/RPC calls by subcommand",
+    ["subcommand"],
+)
+AKASH_COMMAND_FAILURES = registry.counter(
+    "broker_akash_command_failures",
+    "akash CLI calls that exited non-zero, by subcommand",
+    ["subcommand"],
+)
+EXTERNAL_CALL_SECONDS = registry.histogram(
+    "broker_external_call_seconds",
+    "Latency of Stripe and Osmosis API calls",
+    ["service", "operation"],
+)
+LEASE_PHASE_SECONDS = registry.histogram(
+    "broker_lease_phase_seconds",
+    "Latency of each phase of lease provisioning and session migration",
+    ["operation", "phase"],
+)
+HEDGED_LEASES = registry.counter(
+    "broker_hedged_leases",
+    "Leases created by hedged provisioning, by whether they were kept or closed after the race",
+    ["outcome"],
+)
+BOOT_PHASE_SECONDS = registry.histogram(
+    "broker_boot_phase_seconds",
+    "Duration of each Sunshine container boot phase, from the lease's boot report",
+    ["phase"],
+)
+IDEMPOTENT_REQUESTS = registry.counter(
+    "broker_idempotent_requests",
+    "Requests carrying an Idempotency-Key, by whether they ran, joined an in-flight run, "
+    "replayed a stored response or reused a key",
+    ["outcome"],
+)
+GAS_ESTIMATES = registry.counter(
+    "broker_gas_estimates",
+    "Gas limits for akash txs, by whether they came from the cache or a node simulation, "
+    "and cached limits dropped after running out of gas",
+    ["source"],
+)
+TX_BROADCASTS = registry.counter(
+    "broker_tx_broadcasts",
+    "Pipelined akash txs by outcome: confirmed or failed in a block, dropped before one, "
+    "or rejected for a stale account sequence",
+    ["outcome"],
+)
+TELEMETRY_SAMPLES = registry.counter(
+    "broker_telemetry_samples",
+    "Stream-quality telemetry values ingested, by whether the lease agent or the client sent them",
+    ["source"],
+)
+AUTO_MIGRATIONS = registry.counter(
+    "broker_auto_migrations",
+    "Migrations started by the degradation detector, by whether the session moved",
+    ["outcome"],
+)
+# Set by the scheduler leader and read from the shared store respectively, so
+# every worker reports the same broker-wide value rather than a share of it
+DEGRADED_LEASES = registry.gauge(
+    "broker_degraded_leases",
+    "Dedicated leases the degradation detector currently scores as degraded",
+    multiprocess_mode="latest",
+)
+ACTIVE_SESSIONS = registry.gauge(
+    "broker_active_sessions",
+    "Gaming sessions currently held by this broker",
+    multiprocess_mode="latest",
+)
+INFLIGHT_PROVISIONS = registry.gauge(
+    "broker_inflight_provisions", "Lease provisioning flows currently in progress"
+)
+QUEUE_DEPTH = registry.gauge(
+    "broker_queue_depth", "Items waiting in broker work queues", ["queue"]
+)
+
+AKASH_COMMAND_SECONDS.preallocate(
+    [(" ".join(subcommand),) for subcommand in AKASH_SUBCOMMANDS] + [("other",)]
+)
+AKASH_COMMAND_FAILURES.preallocate(
+    [(" ".join(subcommand),) for subcommand in AKASH_SUBCOMMANDS] + [("other",)]
+)
+EXTERNAL_CALL_SECONDS.preallocate(
+    [
+        ("stripe", "create_payment_intent"),
+        ("stripe", "retrieve_payment_intent"),
+        ("stripe", "list_payment_intents"),
+        ("osmosis", "swap_exact_amount_in"),
+    ]
+)
+LEASE_PHASE_SECONDS.preallocate(
+    [("create_lease", phase) for phase in CREATE_LEASE_PHASES]
+    + [("create_hedged_lease", phase) for phase in CREATE_HEDGED_LEASE_PHASES]
+    + [("migrate_session", phase) for phase in MIGRATE_SESSION_PHASES]
+)
+HEDGED_LEASES.preallocate([("kept",), ("closed",)])
+IDEMPOTENT_REQUESTS.preallocate(
+    [("new",), ("in_flight",), ("replayed",), ("conflict",)]
+)
+GAS_ESTIMATES.preallocate([("cached",), ("simulated",), ("out_of_gas",)])
+TX_BROADCASTS.preallocate(
+    [("confirmed",), ("failed",), ("dropped",), ("sequence_mismatch",)]
+)
+TELEMETRY_SAMPLES.preallocate([("agent",), ("client",)])
+AUTO_MIGRATIONS.preallocate([("migrated",), ("failed",)])
+BOOT_PHASE_SECONDS.preallocate([(phase,) for phase in BOOT_PHASES])
@@ -0,0 +1,470 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+import stripe
+from .settings import settings
+from .state import StateStore
+from .ledger import SessionLedger
+from .lease_manager import LeaseManager
+from .recycling import LeasePool
+from .slots import SlotAllocator
+from . import metrics
+
+# Discrepancy types written to the report
+PAYMENT_MISSING = "payment_missing"
+PAYMENT_NOT_SUCCEEDED = "payment_not_succeeded"
+AMOUNT_MISMATCH = "amount_mismatch"
+ORPHAN_PAYMENT = "orphan_payment"
+LEASE_MISSING = "lease_missing"
+LEASE_OVERSPENT = "lease_overspent"
+LEASE_LEFT_OPEN = "lease_left_open"
+ORPHAN_LEASE = "orphan_lease"
+
+SPILL_SCHEMA = """
+CREATE TABLE payments (
+    payment_intent_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    created INTEGER NOT NULL
+);
+CREATE TABLE leases (
+    dseq TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    state TEXT NOT NULL,
+    consumed_uakt REAL NOT NULL
+);
+CREATE TABLE sessions (
+    session_id TEXT PRIMARY KEY,
+    payment_intent_id TEXT,
+    charged_cents INTEGER NOT NULL,
+    charged_uakt INTEGER NOT NULL,
+    lease_count INTEGER NOT NULL,
+    closed INTEGER NOT NULL,
+    in_window INTEGER NOT NULL
+);
+CREATE TABLE session_leases (
+    session_id TEXT NOT NULL,
+    dseq TEXT NOT NULL
+);
+CREATE TABLE held_leases (
+    dseq TEXT PRIMARY KEY
+);
+CREATE TABLE hedge_leases (
+    session_id TEXT NOT NULL,
+    dseq TEXT NOT NULL
+);
+"""
+
+# Built after loading; bulk inserts into unindexed tables are much faster
+SPILL_INDEXES = """
+CREATE INDEX sessions_payment ON sessions (payment_intent_id);
+CREATE INDEX session_leases_dseq ON session_leases (dseq);
+CREATE INDEX session_leases_session ON session_leases (session_id);
+CREATE INDEX hedge_leases_dseq ON hedge_leases (dseq);
+"""
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def payment_record(intent: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Flatten a Stripe payment intent; None for payments from other services"""
+    if (intent.get("metadata") or {}).get("service") != "cloud-gaming":
+        return None
+    return {
+        "payment_intent_id": intent["id"],
+        "status": intent["status"],
+        "amount_cents": intent["amount"],
+        "created": intent["created"],
+    }
+
+
+def stripe_payment_intents(
+    created_gte: int, created_lt: int, page_size: int = 100
+) -> Iterator[Dict[str, Any]]:
+    """Our payment intents created in a time range, one Stripe page at a time"""
+    starting_after = None
+    while True:
+        params: Dict[str, Any] = {
+            "limit": page_size,
+            "created": {"gte": created_gte, "lt": created_lt},
+        }
+        if starting_after:
+            params["starting_after"] = starting_after
+        with metrics.EXTERNAL_CALL_SECONDS.labels(
+            "stripe", "list_payment_intents"
+        ).time():
+            page = stripe.PaymentIntent.list(**params)
+        for intent in page["data"]:
+            record = payment_record(intent)
+            if record is not None:
+                yield record
+        if not page["has_more"] or not page["data"]:
+            return
+        starting_after = page["data"][-1]["id"]
+
+
+def lease_record(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten one entry of `akash query market lease list`"""
+    lease = entry["lease"]
+    escrow = entry.get("escrow_payment") or {}
+    # Withdrawn has been paid to the provider; balance is owed but not yet withdrawn
+    consumed = sum(
+        Decimal((escrow.get(key) or {}).get("amount", "0"))
+        for key in ("withdrawn", "balance")
+    )
+    return {
+        "dseq": str(lease["lease_id"]["dseq"]),
+        "provider": lease["lease_id"]["provider"],
+        "state": lease["state"],
+        "consumed_uakt": float(consumed),
+    }
+
+
+def _batches(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Reconciler:
+    """Checks Stripe charges and on-chain lease spend against the session ledger.
+
+    The three streams are spilled in batches into a scratch SQLite file.
+    Memory stays flat however many records a month holds. The joins then
+    run as indexed SQL, and each discrepancy is yielded as its cursor
+    reaches it, so a report can be written while the join is still running.
+    """
+
+    def __init__(
+        self,
+        spill_path: Optional[str] = None,
+        tolerance_percent: float = 5.0,
+        batch_size: int = 1000,
+    ):
+        self.tolerance_percent = tolerance_percent
+        self.batch_size = batch_size
+        self._owns_spill = spill_path is None
+        if spill_path is None:
+            fd, spill_path = tempfile.mkstemp(prefix="reconcile-", suffix=".db")
+            os.close(fd)
+            os.unlink(spill_path)
+        self.spill_path = spill_path
+        self.conn = sqlite3.connect(spill_path)
+        # Scratch data: rebuilt from the sources on every run
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.executescript(SPILL_SCHEMA)
+        self._indexed = False
+
+    def close(self) -> None:
+        self.conn.close()
+        if self._owns_spill and os.path.exists(self.spill_path):
+            os.unlink(self.spill_path)
+
+    def _insert(self, sql: str, rows: Iterable[tuple]) -> int:
+        count = 0
+        for batch in _batches(rows, self.batch_size):
+            with self.conn:
+                self.conn.executemany(sql, batch)
+            count += len(batch)
+        return count
+
+    def load_payments(self, intents: Iterable[Dict[str, Any]]) -> int:
+        return self._insert(
+            "INSERT OR REPLACE INTO payments VALUES (?, ?, ?, ?)",
+            (
+                (i["payment_intent_id"], i["status"], i["amount_cents"], i["created"])
+                for i in intents
+            ),
+        )
+
+    def load_leases(self, leases: Iterable[Dict[str, Any]]) -> int:
+        return self._insert(
+            "INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)",
+            (
+                (l["dseq"], l["provider"], l["state"], l["consumed_uakt"])
+                for l in leases
+            ),
+        )
+
+    def load_ledger(
+        self,
+        entries: Iterable[Dict[str, Any]],
+        created_gte: Optional[float] = None,
+        created_lt: Optional[float] = None,
+    ) -> int:
+        """The whole ledger; sessions created outside the window only serve to claim their leases.
+
+        The chain lists every lease we ever held, so older sessions are needed
+        to tell their leases apart from orphans. Charges are only checked for
+        sessions created inside the window.
+        """
+
+        def in_window(entry: Dict[str, Any]) -> bool:
+            return (created_gte is None or entry["created_at"] >= created_gte) and (
+                created_lt is None or entry["created_at"] < created_lt
+            )
+
+        count = 0
+        for batch in _batches(entries, self.batch_size):
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            entry["session_id"],
+                            entry.get("payment_intent_id"),
+                            entry["charged_cents"],
+                            entry["charged_uakt"],
+                            len(entry["lease_ids"]),
+                            int(entry.get("closed_at") is not None),
+                            int(in_window(entry)),
+                        )
+                        for entry in batch
+                    ],
+                )
+                self.conn.executemany(
+                    "INSERT INTO session_leases VALUES (?, ?)",
+                    [
+                        (entry["session_id"], str(dseq))
+                        for entry in batch
+                        for dseq in entry["lease_ids"]
+                    ],
+                )
+                self.conn.executemany(
+                    "INSERT INTO hedge_leases VALUES (?, ?)",
+                    [
+                        (entry["session_id"], str(dseq))
+                        for entry in batch
+                        for dseq in entry.get("hedge_lease_ids", [])
+                    ],
+                )
+            count += len(batch)
+        return count
+
+    def load_held_leases(self, lease_ids: Iterable[str]) -> int:
+        """Leases the broker keeps open on purpose: recycled and packed leases between players"""
+        return self._insert(
+            "INSERT OR IGNORE INTO held_leases VALUES (?)",
+            ((str(d),) for d in lease_ids),
+        )
+
+    def _ensure_indexes(self) -> None:
+        if not self._indexed:
+            self.conn.executescript(SPILL_INDEXES)
+            self._indexed = True
+
+    def discrepancies(self) -> Iterator[Dict[str, Any]]:
+        self._ensure_indexes()
+        tolerance = 1 + self.tolerance_percent / 100
+
+        rows = self.conn.execute(
+            "SELECT s.session_id, s.payment_intent_id, s.charged_cents, p.status, p.amount_cents "
+            "FROM sessions s LEFT JOIN payments p ON p.payment_intent_id = s.payment_intent_id "
+            "WHERE s.in_window = 1 AND s.payment_intent_id IS NOT NULL "
+            "AND (p.payment_intent_id IS NULL OR p.status != 'succeeded' OR p.amount_cents != s.charged_cents)"
+        )
+        for session_id, payment_intent_id, charged_cents, status, amount_cents in rows:
+            record = {"session_id": session_id, "payment_intent_id": payment_intent_id}
+            if status is None:
+                yield {"type": PAYMENT_MISSING, **record}
+            elif status != "succeeded":
+                yield {"type": PAYMENT_NOT_SUCCEEDED, **record, "status": status}
+            else:
+                yield {
+                    "type": AMOUNT_MISMATCH,
+                    **record,
+                    "charged_cents": charged_cents,
+                    "stripe_amount_cents": amount_cents,
+                }
+
+        rows = self.conn.execute(
+            "SELECT p.payment_intent_id, p.amount_cents, p.created FROM payments p "
+            "WHERE p.status = 'succeeded' AND NOT EXISTS "
+            "(SELECT 1 FROM sessions s WHERE s.payment_intent_id = p.payment_intent_id)"
+        )
+        for payment_intent_id, amount_cents, created in rows:
+            yield {
+                "type": ORPHAN_PAYMENT,
+                "payment_intent_id": payment_intent_id,
+                "amount_cents": amount_cents,
+                "created": created,
+            }
+
+        rows = self.conn.execute(
+            "SELECT sl.session_id, sl.dseq FROM session_leases sl "
+            "JOIN sessions s ON s.session_id = sl.session_id "
+            "WHERE s.in_window = 1 AND NOT EXISTS (SELECT 1 FROM leases l WHERE l.dseq = sl.dseq)"
+        )
+        for session_id, dseq in rows:
+            yield {"type": LEASE_MISSING, "session_id": session_id, "lease_id": dseq}
+
+        # A session that moved leases is charged once; split its charge
+        # evenly so each lease is compared against its share
+        rows = self.conn.execute(
+            "SELECT l.dseq, l.provider, l.state, l.consumed_uakt, "
+            "SUM(CAST(s.charged_uakt AS REAL) / s.lease_count), MIN(s.closed), "
+            "EXISTS (SELECT 1 FROM held_leases h WHERE h.dseq = l.dseq) "
+            "FROM leases l "
+            "JOIN session_leases sl ON sl.dseq = l.dseq "
+            "JOIN sessions s ON s.session_id = sl.session_id "
+            "GROUP BY l.dseq HAVING MAX(s.in_window) = 1"
+        )
+        for dseq, provider, state, consumed, charged, all_closed, held in rows:
+            record = {"lease_id": dseq, "provider": provider}
+            if consumed > charged * tolerance:
+                yield {
+                    "type": LEASE_OVERSPENT,
+                    **record,
+                    "consumed_uakt": consumed,
+                    "charged_uakt": round(charged, 3),
+                }
+            if state == "active" and all_closed and not held:
+                yield {"type": LEASE_LEFT_OPEN, **record, "consumed_uakt": consumed}
+
+        # Leases that lost a hedged race belong to their session but should
+        # have been closed as soon as the race was decided
+        rows = self.conn.execute(
+            "SELECT hl.session_id, l.dseq, l.provider, l.consumed_uakt FROM hedge_leases hl "
+            "JOIN leases l ON l.dseq = hl.dseq "
+            "JOIN sessions s ON s.session_id = hl.session_id "
+            "WHERE s.in_window = 1 AND l.state = 'active'"
+        )
+        for session_id, dseq, provider, consumed in rows:
+            yield {
+                "type": LEASE_LEFT_OPEN,
+                "lease_id": dseq,
+                "provider": provider,
+                "consumed_uakt": consumed,
+                "session_id": session_id,
+                "hedge": True,
+            }
+
+        rows = self.conn.execute(
+            "SELECT l.dseq, l.provider, l.state, l.consumed_uakt FROM leases l "
+            "WHERE NOT EXISTS (SELECT 1 FROM session_leases sl WHERE sl.dseq = l.dseq) "
+            "AND NOT EXISTS (SELECT 1 FROM hedge_leases hl WHERE hl.dseq = l.dseq) "
+            "AND NOT EXISTS (SELECT 1 FROM held_leases h WHERE h.dseq = l.dseq) "
+            "AND (l.state = 'active' OR l.consumed_uakt > 0)"
+        )
+        for dseq, provider, state, consumed in rows:
+            yield {
+                "type": ORPHAN_LEASE,
+                "lease_id": dseq,
+                "provider": provider,
+                "state": state,
+                "consumed_uakt": consumed,
+            }
+
+    def write_report(self, output: TextIO) -> Dict[str, int]:
+        """Write discrepancies as JSON lines while the joins run; returns counts by type"""
+        counts: Dict[str, int] = {}
+        for discrepancy in self.discrepancies():
+            output.write(json.dumps(discrepancy) + "\n")
+            counts[discrepancy["type"]] = counts.get(discrepancy["type"], 0) + 1
+        output.flush()
+        return counts
+
+
+def held_lease_ids(store: StateStore) -> Iterator[str]:
+    for namespace in (LeasePool.NAMESPACE, SlotAllocator.NAMESPACE):
+        for lease_id, _ in store.items(namespace):
+            yield lease_id
+
+
+def _timestamp(day: str) -> int:
+    return int(
+        datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Reconcile Stripe charges and chain spend against the session ledger"
+    )
+    parser.add_argument(
+        "--since", required=True, help="First day to check (YYYY-MM-DD, UTC)"
+    )
+    parser.add_argument(
+        "--until",
+        required=True,
+        help="Day after the last one to check (YYYY-MM-DD, UTC)",
+    )
+    parser.add_argument(
+        "--output",
+        default="-",
+        help="Discrepancy report (JSON lines); stdout by default",
+    )
+    parser.add_argument(
+        "--fixtures",
+        help="Directory with payments.jsonl, leases.jsonl, ledger.jsonl and "
+        "optionally held_leases.jsonl to reconcile instead of the live sources",
+    )
+    parser.add_argument(
+        "--spill", help="Scratch SQLite file (a temporary file by default)"
+    )
+    parser.add_argument(
+        "--tolerance-percent", type=float, default=settings.RECONCILE_TOLERANCE_PERCENT
+    )
+    args = parser.parse_args(argv)
+
+    since, until = _timestamp(args.since), _timestamp(args.until)
+    reconciler = Reconciler(args.spill, args.tolerance_percent)
+    try:
+        if args.fixtures:
+            # Recorded API responses: Stripe payment intents and chain lease list entries
+            payments = (
+                payment_record(intent)
+                for intent in read_jsonl(os.path.join(args.fixtures, "payments.jsonl"))
+            )
+            reconciler.load_payments(
+                payment for payment in payments if payment is not None
+            )
+            reconciler.load_leases(
+                lease_record(entry)
+                for entry in read_jsonl(os.path.join(args.fixtures, "leases.jsonl"))
+            )
+            reconciler.load_ledger(
+                read_jsonl(os.path.join(args.fixtures, "ledger.jsonl")), since, until
+            )
+            held_path = os.path.join(args.fixtures, "held_leases.jsonl")
+            if os.path.exists(held_path):
+                reconciler.load_held_leases(
+                    entry["lease_id"] for entry in read_jsonl(held_path)
+                )
+        else:
+            store = StateStore(settings.STATE_DB_PATH)
+            reconciler.load_payments(stripe_payment_intents(since, until))
+            reconciler.load_leases(
+                lease_record(entry) for entry in LeaseManager().iter_leases()
+            )
+            reconciler.load_ledger(SessionLedger(store).entries(), since, until)
+            reconciler.load_held_leases(held_lease_ids(store))
+
+        if args.output == "-":
+            counts = reconciler.write_report(sys.stdout)
+        else:
+            with open(args.output, "w", encoding="utf-8") as output:
+                counts = reconciler.write_report(output)
+    finally:
+        reconciler.close()
+    print(json.dumps({"discrepancies": counts}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import time
+from typing import Any, Callable, Dict, List, Optional
+from .state import StateStore
+
+
+class LeasePool:
+    """Funded, freshly reset leases waiting for their next player.
+
+    Each idle lease is a record in the shared StateStore keyed by dseq, and
+    taking one deletes it, so two workers can never get the same lease.
+    The most recently released lease is reused first, which lets older ones
+    run out their idle TTL and be closed by `reap`.
+    """
+
+    NAMESPACE = "recycled_leases"
+
+    def __init__(self, store: StateStore, idle_ttl_seconds: float):
+        self.store = store
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.reused_total = 0
+
+    def release(self, pool: str, lease_id: str, provider: str, host: str) -> None:
+        self.store.put(
+            self.NAMESPACE,
+            lease_id,
+            {
+                "lease_id": lease_id,
+                "provider": provider,
+                "host": host,
+                "pool": pool,
+                "released_at": time.time(),
+            },
+        )
+
+    def acquire(self, pool: str) -> Optional[Dict[str, Any]]:
+        """Take the most recently released idle lease in a pool, if any"""
+        candidates = sorted(
+            (
+                record
+                for _, record in self.store.items(self.NAMESPACE)
+                if record["pool"] == pool
+            ),
+            key=lambda record: record["released_at"],
+            reverse=True,
+        )
+        for record in candidates:
+            if time.time() - record["released_at"] >= self.idle_ttl_seconds:
+                continue
+            # Losing the delete means another worker took it first
+            if self.store.delete(self.NAMESPACE, record["lease_id"]):
+                self.reused_total += 1
+                return record
+        return None
+
+    def discard(self, lease_id: str) -> bool:
+        """Forget an idle lease that was closed outside the broker"""
+        return self.store.delete(self.NAMESPACE, lease_id)
+
+    def reap(self, close_lease: Callable[[str], bool]) -> List[str]:
+        """Close leases that have sat idle past the TTL"""
+        closed = []
+        cutoff = time.time() - self.idle_ttl_seconds
+        for lease_id, record in list(self.store.items(self.NAMESPACE)):
+            if record["released_at"] > cutoff:
+                continue
+            if not self.store.delete(self.NAMESPACE, lease_id):
+                continue
+            if close_lease(lease_id):
+                closed.append(lease_id)
+            else:
+                # Still open and billing: leave it for the next reap. It is
+                # past the TTL, so acquire won't hand it out meanwhile.
+                self.store.put(self.NAMESPACE, lease_id, record)
+        return closed
+
+    def status(self) -> Dict[str, Any]:
+        pools: Dict[str, int] = {}
+        for _, record in self.store.items(self.NAMESPACE):
+            pools[record["pool"]] = pools.get(record["pool"], 0) + 1
+        return {
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "idle_leases": pools,
+            "reused_total": self.reused_total,
+        }
@@ -0,0 +1,146 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from .state import StateStore
+from .settings import settings
+from . import tracing
+
+
+@dataclass
+class Job:
+    name: str
+    interval_seconds: float
+    function: Callable[[], object]
+
+
+class Scheduler:
+    """Runs singleton background jobs on whichever worker holds leadership.
+
+    Every worker runs a Scheduler, but only the one holding the leadership
+    lease in the shared StateStore executes jobs. Last-run times live in the
+    store too, so a newly elected leader picks up the cadence where the
+    previous one left off instead of re-running everything at once.
+    """
+
+    LEADERSHIP = "scheduler"
+
+    def __init__(
+        self,
+        store: StateStore,
+        holder_id: Optional[str] = None,
+        tick_seconds: Optional[float] = None,
+        leadership_ttl: Optional[float] = None,
+    ):
+        self.store = store
+        self.holder_id = (
+            holder_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.tick_seconds = tick_seconds or settings.SCHEDULER_TICK_SECONDS
+        self.leadership_ttl = leadership_ttl or settings.LEADER_TTL_SECONDS
+        self.jobs: Dict[str, Job] = {}
+        self._is_leader = False
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(
+        self, name: str, interval_seconds: float, function: Callable[[], object]
+    ) -> None:
+        self.jobs[name] = Job(name, interval_seconds, function)
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def _renew_leadership(self) -> bool:
+        self._is_leader = self.store.try_acquire_leadership(
+            self.LEADERSHIP, self.holder_id, self.leadership_ttl
+        )
+        return self._is_leader
+
+    def _claim(self, job: Job, started: float) -> bool:
+        """Atomically mark a due job as started by this worker.
+
+        Jobs can outlive the leadership TTL, so a worker that takes over
+        mid-job must see the claim rather than a stale last_run.
+        """
+        claimed = []
+
+        def claim(state: Optional[Dict[str, object]]) -> Dict[str, object]:
+            state = state or {}
+            if started - state.get("last_run", 0) < job.interval_seconds:
+                return state
+            claimed.append(True)
+            return {**state, "last_run": started, "holder": self.holder_id}
+
+        self.store.update("scheduler", job.name, claim)
+        return bool(claimed)
+
+    def tick(self) -> List[str]:
+        """Renew or contend for leadership, then run any due jobs if leader"""
+        if not self._renew_leadership():
+            return []
+
+        ran = []
+        for job in list(self.jobs.values()):
+            # An earlier job this tick may have run past the leadership TTL
+            if ran and not self._renew_leadership():
+                break
+            started = time.time()
+            if not self._claim(job, started):
+                continue
+
+            error = None
+            try:
+                with tracing.span(f"job.{job.name}", holder=self.holder_id):
+                    job.function()
+            except Exception as e:
+                error = str(e)
+
+            self.store.put(
+                "scheduler",
+                job.name,
+                {
+                    "last_run": started,
+                    "duration_seconds": time.time() - started,
+                    "holder": self.holder_id,
+                    "last_error": error,
+                },
+            )
+            ran.append(job.name)
+        return ran
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.tick_seconds * 2)
+        if self._is_leader:
+            self.store.release_leadership(self.LEADERSHIP, self.holder_id)
+            self._is_leader = False
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.tick()
+            except Exception:
+                # A locked or unavailable store just means no jobs this tick
+                self._is_leader = False
+            self._stop_event.wait(self.tick_seconds)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "holder_id": self.holder_id,
+            "is_leader": self._is_leader,
+            "leader": self.store.leader(self.LEADERSHIP),
+            "jobs": {name: self.store.get("scheduler", name) for name in self.jobs},
+        }
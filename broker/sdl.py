@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, asdict
+from string import Template
+from typing import Any, Dict, Optional
+from .encoder import DEFAULT_PROFILE
+
+# Tier parameters and the shape each value must have. Checked when the
+# registry loads, so rendering a manifest never needs to parse YAML.
+PARAMETER_PATTERNS = {
+    "cpu_units": re.compile(r"^\d+(\.\d+)?$"),
+    "memory_size": re.compile(r"^\d+(Mi|Gi|Ti)$"),
+    "storage_size": re.compile(r"^\d+(Mi|Gi|Ti)$"),
+    "gpu_units": re.compile(r"^\d+$"),
+    "gpu_model": re.compile(r"^(\*|[a-z0-9][a-z0-9\-]*)$"),
+    "region": re.compile(r"^[a-z0-9][a-z0-9\-]*$"),
+    "max_price_uakt": re.compile(r"^[1-9]\d*$"),
+    # sunshine-packed exposes port sets for up to four Sunshine instances
+    "slot_count": re.compile(r"^[1-4]$"),
+    "encoder_fps": re.compile(r"^[1-9]\d{0,2}$"),
+    "encoder_bitrate_kbps": re.compile(r"^[1-9]\d*$"),
+    "encoder_resolution": re.compile(r"^\d{3,4}x\d{3,4}$"),
+    "encoder_fec_percentage": re.compile(r"^\d{1,2}$"),
+    # The broker's public key for the image's sshd; empty leaves sshd off
+    "ssh_authorized_key": re.compile(
+        r"^((ssh-ed25519|ssh-rsa|ecdsa-sha2-nistp(256|384|521)) [A-Za-z0-9+/]+=*)?$"
+    ),
+}
+
+REQUIRED_SECTIONS = ("version:", "services:", "profiles:", "deployment:")
+
+
+class SDLTemplateError(Exception):
+    """Raised when a template or tier definition is invalid"""
+
+
+@dataclass(frozen=True)
+class SessionTier:
+    name: str
+    template: str
+    cpu_units: float
+    memory_size: str
+    storage_size: str
+    gpu_units: int
+    gpu_model: str
+    region: str
+    max_price_uakt: int
+    slot_count: int = 1
+    # Leases raced to readiness per session; only the first one ready is kept
+    hedge_count: int = 1
+
+    @property
+    def packed(self) -> bool:
+        return self.slot_count > 1
+
+    @property
+    def hedged(self) -> bool:
+        return self.hedge_count > 1
+
+    def parameters(self) -> Dict[str, str]:
+        params = asdict(self)
+        del params["name"], params["template"], params["hedge_count"]
+        return {key: str(value) for key, value in params.items()}
+
+
+class SDLTemplateRegistry:
+    """Renders per-tier deployment manifests from string.Template SDL files.
+
+    Templates and tiers are validated once by `load`. Each distinct set of
+    parameters is rendered once to a file under `render_dir` and that path is
+    reused by every later deployment with the same parameters. `defaults`
+    fills parameters that are the same for every tier.
+    """
+
+    def __init__(
+        self,
+        template_dir: str,
+        tiers_path: str,
+        render_dir: str,
+        defaults: Optional[Dict[str, str]] = None,
+    ):
+        self.template_dir = template_dir
+        self.tiers_path = tiers_path
+        self.render_dir = render_dir
+        self.defaults = defaults or {}
+        self.templates: Dict[str, Template] = {}
+        self._template_digests: Dict[str, str] = {}
+        self.tiers: Dict[str, SessionTier] = {}
+        self._rendered: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.tiers)
+
+    def load(self) -> None:
+        """Read and validate every template and tier; raises SDLTemplateError"""
+        templates = {}
+        for filename in sorted(os.listdir(self.template_dir)):
+            if not filename.endswith(".yaml.tmpl"):
+                continue
+            with open(os.path.join(self.template_dir, filename), encoding="utf-8") as f:
+                template = Template(f.read())
+            name = filename[: -len(".yaml.tmpl")]
+            self._validate_template(name, template)
+            templates[name] = template
+
+        with open(self.tiers_path, encoding="utf-8") as f:
+            tier_definitions = json.load(f)
+
+        tiers = {}
+        for name, definition in tier_definitions.items():
+            try:
+                tier = SessionTier(name=name, **definition)
+            except TypeError as e:
+                raise SDLTemplateError(f"Tier '{name}' is invalid: {e}")
+            if tier.template not in templates:
+                raise SDLTemplateError(
+                    f"Tier '{name}' uses unknown template '{tier.template}'"
+                )
+            if not isinstance(tier.hedge_count, int) or tier.hedge_count < 1:
+                raise SDLTemplateError(
+                    f"Tier '{name}' has an invalid hedge_count: {tier.hedge_count!r}"
+                )
+            if tier.packed and tier.hedged:
+                raise SDLTemplateError(f"Tier '{name}' is packed and cannot be hedged")
+            params = self._parameters(tier)
+            self._validate_parameters(params)
+            self._substitute(templates[tier.template], params)
+            tiers[name] = tier
+
+        self.templates = templates
+        # Rendered files are named by content, so an edited template never
+        # reuses a manifest rendered from its previous version
+        self._template_digests = {
+            name: hashlib.sha256(template.template.encode()).hexdigest()
+            for name, template in templates.items()
+        }
+        self.tiers = tiers
+        self._rendered = {}
+
+    def _validate_template(self, name: str, template: Template) -> None:
+        identifiers = set()
+        for match in template.pattern.finditer(template.template):
+            if match.group("invalid") is not None:
+                raise SDLTemplateError(f"Template '{name}' has an invalid placeholder")
+            identifier = match.group("named") or match.group("braced")
+            if identifier:
+                identifiers.add(identifier)
+
+        unknown = identifiers - set(PARAMETER_PATTERNS)
+        if unknown:
+            raise SDLTemplateError(
+                f"Template '{name}' uses unknown parameters: {', '.join(sorted(unknown))}"
+            )
+        missing = [
+            section for section in REQUIRED_SECTIONS if section not in template.template
+        ]
+        if missing:
+            raise SDLTemplateError(
+                f"Template '{name}' is missing sections: {', '.join(missing)}"
+            )
+
+    @staticmethod
+    def _validate_parameters(params: Dict[str, str]) -> None:
+        for key, value in params.items():
+            pattern = PARAMETER_PATTERNS.get(key)
+            if pattern is None:
+                raise SDLTemplateError(f"Unknown SDL parameter '{key}'")
+            if not pattern.match(value):
+                raise SDLTemplateError(f"Invalid value for {key}: {value!r}")
+
+    @staticmethod
+    def _substitute(template: Template, params: Dict[str, str]) -> str:
+        try:
+            return template.substitute(params)
+        except KeyError as e:
+            raise SDLTemplateError(f"Missing SDL parameter {e}")
+
+    def _parameters(self, tier: SessionTier) -> Dict[str, str]:
+        # Per-session encoder settings default to the image's stock profile
+        params = {"ssh_authorized_key": "", **DEFAULT_PROFILE.sdl_parameters()}
+        params.update(self.defaults)
+        params.update(tier.parameters())
+        return params
+
+    def get_tier(self, name: str) -> SessionTier:
+        if not self.loaded:
+            self.load()
+        tier = self.tiers.get(name)
+        if tier is None:
+            raise SDLTemplateError(f"Unknown session tier '{name}'")
+        return tier
+
+    def validate_overrides(self, **overrides: Any) -> Dict[str, str]:
+        """Check client-supplied parameters before anything is paid for or leased"""
+        params = {
+            key: str(value) for key, value in overrides.items() if value is not None
+        }
+        self._validate_parameters(params)
+        return params
+
+    def render(self, tier_name: str, **overrides: Any) -> str:
+        """Path to the manifest for a tier, with optional parameter overrides"""
+        tier = self.get_tier(tier_name)
+        params = self._parameters(tier)
+        params.update(self.validate_overrides(**overrides))
+
+        cache_key = hashlib.sha256(
+            json.dumps(
+                [self._template_digests[tier.template], params], sort_keys=True
+            ).encode()
+        ).hexdigest()[:16]
+        path = self._rendered.get(cache_key)
+        if path is not None:
+            return path
+
+        with self._lock:
+            path = self._rendered.get(cache_key)
+            if path is None:
+                path = self._write(
+                    f"{tier.template}-{cache_key}.yaml",
+                    self._substitute(self.templates[tier.template], params),
+                )
+                self._rendered[cache_key] = path
+        return path
+
+    def _write(self, filename: str, content: str) -> str:
+        os.makedirs(self.render_dir, exist_ok=True)
+        path = os.path.join(self.render_dir, filename)
+        if not os.path.exists(path):
+            # Other workers may render the same manifest; rename is atomic
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return path
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "templates": sorted(self.templates),
+            "tiers": {name: asdict(tier) for name, tier in self.tiers.items()},
+            "rendered": len(self._rendered),
+        }
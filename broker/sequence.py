@@ -0,0 +1,223 @@
+import json
+import re
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .state import StateStore
+from . import metrics
+
+# Returned by CheckTx when a tx's sequence isn't the one the account expects next
+SEQUENCE_MISMATCH_PATTERN = re.compile(
+    r"account sequence mismatch, expected (\d+), got (\d+)"
+)
+
+
+def tx_response(result: subprocess.CompletedProcess) -> Optional[Dict[str, Any]]:
+    try:
+        response = json.loads(result.stdout)
+    except (TypeError, ValueError):
+        return None
+    return response if isinstance(response, dict) else None
+
+
+def sequence_mismatch(result: subprocess.CompletedProcess) -> Optional[int]:
+    """The sequence the chain expected, if the tx was rejected for using another one"""
+    response = tx_response(result) or {}
+    match = SEQUENCE_MISMATCH_PATTERN.search(
+        f"{result.stderr or ''} {response.get('raw_log', '')}"
+    )
+    return int(match.group(1)) if match else None
+
+
+def check_tx_failure(
+    result: subprocess.CompletedProcess,
+) -> subprocess.CompletedProcess:
+    """Turn a sync broadcast the mempool rejected into a failed command.
+
+    The CLI exits 0 whenever the node answered, even with a non-zero code.
+    """
+    response = tx_response(result)
+    if result.returncode != 0 or not response or not response.get("code"):
+        return result
+    return subprocess.CompletedProcess(
+        result.args,
+        1,
+        result.stdout,
+        f"tx rejected with code {response['code']}: {response.get('raw_log', '')}",
+    )
+
+
+def delivered_result(
+    result: subprocess.CompletedProcess, tx: Dict[str, Any]
+) -> subprocess.CompletedProcess:
+    """A sync broadcast's result carrying the tx as its block has it.
+
+    Its code and raw_log are then DeliverTx's, so check_tx_failure and
+    out_of_gas see a tx that failed in the block.
+    """
+    return subprocess.CompletedProcess(
+        result.args, result.returncode, json.dumps(tx), result.stderr
+    )
+
+
+@dataclass
+class Reservation:
+    address: str
+    account_number: int
+    sequence: int
+    epoch: int
+
+    def flags(self) -> List[str]:
+        # With both numbers given the CLI signs without querying the account
+        return [
+            "--account-number",
+            str(self.account_number),
+            "--sequence",
+            str(self.sequence),
+            "--broadcast-mode",
+            "sync",
+        ]
+
+
+class SequenceManager:
+    """Allocates account sequence numbers so one key can broadcast many txs per block.
+
+    The next sequence for each signer lives in the shared StateStore, so every
+    worker draws from the same counter instead of asking the node and racing.
+    Txs are broadcast in sync mode and only wait for the mempool, not a block.
+    A mismatch reply says which sequence the chain expects. The first tx to see
+    it resets the counter and starts a new epoch. Other txs reserved in the old
+    epoch draw again rather than resetting it a second time. Broadcasts are
+    recorded as pending until `confirm` finds them in a block. A tx that never
+    lands left a gap, so the counter is marked stale and re-read from the chain.
+    """
+
+    NAMESPACE = "tx_sequence"
+    PENDING_NAMESPACE = "pending_txs"
+
+    def __init__(self, store: StateStore, confirm_timeout: float = 120.0):
+        self.store = store
+        self.confirm_timeout = confirm_timeout
+
+    def reserve(
+        self, address: str, fetch: Callable[[str], Tuple[int, int]]
+    ) -> Reservation:
+        """Next sequence for `address`; `fetch` reads (account number, sequence) from the chain"""
+        state = self.store.get(self.NAMESPACE, address)
+        if state is None or state.get("stale"):
+            account_number, sequence = fetch(address)
+
+            def synced(current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+                if current is not None and not current.get("stale"):
+                    # Another worker synced first
+                    return current
+                epoch = (current or {}).get("epoch", 0) + 1
+                return {
+                    "account_number": account_number,
+                    "next": sequence,
+                    "epoch": epoch,
+                }
+
+            self.store.update(self.NAMESPACE, address, synced)
+
+        state = self.store.update(
+            self.NAMESPACE,
+            address,
+            lambda current: {**current, "next": current["next"] + 1},
+        )
+        return Reservation(
+            address, state["account_number"], state["next"] - 1, state["epoch"]
+        )
+
+    def resync(self, reservation: Reservation, expected: int) -> None:
+        """Restart the counter at the sequence the chain expects, once per epoch"""
+        metrics.TX_BROADCASTS.labels("sequence_mismatch").inc()
+
+        def restart(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if current is None or current["epoch"] != reservation.epoch:
+                return current
+            return {
+                **current,
+                "next": expected,
+                "epoch": current["epoch"] + 1,
+                "stale": False,
+            }
+
+        self.store.update(self.NAMESPACE, reservation.address, restart)
+
+    def release(self, reservation: Reservation) -> None:
+        """Hand back a sequence the mempool rejected, if nothing was reserved after it"""
+
+        def rewind(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if (
+                current is None
+                or current["epoch"] != reservation.epoch
+                or current["next"] != reservation.sequence + 1
+            ):
+                return current
+            return {**current, "next": reservation.sequence}
+
+        self.store.update(self.NAMESPACE, reservation.address, rewind)
+
+    def track(self, txhash: str, reservation: Reservation, **details: Any) -> None:
+        """Remember a broadcast until it's confirmed in a block"""
+        self.store.put(
+            self.PENDING_NAMESPACE,
+            txhash,
+            {
+                "address": reservation.address,
+                "sequence": reservation.sequence,
+                "epoch": reservation.epoch,
+                "broadcast_at": time.time(),
+                **details,
+            },
+            ttl=self.confirm_timeout * 10,
+        )
+
+    def pending(self) -> int:
+        return self.store.count(self.PENDING_NAMESPACE)
+
+    def confirm(
+        self,
+        lookup: Callable[[str], Optional[Dict[str, Any]]],
+        on_result: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+    ) -> Dict[str, int]:
+        """Look up pending txs by hash, settling the ones in a block or given up on.
+
+        `lookup` returns the included tx or None while it isn't in a block;
+        `on_result` gets the pending record and the tx for every included one.
+        """
+        counts = {"confirmed": 0, "failed": 0, "dropped": 0, "pending": 0}
+        now = time.time()
+        for txhash, record in list(self.store.items(self.PENDING_NAMESPACE)):
+            tx = lookup(txhash)
+            if tx is None:
+                if now - record["broadcast_at"] < self.confirm_timeout:
+                    counts["pending"] += 1
+                    continue
+                outcome = "dropped"
+                self._mark_stale(record)
+            else:
+                # Delivered but failed txs still used their sequence
+                outcome = "confirmed" if not int(tx.get("code", 0)) else "failed"
+                if on_result is not None:
+                    on_result(record, tx)
+            self.store.delete(self.PENDING_NAMESPACE, txhash)
+            metrics.TX_BROADCASTS.labels(outcome).inc()
+            counts[outcome] += 1
+        return counts
+
+    def _mark_stale(self, record: Dict[str, Any]) -> None:
+        def stale(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if current is None or current["epoch"] != record["epoch"]:
+                return current
+            return {**current, "stale": True}
+
+        self.store.update(self.NAMESPACE, record["address"], stale)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "accounts": dict(self.store.items(self.NAMESPACE)),
+            "pending": self.pending(),
+        }
@@ -7,21 +7,149 @@ class Settings:
     AKASH_CHAIN_ID: str = os.getenv("AKASH_CHAIN_ID", "akashnet-2")
     AKASH_KEYRING_BACKEND: str = os.getenv("AKASH_KEYRING_BACKEND", "os")
     AKASH_FROM: str = os.getenv("AKASH_FROM", "")
+    # Comma-separated keys new deployments are spread over; AKASH_FROM alone when unset
+    AKASH_SIGNER_KEYS: str = os.getenv("AKASH_SIGNER_KEYS", "")
+    # Signer keys below this are topped up from the others
+    SIGNER_MIN_BALANCE_UAKT: int = int(os.getenv("SIGNER_MIN_BALANCE_UAKT", "5000000"))
+    SIGNER_REBALANCE_INTERVAL_SECONDS: float = float(os.getenv("SIGNER_REBALANCE_INTERVAL_SECONDS", "600"))
     
     # Billing configuration
     STRIPE_SECRET_KEY: str = os.getenv("STRIPE_SECRET_KEY", "")
     STRIPE_WEBHOOK_SECRET: str = os.getenv("STRIPE_WEBHOOK_SECRET", "")
     
+    # Reuse gas limits learned from recent txs instead of simulating each
+    # one on the node; the margin covers growth between samples
+    GAS_CACHE_ENABLED: bool = os.getenv("GAS_CACHE_ENABLED", "true").lower() == "true"
+    GAS_SAFETY_MARGIN: float = float(os.getenv("GAS_SAFETY_MARGIN", "1.3"))
+    GAS_SAMPLE_WINDOW: int = int(os.getenv("GAS_SAMPLE_WINDOW", "20"))
+    
+    # Allocate account sequences locally and broadcast without waiting for
+    # blocks, so one key can have many txs in flight
+    TX_PIPELINING_ENABLED: bool = os.getenv("TX_PIPELINING_ENABLED", "true").lower() == "true"
+    TX_CONFIRM_INTERVAL_SECONDS: float = float(os.getenv("TX_CONFIRM_INTERVAL_SECONDS", "6"))
+    TX_CONFIRM_TIMEOUT_SECONDS: float = float(os.getenv("TX_CONFIRM_TIMEOUT_SECONDS", "120"))
+    
     # Pricing (uakt per hour)
     LEASE_PRICE_UAKT: int = int(os.getenv("LEASE_PRICE_UAKT", "5000"))
     
     # Gaming configuration
     SUNSHINE_PORT: int = int(os.getenv("SUNSHINE_PORT", "47984"))
     SUNSHINE_UDP_PORT: int = int(os.getenv("SUNSHINE_UDP_PORT", "47989"))
+    # How long a new lease's provider has to report its forwarded ports
+    ENDPOINT_DISCOVERY_TIMEOUT_SECONDS: float = float(os.getenv("ENDPOINT_DISCOVERY_TIMEOUT_SECONDS", "60"))
+    ENDPOINT_DISCOVERY_INTERVAL_SECONDS: float = float(os.getenv("ENDPOINT_DISCOVERY_INTERVAL_SECONDS", "3"))
+    # Public half of the key the broker's ssh uses; written into each lease's authorized_keys.
+    # The comment field is dropped, since SDL env values can't carry one safely.
+    LEASE_SSH_PUBLIC_KEY: str = " ".join(os.getenv("LEASE_SSH_PUBLIC_KEY", "").split()[:2])
+    
+    # SDL templates rendered per session tier
+    SDL_TEMPLATE_DIR: str = os.getenv("SDL_TEMPLATE_DIR", "sdl/templates")
+    SDL_TIERS_PATH: str = os.getenv("SDL_TIERS_PATH", "sdl/tiers.json")
+    SDL_RENDER_DIR: str = os.getenv("SDL_RENDER_DIR", "/tmp/broker-sdl")
+    DEFAULT_SESSION_TIER: str = os.getenv("DEFAULT_SESSION_TIER", "standard")
+    
+    # Chain event subscription over the node's Tendermint websocket; bids
+    # are polled for from the node when disabled or disconnected
+    CHAIN_EVENTS_ENABLED: bool = os.getenv("CHAIN_EVENTS_ENABLED", "true").lower() == "true"
+    CHAIN_EVENT_BID_TIMEOUT_SECONDS: float = float(os.getenv("CHAIN_EVENT_BID_TIMEOUT_SECONDS", "60"))
+    CHAIN_EVENT_BID_WINDOW_SECONDS: float = float(os.getenv("CHAIN_EVENT_BID_WINDOW_SECONDS", "3"))
+    # How long the bid list is polled for after a deployment lands, and how often (a block)
+    BID_WAIT_SECONDS: float = float(os.getenv("BID_WAIT_SECONDS", "60"))
+    BID_POLL_INTERVAL_SECONDS: float = float(os.getenv("BID_POLL_INTERVAL_SECONDS", "6"))
+    
+    # Hedged provisioning for tiers with hedge_count > 1: the most the backup
+    # leases may cost while racing, and how long the race may run
+    HEDGE_MAX_EXTRA_COST_UAKT: float = float(os.getenv("HEDGE_MAX_EXTRA_COST_UAKT", "5000"))
+    HEDGE_READY_TIMEOUT_SECONDS: float = float(os.getenv("HEDGE_READY_TIMEOUT_SECONDS", "120"))
+    
+    # Encoder policy table (built-in table when unset)
+    ENCODER_POLICY_PATH: str = os.getenv("ENCODER_POLICY_PATH", "")
+    
+    # Session checkpointing (disabled when no bucket is configured)
+    CHECKPOINT_S3_BUCKET: str = os.getenv("CHECKPOINT_S3_BUCKET", "")
+    CHECKPOINT_S3_REGION: str = os.getenv("CHECKPOINT_S3_REGION", "us-east-1")
+    CHECKPOINT_INTERVAL_SECONDS: int = int(os.getenv("CHECKPOINT_INTERVAL_SECONDS", "30"))
+    CHECKPOINT_BANDWIDTH_KBPS: int = int(os.getenv("CHECKPOINT_BANDWIDTH_KBPS", "1024"))
+    
+    # Tracing ("none", "file" or "otlp")
+    TRACE_EXPORTER: str = os.getenv("TRACE_EXPORTER", "none")
+    TRACE_FILE_PATH: str = os.getenv("TRACE_FILE_PATH", "/tmp/broker-traces.jsonl")
+    TRACE_OTLP_ENDPOINT: str = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318")
+    TRACE_SERVICE_NAME: str = os.getenv("TRACE_SERVICE_NAME", "cloud-gaming-broker")
     
     # API configuration
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
     API_PORT: int = int(os.getenv("API_PORT", "8000"))
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "1"))
+    # How often each worker shares its metrics for other workers' /metrics scrapes
+    METRICS_PUBLISH_INTERVAL_SECONDS: float = float(os.getenv("METRICS_PUBLISH_INTERVAL_SECONDS", "5"))
+    
+    # Admission control (limits are split evenly across API workers)
+    ADMISSION_MAX_CONCURRENT_PROVISIONS: int = int(os.getenv("ADMISSION_MAX_CONCURRENT_PROVISIONS", "8"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+    ADMISSION_INITIAL_PROVISION_SECONDS: float = float(os.getenv("ADMISSION_INITIAL_PROVISION_SECONDS", "90"))
+    
+    # Shared state and background jobs
+    STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "broker-state.db")
+    SCHEDULER_TICK_SECONDS: float = float(os.getenv("SCHEDULER_TICK_SECONDS", "5"))
+    LEADER_TTL_SECONDS: float = float(os.getenv("LEADER_TTL_SECONDS", "15"))
+    EXTENSION_SWEEP_INTERVAL_SECONDS: int = int(os.getenv("EXTENSION_SWEEP_INTERVAL_SECONDS", "60"))
+    
+    # Idempotency-Key: how long completed responses are replayed, how many are
+    # kept, and how long a crashed worker's in-flight claim blocks retries
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000"))
+    IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS", "900"))
+    
+    # Admin API (disabled unless a token is set) and bulk operation fan-out
+    ADMIN_API_TOKEN: str = os.getenv("ADMIN_API_TOKEN", "")
+    BULK_DEFAULT_CONCURRENCY: int = int(os.getenv("BULK_DEFAULT_CONCURRENCY", "8"))
+    BULK_MAX_CONCURRENCY: int = int(os.getenv("BULK_MAX_CONCURRENCY", "32"))
+    
+    # Game content cache (comma-separated cache node URLs; disabled when unset)
+    GAME_CACHE_NODES: str = os.getenv("GAME_CACHE_NODES", "")
+    GAME_CACHE_ROOT: str = os.getenv("GAME_CACHE_ROOT", "/var/cache/cloud-gaming")
+    GAME_CACHE_FETCH_WORKERS: int = int(os.getenv("GAME_CACHE_FETCH_WORKERS", "16"))
+    
+    # Lease recycling: reset and reuse funded leases instead of closing them
+    LEASE_RECYCLING_ENABLED: bool = os.getenv("LEASE_RECYCLING_ENABLED", "true").lower() == "true"
+    RECYCLE_IDLE_TTL_SECONDS: int = int(os.getenv("RECYCLE_IDLE_TTL_SECONDS", "600"))
+    RECYCLE_MIN_BLOCKS_REMAINING: int = int(os.getenv("RECYCLE_MIN_BLOCKS_REMAINING", "600"))
+    
+    # Degradation detection: dedicated leases are probed every scan and their
+    # sessions migrated once the smoothed score crosses the degraded mark
+    HEALTH_SCAN_INTERVAL_SECONDS: float = float(os.getenv("HEALTH_SCAN_INTERVAL_SECONDS", "30"))
+    HEALTH_PROBE_CONCURRENCY: int = int(os.getenv("HEALTH_PROBE_CONCURRENCY", "16"))
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "3"))
+    HEALTH_GRACE_SECONDS: float = float(os.getenv("HEALTH_GRACE_SECONDS", "300"))
+    HEALTH_DEGRADED_SCORE: float = float(os.getenv("HEALTH_DEGRADED_SCORE", "0.6"))
+    HEALTH_RECOVERED_SCORE: float = float(os.getenv("HEALTH_RECOVERED_SCORE", "0.2"))
+    AUTO_MIGRATION_ENABLED: bool = os.getenv("AUTO_MIGRATION_ENABLED", "false").lower() == "true"
+    AUTO_MIGRATION_MAX_CONCURRENT: int = int(os.getenv("AUTO_MIGRATION_MAX_CONCURRENT", "4"))
+    AUTO_MIGRATION_MAX_PER_PROVIDER: int = int(os.getenv("AUTO_MIGRATION_MAX_PER_PROVIDER", "2"))
+    AUTO_MIGRATION_RETRY_SECONDS: float = float(os.getenv("AUTO_MIGRATION_RETRY_SECONDS", "300"))
+    # A migration claim older than this belongs to a worker that died mid-migration
+    MIGRATION_CLAIM_TTL_SECONDS: float = float(os.getenv("MIGRATION_CLAIM_TTL_SECONDS", "1800"))
+    
+    # Reconciliation: spend a lease may exceed its sessions' charges by
+    RECONCILE_TOLERANCE_PERCENT: float = float(os.getenv("RECONCILE_TOLERANCE_PERCENT", "5"))
+    
+    # Stream-quality telemetry: values kept per signal for each session and
+    # each provider, and how many sessions one worker tracks
+    TELEMETRY_SESSION_SAMPLES: int = int(os.getenv("TELEMETRY_SESSION_SAMPLES", "600"))
+    TELEMETRY_PROVIDER_SAMPLES: int = int(os.getenv("TELEMETRY_PROVIDER_SAMPLES", "4096"))
+    TELEMETRY_MAX_SESSIONS: int = int(os.getenv("TELEMETRY_MAX_SESSIONS", "10000"))
+    
+    # Bid and lease outcome history (disabled when the directory is unset),
+    # shared by all workers on the host, and whether new leases go to the
+    # bid it ranks best rather than the first bid
+    MARKET_HISTORY_DIR: str = os.getenv("MARKET_HISTORY_DIR", "market-history")
+    MARKET_HISTORY_RETENTION_DAYS: int = int(os.getenv("MARKET_HISTORY_RETENTION_DAYS", "90"))
+    MARKET_HISTORY_RANKING_ENABLED: bool = os.getenv("MARKET_HISTORY_RANKING_ENABLED", "true").lower() == "true"
+    
+    # Session event streaming
+    EVENT_STREAM_KEEPALIVE_SECONDS: float = float(os.getenv("EVENT_STREAM_KEEPALIVE_SECONDS", "15"))
+    EVENT_LOG_RETENTION_SECONDS: int = int(os.getenv("EVENT_LOG_RETENTION_SECONDS", "3600"))
     
     @classmethod
     def validate(cls) -> None:
@@ -0,0 +1,96 @@
+import zlib
+from typing import Dict, List, Optional, Tuple
+from .state import StateStore
+
+
+def plan_transfers(
+    balances: Dict[str, int], minimum: int
+) -> List[Tuple[str, str, int]]:
+    """Transfers (from, to, uakt) that lift keys below `minimum` towards the pool average.
+
+    Funds come from the keys furthest above the average, and no donor is
+    taken below it, so a pool that is short overall evens out rather than
+    moving the shortfall around.
+    """
+    if not balances:
+        return []
+    target = sum(balances.values()) // len(balances)
+    needy = sorted(
+        (key for key, balance in balances.items() if balance < minimum),
+        key=balances.get,
+    )
+    donors = sorted(
+        (key for key, balance in balances.items() if balance > target),
+        key=balances.get,
+        reverse=True,
+    )
+    surplus = {key: balances[key] - target for key in donors}
+    transfers = []
+    for key in needy:
+        deficit = target - balances[key]
+        for donor in donors:
+            if deficit <= 0:
+                break
+            amount = min(deficit, surplus[donor])
+            if amount <= 0:
+                continue
+            transfers.append((donor, key, amount))
+            surplus[donor] -= amount
+            deficit -= amount
+    return transfers
+
+
+class SignerPool:
+    """Akash keys the broker signs with, and which key owns each deployment.
+
+    New deployments go to the key owning the fewest live ones, ties broken
+    by a hash of the dseq, so txs spread over every key's sequence. Each
+    deployment's later txs - lease create, deposits, close - must come from
+    the key that created it, so ownership is recorded in the shared
+    StateStore. Deployments with no record predate the pool and belong to
+    `default_key`.
+    """
+
+    NAMESPACE = "signer_owners"
+    LOAD_KEY = "load"
+
+    def __init__(self, keys: List[str], store: StateStore, default_key: str):
+        self.keys = keys
+        self.store = store
+        self.default_key = default_key
+
+    def assign(self, dseq: str) -> str:
+        """Pick the key a new deployment is created with and record it"""
+        chosen: List[str] = []
+
+        def take_least_loaded(load: Optional[Dict[str, int]]) -> Dict[str, int]:
+            load = {key: (load or {}).get(key, 0) for key in self.keys}
+            offset = zlib.crc32(dseq.encode()) % len(self.keys)
+            key = min(self.keys[offset:] + self.keys[:offset], key=load.get)
+            chosen.append(key)
+            return {**load, key: load[key] + 1}
+
+        self.store.update(self.NAMESPACE, self.LOAD_KEY, take_least_loaded)
+        self.store.put(self.NAMESPACE, f"dseq:{dseq}", chosen[0])
+        return chosen[0]
+
+    def owner(self, dseq: str) -> str:
+        return self.store.get(self.NAMESPACE, f"dseq:{dseq}") or self.default_key
+
+    def release(self, dseq: str) -> None:
+        """Forget a closed deployment; harmless for ones the pool never assigned"""
+        key = self.store.get(self.NAMESPACE, f"dseq:{dseq}")
+        if key is None or not self.store.delete(self.NAMESPACE, f"dseq:{dseq}"):
+            return
+        self.store.update(
+            self.NAMESPACE,
+            self.LOAD_KEY,
+            lambda load: {**(load or {}), key: max(0, (load or {}).get(key, 0) - 1)},
+        )
+
+    def load(self) -> Dict[str, int]:
+        load = self.store.get(self.NAMESPACE, self.LOAD_KEY) or {}
+        return {key: load.get(key, 0) for key in self.keys}
+
+    def status(self) -> Dict[str, object]:
+        return {"keys": self.keys, "deployments": self.load()}
@@ -0,0 +1,963 @@
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import subprocess
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from . import tracing
+from .endpoints import SSH_PORT
+from .lease_manager import AKASH_BLOCK_SECONDS, LeaseManager
+from .settings import settings
+
+# Heights start near mainnet's so lease math sees realistic numbers
+GENESIS_HEIGHT = 20_000_000
+
+# Why the chain closed a lease out from under a session
+PROVIDER_FAILURE = "provider_failure"
+ESCROW_DEPLETED = "escrow_depleted"
+CLOSED_BY_OWNER = "closed"
+
+# akash CLI flags that take no value
+BOOLEAN_FLAGS = {"--yes"}
+# Signs every tx the simulated broker sends
+BROKER_ADDRESS = "akash1simbroker"
+# Gas each tx uses on chain, roughly what mainnet reports
+TX_GAS = {
+    "tx deployment create": 190_000,
+    "tx deployment close": 95_000,
+    "tx market lease create": 125_000,
+    "tx market lease create-bid": 105_000,
+}
+# Kubernetes NodePort range providers forward global ports into
+NODE_PORT_MIN = 30000
+NODE_PORT_RANGE = 2768
+
+
+@dataclass
+class MarketConfig:
+    """Shape of the simulated market; prices are uakt per block"""
+
+    providers: int = 60
+    # 0 sizes providers so the market has 50% headroom over the session count
+    capacity_per_provider: int = 0
+    base_price_uakt: float = 160.0
+    hourly_price_volatility: float = 0.03
+    # Chance a provider with room bids on an order; ~9 bids from 60 providers
+    bid_probability: float = 0.15
+    # Bids are txs, so each lands in the first block after its provider's latency
+    bid_latency_seconds: float = 8.0
+    boot_seconds: float = 45.0
+    provider_mtbf_hours: float = 150.0
+    # How long before failing a provider's leases look degraded; 0 fails without warning
+    degradation_warning_seconds: float = 300.0
+    deployment_deposit_uakt: int = 500_000
+    block_seconds: float = AKASH_BLOCK_SECONDS
+    query_seconds: float = 0.15
+    ssh_seconds: float = 1.0
+    s3_sync_seconds: float = 90.0
+
+
+@dataclass
+class SimProvider:
+    address: str
+    capacity: int
+    price_factor: float
+    active: int = 0
+
+
+@dataclass
+class SimLease:
+    dseq: str
+    provider: SimProvider
+    price: float
+    ip_address: str
+    created_height: int
+    escrow_uakt: float
+    ready_at: float
+    fails_at: float
+    closed_reason: Optional[str] = None
+    # Nothing runs, and no port is forwarded, until the provider has the manifest
+    manifest_sent: bool = False
+
+    @property
+    def active(self) -> bool:
+        return self.closed_reason is None
+
+    @property
+    def funded_blocks(self) -> int:
+        return int(self.escrow_uakt / self.price)
+
+    @property
+    def end_height(self) -> int:
+        return self.created_height + self.funded_blocks
+
+
+@dataclass
+class SimDeployment:
+    dseq: str
+    # (arrival time, provider, price) in arrival order
+    bids: List[Tuple[float, SimProvider, float]] = field(default_factory=list)
+    lease: Optional[SimLease] = None
+    closed: bool = False
+
+
+def parse_command(args: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """Split akash CLI arguments into the subcommand's words and --flag values"""
+    positional: List[str] = []
+    options: Dict[str, str] = {}
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg[:2] != "--":
+            positional.append(arg)
+        elif arg in BOOLEAN_FLAGS or index + 1 == len(args):
+            options[arg] = ""
+        else:
+            index += 1
+            options[arg] = args[index]
+        index += 1
+    return positional, options
+
+
+class SimulatedMarket:
+    """In-process stand-in for the akash CLI, the chain behind it and the leases' ssh.
+
+    Hand `run` and `sleep` to a LeaseManager as its runner and sleep. Time is
+    simulated: each command moves the clock on by its latency (a block for
+    transactions), and scheduled events - hourly price moves, provider
+    failures, escrow running dry - fire as the driver advances the clock.
+    Actions run to completion on their own clock, so a sweep that takes ten
+    simulated minutes doesn't hold up sessions arriving meanwhile.
+    """
+
+    def __init__(self, config: MarketConfig, capacity_per_provider: int, seed: int = 0):
+        self.config = config
+        self.random = random.Random(seed)
+        self.now = 0.0
+        self.price_index = 1.0
+        self.providers = [
+            SimProvider(
+                f"akash1simprovider{index:03d}",
+                capacity_per_provider,
+                self.random.uniform(0.7, 1.5),
+            )
+            for index in range(config.providers)
+        ]
+        self.deployments: Dict[str, SimDeployment] = {}
+        self.commands: Dict[str, int] = {}
+        self.gas_simulations = 0
+        # The broker's account; every accepted tx uses up one sequence
+        self.account_sequence = 0
+        self.transactions: Dict[str, Dict[str, Any]] = {}
+        self.spent_uakt = 0.0
+        self.closed_listeners: List[Callable[[SimLease], None]] = []
+        self.degraded_listeners: List[Callable[[SimLease], None]] = []
+        self._events: List[Tuple[float, int, Callable[..., None], tuple]] = []
+        self._sequence = itertools.count()
+        self._serials = itertools.count(1)
+        self._hosts: Dict[str, SimLease] = {}
+        self._handlers = {
+            "tx deployment create": self._create_deployment,
+            "tx deployment close": self._close_deployment,
+            "tx market lease create": self._create_lease,
+            "tx market lease create-bid": self._deposit,
+            "query market bid list": self._list_bids,
+            "query market lease get": self._get_lease,
+            "query market lease list": self._list_leases,
+            "query deployment get": self._get_deployment,
+            "query block": self._get_block,
+            "query auth account": self._get_account,
+            "query tx": self._get_tx,
+            "provider lease-status": self._lease_status,
+            "provider send-manifest": self._send_manifest,
+        }
+        self.schedule(3600, self._move_prices)
+
+    @property
+    def height(self) -> int:
+        return GENESIS_HEIGHT + int(self.now / self.config.block_seconds)
+
+    def time_at_height(self, height: int) -> float:
+        return (height - GENESIS_HEIGHT) * self.config.block_seconds
+
+    def schedule(self, delay: float, callback: Callable[..., None], *args: Any) -> None:
+        self.schedule_at(self.now + delay, callback, *args)
+
+    def schedule_at(self, at: float, callback: Callable[..., None], *args: Any) -> None:
+        heapq.heappush(self._events, (at, next(self._sequence), callback, args))
+
+    def run_until(self, horizon: float) -> None:
+        while self._events and self._events[0][0] <= horizon:
+            at, _, callback, args = heapq.heappop(self._events)
+            self.now = at
+            callback(*args)
+        self.now = horizon
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+    def lease(self, dseq: str) -> Optional[SimLease]:
+        deployment = self.deployments.get(dseq)
+        return deployment.lease if deployment else None
+
+    def accrued_uakt(self) -> float:
+        """Spend so far, counting open leases up to the current height"""
+        return self.spent_uakt + sum(
+            self._lease_cost(lease) for lease in self._hosts.values()
+        )
+
+    def orphaned_deployments(self) -> int:
+        """Deployments left open without a lease, their deposits stuck in escrow"""
+        return sum(
+            1
+            for deployment in self.deployments.values()
+            if not deployment.closed and deployment.lease is None
+        )
+
+    def _lease_cost(self, lease: SimLease) -> float:
+        return (
+            max(0, min(self.height - lease.created_height, lease.funded_blocks))
+            * lease.price
+        )
+
+    def _move_prices(self) -> None:
+        self.price_index *= math.exp(
+            self.random.gauss(0, self.config.hourly_price_volatility)
+        )
+        self.schedule(3600, self._move_prices)
+
+    # Commands
+
+    def run(self, cmd: List[str], **kwargs: Any) -> subprocess.CompletedProcess:
+        if cmd[:3] == ["akash", "keys", "show"]:
+            return subprocess.CompletedProcess(cmd, 0, f"{BROKER_ADDRESS}\n", "")
+        if cmd[0] == "akash":
+            return self._akash(cmd)
+        if cmd[0] == "ssh":
+            port = int(cmd[cmd.index("-p") + 1]) if "-p" in cmd else 22
+            return self._ssh(cmd, cmd[-2].split("@", 1)[-1], port, cmd[-1])
+        # aws s3 rm of a migration backup
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    def _akash(self, cmd: List[str]) -> subprocess.CompletedProcess:
+        positional, options = parse_command(cmd[1:])
+        is_tx = positional[:1] == ["tx"]
+        # Sync broadcasts return once the mempool accepts the tx rather than after its block
+        waits_for_block = is_tx and options.get("--broadcast-mode") != "sync"
+        self.now += (
+            self.config.block_seconds if waits_for_block else self.config.query_seconds
+        )
+        # Longest match first: "tx deployment create <sdl>" is three words and a path
+        for length in (4, 3, 2):
+            subcommand = " ".join(positional[:length])
+            handler = self._handlers.get(subcommand)
+            if handler is not None:
+                break
+        else:
+            return subprocess.CompletedProcess(
+                cmd, 1, "", f"Error: not simulated: {' '.join(positional)}"
+            )
+        self.commands[subcommand] = self.commands.get(subcommand, 0) + 1
+        options["args"] = " ".join(positional[length:])
+        if (
+            is_tx
+            and "--sequence" in options
+            and int(options["--sequence"]) != self.account_sequence
+        ):
+            return subprocess.CompletedProcess(
+                cmd,
+                0,
+                json.dumps(
+                    {
+                        "code": 32,
+                        "txhash": "",
+                        "raw_log": f"account sequence mismatch, expected {self.account_sequence}, "
+                        f"got {options['--sequence']}: incorrect account sequence",
+                    }
+                ),
+                "",
+            )
+        stderr = ""
+        if options.get("--gas") == "auto":
+            # Simulating the tx is one more round trip to the node before broadcasting
+            self.now += self.config.query_seconds
+            self.gas_simulations += 1
+            stderr = f"gas estimate: {int(TX_GAS.get(subcommand, 100_000) * 1.4)}\n"
+        try:
+            response = handler(options)
+            if is_tx:
+                self.account_sequence += 1
+                self.transactions[response["txhash"]] = {
+                    **response,
+                    # A sync broadcast is only in the mempool until the next block
+                    "height": str(self.height + (0 if waits_for_block else 1)),
+                    "gas_used": str(TX_GAS.get(subcommand, 100_000)),
+                }
+            stdout = response if isinstance(response, str) else json.dumps(response)
+            return subprocess.CompletedProcess(cmd, 0, stdout, stderr)
+        except ValueError as e:
+            return subprocess.CompletedProcess(cmd, 1, "", f"Error: {e}")
+
+    def _ssh(
+        self, cmd: List[str], host: str, port: int, command: str
+    ) -> subprocess.CompletedProcess:
+        lease = self._hosts.get(host)
+        self.now += (
+            self.config.s3_sync_seconds
+            if "aws s3" in command
+            else self.config.ssh_seconds
+        )
+        if (
+            lease is None
+            or not lease.active
+            or not lease.manifest_sent
+            or port != self._external_port(lease, SSH_PORT)
+        ):
+            return subprocess.CompletedProcess(
+                cmd,
+                255,
+                "",
+                f"ssh: connect to host {host} port {port}: Connection refused",
+            )
+        if "curl" in command and self.now < lease.ready_at:
+            return subprocess.CompletedProcess(
+                cmd, 7, "", "curl: (7) Failed to connect to localhost"
+            )
+        return subprocess.CompletedProcess(cmd, 0, "1\n", "")
+
+    def _tx(self) -> Dict[str, Any]:
+        return {
+            "height": str(self.height),
+            "txhash": f"{self.random.getrandbits(128):032X}",
+            "code": 0,
+        }
+
+    def _get_account(self, options: Dict[str, str]) -> Dict[str, Any]:
+        return {
+            "account": {
+                "@type": "/cosmos.auth.v1beta1.BaseAccount",
+                "address": options["args"],
+                "account_number": "1",
+                "sequence": str(self.account_sequence),
+            }
+        }
+
+    def _get_tx(self, options: Dict[str, str]) -> Dict[str, Any]:
+        tx = self.transactions.get(options["args"])
+        if tx is None or int(tx["height"]) > self.height:
+            raise ValueError(f"tx ({options['args']}) not found")
+        return tx
+
+    def _deployment(self, options: Dict[str, str]) -> SimDeployment:
+        deployment = self.deployments.get(options.get("--dseq", ""))
+        if deployment is None:
+            raise ValueError("deployment not found")
+        return deployment
+
+    def _create_deployment(self, options: Dict[str, str]) -> Dict[str, Any]:
+        dseq = options["--dseq"]
+        if dseq in self.deployments:
+            raise ValueError("deployment exists")
+        deployment = SimDeployment(dseq)
+        for provider in self.providers:
+            if (
+                provider.active < provider.capacity
+                and self.random.random() < self.config.bid_probability
+            ):
+                latency = self.random.expovariate(1 / self.config.bid_latency_seconds)
+                arrival = self.time_at_height(
+                    self.height + 1 + int(latency / self.config.block_seconds)
+                )
+                price = (
+                    self.config.base_price_uakt
+                    * self.price_index
+                    * provider.price_factor
+                )
+                deployment.bids.append(
+                    (
+                        arrival,
+                        provider,
+                        round(price * self.random.uniform(0.95, 1.05), 2),
+                    )
+                )
+        deployment.bids.sort(key=lambda bid: bid[0])
+        self.deployments[dseq] = deployment
+        return self._tx()
+
+    def bids(self, deployment: SimDeployment) -> List[Dict[str, Any]]:
+        """Open bids that have reached the chain, as `query market bid list` returns them"""
+        return [
+            {
+                "bid": {
+                    "bid_id": {
+                        "owner": settings.AKASH_FROM,
+                        "dseq": deployment.dseq,
+                        "gseq": 1,
+                        "oseq": 1,
+                        "provider": provider.address,
+                    },
+                    "state": "open",
+                    "price": {"denom": "uakt", "amount": str(price)},
+                }
+            }
+            for arrival, provider, price in deployment.bids
+            if arrival <= self.now
+        ]
+
+    def _list_bids(self, options: Dict[str, str]) -> Dict[str, Any]:
+        deployment = self.deployments.get(options.get("--dseq", ""))
+        return {
+            "bids": (
+                self.bids(deployment) if deployment and deployment.lease is None else []
+            )
+        }
+
+    def _create_lease(self, options: Dict[str, str]) -> Dict[str, Any]:
+        deployment = self._deployment(options)
+        if deployment.closed or deployment.lease is not None:
+            raise ValueError("deployment has no open order")
+        bid = next(
+            (
+                bid
+                for bid in deployment.bids
+                if bid[1].address == options.get("--provider") and bid[0] <= self.now
+            ),
+            None,
+        )
+        if bid is None:
+            raise ValueError("bid not found")
+        _, provider, price = bid
+        if provider.active >= provider.capacity:
+            raise ValueError("provider has insufficient capacity")
+
+        provider.active += 1
+        serial = next(self._serials)
+        lease = SimLease(
+            dseq=deployment.dseq,
+            provider=provider,
+            price=price,
+            ip_address=f"10.{serial >> 16 & 255}.{serial >> 8 & 255}.{serial & 255}",
+            created_height=self.height,
+            escrow_uakt=self.config.deployment_deposit_uakt,
+            ready_at=self.now
+            + self.config.boot_seconds * self.random.uniform(0.5, 1.5),
+            fails_at=self.now
+            + self.random.expovariate(1 / (self.config.provider_mtbf_hours * 3600)),
+        )
+        deployment.lease = lease
+        self._hosts[lease.ip_address] = lease
+
+        self.schedule_at(
+            self.time_at_height(lease.end_height), self._check_escrow, lease
+        )
+        self.schedule_at(lease.fails_at, self._fail, lease)
+        if self.config.degradation_warning_seconds > 0:
+            self.schedule_at(
+                max(self.now, lease.fails_at - self.config.degradation_warning_seconds),
+                self._degrade,
+                lease,
+            )
+        return self._tx()
+
+    def _deposit(self, options: Dict[str, str]) -> Dict[str, Any]:
+        lease = self._deployment(options).lease
+        if lease is None or not lease.active:
+            raise ValueError("lease not active")
+        lease.escrow_uakt += int(options["--deposit"].rstrip("uakt"))
+        self.schedule_at(
+            self.time_at_height(lease.end_height), self._check_escrow, lease
+        )
+        return self._tx()
+
+    def _close_deployment(self, options: Dict[str, str]) -> Dict[str, Any]:
+        deployment = self._deployment(options)
+        if deployment.closed:
+            raise ValueError("deployment closed")
+        deployment.closed = True
+        if deployment.lease is not None and deployment.lease.active:
+            self._close(deployment.lease, CLOSED_BY_OWNER)
+        return self._tx()
+
+    def _get_lease(self, options: Dict[str, str]) -> Dict[str, Any]:
+        lease = self._deployment(options).lease
+        if lease is None or not lease.active:
+            raise ValueError("lease not found")
+        return {
+            "lease": {
+                "lease": {
+                    "created_at": str(lease.created_height),
+                    "state": {"transferred": {"amount": str(lease.funded_blocks)}},
+                }
+            }
+        }
+
+    def _list_leases(self, options: Dict[str, str]) -> str:
+        if options.get("--state") == "active":
+            leases = list(self._hosts.values())
+        else:
+            leases = [
+                deployment.lease
+                for deployment in self.deployments.values()
+                if deployment.lease is not None
+            ]
+        # Every sweep lists every lease, so entries are written as JSON directly
+        owner = json.dumps(settings.AKASH_FROM)
+        entries = ",".join(self._lease_entry(lease, owner) for lease in leases)
+        return f'{{"leases": [{entries}], "pagination": {{"next_key": null}}}}'
+
+    def _lease_entry(self, lease: SimLease, owner: str) -> str:
+        cost = int(self._lease_cost(lease))
+        return (
+            f'{{"lease": {{"lease_id": {{"owner": {owner}, '
+            f'"dseq": "{lease.dseq}", "gseq": 1, "oseq": 1, '
+            f'"provider": "{lease.provider.address}"}}, '
+            f'"state": "{"active" if lease.active else "closed"}", '
+            f'"price": {{"denom": "uakt", "amount": "{lease.price}"}}}}, '
+            f'"escrow_payment": {{"withdrawn": {{"denom": "uakt", "amount": "{cost}"}}, '
+            f'"balance": {{"denom": "uakt", "amount": "{int(lease.escrow_uakt) - cost}"}}}}}}'
+        )
+
+    def _get_deployment(self, options: Dict[str, str]) -> Dict[str, Any]:
+        deployment = self._deployment(options)
+        lease = deployment.lease
+        return {
+            "deployment": {
+                "deployment_id": {
+                    "owner": settings.AKASH_FROM,
+                    "dseq": deployment.dseq,
+                },
+                "state": "closed" if deployment.closed else "active",
+            },
+            "lease": {
+                "services": {
+                    "sunshine": {
+                        "external_ip": (
+                            lease.ip_address if lease and lease.active else ""
+                        )
+                    }
+                }
+            },
+        }
+
+    def _provider_lease(self, options: Dict[str, str]) -> SimLease:
+        lease = self._deployment(options).lease
+        if (
+            lease is None
+            or not lease.active
+            or lease.provider.address != options.get("--provider")
+        ):
+            raise ValueError("lease not found")
+        return lease
+
+    def _send_manifest(self, options: Dict[str, str]) -> Dict[str, Any]:
+        self._provider_lease(options).manifest_sent = True
+        return {}
+
+    def _lease_status(self, options: Dict[str, str]) -> Dict[str, Any]:
+        lease = self._provider_lease(options)
+        if not lease.manifest_sent:
+            raise ValueError("manifest not found")
+        # The provider forwards the manifest's global ports to node ports of its choosing
+        return {
+            "services": {"sunshine": {"name": "sunshine", "available": 1, "total": 1}},
+            "forwarded_ports": {
+                "sunshine": [
+                    {
+                        "host": lease.ip_address,
+                        "port": port,
+                        "proto": proto,
+                        "name": "sunshine",
+                        "externalPort": self._external_port(lease, port),
+                    }
+                    for port, proto in (
+                        (settings.SUNSHINE_PORT, "TCP"),
+                        (settings.SUNSHINE_UDP_PORT, "UDP"),
+                        (SSH_PORT, "TCP"),
+                    )
+                ]
+            },
+        }
+
+    @staticmethod
+    def _external_port(lease: SimLease, port: int) -> int:
+        return (
+            NODE_PORT_MIN
+            + zlib.crc32(f"{lease.dseq}/{port}".encode()) % NODE_PORT_RANGE
+        )
+
+    def _get_block(self, options: Dict[str, str]) -> Dict[str, Any]:
+        return {"block": {"header": {"height": str(self.height)}}}
+
+    # Chain-side lease lifecycle
+
+    def _check_escrow(self, lease: SimLease) -> None:
+        # Superseded by a later check when the lease was topped up
+        if lease.active and self.height >= lease.end_height:
+            self._close(lease, ESCROW_DEPLETED)
+
+    def _fail(self, lease: SimLease) -> None:
+        if lease.active:
+            self._close(lease, PROVIDER_FAILURE)
+
+    def _degrade(self, lease: SimLease) -> None:
+        if lease.active:
+            for listener in self.degraded_listeners:
+                listener(lease)
+
+    def _close(self, lease: SimLease, reason: str) -> None:
+        lease.closed_reason = reason
+        lease.provider.active -= 1
+        self.spent_uakt += self._lease_cost(lease)
+        self._hosts.pop(lease.ip_address, None)
+        if reason != CLOSED_BY_OWNER:
+            for listener in self.closed_listeners:
+                listener(lease)
+
+
+class SimulatedChainEvents:
+    """Bids pushed as ChainEventSubscriber delivers them, so provisioning doesn't query the market"""
+
+    connected = True
+
+    def __init__(self, market: SimulatedMarket):
+        self.market = market
+
+    def collect_bids(
+        self, dseq: str, timeout: float, window: float
+    ) -> List[Dict[str, Any]]:
+        deployment = self.market.deployments.get(dseq)
+        if (
+            deployment is None
+            or not deployment.bids
+            or deployment.bids[0][0] - self.market.now > timeout
+        ):
+            self.market.now += timeout
+            return []
+        self.market.now = max(self.market.now, deployment.bids[0][0]) + window
+        return self.market.bids(deployment)
+
+
+@dataclass
+class Policy:
+    """Broker settings a simulation run evaluates"""
+
+    name: str
+    sweep_interval_seconds: float = settings.EXTENSION_SWEEP_INTERVAL_SECONDS
+    threshold_blocks: int = 300
+    deposit_uakt: int = settings.LEASE_PRICE_UAKT
+    chain_events: bool = False
+    migrate_on_degradation: bool = False
+    retry_seconds: float = 30.0
+
+
+POLICIES = {
+    "default": Policy("default"),
+    "chain-events": Policy("chain-events", chain_events=True),
+    "deep-deposit": Policy("deep-deposit", threshold_blocks=600, deposit_uakt=100_000),
+    "migrate": Policy(
+        "migrate",
+        chain_events=True,
+        deposit_uakt=100_000,
+        threshold_blocks=600,
+        migrate_on_degradation=True,
+    ),
+}
+
+
+@dataclass
+class SimSession:
+    session_id: str
+    requested_at: float
+    ends_at: float
+    lease: Optional[SimLease] = None
+    interrupted_at: Optional[float] = None
+    migrating: bool = False
+    ended: bool = False
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+class Simulation:
+    """Keeps a steady number of sessions running on a simulated market through a LeaseManager.
+
+    Sessions arrive over the first ten minutes and last an exponentially
+    distributed time; each one that ends is replaced. The broker's
+    behaviour is the LeaseManager's: sessions are provisioned with
+    create_lease, kept funded by an extend_if_needed sweep and, when the
+    policy says so, moved off degraded providers with migrate_session.
+    A session whose lease the chain closes is interrupted until it has a
+    new one.
+    """
+
+    def __init__(
+        self,
+        policy: Policy,
+        sessions: int,
+        hours: float,
+        mean_session_hours: float = 2.0,
+        config: Optional[MarketConfig] = None,
+        seed: int = 0,
+    ):
+        config = config or MarketConfig()
+        capacity = config.capacity_per_provider or math.ceil(
+            sessions * 1.5 / config.providers
+        )
+        self.policy = policy
+        self.sessions = sessions
+        self.horizon = hours * 3600
+        self.mean_session_seconds = mean_session_hours * 3600
+        self.market = SimulatedMarket(config, capacity, seed)
+        self.random = random.Random(seed + 1)
+        self.lease_manager = LeaseManager(
+            chain_events=(
+                SimulatedChainEvents(self.market) if policy.chain_events else None
+            ),
+            runner=self.market.run,
+            sleep=self.market.sleep,
+        )
+        self.market.closed_listeners.append(self._lease_lost)
+        self.market.degraded_listeners.append(self._lease_degraded)
+        self.by_lease: Dict[str, SimSession] = {}
+        self.active: Dict[str, SimSession] = {}
+        self._ids = itertools.count()
+        self.completed = 0
+        self.session_seconds = 0.0
+        self.downtime_seconds = 0.0
+        self.interruptions = {PROVIDER_FAILURE: 0, ESCROW_DEPLETED: 0}
+        self.provision_failures = 0
+        self.migrations = {"attempted": 0, "succeeded": 0}
+        self.extensions = 0
+        self.longest_sweep_seconds = 0.0
+        self.time_to_lease: List[float] = []
+
+    def run(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        for _ in range(self.sessions):
+            self.market.schedule(
+                self.random.uniform(0, min(600, self.horizon)), self._start_session
+            )
+        self.market.schedule(self.policy.sweep_interval_seconds, self._sweep)
+        # Spans would time the simulator's wall clock, not the market's
+        with tracing.disabled():
+            self.market.run_until(self.horizon)
+        return self.report(time.monotonic() - started)
+
+    def _start_session(self) -> None:
+        now = self.market.now
+        session = SimSession(
+            f"sim-{next(self._ids)}",
+            now,
+            now + self.random.expovariate(1 / self.mean_session_seconds),
+        )
+        self.active[session.session_id] = session
+        self.market.schedule_at(session.ends_at, self._end_session, session)
+        self._provision(session)
+
+    def _provision(self, session: SimSession) -> None:
+        if session.ended:
+            return
+        try:
+            lease_info = self.lease_manager.create_lease()
+        except Exception:
+            self.provision_failures += 1
+            self.market.schedule(self.policy.retry_seconds, self._provision, session)
+            return
+        if session.interrupted_at is None:
+            self.time_to_lease.append(self.market.now - session.requested_at)
+        self._attach(session, self.market.lease(lease_info.lease_id))
+
+    def _attach(self, session: SimSession, lease: SimLease) -> None:
+        session.lease = lease
+        self.by_lease[lease.dseq] = session
+        if session.interrupted_at is not None:
+            self.downtime_seconds += self.market.now - session.interrupted_at
+            session.interrupted_at = None
+
+    def _end_session(self, session: SimSession) -> None:
+        session.ended = True
+        del self.active[session.session_id]
+        if session.lease is not None and session.lease.active:
+            self.by_lease.pop(session.lease.dseq, None)
+            self.lease_manager.close_lease(session.lease.dseq)
+        if session.interrupted_at is not None:
+            self.downtime_seconds += self.market.now - session.interrupted_at
+        self.completed += 1
+        self.session_seconds += self.market.now - session.requested_at
+        # Closed system: a new player takes every slot that frees up
+        if self.market.now < self.horizon:
+            self.market.schedule(0, self._start_session)
+
+    def _sweep(self) -> None:
+        started = self.market.now
+        remaining = self.lease_manager.blocks_remaining_by_lease()
+        for dseq, session in list(self.by_lease.items()):
+            if session.lease is None or not session.lease.active:
+                continue
+            if remaining.get(dseq, 0) >= self.policy.threshold_blocks:
+                continue
+            result = self.lease_manager.extend_if_needed(
+                dseq,
+                session.lease.provider.address,
+                threshold_blocks=self.policy.threshold_blocks,
+                deposit_uakt=self.policy.deposit_uakt,
+                blocks_remaining=remaining.get(dseq),
+            )
+            if result.get("extended"):
+                self.extensions += 1
+        took = self.market.now - started
+        self.longest_sweep_seconds = max(self.longest_sweep_seconds, took)
+        self.market.schedule(
+            max(0.0, self.policy.sweep_interval_seconds - took), self._sweep
+        )
+
+    def _lease_lost(self, lease: SimLease) -> None:
+        session = self.by_lease.pop(lease.dseq, None)
+        if session is None:
+            return
+        self.interruptions[lease.closed_reason] += 1
+        session.lease = None
+        session.interrupted_at = self.market.now
+        # A migration under way brings the session back on its new lease
+        if not session.migrating:
+            self._provision(session)
+
+    def _lease_degraded(self, lease: SimLease) -> None:
+        session = self.by_lease.get(lease.dseq)
+        if (
+            not self.policy.migrate_on_degradation
+            or session is None
+            or session.migrating
+        ):
+            return
+        session.migrating = True
+        self.migrations["attempted"] += 1
+        result = self.lease_manager.migrate_session(
+            lease.dseq,
+            lease.provider.address,
+            "sim-session-backups",
+            session_id=session.session_id,
+        )
+        session.migrating = False
+
+        if result["status"] not in ("success", "warning"):
+            if session.lease is None:
+                self._provision(session)
+            return
+        new_lease = self.market.lease(result["new_lease_id"])
+        if result["status"] == "warning" and lease.active:
+            self.lease_manager.close_lease(lease.dseq)
+        self.migrations["succeeded"] += 1
+        # Actions run to completion, so a failure during the migration is accounted here
+        if self.market.now > lease.fails_at and lease.closed_reason != PROVIDER_FAILURE:
+            self.interruptions[PROVIDER_FAILURE] += 1
+            if session.interrupted_at is None:
+                session.interrupted_at = lease.fails_at
+        self.by_lease.pop(lease.dseq, None)
+        if session.ended:
+            self.lease_manager.close_lease(new_lease.dseq)
+        else:
+            self._attach(session, new_lease)
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        session_seconds = self.session_seconds + sum(
+            self.market.now - session.requested_at for session in self.active.values()
+        )
+        session_hours = session_seconds / 3600
+        cost = self.market.accrued_uakt()
+        queries = {
+            name: count
+            for name, count in self.market.commands.items()
+            if name.startswith("query")
+        }
+        transactions = {
+            name: count
+            for name, count in self.market.commands.items()
+            if name.startswith("tx")
+        }
+        interrupted = sum(self.interruptions.values())
+        return {
+            "policy": self.policy.name,
+            "sessions": self.sessions,
+            "simulated_hours": round(self.horizon / 3600, 2),
+            "wall_seconds": round(wall_seconds, 2),
+            "sessions_completed": self.completed,
+            "session_hours": round(session_hours, 1),
+            "cost_uakt": round(cost),
+            "cost_uakt_per_session_hour": (
+                round(cost / session_hours, 1) if session_hours else None
+            ),
+            "interruptions": dict(self.interruptions),
+            "interruptions_per_1000_session_hours": (
+                round(interrupted * 1000 / session_hours, 2) if session_hours else None
+            ),
+            "downtime_seconds": round(self.downtime_seconds),
+            "provision_failures": self.provision_failures,
+            "orphaned_deployments": self.market.orphaned_deployments(),
+            "time_to_lease_seconds": {
+                "p50": percentile(self.time_to_lease, 0.5),
+                "p99": percentile(self.time_to_lease, 0.99),
+            },
+            "extensions": self.extensions,
+            "longest_sweep_seconds": round(self.longest_sweep_seconds),
+            "migrations": dict(self.migrations),
+            "chain_queries": sum(queries.values()),
+            "chain_queries_by_subcommand": queries,
+            "transactions": sum(transactions.values()),
+            "transactions_by_subcommand": transactions,
+            "gas_simulations": self.market.gas_simulations,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Simulate LeaseManager policies against a model Akash market"
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=10_000,
+        help="Concurrent sessions to keep running",
+    )
+    parser.add_argument("--hours", type=float, default=24, help="Simulated time")
+    parser.add_argument("--mean-session-hours", type=float, default=2.0)
+    parser.add_argument(
+        "--policy",
+        action="append",
+        choices=sorted(POLICIES),
+        help="Policy to evaluate; repeat to compare (all by default)",
+    )
+    parser.add_argument("--providers", type=int, default=MarketConfig.providers)
+    parser.add_argument(
+        "--mtbf-hours",
+        type=float,
+        default=MarketConfig.provider_mtbf_hours,
+        help="Mean time between failures per lease",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = MarketConfig(providers=args.providers, provider_mtbf_hours=args.mtbf_hours)
+    for name in args.policy or sorted(POLICIES):
+        simulation = Simulation(
+            POLICIES[name],
+            args.sessions,
+            args.hours,
+            args.mean_session_hours,
+            config=config,
+            seed=args.seed,
+        )
+        print(json.dumps(simulation.run()), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from .settings import settings
+from .state import StateStore
+
+# Must match the port spacing in sdl/templates/sunshine-packed.yaml.tmpl
+SLOT_PORT_STRIDE = 100
+SUNSHINE_WEB_PORT = 47990
+# Occupant of a slot whose reset failed: it may still hold a player's state
+RETIRED = "retired"
+
+
+def live_occupants(record: Dict[str, Any]) -> int:
+    return sum(1 for occupant in record["occupied"].values() if occupant != RETIRED)
+
+
+@dataclass
+class SlotAssignment:
+    lease_id: str
+    provider: str
+    host: str
+    slot_index: int
+    new_lease: bool = False
+
+    @property
+    def port(self) -> int:
+        return settings.SUNSHINE_PORT + self.slot_index * SLOT_PORT_STRIDE
+
+    @property
+    def web_port(self) -> int:
+        return SUNSHINE_WEB_PORT + self.slot_index * SLOT_PORT_STRIDE
+
+
+class SlotAllocator:
+    """Packs sessions onto the Sunshine slots of shared leases.
+
+    Each packed lease is one record in the shared StateStore holding its
+    slot occupancy, so claims are atomic across workers. Sessions go to the
+    fullest lease with a free slot in their pool (tier and region), which
+    lets lightly used leases drain. A new lease is only needed when every
+    slot in the pool is taken, and an empty lease stays available until it
+    has been idle for the reap TTL.
+    """
+
+    NAMESPACE = "packed_leases"
+
+    def __init__(self, store: StateStore):
+        self.store = store
+
+    @staticmethod
+    def pool_key(tier: str, region: str) -> str:
+        return f"{tier}:{region}"
+
+    @staticmethod
+    def _assignment(
+        record: Dict[str, Any], slot_index: int, new_lease: bool = False
+    ) -> SlotAssignment:
+        return SlotAssignment(
+            lease_id=record["lease_id"],
+            provider=record["provider"],
+            host=record["host"],
+            slot_index=slot_index,
+            new_lease=new_lease,
+        )
+
+    def claim(self, pool: str, session_id: str) -> Optional[SlotAssignment]:
+        """Take a free slot on an existing lease, or None if the pool is full"""
+        candidates = [
+            (len(record["occupied"]), lease_id)
+            for lease_id, record in self.store.items(self.NAMESPACE)
+            if record["pool"] == pool and len(record["occupied"]) < record["slot_count"]
+        ]
+
+        def take(record: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if record is None:
+                return None
+            for slot_index in range(record["slot_count"]):
+                if str(slot_index) not in record["occupied"]:
+                    record["occupied"][str(slot_index)] = session_id
+                    record["idle_since"] = None
+                    break
+            return record
+
+        for _, lease_id in sorted(candidates, reverse=True):
+            # Another worker may have filled it since the scan
+            record = self.store.update(self.NAMESPACE, lease_id, take)
+            for slot_index, occupant in (record or {}).get("occupied", {}).items():
+                if occupant == session_id:
+                    return self._assignment(record, int(slot_index))
+        return None
+
+    def add_lease(
+        self,
+        pool: str,
+        lease_id: str,
+        provider: str,
+        host: str,
+        slot_count: int,
+        session_id: str,
+    ) -> SlotAssignment:
+        """Register a freshly created packed lease with its first slot taken"""
+        record = {
+            "lease_id": lease_id,
+            "provider": provider,
+            "host": host,
+            "pool": pool,
+            "slot_count": slot_count,
+            "occupied": {"0": session_id},
+            "idle_since": None,
+            "created_at": time.time(),
+        }
+        self.store.put(self.NAMESPACE, lease_id, record)
+        return self._assignment(record, 0, new_lease=True)
+
+    def release(
+        self, lease_id: str, slot_index: int, retire: bool = False
+    ) -> Optional[int]:
+        """Free a slot; returns how many players remain on the lease.
+
+        A retired slot is never handed out again, so a slot that could not be
+        wiped doesn't give the next player the previous one's state.
+        """
+
+        def free(record: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if record is not None:
+                if retire:
+                    record["occupied"][str(slot_index)] = RETIRED
+                else:
+                    record["occupied"].pop(str(slot_index), None)
+                if not live_occupants(record):
+                    record["idle_since"] = time.time()
+            return record
+
+        record = self.store.update(self.NAMESPACE, lease_id, free)
+        return live_occupants(record) if record is not None else None
+
+    def remove_lease(self, lease_id: str) -> None:
+        self.store.delete(self.NAMESPACE, lease_id)
+
+    def reap(
+        self, idle_ttl_seconds: float, close_lease: Callable[[str], bool]
+    ) -> List[str]:
+        """Close packed leases that have had no players for the idle TTL"""
+        closed = []
+        removed: Dict[str, Dict[str, Any]] = {}
+        now = time.time()
+        cutoff = now - idle_ttl_seconds
+
+        def remove_if_idle(
+            current: Optional[Dict[str, Any]],
+        ) -> Optional[Dict[str, Any]]:
+            # A session may have claimed a slot since the scan
+            if (
+                current is None
+                or live_occupants(current)
+                or (current.get("idle_since") or now) > cutoff
+            ):
+                return current
+            removed[current["lease_id"]] = current
+            return None
+
+        for lease_id, record in list(self.store.items(self.NAMESPACE)):
+            if (
+                live_occupants(record)
+                or not record.get("idle_since")
+                or record["idle_since"] > cutoff
+            ):
+                continue
+            self.store.update(self.NAMESPACE, lease_id, remove_if_idle)
+            if lease_id not in removed:
+                continue
+            if close_lease(lease_id):
+                closed.append(lease_id)
+            else:
+                # Keep tracking the lease so the next reap retries the close
+                self.store.put(self.NAMESPACE, lease_id, removed[lease_id])
+        return closed
+
+    def status(self) -> Dict[str, Dict[str, int]]:
+        pools: Dict[str, Dict[str, int]] = {}
+        for _, record in self.store.items(self.NAMESPACE):
+            pool = pools.setdefault(
+                record["pool"], {"leases": 0, "slots": 0, "occupied": 0}
+            )
+            pool["leases"] += 1
+            pool["slots"] += record["slot_count"]
+            pool["occupied"] += live_occupants(record)
+        return pools
@@ -0,0 +1,268 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leadership (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class StateStore:
+    """Broker state shared by every worker process through SQLite in WAL mode.
+
+    Values are JSON documents grouped by namespace ("sessions", "scheduler",
+    ...). WAL lets readers in all workers proceed while one writer commits,
+    and `update` gives atomic read-modify-write across processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            # Connections must not be shared across fork, so each process
+            # (and each thread within it) opens its own
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl is not None else None
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def put(
+        self, namespace: str, key: str, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time(), self._expiry(ttl)),
+            )
+
+    def put_if_absent(
+        self, namespace: str, key: str, value: Any, ttl: Optional[float] = None
+    ) -> bool:
+        """Insert a value unless a live one exists; returns whether it was inserted"""
+        with self._transaction() as conn:
+            now = time.time()
+            conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                (namespace, key, now),
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (namespace, key, value, updated_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now, self._expiry(ttl)),
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+            return cursor.rowcount == 1
+
+    def update(
+        self,
+        namespace: str,
+        key: str,
+        function: Callable[[Optional[Any]], Optional[Any]],
+        ttl: Optional[float] = None,
+    ) -> Optional[Any]:
+        """Atomically replace a value with `function(current)`; None deletes it"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+            new_value = function(json.loads(row[0]) if row else None)
+            if new_value is None:
+                conn.execute(
+                    "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+                )
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        namespace,
+                        key,
+                        json.dumps(new_value),
+                        time.time(),
+                        self._expiry(ttl),
+                    ),
+                )
+            return new_value
+
+    def items(self, namespace: str, page_size: int = 500) -> Iterator[Tuple[str, Any]]:
+        """Iterate live entries of a namespace in key order, one page at a time"""
+        last_key = ""
+        while True:
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT key, value FROM kv WHERE namespace = ? AND key > ? "
+                    "AND (expires_at IS NULL OR expires_at > ?) ORDER BY key LIMIT ?",
+                    (namespace, last_key, time.time(), page_size),
+                )
+                .fetchall()
+            )
+            for key, value in rows:
+                yield key, json.loads(value)
+            if len(rows) < page_size:
+                return
+            last_key = rows[-1][0]
+
+    def count(self, namespace: str) -> int:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT COUNT(*) FROM kv WHERE namespace = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def purge_expired(self) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+            return cursor.rowcount
+
+    def trim(self, namespace: str, max_entries: int) -> int:
+        """Delete the least recently written entries beyond `max_entries`"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key IN ("
+                "SELECT key FROM kv WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (namespace, namespace, max_entries),
+            )
+            return cursor.rowcount
+
+    def try_acquire_leadership(self, name: str, holder: str, ttl: float) -> bool:
+        """Acquire or renew a leadership lease; only one holder wins per TTL window"""
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute(
+                "SELECT holder, expires_at FROM leadership WHERE name = ?", (name,)
+            ).fetchone()
+            if row and row[0] != holder and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leadership (name, holder, expires_at) VALUES (?, ?, ?)",
+                (name, holder, now + ttl),
+            )
+            return True
+
+    def release_leadership(self, name: str, holder: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM leadership WHERE name = ? AND holder = ?", (name, holder)
+            )
+
+    def leader(self, name: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT holder, expires_at FROM leadership WHERE name = ? AND expires_at > ?",
+                (name, time.time()),
+            )
+            .fetchone()
+        )
+        return {"holder": row[0], "expires_at": row[1]} if row else None
+
+    def append_event(self, origin: str, payload: Dict[str, Any]) -> int:
+        """Append to the cross-worker event log; returns the event id"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO events (origin, payload, created_at) VALUES (?, ?, ?)",
+                (origin, json.dumps(payload), time.time()),
+            )
+            return cursor.lastrowid
+
+    def events_after(
+        self, after_id: int, limit: int = 500
+    ) -> List[Tuple[int, str, Dict[str, Any]]]:
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT id, origin, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            )
+            .fetchall()
+        )
+        return [
+            (event_id, origin, json.loads(payload))
+            for event_id, origin, payload in rows
+        ]
+
+    def last_event_id(self) -> int:
+        row = self._connection().execute("SELECT MAX(id) FROM events").fetchone()
+        return row[0] or 0
+
+    def prune_events(self, older_than_seconds: float) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM events WHERE created_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cursor.rowcount
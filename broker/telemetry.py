@@ -0,0 +1,176 @@
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# Signals the lease agent and Moonlight clients report, one value per sample
+ENCODE_LATENCY_MS = "encode_latency_ms"
+FRAME_INTERVAL_MS = "frame_interval_ms"
+DROPPED_FRAMES = "dropped_frames"
+BITRATE_KBPS = "bitrate_kbps"
+RTT_MS = "rtt_ms"
+SIGNALS = (ENCODE_LATENCY_MS, FRAME_INTERVAL_MS, DROPPED_FRAMES, BITRATE_KBPS, RTT_MS)
+
+SOURCES = ("agent", "client")
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class RingBuffer:
+    """The last `capacity` values of one signal, in a preallocated array of doubles"""
+
+    __slots__ = ("values", "capacity", "count", "_next")
+
+    def __init__(self, capacity: int):
+        self.values = array("d", bytes(8 * capacity))
+        self.capacity = capacity
+        self.count = 0
+        self._next = 0
+
+    def append(self, value: float) -> None:
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.append(value)
+
+    def summary(
+        self, percentiles: Sequence[float] = PERCENTILES
+    ) -> Optional[Dict[str, float]]:
+        if not self.count:
+            return None
+        # Sorting a copy on read keeps ingestion to one store per value
+        ordered = sorted(
+            self.values if self.count == self.capacity else self.values[: self.count]
+        )
+        summary = {
+            f"p{round(fraction * 100)}": round(
+                ordered[min(self.count - 1, int(fraction * self.count))], 2
+            )
+            for fraction in percentiles
+        }
+        summary["mean"] = round(sum(ordered) / self.count, 2)
+        summary["max"] = round(ordered[-1], 2)
+        return summary
+
+
+class SignalBuffers:
+    """Ring buffers for every signal of one session or provider"""
+
+    __slots__ = ("buffers", "provider", "samples", "last_sample_at")
+
+    def __init__(self, capacity: int, provider: str = ""):
+        self.buffers = {signal: RingBuffer(capacity) for signal in SIGNALS}
+        self.provider = provider
+        self.samples = 0
+        self.last_sample_at = 0.0
+
+    def add(self, signal: str, values: List[float], now: float) -> None:
+        self.buffers[signal].extend(values)
+        self.samples += len(values)
+        self.last_sample_at = now
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "samples": self.samples,
+            "last_sample_age_seconds": (
+                round(time.time() - self.last_sample_at, 1) if self.samples else None
+            ),
+            "signals": {
+                signal: buffer.summary() for signal, buffer in self.buffers.items()
+            },
+        }
+
+
+class TelemetryAggregator:
+    """Rolling stream-quality statistics per session and per provider.
+
+    Samples arrive in batches, one list of values per signal. Each value
+    lands in a fixed-size ring buffer for its session and its provider, so
+    memory is bounded and ingestion allocates nothing per sample.
+    Percentiles are computed when a summary is read. A worker only
+    aggregates the samples sent to it, and sessions that stop reporting are
+    evicted oldest first once `max_sessions` are tracked.
+    """
+
+    def __init__(
+        self,
+        session_capacity: int = 600,
+        provider_capacity: int = 4096,
+        max_sessions: int = 10000,
+    ):
+        self.session_capacity = session_capacity
+        self.provider_capacity = provider_capacity
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SignalBuffers]" = OrderedDict()
+        self._providers: Dict[str, SignalBuffers] = {}
+        self._lock = threading.Lock()
+
+    def ingest(
+        self, session_id: str, provider: str, samples: Dict[str, List[float]]
+    ) -> int:
+        """Add a batch of samples; unknown signals or non-finite values raise ValueError before anything is stored"""
+        unknown = set(samples) - set(SIGNALS)
+        if unknown:
+            raise ValueError(f"Unknown telemetry signals: {', '.join(sorted(unknown))}")
+        # One NaN would poison every percentile of the session's and provider's buffers
+        non_finite = sorted(
+            signal
+            for signal, values in samples.items()
+            if not all(math.isfinite(value) for value in values)
+        )
+        if non_finite:
+            raise ValueError(
+                f"Non-finite telemetry values for: {', '.join(non_finite)}"
+            )
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = SignalBuffers(
+                    self.session_capacity, provider
+                )
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            # A migrated session reports under its new provider from here on
+            session.provider = provider
+            provider_buffers = self._providers.get(provider)
+            if provider_buffers is None:
+                provider_buffers = self._providers[provider] = SignalBuffers(
+                    self.provider_capacity, provider
+                )
+            for signal, values in samples.items():
+                session.add(signal, values, now)
+                provider_buffers.add(signal, values, now)
+        return sum(len(values) for values in samples.values())
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def session_summary(self, session_id: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return {
+                "session_id": session_id,
+                "provider": session.provider,
+                **session.summary(),
+            }
+
+    def provider_summaries(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            sessions: Dict[str, int] = {}
+            for session in self._sessions.values():
+                sessions[session.provider] = sessions.get(session.provider, 0) + 1
+            return {
+                provider: {"sessions": sessions.get(provider, 0), **buffers.summary()}
+                for provider, buffers in self._providers.items()
+            }
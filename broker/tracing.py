@@ -0,0 +1,436 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import requests
+from .settings import settings
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "broker_current_span", default=None
+)
+
+
+class Span:
+    """A timed unit of work within a trace"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "attributes",
+        "start_time_ns",
+        "end_time_ns",
+        "status",
+        "status_message",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        parent: Optional["Span"] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = {}
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        if parent:
+            # Session identity is inherited so every stage can be grouped per
+            # session and provider without threading ids through each call
+            for key in ("session_id", "dseq", "provider"):
+                if key in parent.attributes:
+                    self.attributes[key] = parent.attributes[key]
+        if attributes:
+            self.set_attributes(**attributes)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = (
+                value if isinstance(value, (str, bool, int, float)) else str(value)
+            )
+
+    def set_attributes(self, **attributes: Any) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_error(self, message: str) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self) -> None:
+        if self.end_time_ns is None:
+            self.end_time_ns = time.time_ns()
+            if self.status == STATUS_UNSET:
+                self.status = STATUS_OK
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_time_ns is None:
+            return None
+        return (self.end_time_ns - self.start_time_ns) / 1_000_000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_ns": self.start_time_ns,
+            "end_time_ns": self.end_time_ns,
+            "duration_ms": self.duration_ms,
+            "status": {STATUS_UNSET: "unset", STATUS_OK: "ok", STATUS_ERROR: "error"}[
+                self.status
+            ],
+            "status_message": self.status_message,
+            "attributes": dict(self.attributes),
+        }
+
+
+class SpanExporter:
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends finished spans to a local file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        payload = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(payload)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPHttpExporter(SpanExporter):
+    """Posts spans to an OTLP/HTTP collector using the JSON encoding"""
+
+    def __init__(
+        self, endpoint: str, service_name: str = "cloud-gaming-broker", timeout: int = 5
+    ):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def encode(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "broker"},
+                            "spans": [
+                                {
+                                    "traceId": span.trace_id,
+                                    "spanId": span.span_id,
+                                    "parentSpanId": span.parent_span_id or "",
+                                    "name": span.name,
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(span.start_time_ns),
+                                    "endTimeUnixNano": str(span.end_time_ns),
+                                    "attributes": [
+                                        {"key": key, "value": _otlp_value(value)}
+                                        for key, value in span.attributes.items()
+                                    ],
+                                    "status": {
+                                        "code": span.status,
+                                        "message": span.status_message,
+                                    },
+                                }
+                                for span in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def export(self, spans: List[Span]) -> None:
+        try:
+            requests.post(self.url, json=self.encode(spans), timeout=self.timeout)
+        except requests.RequestException:
+            # Tracing must never take the broker down with it
+            pass
+
+
+class BatchSpanProcessor:
+    """Hands finished spans to an exporter from a background thread.
+
+    The request path only enqueues; when the queue is full, spans are dropped
+    rather than applying backpressure to session provisioning.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: int = 4096,
+        max_batch_size: int = 256,
+        flush_interval: float = 1.0,
+    ):
+        self.exporter = exporter
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def on_end(self, finished: Span) -> None:
+        if self._stopped.is_set():
+            return
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            self._start()
+
+    def _start(self) -> None:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="span-exporter", daemon=True
+                )
+                self._thread.start()
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first] + self._drain()
+            self.exporter.export(batch)
+
+    def force_flush(self) -> None:
+        """Export everything queued so far on the calling thread"""
+        batch = self._drain()
+        while batch:
+            self.exporter.export(batch)
+            batch = self._drain()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Stop the export thread and export whatever is still queued"""
+        self._stopped.set()
+        if isinstance(self._thread, threading.Thread):
+            self._thread.join(timeout)
+        self.force_flush()
+
+
+class Tracer:
+    def __init__(self, processor: Optional[BatchSpanProcessor] = None):
+        self.processor = processor
+        # Off, spans are neither created nor made current, e.g. under the market simulator
+        self.enabled = True
+
+    def start_span(self, name: str, **attributes: Any) -> "_SpanScope":
+        if not self.enabled:
+            return _NOOP_SCOPE
+        return _SpanScope(self, name, attributes)
+
+    def force_flush(self) -> None:
+        if self.processor is not None:
+            self.processor.force_flush()
+
+    def shutdown(self) -> None:
+        if self.processor is not None:
+            self.processor.shutdown(timeout=self.processor.flush_interval)
+
+    def _finish(self, finished: Span) -> None:
+        finished.end()
+        if self.processor is not None:
+            self.processor.on_end(finished)
+
+
+class _SpanScope:
+    """Context manager making a span current for the enclosed block"""
+
+    __slots__ = ("_tracer", "_name", "_attributes", "_span", "_token")
+
+    def __init__(self, owner: Tracer, name: str, attributes: Dict[str, Any]):
+        self._tracer = owner
+        self._name = name
+        self._attributes = attributes
+        self._span: Optional[Span] = None
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._span = Span(
+            self._name, parent=_current_span.get(), attributes=self._attributes
+        )
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current_span.reset(self._token)
+        if exc is not None:
+            self._span.set_error(str(exc) or exc_type.__name__)
+        self._tracer._finish(self._span)
+        return False
+
+
+class _NoopSpan:
+    """Accepts what callers record on a span while tracing is disabled"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self) -> _NoopSpan:
+        return _NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+_NOOP_SCOPE = _NoopScope()
+
+
+def build_processor() -> Optional[BatchSpanProcessor]:
+    """Build the span processor selected by TRACE_EXPORTER"""
+    exporter_name = settings.TRACE_EXPORTER.lower()
+    if exporter_name == "file":
+        return BatchSpanProcessor(FileSpanExporter(settings.TRACE_FILE_PATH))
+    if exporter_name == "otlp":
+        return BatchSpanProcessor(
+            OTLPHttpExporter(settings.TRACE_OTLP_ENDPOINT, settings.TRACE_SERVICE_NAME)
+        )
+    return None
+
+
+tracer = Tracer(build_processor())
+
+
+def span(name: str, **attributes: Any) -> _SpanScope:
+    """Open a span as a child of the current one"""
+    return tracer.start_span(name, **attributes)
+
+
+@contextlib.contextmanager
+def disabled() -> Iterator[None]:
+    """Skip tracing in the enclosed block; for offline runs that aren't worth a span each"""
+    enabled = tracer.enabled
+    tracer.enabled = False
+    try:
+        yield
+    finally:
+        tracer.enabled = enabled
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Attach attributes to the current span, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+def wrap(function: Callable) -> Callable:
+    """Bind a callable to the current trace context for background execution"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def run_in_context(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+
+    return run_in_context
+
+
+def traced(name: str) -> Callable:
+    """Decorator wrapping a sync or async function in a span.
+
+    Operations here report failures as result dicts rather than exceptions, so
+    a dict result's "status" is recorded and "error" marks the span failed.
+    """
+
+    def record_result(current: Span, result: Any) -> None:
+        if isinstance(result, dict) and "status" in result:
+            current.set_attribute("result.status", result["status"])
+            if result["status"] == "error":
+                current.set_error(str(result.get("message", "")))
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name) as current:
+                    result = await function(*args, **kwargs)
+                    record_result(current, result)
+                    return result
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = function(*args, **kwargs)
+                record_result(current, result)
+                return result
+
+        return wrapper
+
+    return decorator
@@ -1,42 +1,177 @@
 #!/bin/bash
+# Boot supervisor for the Sunshine container.
+#
+# The display, audio and NVENC check start concurrently. Sunshine starts as
+# soon as the display and audio it needs are up. Every wait is on a real
+# readiness signal (X socket, `pactl info`, the Sunshine API) rather than a
+# fixed sleep, so boot takes as long as the slowest component. Per-phase
+# timings go to $BOOT_REPORT as JSON, which the broker collects.
 set -e
 
-# Create runtime directory
-mkdir -p /tmp/runtime-gamer/pulse
+SUNSHINE_CONF=/home/gamer/.config/sunshine/sunshine.conf
+SUNSHINE_SLOTS="${SUNSHINE_SLOTS:-1}"
+SUNSHINE_SLOT_PORT_STRIDE="${SUNSHINE_SLOT_PORT_STRIDE:-100}"
+BOOT_REPORT="${BOOT_REPORT:-/tmp/boot-report.json}"
+BOOT_TIMEOUT="${BOOT_TIMEOUT:-60}"
+BOOT_DIR=/tmp/boot
+SSHD_DIR=/home/gamer/.sshd
+SSH_PORT="${SSH_PORT:-2222}"
 
-# Start virtual display
-Xvfb :0 -screen 0 1920x1080x24 &
+now() { date +%s.%N; }
+elapsed() { awk -v a="$1" -v b="$2" 'BEGIN { printf "%.3f", b - a }'; }
 
-# Start PulseAudio
-pulseaudio --start --exit-idle-time=-1
+BOOT_STARTED=$(now)
 
-# Wait for X server to be ready
-sleep 2
+# Create runtime directories
+mkdir -p /tmp/runtime-gamer/pulse "$BOOT_DIR"
+rm -f "$BOOT_DIR"/*.json "$BOOT_REPORT"
 
-# Verify NVENC is available
-echo "Verifying NVENC encoding support..."
-if ! ffmpeg -encoders 2>/dev/null | grep -q nvenc; then
-    echo "ERROR: NVENC encoding not available"
+# Poll a readiness check every 50ms until it passes or the timeout expires
+wait_until() {
+    local timeout="$1"; shift
+    local deadline=$(( $(date +%s) + timeout ))
+    until "$@" >/dev/null 2>&1; do
+        if [ "$(date +%s)" -ge "$deadline" ]; then
+            return 1
+        fi
+        sleep 0.05
+    done
+}
+
+# Run one boot phase, recording when it started and how long it took
+run_phase() {
+    local name="$1" started finished status=ok
+    shift
+    started=$(now)
+    "$@" || status=failed
+    finished=$(now)
+    printf '{"phase": "%s", "start_offset_seconds": %s, "seconds": %s, "status": "%s"}\n' \
+        "$name" "$(elapsed "$BOOT_STARTED" "$started")" "$(elapsed "$started" "$finished")" "$status" \
+        > "${BOOT_DIR}/${name}.json"
+    echo "Boot phase ${name}: ${status} in $(elapsed "$started" "$finished")s"
+    [ "$status" = ok ]
+}
+
+write_report() {
+    local status="$1"
+    {
+        printf '{"status": "%s", "slots": %s, "total_seconds": %s, "finished_at": %s, "phases": [' \
+            "$status" "$SUNSHINE_SLOTS" "$(elapsed "$BOOT_STARTED" "$(now)")" "$(date +%s)"
+        # Phases in start order; ones that never ran are left out
+        cat "$BOOT_DIR"/*.json 2>/dev/null | sort -t: -k3 -n | paste -sd, -
+        printf ']}\n'
+    } > "${BOOT_REPORT}.tmp"
+    mv "${BOOT_REPORT}.tmp" "$BOOT_REPORT"
+}
+
+fail() {
+    echo "ERROR: $1"
+    write_report failed
     exit 1
-fi
+}
 
-echo "NVENC verification passed"
+# Apply the per-session encoder profile the broker put in the SDL env
+set_sunshine_option() {
+    local key="$1" value="$2"
+    if [ -n "$value" ]; then
+        sed -i "s|^${key} = .*|${key} = ${value}|" "$SUNSHINE_CONF"
+        echo "Sunshine ${key} = ${value}"
+    fi
+}
 
-# Start Sunshine streaming server
-echo "Starting Sunshine streaming server..."
-sunshine &
+apply_config() {
+    set_sunshine_option fps "$SUNSHINE_FPS"
+    set_sunshine_option bitrate "$SUNSHINE_BITRATE"
+    set_sunshine_option resolution "$SUNSHINE_RESOLUTION"
+    set_sunshine_option fec_percentage "$SUNSHINE_FEC_PERCENTAGE"
+}
 
-# Wait for Sunshine to start
-sleep 5
+# The broker manages the lease over ssh with the key from its SDL env
+start_sshd() {
+    mkdir -p /home/gamer/.ssh "$SSHD_DIR"
+    chmod 700 /home/gamer/.ssh
+    echo "$SSH_AUTHORIZED_KEYS" > /home/gamer/.ssh/authorized_keys
+    chmod 600 /home/gamer/.ssh/authorized_keys
+    [ -f "$SSHD_DIR/host_key" ] || ssh-keygen -q -t ed25519 -N "" -f "$SSHD_DIR/host_key"
+    cat > "$SSHD_DIR/sshd_config" <<EOF
+Port ${SSH_PORT}
+HostKey ${SSHD_DIR}/host_key
+PidFile ${SSHD_DIR}/sshd.pid
+AuthorizedKeysFile .ssh/authorized_keys
+PasswordAuthentication no
+KbdInteractiveAuthentication no
+UsePAM no
+EOF
+    /usr/sbin/sshd -f "$SSHD_DIR/sshd_config"
+}
 
-# Verify Sunshine is running
-if ! curl -f http://localhost:47990/api/config >/dev/null 2>&1; then
-    echo "ERROR: Sunshine failed to start"
-    exit 1
+start_display() {
+    Xvfb :0 -screen 0 "${SUNSHINE_RESOLUTION:-1920x1080}x24" > /dev/null 2>&1 &
+    wait_until "$BOOT_TIMEOUT" test -S /tmp/.X11-unix/X0
+}
+
+start_audio() {
+    pulseaudio --start --exit-idle-time=-1
+    wait_until "$BOOT_TIMEOUT" pactl info
+}
+
+check_nvenc() {
+    ffmpeg -hide_banner -encoders 2>/dev/null | grep -q nvenc
+}
+
+start_sunshine() {
+    sunshine &
+    wait_until "$BOOT_TIMEOUT" curl -sf http://localhost:47990/api/config
+}
+
+start_slots() {
+    # Packed lease: one isolated Sunshine instance per slot, all at once
+    local slot pids=()
+    for slot in $(seq 0 $((SUNSHINE_SLOTS - 1))); do
+        sunshine-slot start "$slot" &
+        pids+=($!)
+    done
+    for pid in "${pids[@]}"; do
+        wait "$pid" || return 1
+    done
+    for slot in $(seq 0 $((SUNSHINE_SLOTS - 1))); do
+        wait_until "$BOOT_TIMEOUT" curl -sf "http://localhost:$((47990 + slot * SUNSHINE_SLOT_PORT_STRIDE))/api/config" \
+            || return 1
+    done
+}
+
+run_phase config apply_config || fail "Could not apply the encoder profile"
+
+# Up before the slow phases, so a failed boot can still be inspected
+if [ -n "$SSH_AUTHORIZED_KEYS" ]; then
+    start_sshd || fail "sshd failed to start"
+fi
+
+run_phase nvenc check_nvenc &
+NVENC_PID=$!
+run_phase pulseaudio start_audio &
+AUDIO_PID=$!
+if [ "$SUNSHINE_SLOTS" -le 1 ]; then
+    # Packed leases give every slot its own display instead
+    run_phase xvfb start_display &
+    DISPLAY_PID=$!
+    wait "$DISPLAY_PID" || fail "Virtual display failed to start"
+fi
+wait "$AUDIO_PID" || fail "PulseAudio failed to start"
+
+if [ "$SUNSHINE_SLOTS" -gt 1 ]; then
+    echo "Starting ${SUNSHINE_SLOTS} Sunshine slots..."
+    run_phase sunshine start_slots || { wait "$NVENC_PID" || true; fail "Sunshine slots failed to start"; }
+else
+    echo "Starting Sunshine streaming server..."
+    run_phase sunshine start_sunshine || { wait "$NVENC_PID" || true; fail "Sunshine failed to start"; }
 fi
 
+wait "$NVENC_PID" || fail "NVENC encoding not available"
+
+write_report ready
 echo "Sunshine started successfully"
 echo "Gaming session ready on port 47984 (TCP) and 47989 (UDP)"
 
 # Keep container running
-tail -f /dev/null
\ No newline at end of file
+tail -f /dev/null
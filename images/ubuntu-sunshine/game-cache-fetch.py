@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Install a game from the broker's cache nodes instead of Steam's CDN.
+
+The broker pipes the game's manifest (JSON) to stdin:
+
+    game-cache-fetch --nodes http://cache-a:8090,http://cache-b:8090 \
+        --dest /home/gamer/.steam/steam/steamapps < manifest.json
+
+Nodes are ranked by measured round-trip time and chunks are downloaded in
+parallel from the nearest one, falling back to the others on error. Every
+chunk is checked against its SHA-256 name. Chunks already on disk (a
+recycled lease that had the game) are verified locally and not downloaded.
+Prints a JSON report on success.
+"""
+import argparse
+import hashlib
+import json
+import os
+import stat
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+
+def probe(node: str, timeout: float = 2.0) -> float:
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(f"{node}/health", timeout=timeout) as response:
+            response.read()
+    except Exception:
+        return float("inf")
+    return time.monotonic() - started
+
+
+def rank_nodes(nodes: List[str]) -> List[str]:
+    """Nearest node first; unreachable nodes are kept last as a final fallback"""
+    with ThreadPoolExecutor(max_workers=len(nodes) or 1) as pool:
+        latencies = list(pool.map(probe, nodes))
+    return [node for _, node in sorted(zip(latencies, nodes), key=lambda pair: pair[0])]
+
+
+def fetch_chunk(nodes: List[str], digest: str, timeout: float = 30.0) -> bytes:
+    errors = []
+    for node in nodes:
+        try:
+            with urllib.request.urlopen(f"{node}/chunks/{digest}", timeout=timeout) as response:
+                data = response.read()
+        except Exception as e:
+            errors.append(f"{node}: {e}")
+            continue
+        if hashlib.sha256(data).hexdigest() == digest:
+            return data
+        errors.append(f"{node}: checksum mismatch")
+    raise RuntimeError(f"Chunk {digest} unavailable ({'; '.join(errors)})")
+
+
+def resolve(dest: str, relative: str) -> str:
+    """A manifest path under dest; anything resolving outside it is rejected"""
+    root = os.path.realpath(dest)
+    path = os.path.realpath(os.path.join(root, relative))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"Manifest path escapes the destination: {relative!r}")
+    return path
+
+
+def plan(manifest: Dict[str, Any], dest: str) -> Tuple[Dict[str, List[Tuple[str, int]]], int]:
+    """Chunk digest -> every (file, offset) it belongs at, minus chunks already on disk"""
+    chunk_size = manifest["chunk_size"]
+    needed: Dict[str, List[Tuple[str, int]]] = {}
+    reused = 0
+    paths = [resolve(dest, entry["path"]) for entry in manifest["files"]]
+    for entry, path in zip(manifest["files"], paths):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        existing = os.path.exists(path) and os.path.getsize(path) == entry["size"]
+        if existing:
+            # A previous install may have left it read-only
+            os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) | stat.S_IRUSR | stat.S_IWUSR)
+        else:
+            with open(path, "wb") as f:
+                f.truncate(entry["size"])
+
+        with open(path, "rb") as f:
+            for index, digest in enumerate(entry["chunks"]):
+                offset = index * chunk_size
+                if existing:
+                    f.seek(offset)
+                    if hashlib.sha256(f.read(chunk_size)).hexdigest() == digest:
+                        reused += 1
+                        continue
+                needed.setdefault(digest, []).append((path, offset))
+    return needed, reused
+
+
+def write_chunk(data: bytes, targets: List[Tuple[str, int]]) -> None:
+    for path, offset in targets:
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+
+
+def apply_modes(manifest: Dict[str, Any], dest: str) -> None:
+    """Set the manifest's file modes; only once every chunk is written, as they may be read-only"""
+    for entry in manifest["files"]:
+        os.chmod(resolve(dest, entry["path"]), entry["mode"])
+
+
+def install(manifest: Dict[str, Any], nodes: List[str], dest: str, workers: int = 16) -> Dict[str, Any]:
+    started = time.monotonic()
+    ranked = rank_nodes(nodes)
+    needed, reused = plan(manifest, dest)
+
+    def download(item: Tuple[str, List[Tuple[str, int]]]) -> int:
+        digest, targets = item
+        data = fetch_chunk(ranked, digest)
+        write_chunk(data, targets)
+        return len(data)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        downloaded = sum(pool.map(download, needed.items()))
+    apply_modes(manifest, dest)
+
+    return {
+        "app_id": manifest["app_id"],
+        "node": ranked[0] if ranked else None,
+        "chunks_downloaded": len(needed),
+        "chunks_reused": reused,
+        "bytes_downloaded": downloaded,
+        "seconds": round(time.monotonic() - started, 3)
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", required=True, help="Comma-separated cache node URLs")
+    parser.add_argument("--dest", required=True, help="Steam library (steamapps) to install into")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    manifest = json.load(sys.stdin)
+    nodes = [node.strip().rstrip("/") for node in args.nodes.split(",") if node.strip()]
+    try:
+        report = install(manifest, nodes, args.dest, args.workers)
+    except Exception as e:
+        print(json.dumps({"app_id": manifest.get("app_id"), "error": str(e)}))
+        return 1
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
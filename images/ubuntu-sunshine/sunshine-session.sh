@@ -0,0 +1,81 @@
+#!/bin/bash
+# Prepare a dedicated lease for its next player without redeploying it.
+#
+#   sunshine-session reset     stop Sunshine, wipe the player's state, start
+#                              Sunshine again with the stock profile
+#   sunshine-session restart   restart Sunshine with the SUNSHINE_* encoder
+#                              profile in the environment
+#
+# Installed games and the Steam/Proton runtime are kept, which is what makes
+# reusing a lease much faster than provisioning a new one.
+set -e
+
+ACTION="$1"
+SUNSHINE_CONF=/home/gamer/.config/sunshine/sunshine.conf
+STEAM_COMPAT_DATA_PATH="${STEAM_COMPAT_DATA_PATH:-/home/gamer/.steam/steam/steamapps/compatdata}"
+
+set_sunshine_option() {
+    local key="$1" value="$2"
+    if [ -n "$value" ]; then
+        sed -i "s|^${key} = .*|${key} = ${value}|" "$SUNSHINE_CONF"
+    fi
+}
+
+stop_sunshine() {
+    pkill -x sunshine 2>/dev/null || true
+    pkill -f "Xvfb :0" 2>/dev/null || true
+    # Xvfb removes its socket on exit; a stale one would fool the start check
+    for _ in $(seq 1 40); do
+        [ -S /tmp/.X11-unix/X0 ] || break
+        sleep 0.05
+    done
+    rm -f /tmp/.X11-unix/X0
+}
+
+wipe_player_state() {
+    # Save data, Steam login and user data, paired Moonlight clients, caches
+    rm -rf "${STEAM_COMPAT_DATA_PATH:?}"/* \
+        /home/gamer/.steam/steam/userdata \
+        /home/gamer/.local/share/Steam/userdata \
+        /home/gamer/.steam/steam/config/loginusers.vdf \
+        /home/gamer/.local/share/Steam/config/loginusers.vdf \
+        /home/gamer/.config/sunshine/sunshine_state.json \
+        /home/gamer/.cache
+    mkdir -p "$STEAM_COMPAT_DATA_PATH"
+}
+
+start_sunshine() {
+    set_sunshine_option fps "$SUNSHINE_FPS"
+    set_sunshine_option bitrate "$SUNSHINE_BITRATE"
+    set_sunshine_option resolution "$SUNSHINE_RESOLUTION"
+    set_sunshine_option fec_percentage "$SUNSHINE_FEC_PERCENTAGE"
+
+    local resolution
+    resolution="$(grep '^resolution = ' "$SUNSHINE_CONF" | cut -d' ' -f3)"
+    Xvfb :0 -screen 0 "${resolution:-1920x1080}x24" > /dev/null 2>&1 &
+    # Start Sunshine as soon as the display accepts connections
+    for _ in $(seq 1 200); do
+        [ -S /tmp/.X11-unix/X0 ] && break
+        sleep 0.05
+    done
+    DISPLAY=:0 nohup sunshine > /tmp/sunshine.log 2>&1 &
+
+    for _ in $(seq 1 300); do
+        if curl -sf http://localhost:47990/api/config >/dev/null 2>&1; then
+            echo "Sunshine ready"
+            return 0
+        fi
+        sleep 0.05
+    done
+    echo "ERROR: Sunshine failed to start" >&2
+    return 1
+}
+
+case "$ACTION" in
+    reset) stop_sunshine; wipe_player_state; start_sunshine ;;
+    restart) stop_sunshine; start_sunshine ;;
+    *)
+        echo "Usage: sunshine-session reset|restart" >&2
+        exit 2
+        ;;
+esac
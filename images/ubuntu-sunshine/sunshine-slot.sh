@@ -0,0 +1,82 @@
+#!/bin/bash
+# Manage one Sunshine instance ("slot") of a packed lease.
+#
+#   sunshine-slot start|stop|restart|reset <slot>
+#
+# Slot N listens on the base ports + N * SUNSHINE_SLOT_PORT_STRIDE, renders
+# to its own virtual display :N and keeps its config and state in its own
+# directory, so players sharing a GPU never see each other's sessions.
+# SUNSHINE_FPS / _BITRATE / _RESOLUTION / _FEC_PERCENTAGE set the slot's
+# encoder profile. `reset` stops the slot and wipes its player's state so
+# the slot can be handed to someone else.
+set -e
+
+ACTION="$1"
+SLOT="${2:-0}"
+STRIDE="${SUNSHINE_SLOT_PORT_STRIDE:-100}"
+BASE_CONF=/home/gamer/.config/sunshine/sunshine.conf
+SLOT_DIR="/home/gamer/.config/sunshine/slot-${SLOT}"
+SLOT_CONF="${SLOT_DIR}/sunshine.conf"
+SLOT_HOME="/home/gamer/slots/${SLOT}"
+PID_FILE="/tmp/sunshine-slot-${SLOT}.pid"
+XVFB_PID_FILE="/tmp/xvfb-slot-${SLOT}.pid"
+
+set_option() {
+    local key="$1" value="$2"
+    [ -n "$value" ] || return 0
+    if grep -q "^${key} = " "$SLOT_CONF"; then
+        sed -i "s|^${key} = .*|${key} = ${value}|" "$SLOT_CONF"
+    else
+        echo "${key} = ${value}" >> "$SLOT_CONF"
+    fi
+}
+
+stop_process() {
+    local pid_file="$1"
+    if [ -f "$pid_file" ]; then
+        kill "$(cat "$pid_file")" 2>/dev/null || true
+        rm -f "$pid_file"
+    fi
+}
+
+start_slot() {
+    mkdir -p "$SLOT_DIR" "$SLOT_HOME"
+    cp "$BASE_CONF" "$SLOT_CONF"
+    set_option sunshine_name "CloudGamingGPU-${SLOT}"
+    set_option port "$((47984 + SLOT * STRIDE))"
+    set_option file_state "${SLOT_DIR}/sunshine_state.json"
+    set_option fps "$SUNSHINE_FPS"
+    set_option bitrate "$SUNSHINE_BITRATE"
+    set_option resolution "$SUNSHINE_RESOLUTION"
+    set_option fec_percentage "$SUNSHINE_FEC_PERCENTAGE"
+
+    local resolution
+    resolution="$(grep '^resolution = ' "$SLOT_CONF" | cut -d' ' -f3)"
+    Xvfb ":${SLOT}" -screen 0 "${resolution:-1920x1080}x24" &
+    echo $! > "$XVFB_PID_FILE"
+    # Start Sunshine as soon as the display accepts connections
+    for _ in $(seq 1 200); do
+        [ -S "/tmp/.X11-unix/X${SLOT}" ] && break
+        sleep 0.05
+    done
+
+    DISPLAY=":${SLOT}" HOME="$SLOT_HOME" sunshine "$SLOT_CONF" > "${SLOT_DIR}/sunshine.log" 2>&1 &
+    echo $! > "$PID_FILE"
+    echo "Sunshine slot ${SLOT} started on port $((47984 + SLOT * STRIDE))"
+}
+
+stop_slot() {
+    stop_process "$PID_FILE"
+    stop_process "$XVFB_PID_FILE"
+}
+
+case "$ACTION" in
+    start) start_slot ;;
+    stop) stop_slot ;;
+    restart) stop_slot; start_slot ;;
+    reset) stop_slot; rm -rf "${SLOT_HOME:?}" "${SLOT_DIR}/sunshine_state.json" ;;
+    *)
+        echo "Usage: sunshine-slot start|stop|restart|reset <slot>" >&2
+        exit 2
+        ;;
+esac
@@ -0,0 +1,146 @@
+import pytest
+import asyncio
+from broker.admission import AdmissionController, QueueFullError
+
+class TestAdmissionController:
+    
+    def test_admits_up_to_limit_immediately(self):
+        """Test requests under the concurrency limit are not queued"""
+        async def scenario():
+            controller = AdmissionController(max_concurrent=2, max_queue=5)
+            first = await controller.acquire()
+            second = await controller.acquire()
+            return controller, first, second
+        
+        controller, first, second = asyncio.run(scenario())
+        
+        assert controller.active == 2
+        assert controller.queued == 0
+        assert first.queue_position == 0
+        assert second.queue_wait_seconds < 1
+    
+    def test_fifo_order(self):
+        """Test queued requests are admitted strictly in arrival order"""
+        async def scenario():
+            controller = AdmissionController(max_concurrent=1, max_queue=5)
+            holder = await controller.acquire()
+            order = []
+            
+            async def waiter(name):
+                ticket = await controller.acquire()
+                order.append(name)
+                controller.release(ticket)
+            
+            tasks = [asyncio.create_task(waiter(name)) for name in ("a", "b", "c")]
+            await asyncio.sleep(0)
+            positions = [controller.queued]
+            controller.release(holder)
+            await asyncio.gather(*tasks)
+            return controller, order, positions
+        
+        controller, order, positions = asyncio.run(scenario())
+        
+        assert order == ["a", "b", "c"]
+        assert positions == [3]
+        assert controller.active == 0
+        assert controller.queued == 0
+    
+    def test_queue_position_and_estimated_wait(self):
+        """Test waiters learn their position and an estimated wait"""
+        async def scenario():
+            controller = AdmissionController(max_concurrent=2, max_queue=10, initial_provision_seconds=60)
+            holders = [await controller.acquire() for _ in range(2)]
+            tasks = [asyncio.create_task(controller.acquire()) for _ in range(3)]
+            await asyncio.sleep(0)
+            status = controller.status()
+            for holder in holders:
+                controller.release(holder, record_duration=False)
+            tickets = await asyncio.gather(*tasks[:2])
+            tasks[2].cancel()
+            return status, tickets
+        
+        status, tickets = asyncio.run(scenario())
+        
+        assert status["queued"] == 3
+        assert status["estimated_wait_seconds"] == 120
+        assert [ticket.queue_position for ticket in tickets] == [0, 1]
+        assert [ticket.estimated_wait_seconds for ticket in tickets] == [60, 60]
+    
+    def test_reserve_then_wait(self):
+        """Test a reserved ticket keeps its place even if admitted before anyone waits on it"""
+        async def scenario():
+            controller = AdmissionController(max_concurrent=1, max_queue=5, initial_provision_seconds=60)
+            holder = controller.reserve()
+            queued = controller.reserve()
+            waiting = controller.waiting()
+            controller.release(holder, record_duration=False)
+            admitted = await controller.wait(queued)
+            return controller, holder, queued, waiting, admitted
+        
+        controller, holder, queued, waiting, admitted = asyncio.run(scenario())
+        
+        assert holder.admitted_at is not None
+        assert waiting == [queued]
+        assert (queued.queue_position, queued.estimated_wait_seconds) == (0, 60)
+        assert admitted is queued and queued.admitted_at is not None
+        assert controller.active == 1
+        assert controller.queued == 0
+    
+    def test_sheds_load_when_queue_full(self):
+        """Test a full queue rejects instead of growing unbounded"""
+        async def scenario():
+            controller = AdmissionController(max_concurrent=1, max_queue=1, initial_provision_seconds=30)
+            await controller.acquire()
+            pending = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0)
+            try:
+                await controller.acquire()
+            finally:
+                pending.cancel()
+        
+        with pytest.raises(QueueFullError) as excinfo:
+            asyncio.run(scenario())
+        
+        assert excinfo.value.queue_depth == 1
+        assert excinfo.value.estimated_wait_seconds == 60
+    
+    def test_cancelled_waiter_leaves_queue(self):
+        """Test a client that disconnects gives up its place in line"""
+        async def scenario():
+            controller = AdmissionController(max_concurrent=1, max_queue=5)
+            holder = await controller.acquire()
+            cancelled = asyncio.create_task(controller.acquire())
+            behind = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            queued_after_cancel = controller.queued
+            controller.release(holder)
+            await behind
+            return controller, queued_after_cancel
+        
+        controller, queued_after_cancel = asyncio.run(scenario())
+        
+        assert queued_after_cancel == 1
+        assert controller.active == 1
+    
+    def test_release_updates_average(self):
+        """Test the provisioning time estimate tracks observed durations"""
+        async def scenario():
+            controller = AdmissionController(max_concurrent=1, max_queue=1, initial_provision_seconds=100, smoothing=0.5)
+            ticket = await controller.acquire()
+            ticket.admitted_at -= 20
+            controller.release(ticket)
+            return controller
+        
+        controller = asyncio.run(scenario())
+        
+        assert controller.average_provision_seconds == pytest.approx(60, abs=1)
+    
+    def test_invalid_limit(self):
+        """Test a zero concurrency limit is rejected"""
+        with pytest.raises(ValueError):
+            AdmissionController(max_concurrent=0, max_queue=1)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
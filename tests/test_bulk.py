@@ -0,0 +1,117 @@
+import pytest
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import Mock, patch
+from broker.bulk import SessionSelector, run_bulk, OK, FAILED
+from broker.admin import main, parse_duration
+
+
+def session(session_id, provider="akash1provA", tier="standard", age_seconds=60):
+    return {"session_id": session_id, "lease_id": f"lease-{session_id}", "provider": provider,
+            "tier": tier, "created_at": time.time() - age_seconds}
+
+
+def collect(keys, operation, concurrency):
+    async def scenario():
+        return [record async for record in run_bulk("close", keys, operation, concurrency)]
+    return asyncio.run(scenario())
+
+
+class TestSessionSelector:
+
+    def test_criteria_must_all_match(self):
+        """Test provider, tier and age narrow the selection together"""
+        sessions = [session("a"), session("b", provider="akash1provB"), session("c", tier="indie"),
+                    session("d", age_seconds=7200)]
+
+        selected = SessionSelector(provider="akash1provA", tier="standard",
+                                   older_than_seconds=3600).select(sessions)
+
+        assert [s["session_id"] for s in selected] == ["d"]
+
+    def test_id_list(self):
+        """Test an explicit list selects only those sessions"""
+        sessions = [session("a"), session("b"), session("c")]
+
+        assert [s["session_id"] for s in SessionSelector(session_ids=["c", "a"]).select(sessions)] == ["a", "c"]
+        assert SessionSelector().empty
+        assert not SessionSelector(tier="indie").empty
+
+
+class TestRunBulk:
+
+    def test_streams_items_then_report(self):
+        """Test every item is reported as it finishes, followed by the totals"""
+        def operation(key):
+            if key == "bad":
+                raise RuntimeError("lease close failed")
+            return {"status": OK}
+
+        records = collect(["a", "bad", "c"], operation, concurrency=2)
+
+        assert [record["type"] for record in records] == ["item", "item", "item", "report"]
+        report = records[-1]
+        assert report["selected"] == 3
+        assert report["by_status"] == {OK: 2, FAILED: 1}
+        assert report["failures"] == [{"key": "bad", "message": "lease close failed"}]
+
+    def test_concurrency_is_bounded(self):
+        """Test no more than `concurrency` operations run at once"""
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def operation(key):
+            with lock:
+                running.append(key)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(key)
+            return {"status": OK}
+
+        started = time.monotonic()
+        records = collect([str(i) for i in range(12)], operation, concurrency=4)
+
+        assert max(peak) == 4
+        assert records[-1]["completed"] == 12
+        # Three rounds of four rather than twelve in a row
+        assert time.monotonic() - started < 12 * 0.02
+
+
+class TestAdminCli:
+
+    def test_parse_duration(self):
+        assert parse_duration("90") == 90
+        assert parse_duration("30m") == 1800
+        assert parse_duration("2h") == 7200
+
+    def test_streams_progress_and_prints_report(self, capsys):
+        """Test the client sends the selector and exits non-zero on failures"""
+        lines = [
+            {"type": "selected", "action": "migrate", "count": 2, "keys": ["a", "b"], "dry_run": False},
+            {"type": "item", "key": "a", "status": "ok", "seconds": 41.2},
+            {"type": "item", "key": "b", "status": "failed", "message": "no bids", "seconds": 60.0},
+            {"type": "report", "action": "migrate", "selected": 2, "completed": 2,
+             "by_status": {"ok": 1, "failed": 1}, "failures": [{"key": "b", "message": "no bids"}]},
+        ]
+        response = Mock(status_code=200)
+        response.iter_lines.return_value = [json.dumps(line).encode() for line in lines]
+
+        with patch('broker.admin.requests.post', return_value=response) as post:
+            code = main(["migrate", "--provider", "akash1provA", "--older-than", "1h",
+                         "--url", "http://broker:8000", "--token", "secret", "--concurrency", "4"])
+
+        assert code == 1
+        assert post.call_args[0][0] == "http://broker:8000/admin/sessions/migrate"
+        assert post.call_args.kwargs["json"] == {"concurrency": 4, "dry_run": False,
+                                                 "provider": "akash1provA", "older_than_seconds": 3600}
+        assert post.call_args.kwargs["headers"] == {"Authorization": "Bearer secret"}
+        output = capsys.readouterr()
+        assert json.loads(output.out)["by_status"] == {"ok": 1, "failed": 1}
+        assert "no bids" in output.err
+
+if __name__ == "__main__":
+    pytest.main([__file__])
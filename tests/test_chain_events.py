@@ -0,0 +1,197 @@
+import pytest
+import json
+import threading
+from unittest.mock import Mock, patch
+from websockets.sync.server import serve
+from broker.chain_events import (
+    ChainEventSubscriber, parse_events, websocket_url,
+    BID_CREATED, LEASE_CLOSED
+)
+from broker.lease_manager import LeaseManager
+
+OWNER = "akash1owner"
+
+
+def tx_message(height, sender, *akash_events):
+    """A Tendermint Tx subscription result as the node sends it"""
+    return json.dumps({
+        "jsonrpc": "2.0",
+        "id": 2,
+        "result": {
+            "query": f"tm.event='Tx' AND akash.v1.module='market' AND akash.v1.owner='{OWNER}'",
+            "data": {
+                "type": "tendermint/event/Tx",
+                "value": {"TxResult": {"height": str(height), "result": {"events": [
+                    {"type": "message", "attributes": [{"key": "sender", "value": sender}]},
+                    *[{"type": "akash.v1",
+                       "attributes": [{"key": key, "value": value} for key, value in attributes.items()]}
+                      for attributes in akash_events]
+                ]}}}
+            }
+        }
+    })
+
+
+def bid_event(dseq, provider, amount, action="bid-created"):
+    return {"module": "market", "action": action, "owner": OWNER, "dseq": dseq, "gseq": "1",
+            "oseq": "1", "provider": provider, "price-denom": "uakt", "price-amount": amount}
+
+
+# Recorded from a deployment that received three bids, one of them withdrawn
+RECORDED = [
+    tx_message(100, OWNER, {"module": "deployment", "action": "deployment-created",
+                            "owner": OWNER, "dseq": "42"}),
+    tx_message(101, "akash1provA", bid_event("42", "akash1provA", "120.5")),
+    tx_message(101, "akash1provB", bid_event("42", "akash1provB", "98.0")),
+    tx_message(102, "akash1provC", bid_event("42", "akash1provC", "150.0")),
+    tx_message(102, "akash1provC", bid_event("42", "akash1provC", "150.0", action="bid-closed")),
+]
+
+
+class ChainNodeStandIn:
+    """Local Tendermint websocket that acknowledges subscriptions and replays events"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.queries = []
+        self.server = serve(self.handle, "127.0.0.1", 0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.socket.getsockname()[:2]
+        return f"ws://{host}:{port}/websocket"
+
+    def handle(self, connection):
+        for _ in range(2):
+            request = json.loads(connection.recv())
+            self.queries.append(request["params"]["query"])
+            connection.send(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": {}}))
+        for message in self.messages:
+            connection.send(message)
+        connection.recv()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join(timeout=5)
+
+
+class TestChainEvents:
+
+    @pytest.fixture
+    def subscriber(self):
+        subscriber = ChainEventSubscriber("ws://unused/websocket", OWNER)
+        yield subscriber
+        subscriber.stop()
+
+    def test_websocket_url(self):
+        """Test the websocket endpoint is derived from the RPC node URL"""
+        assert websocket_url("https://rpc.akash.forbole.com:443") == "wss://rpc.akash.forbole.com:443/websocket"
+        assert websocket_url("http://localhost:26657") == "ws://localhost:26657/websocket"
+
+    def test_subscribes_for_every_signer(self):
+        """Test each key of a signer pool gets its own deployment and market subscriptions"""
+        subscriber = ChainEventSubscriber("ws://unused/websocket", [OWNER, "akash1second"])
+
+        assert len(subscriber.queries()) == 4
+        assert "akash.v1.owner='akash1second'" in subscriber.queries()[-1]
+
+    def test_parse_events(self):
+        """Test Akash events are read from the Tx result with the signing account"""
+        parsed = parse_events(json.loads(RECORDED[1])["result"])
+
+        assert len(parsed) == 1
+        assert parsed[0].action == BID_CREATED
+        assert parsed[0].dseq == "42"
+        assert parsed[0].provider == "akash1provA"
+        assert parsed[0].sender == "akash1provA"
+        assert parsed[0].height == 101
+        assert parsed[0].to_bid()["bid"]["price"]["amount"] == "120.5"
+
+    def test_subscription_ack_has_no_events(self, subscriber):
+        """Test subscribe acknowledgements are ignored"""
+        assert subscriber.handle_message(json.dumps({"jsonrpc": "2.0", "id": 1, "result": {}})) == []
+        assert subscriber.handle_message("not json") == []
+
+    def test_collect_bids_drops_withdrawn(self, subscriber):
+        """Test collected bids exclude those the provider closed"""
+        for message in RECORDED:
+            subscriber.handle_message(message)
+
+        bids = subscriber.collect_bids("42", timeout=1, window=0)
+
+        assert sorted(bid["bid"]["bid_id"]["provider"] for bid in bids) == ["akash1provA", "akash1provB"]
+
+    def test_wait_for_wakes_on_event(self, subscriber):
+        """Test a waiter blocks until a matching event is dispatched"""
+        timer = threading.Timer(0.05, subscriber.handle_message, args=(RECORDED[1],))
+        timer.start()
+
+        matched = subscriber.wait_for("42", lambda event: event.action == BID_CREATED, timeout=5)
+        timer.join()
+
+        assert [event.provider for event in matched] == ["akash1provA"]
+        assert subscriber.wait_for("7", lambda event: True, timeout=0) == []
+
+    def test_listener_errors_are_contained(self, subscriber):
+        """Test a failing listener doesn't stop delivery to the others"""
+        received = []
+        subscriber.add_listener(Mock(side_effect=RuntimeError("boom")))
+        subscriber.add_listener(received.append)
+
+        subscriber.handle_message(tx_message(103, "akash1provB", bid_event("42", "akash1provB", "98.0",
+                                                                             action="lease-closed")))
+
+        assert [event.action for event in received] == [LEASE_CLOSED]
+
+    def test_streams_from_node(self):
+        """Test the subscriber follows a live websocket and hands bids to provisioning"""
+        with ChainNodeStandIn(RECORDED) as node:
+            subscriber = ChainEventSubscriber(node.url, OWNER, reconnect_seconds=0.1)
+            subscriber.start()
+            try:
+                assert subscriber.wait_until_connected(timeout=5)
+                bids = subscriber.collect_bids("42", timeout=5, window=0.2)
+            finally:
+                subscriber.stop()
+
+        assert node.queries == subscriber.queries()
+        assert f"akash.v1.owner='{OWNER}'" in node.queries[0]
+        assert {bid["bid"]["bid_id"]["provider"] for bid in bids} == {"akash1provA", "akash1provB"}
+        assert subscriber.status()["events_received"] == len(RECORDED)
+
+    def test_lease_manager_waits_on_bid_events(self):
+        """Test bids come from the subscription instead of a market query"""
+        subscriber = ChainEventSubscriber("ws://unused/websocket", OWNER)
+        subscriber.connected = True
+        lease_manager = LeaseManager(chain_events=subscriber)
+        bid = parse_events(json.loads(RECORDED[2])["result"])[0].to_bid()
+
+        with patch.object(subscriber, 'collect_bids', return_value=[bid]) as collect, \
+             patch('broker.lease_manager.subprocess.run') as mock_run:
+            bids = lease_manager._query_bids("42", "create_lease")
+
+        assert collect.call_args[0][0] == "42"
+        assert bids[0]["bid"]["bid_id"]["provider"] == "akash1provB"
+        mock_run.assert_not_called()
+
+    def test_lease_manager_queries_when_disconnected(self):
+        """Test bids are queried from the node while the subscription is down"""
+        subscriber = ChainEventSubscriber("ws://unused/websocket", OWNER)
+        lease_manager = LeaseManager(chain_events=subscriber)
+
+        with patch('broker.lease_manager.subprocess.run') as mock_run:
+            mock_run.return_value = Mock(returncode=0, stdout=json.dumps({
+                "bids": [{"bid": {"bid_id": {"provider": "akash1test", "gseq": 1, "oseq": 1}}}]
+            }), stderr="")
+            bids = lease_manager._query_bids("42", "create_lease")
+
+        assert bids[0]["bid"]["bid_id"]["provider"] == "akash1test"
+        assert "bid" in mock_run.call_args[0][0]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
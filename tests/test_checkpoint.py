@@ -0,0 +1,146 @@
+import pytest
+from unittest.mock import Mock, patch
+import subprocess
+from broker.checkpoint import CheckpointAgent, CheckpointManager, STEAM_COMPATDATA_PATH
+from broker.endpoints import SSH_PORT
+
+class TestCheckpointAgent:
+
+    @pytest.fixture
+    def agent(self):
+        return CheckpointAgent(
+            session_id="session-123",
+            host="192.168.1.100",
+            s3_path="s3://gaming-backups/session-checkpoints/session-123",
+            interval_seconds=30,
+            bandwidth_kbps=1024
+        )
+
+    @pytest.fixture
+    def mock_subprocess_run(self):
+        with patch('broker.checkpoint.subprocess.run') as mock_run:
+            yield mock_run
+
+    def test_throttled_command_limits_bandwidth(self, agent):
+        """Test that background checkpoints are bandwidth capped and low priority"""
+        cmd = agent.build_sync_command()
+        remote_cmd = cmd[-1]
+
+        assert cmd[0] == "ssh"
+        assert "gamer@192.168.1.100" in cmd
+        assert cmd[cmd.index("-p") + 1] == str(SSH_PORT)
+        assert "max_bandwidth = 128KB/s" in remote_cmd
+        assert "nice -n 19 ionice -c 3" in remote_cmd
+        assert "--delete" not in remote_cmd
+        assert f"aws s3 sync {STEAM_COMPATDATA_PATH} s3://gaming-backups/session-checkpoints/session-123/compatdata" in remote_cmd
+
+    def test_unthrottled_command(self, agent):
+        """Test that a final checkpoint runs at full speed"""
+        remote_cmd = agent.build_sync_command(throttled=False)[-1]
+
+        assert "max_bandwidth" not in remote_cmd
+        assert remote_cmd.startswith("aws s3 sync")
+
+    def test_checkpoint_success(self, agent, mock_subprocess_run):
+        """Test successful checkpoint updates agent stats"""
+        mock_subprocess_run.return_value = Mock(returncode=0, stdout="", stderr="")
+
+        result = agent.checkpoint()
+
+        assert result["status"] == "ok"
+        assert agent.checkpoints == 1
+        assert agent.failures == 0
+        assert agent.last_checkpoint_at is not None
+
+    def test_checkpoint_failure(self, agent, mock_subprocess_run):
+        """Test failed checkpoint is recorded"""
+        mock_subprocess_run.return_value = Mock(returncode=1, stdout="", stderr="S3 access denied")
+
+        result = agent.checkpoint()
+
+        assert result["status"] == "error"
+        assert "S3 access denied" in result["message"]
+        assert agent.failures == 1
+        assert agent.last_error == "S3 access denied"
+
+    def test_checkpoint_timeout(self, agent, mock_subprocess_run):
+        """Test checkpoint timeout is reported as an error"""
+        mock_subprocess_run.side_effect = subprocess.TimeoutExpired(cmd="ssh", timeout=300)
+
+        result = agent.checkpoint()
+
+        assert result["status"] == "error"
+        assert "timed out" in result["message"]
+
+class TestCheckpointManager:
+
+    def test_disabled_without_bucket(self):
+        """Test that no agents are started when no bucket is configured"""
+        manager = CheckpointManager(s3_bucket="")
+
+        assert manager.enabled is False
+        assert manager.start("session-123", "192.168.1.100") is None
+
+    @patch.object(CheckpointAgent, 'start')
+    def test_start_and_stop(self, mock_start):
+        """Test agent lifecycle is tracked per session"""
+        manager = CheckpointManager(s3_bucket="gaming-backups")
+
+        agent = manager.start("session-123", "192.168.1.100")
+
+        assert agent.s3_path == "s3://gaming-backups/session-checkpoints/session-123"
+        assert manager.get("session-123") is agent
+        assert manager.start("session-123", "192.168.1.100") is agent
+
+        manager.stop("session-123")
+        assert manager.get("session-123") is None
+
+    @patch.object(CheckpointAgent, 'start')
+    def test_start_with_inherited_path(self, mock_start):
+        """Test a migrated session keeps its checkpoint prefix"""
+        manager = CheckpointManager(s3_bucket="gaming-backups")
+
+        agent = manager.start("new-lease", "192.168.1.200", s3_path="s3://gaming-backups/session-checkpoints/old-lease")
+
+        assert agent.s3_path == "s3://gaming-backups/session-checkpoints/old-lease"
+
+    @patch.object(CheckpointAgent, 'start')
+    def test_agent_follows_session_record(self, mock_start):
+        """Test an agent stops serving once another worker repoints or closes the session"""
+        sessions = {"session-123": {"host": "192.168.1.100", "lease_id": "lease-1"}}
+        manager = CheckpointManager(s3_bucket="gaming-backups", session_lookup=sessions.get)
+        agent = manager.start("session-123", "192.168.1.100", lease_id="lease-1")
+
+        assert agent.is_active() is True
+        sessions["session-123"] = {"host": "192.168.1.200", "lease_id": "lease-2"}
+        assert agent.is_active() is False
+        del sessions["session-123"]
+        assert agent.is_active() is False
+
+    @patch.object(CheckpointAgent, 'start')
+    def test_start_replaces_agent_for_previous_lease(self, mock_start):
+        """Test starting on a new lease replaces an agent left on the old one"""
+        manager = CheckpointManager(s3_bucket="gaming-backups")
+        old_agent = manager.start("session-123", "192.168.1.100", lease_id="lease-1")
+
+        new_agent = manager.start("session-123", "192.168.1.200", lease_id="lease-2")
+
+        assert new_agent is not old_agent
+        assert old_agent._stop_event.is_set()
+        assert manager.get("session-123") is new_agent
+
+    @patch.object(CheckpointAgent, 'start')
+    def test_stop_with_final_checkpoint(self, mock_start):
+        """Test stopping a session flushes remaining changes unthrottled"""
+        manager = CheckpointManager(s3_bucket="gaming-backups")
+        manager.start("session-123", "192.168.1.100")
+
+        with patch('broker.checkpoint.subprocess.run') as mock_run:
+            mock_run.return_value = Mock(returncode=0, stdout="", stderr="")
+            result = manager.stop("session-123", final_checkpoint=True)
+
+        assert result["status"] == "ok"
+        assert "max_bandwidth" not in mock_run.call_args[0][0][-1]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,78 @@
+import pytest
+import json
+from broker.encoder import EncoderPolicy, ClientNetwork, DEFAULT_PROFILE
+
+class TestEncoderPolicy:
+
+    @pytest.fixture
+    def policy(self):
+        return EncoderPolicy()
+
+    def test_no_measurements_uses_stock_profile(self, policy):
+        """Test sessions without measurements keep the image defaults"""
+        assert policy.select(None) == DEFAULT_PROFILE
+
+    def test_strong_link(self, policy):
+        """Test a fast, clean link gets 1080p120 with light FEC"""
+        profile = policy.select(ClientNetwork(downlink_kbps=100000, rtt_ms=15, loss_percent=0))
+
+        assert profile.fps == 120
+        assert profile.resolution == "1920x1080"
+        assert profile.bitrate_kbps == 20000
+        assert profile.fec_percentage == 10
+
+    def test_weak_link(self, policy):
+        """Test a slow link is scaled down and capped below its downlink"""
+        profile = policy.select(ClientNetwork(downlink_kbps=6000, rtt_ms=80, loss_percent=0))
+
+        assert profile.resolution == "1280x720"
+        assert profile.fps == 60
+        assert profile.bitrate_kbps == 4000
+        assert profile.bitrate_kbps <= 6000 * 0.75
+
+    def test_bitrate_capped_to_downlink(self, policy):
+        """Test the bitrate never exceeds the headroom share of the downlink"""
+        profile = policy.select(ClientNetwork(downlink_kbps=10300, rtt_ms=30, loss_percent=0))
+
+        assert profile.resolution == "1600x900"
+        assert profile.bitrate_kbps == 7500
+        assert profile.bitrate_kbps % EncoderPolicy.BITRATE_STEP_KBPS == 0
+
+    def test_loss_raises_fec(self, policy):
+        """Test measured loss increases FEC, within the cap"""
+        clean = policy.select(ClientNetwork(downlink_kbps=12000, rtt_ms=50, loss_percent=0))
+        lossy = policy.select(ClientNetwork(downlink_kbps=12000, rtt_ms=50, loss_percent=1.5))
+        terrible = policy.select(ClientNetwork(downlink_kbps=1000, rtt_ms=300, loss_percent=20))
+
+        assert lossy.fec_percentage > clean.fec_percentage
+        assert terrible.fec_percentage == EncoderPolicy.MAX_FEC_PERCENTAGE
+        assert terrible.bitrate_kbps == EncoderPolicy.MIN_BITRATE_KBPS
+
+    def test_policy_from_file(self, tmp_path):
+        """Test a tuned policy table loaded from JSON"""
+        path = tmp_path / "policy.json"
+        path.write_text(json.dumps({
+            "rules": [{
+                "min_downlink_kbps": 50000, "max_rtt_ms": 30, "max_loss_percent": 0.1,
+                "profile": {"fps": 144, "bitrate_kbps": 40000, "resolution": "2560x1440", "fec_percentage": 5}
+            }],
+            "bandwidth_headroom": 0.5
+        }))
+        policy = EncoderPolicy.from_file(str(path))
+
+        profile = policy.select(ClientNetwork(downlink_kbps=60000, rtt_ms=10))
+        assert profile.resolution == "2560x1440"
+        assert profile.bitrate_kbps == 30000
+        assert policy.select(ClientNetwork(downlink_kbps=60000, rtt_ms=90)).fps == 30
+
+    def test_profile_sdl_parameters(self, policy):
+        """Test profiles become the SUNSHINE_* template parameters"""
+        assert DEFAULT_PROFILE.sdl_parameters() == {
+            "encoder_fps": "120",
+            "encoder_bitrate_kbps": "20000",
+            "encoder_resolution": "1920x1080",
+            "encoder_fec_percentage": "20"
+        }
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,118 @@
+import pytest
+import json
+from unittest.mock import Mock, patch
+from broker.endpoints import (
+    EndpointCache, EndpointDiscoveryError, LeaseEndpoint, SSH_PORT, parse_lease_status, ssh_command
+)
+from broker.lease_manager import LeaseManager
+from broker.state import StateStore
+
+LEASE_STATUS = {
+    "services": {"sunshine": {"name": "sunshine", "available": 1, "total": 1}},
+    "forwarded_ports": {"sunshine": [
+        {"host": "provider.example.com", "port": 47984, "externalPort": 31984, "proto": "TCP", "name": "sunshine"},
+        {"host": "provider.example.com", "port": 47989, "externalPort": 31989, "proto": "UDP", "name": "sunshine"},
+        {"host": "provider.example.com", "port": 2222, "externalPort": 32222, "proto": "TCP", "name": "sunshine"},
+    ]}
+}
+BID = {"bid": {"bid_id": {"provider": "akash1prov", "gseq": 1, "oseq": 1}}}
+
+
+def status(payload, returncode=0, stderr=""):
+    return Mock(returncode=returncode, stdout=json.dumps(payload), stderr=stderr)
+
+
+class TestParseLeaseStatus:
+
+    def test_forwarded_ports(self):
+        endpoint = parse_lease_status(LEASE_STATUS)
+
+        assert endpoint.host == "provider.example.com"
+        assert endpoint.ports == {"47984/tcp": 31984, "47989/udp": 31989, "2222/tcp": 32222}
+        assert endpoint.external_port(47984) == 31984
+        assert endpoint.external_port(47990) == 47990
+        assert endpoint.ssh_port == 32222
+
+    def test_ssh_command(self):
+        """Test ssh goes to gamer on the forwarded port, the container's own when none is known"""
+        assert ssh_command("provider.example.com", "uptime", 32222, connect_timeout=5) == [
+            "ssh", "-o", "StrictHostKeyChecking=no", "-o", "ConnectTimeout=5", "-p", "32222",
+            "gamer@provider.example.com", "uptime"
+        ]
+        assert ssh_command("provider.example.com", "uptime")[-3:-1] == [str(SSH_PORT), "gamer@provider.example.com"]
+
+    def test_not_forwarded_yet(self):
+        assert parse_lease_status({"services": {"sunshine": {"available": 0}}, "forwarded_ports": None}) is None
+
+
+class TestEndpointDiscovery:
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return EndpointCache(StateStore(str(tmp_path / "state.db")))
+
+    @pytest.fixture
+    def lease_manager(self, cache):
+        return LeaseManager(endpoints=cache, sleep=lambda seconds: None)
+
+    def test_polls_until_ports_forwarded(self, lease_manager, cache):
+        """Test lease status is polled until the provider reports forwarded ports, then cached"""
+        with patch('broker.lease_manager.subprocess.run', side_effect=[
+            status({}, returncode=1, stderr="manifest not found"),
+            status({"forwarded_ports": {}}),
+            status(LEASE_STATUS),
+        ]) as mock_run:
+            endpoint = lease_manager.discover_endpoint("42", BID, timeout=10, interval=1)
+
+        assert endpoint.host == "provider.example.com"
+        assert mock_run.call_count == 3
+        cmd = mock_run.call_args[0][0]
+        assert cmd[cmd.index("provider"):cmd.index("provider") + 2] == ["provider", "lease-status"]
+        assert cmd[cmd.index("--provider") + 1] == "akash1prov"
+        assert lease_manager.endpoint("42") == endpoint
+
+    def test_unreachable_lease_closed(self, lease_manager, cache):
+        """Test a lease whose ports never show up is closed and create_lease fails"""
+        with patch('broker.lease_manager.subprocess.run', side_effect=[
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"bids": [BID]}), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            status({}, returncode=1, stderr="lease not found"),
+            status({}, returncode=1, stderr="lease not found"),
+            Mock(returncode=0, stdout="", stderr=""),
+        ]) as mock_run, patch('broker.lease_manager.settings.ENDPOINT_DISCOVERY_TIMEOUT_SECONDS', 1), \
+                patch('broker.lease_manager.settings.ENDPOINT_DISCOVERY_INTERVAL_SECONDS', 1):
+            with pytest.raises(EndpointDiscoveryError, match="lease not found"):
+                lease_manager.create_lease()
+
+        close = mock_run.call_args_list[-1][0][0]
+        assert "close" in close
+
+    def test_rejected_manifest_closes_lease(self, lease_manager, cache):
+        """Test a lease is closed without polling its status when the provider refuses the manifest"""
+        with patch('broker.lease_manager.subprocess.run', side_effect=[
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"bids": [BID]}), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=1, stdout="", stderr="manifest version validation failed"),
+            Mock(returncode=0, stdout="", stderr=""),
+        ]) as mock_run:
+            with pytest.raises(EndpointDiscoveryError, match="Failed to send manifest"):
+                lease_manager.create_lease("sdl/sunshine.yaml")
+
+        lease_create, send_manifest = (call[0][0] for call in mock_run.call_args_list[2:4])
+        assert send_manifest[send_manifest.index("send-manifest") + 1] == "sdl/sunshine.yaml"
+        assert send_manifest[send_manifest.index("--dseq") + 1] == lease_create[lease_create.index("--dseq") + 1]
+        assert "close" in mock_run.call_args_list[-1][0][0]
+
+    def test_forgotten_on_close(self, lease_manager, cache):
+        cache.put("42", LeaseEndpoint("provider.example.com", {"47984/tcp": 31984}))
+
+        with patch('broker.lease_manager.subprocess.run', return_value=Mock(returncode=0, stdout="", stderr="")):
+            assert lease_manager.close_lease("42")
+
+        assert lease_manager.endpoint("42") is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
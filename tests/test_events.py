@@ -0,0 +1,132 @@
+import pytest
+import asyncio
+import threading
+from broker import events
+from broker.events import EventBus, SessionEvent
+from broker.state import StateStore
+
+class TestEventBus:
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return StateStore(str(tmp_path / "state.db"))
+
+    def test_fan_out_to_all_subscribers(self):
+        """Test one publish reaches every client watching the session"""
+        async def scenario():
+            bus = EventBus()
+            bus.attach_loop(asyncio.get_running_loop())
+            watchers = [bus.subscribe("dseq-1") for _ in range(100)]
+            other = bus.subscribe("dseq-2")
+
+            bus.publish("dseq-1", events.LEASE_CREATED, provider="akash1p")
+
+            received = [await watcher.get(timeout=1) for watcher in watchers]
+            assert all(event.event == events.LEASE_CREATED for event in received)
+            assert received[0].data == {"provider": "akash1p"}
+            assert await other.get(timeout=0.01) is None
+
+        asyncio.run(scenario())
+
+    def test_subscribe_replays_latest_state(self):
+        """Test late subscribers immediately see where the session is"""
+        async def scenario():
+            bus = EventBus()
+            bus.publish("dseq-1", events.BID_ACCEPTED)
+            bus.publish("dseq-1", events.LEASE_CREATED)
+
+            event = await bus.subscribe("dseq-1").get(timeout=1)
+            assert event.event == events.LEASE_CREATED
+
+        asyncio.run(scenario())
+
+    def test_slow_subscriber_drops_oldest(self):
+        """Test a client that stops reading loses old events, not new ones"""
+        async def scenario():
+            bus = EventBus(subscriber_queue_size=2)
+            subscription = bus.subscribe("dseq-1")
+            for event in (events.BID_ACCEPTED, events.LEASE_CREATED, events.SUNSHINE_READY):
+                bus.publish("dseq-1", event)
+
+            assert subscription.dropped == 1
+            assert (await subscription.get(timeout=1)).event == events.LEASE_CREATED
+            assert (await subscription.get(timeout=1)).event == events.SUNSHINE_READY
+
+        asyncio.run(scenario())
+
+    def test_terminal_event_clears_state(self):
+        """Test closed sessions are forgotten and unsubscribing cleans up"""
+        async def scenario():
+            bus = EventBus()
+            subscription = bus.subscribe("dseq-1")
+            bus.publish("dseq-1", events.LEASE_CREATED)
+            bus.publish("dseq-1", events.CLOSED)
+
+            await subscription.get(timeout=1)
+            assert (await subscription.get(timeout=1)).terminal
+            assert bus.latest("dseq-1") is None
+
+            subscription.close()
+            assert bus.subscriber_count() == 0
+
+        asyncio.run(scenario())
+
+    def test_latest_state_is_bounded(self):
+        """Test sessions that never end don't grow the replay state without bound"""
+        bus = EventBus(max_latest=2)
+        bus.publish("dseq-1", events.LEASE_CREATED)
+        bus.publish("dseq-2", events.LEASE_CREATED)
+        bus.publish("dseq-1", events.SUNSHINE_READY)
+        bus.publish("dseq-3", events.LEASE_CREATED)
+
+        assert bus.latest("dseq-2") is None
+        assert bus.latest("dseq-1").event == events.SUNSHINE_READY
+        assert bus.latest("dseq-3") is not None
+
+    def test_publish_from_worker_thread(self):
+        """Test events published off the loop are delivered on it"""
+        async def scenario():
+            bus = EventBus()
+            bus.attach_loop(asyncio.get_running_loop())
+            subscription = bus.subscribe("dseq-1")
+
+            thread = threading.Thread(target=bus.publish, args=("dseq-1", events.MIGRATING))
+            thread.start()
+            thread.join()
+
+            assert (await subscription.get(timeout=1)).event == events.MIGRATING
+
+        asyncio.run(scenario())
+
+    def test_relay_between_workers(self, store):
+        """Test events published by one worker reach clients of another"""
+        async def scenario():
+            publisher = EventBus()
+            publisher.attach_store(store, poll_interval=60)
+            watcher = EventBus()
+            watcher.attach_store(store, poll_interval=60)
+            try:
+                subscription = watcher.subscribe("dseq-1")
+                published = publisher.publish("dseq-1", events.EXTENDED, tx_hash="ABC")
+
+                relayed = watcher.relay_once()
+                assert [event.event for event in relayed] == [events.EXTENDED]
+                event = await subscription.get(timeout=1)
+                assert event.data == {"tx_hash": "ABC"}
+                assert event.sequence == published.sequence
+
+                # A worker never re-delivers its own events
+                assert publisher.relay_once() == []
+            finally:
+                publisher.stop()
+                watcher.stop()
+
+        asyncio.run(scenario())
+
+    def test_event_round_trip(self):
+        """Test events serialize for SSE and WebSocket clients"""
+        event = SessionEvent("dseq-1", events.MIGRATED, {"new_lease_id": "dseq-2"}, sequence=7)
+        assert SessionEvent.from_dict(event.to_dict()) == event
+
+if __name__ == "__main__":
+    pytest.main([__file__])
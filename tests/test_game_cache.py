@@ -0,0 +1,182 @@
+import pytest
+from unittest.mock import Mock, patch
+import importlib.util
+import json
+import os
+import threading
+from broker.game_cache import ChunkStore, GameManifest, ManifestIndex, ingest_game, make_cache_node
+from broker.lease_manager import LeaseManager
+from broker.state import StateStore
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_fetcher():
+    path = os.path.join(REPO_ROOT, "images", "ubuntu-sunshine", "game-cache-fetch.py")
+    spec = importlib.util.spec_from_file_location("game_cache_fetch", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class TestGameCache:
+
+    @pytest.fixture
+    def library(self, tmp_path):
+        """A small Steam library with one game and its app manifest"""
+        root = tmp_path / "steamapps"
+        game = root / "common" / "Celeste"
+        game.mkdir(parents=True)
+        (game / "Celeste.exe").write_bytes(os.urandom(10_000) * 3)
+        (game / "Content").mkdir()
+        (game / "Content" / "level.bin").write_bytes(b"\x00" * 25_000)
+        (root / "appmanifest_504230.acf").write_text('"AppState" { "appid" "504230" }')
+        return root
+
+    @pytest.fixture
+    def chunk_store(self, tmp_path):
+        return ChunkStore(str(tmp_path / "cache"))
+
+    @pytest.fixture
+    def cache_node(self, chunk_store):
+        """Local HTTP stand-in for a cache node"""
+        server = make_cache_node(chunk_store, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_port}"
+        server.shutdown()
+        server.server_close()
+
+    def test_ingest_deduplicates_chunks(self, library, chunk_store):
+        """Test identical content is stored once"""
+        manifest = ingest_game("504230", "Celeste", str(library), chunk_store, chunk_size=10_000)
+
+        paths = [f.path for f in manifest.files]
+        assert paths == [
+            "appmanifest_504230.acf",
+            os.path.join("common", "Celeste", "Celeste.exe"),
+            os.path.join("common", "Celeste", "Content", "level.bin")
+        ]
+        exe = manifest.files[1]
+        assert len(exe.chunks) == 3
+        assert len(set(exe.chunks)) == 1
+        assert manifest.total_size == sum(f.size for f in manifest.files)
+        # Repeated exe chunk, zero chunk (level.bin's last chunk is shorter), acf
+        assert manifest.unique_chunks == 4
+        assert all(chunk_store.has(digest) for f in manifest.files for digest in f.chunks)
+
+    def test_manifest_index(self, tmp_path, library, chunk_store):
+        """Test manifests are indexed by app id in the shared store"""
+        index = ManifestIndex(StateStore(str(tmp_path / "state.db")))
+        index.put(ingest_game("504230", "Celeste", str(library), chunk_store))
+
+        manifest = index.get("504230")
+        assert isinstance(manifest, GameManifest)
+        assert manifest.name == "Celeste"
+        assert index.list()[0]["app_id"] == "504230"
+        assert index.get("570") is None
+
+    def test_cache_node_serves_chunks(self, library, chunk_store, cache_node):
+        """Test chunks are served by digest and unknown paths are rejected"""
+        manifest = ingest_game("504230", "Celeste", str(library), chunk_store)
+        fetcher = load_fetcher()
+
+        digest = manifest.files[0].chunks[0]
+        assert fetcher.fetch_chunk([cache_node], digest) == library.joinpath("appmanifest_504230.acf").read_bytes()
+        with pytest.raises(RuntimeError):
+            fetcher.fetch_chunk([cache_node], "0" * 64)
+        with pytest.raises(RuntimeError):
+            fetcher.fetch_chunk([cache_node], "../../etc/passwd")
+
+    def test_fetch_installs_game(self, tmp_path, library, chunk_store, cache_node):
+        """Test a fresh lease installs the game byte-for-byte in parallel"""
+        manifest = ingest_game("504230", "Celeste", str(library), chunk_store, chunk_size=10_000)
+        dest = tmp_path / "lease" / "steamapps"
+        fetcher = load_fetcher()
+
+        report = fetcher.install(manifest.to_dict(), ["http://127.0.0.1:9", cache_node], str(dest), workers=4)
+
+        for f in manifest.files:
+            assert (dest / f.path).read_bytes() == (library / f.path).read_bytes()
+        assert report["node"] == cache_node
+        assert report["chunks_downloaded"] == manifest.unique_chunks
+        assert report["chunks_reused"] == 0
+
+    def test_fetch_reuses_installed_chunks(self, tmp_path, library, chunk_store, cache_node):
+        """Test a recycled lease that already has the game downloads nothing"""
+        manifest = ingest_game("504230", "Celeste", str(library), chunk_store, chunk_size=10_000)
+        dest = tmp_path / "lease" / "steamapps"
+        fetcher = load_fetcher()
+        fetcher.install(manifest.to_dict(), [cache_node], str(dest))
+
+        exe = dest / "common" / "Celeste" / "Celeste.exe"
+        corrupted = bytearray(exe.read_bytes())
+        corrupted[0] ^= 0xFF
+        exe.write_bytes(bytes(corrupted))
+
+        report = fetcher.install(manifest.to_dict(), [cache_node], str(dest))
+
+        assert report["chunks_downloaded"] == 1
+        assert exe.read_bytes() == (library / "common" / "Celeste" / "Celeste.exe").read_bytes()
+
+    def test_fetch_read_only_files(self, tmp_path, library, chunk_store, cache_node):
+        """Test read-only modes are applied after the chunks land, and survive a reinstall"""
+        manifest = ingest_game("504230", "Celeste", str(library), chunk_store, chunk_size=10_000).to_dict()
+        for entry in manifest["files"]:
+            entry["mode"] = 0o444
+        dest = tmp_path / "lease" / "steamapps"
+        fetcher = load_fetcher()
+
+        fetcher.install(manifest, [cache_node], str(dest))
+        report = fetcher.install(manifest, [cache_node], str(dest))
+
+        exe = dest / "common" / "Celeste" / "Celeste.exe"
+        assert exe.read_bytes() == (library / "common" / "Celeste" / "Celeste.exe").read_bytes()
+        assert exe.stat().st_mode & 0o777 == 0o444
+        assert report["chunks_downloaded"] == 0
+
+    def test_fetch_rejects_paths_outside_dest(self, tmp_path, library, chunk_store, cache_node):
+        """Test a manifest can't write outside the Steam library"""
+        manifest = ingest_game("504230", "Celeste", str(library), chunk_store).to_dict()
+        manifest["files"][0]["path"] = "../../outside.bin"
+        fetcher = load_fetcher()
+
+        with pytest.raises(ValueError, match="escapes"):
+            fetcher.install(manifest, [cache_node], str(tmp_path / "lease" / "steamapps"))
+
+        assert not (tmp_path / "outside.bin").exists()
+        assert not (tmp_path / "lease").exists()
+
+    def test_fetch_falls_back_between_nodes(self, tmp_path, library, chunk_store, cache_node):
+        """Test chunks missing on the nearest node come from the next one"""
+        manifest = ingest_game("504230", "Celeste", str(library), chunk_store)
+        empty_node = make_cache_node(ChunkStore(str(tmp_path / "empty")), "127.0.0.1", 0)
+        thread = threading.Thread(target=empty_node.serve_forever, daemon=True)
+        thread.start()
+        fetcher = load_fetcher()
+        try:
+            with patch.object(fetcher, 'rank_nodes', side_effect=lambda nodes: nodes):
+                fetcher.install(manifest.to_dict(),
+                                [f"http://127.0.0.1:{empty_node.server_port}", cache_node],
+                                str(tmp_path / "lease"))
+        finally:
+            empty_node.shutdown()
+            empty_node.server_close()
+
+        assert (tmp_path / "lease" / "appmanifest_504230.acf").exists()
+
+    def test_lease_manager_install_game(self):
+        """Test the manifest is piped to the fetcher on the lease"""
+        with patch('broker.lease_manager.subprocess.run') as mock_run:
+            mock_run.return_value = Mock(returncode=0, stderr="", stdout=json.dumps(
+                {"app_id": "504230", "bytes_downloaded": 1024, "seconds": 1.5}
+            ))
+            result = LeaseManager().install_game("192.168.1.100", {"app_id": "504230"},
+                                                 ["http://cache-a:8090", "http://cache-b:8090"])
+
+        assert result["status"] == "installed"
+        assert result["seconds"] == 1.5
+        called_args = mock_run.call_args[0][0]
+        assert "--nodes http://cache-a:8090,http://cache-b:8090" in called_args[-1]
+        assert json.loads(mock_run.call_args[1]["input"]) == {"app_id": "504230"}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,81 @@
+import pytest
+import json
+import subprocess
+from unittest.mock import Mock, patch
+from broker.gas import GasEstimator, SIMULATE_GAS_FLAGS, gas_used, out_of_gas, size_bucket
+from broker.lease_manager import LeaseManager
+
+
+def tx_result(code=0, gas_used="0", raw_log="", stderr="", returncode=0):
+    stdout = json.dumps({"txhash": "ABC", "code": code, "gas_used": gas_used, "raw_log": raw_log})
+    return subprocess.CompletedProcess([], returncode, stdout, stderr)
+
+
+class TestGasEstimator:
+
+    def test_miss_simulates_then_learns(self):
+        """Test the first tx of a kind simulates and later ones reuse its estimate"""
+        estimator = GasEstimator(margin=1.3)
+
+        assert estimator.flags("lease create") == SIMULATE_GAS_FLAGS
+        estimator.observe("lease create", tx_result(stderr="gas estimate: 140000\n"))
+
+        assert estimator.flags("lease create") == ["--gas", str(int(100000 * 1.3))]
+
+    def test_limit_covers_largest_recent_sample(self):
+        """Test the limit follows the largest sample in the window"""
+        estimator = GasEstimator(margin=1.0, window=2)
+        for used in ("120000", "90000", "100000"):
+            estimator.observe("deployment close", tx_result(gas_used=used))
+
+        # 120000 has aged out of the window
+        assert estimator.limit("deployment close") == 100000
+
+    def test_failed_tx_teaches_nothing(self):
+        estimator = GasEstimator()
+        estimator.observe("lease create", tx_result(stderr="gas estimate: 140000", returncode=1))
+
+        assert estimator.limit("lease create") is None
+
+    def test_parsing(self):
+        assert gas_used(tx_result(gas_used="98123")) == 98123
+        assert gas_used(tx_result()) is None
+        assert out_of_gas(tx_result(code=11, raw_log="out of gas in location: WriteFlat"))
+        assert not out_of_gas(tx_result())
+        assert size_bucket(100) == "1kb"
+        assert size_bucket(3000) == "3kb"
+
+
+class TestLeaseManagerGas:
+
+    @pytest.fixture
+    def lease_manager(self):
+        return LeaseManager(gas_estimator=GasEstimator(margin=1.3))
+
+    def test_second_close_skips_simulation(self, lease_manager):
+        """Test only the first tx of a kind asks the node to simulate"""
+        with patch('broker.lease_manager.subprocess.run',
+                   return_value=tx_result(stderr="gas estimate: 140000")) as mock_run:
+            assert lease_manager.close_lease("111")
+            assert lease_manager.close_lease("222")
+
+        first, second = (call[0][0] for call in mock_run.call_args_list)
+        assert first[-4:] == SIMULATE_GAS_FLAGS
+        assert second[-2:] == ["--gas", "130000"]
+
+    def test_out_of_gas_resimulates(self, lease_manager):
+        """Test a tx rejected for gas is retried once with simulation"""
+        lease_manager.gas_estimator.observe("deployment close", tx_result(gas_used="50000"))
+
+        with patch('broker.lease_manager.subprocess.run', side_effect=[
+            tx_result(code=11, raw_log="out of gas in location: ReadFlat; gasWanted: 65000"),
+            tx_result(stderr="gas estimate: 140000"),
+        ]) as mock_run:
+            assert lease_manager.close_lease("111")
+
+        assert mock_run.call_args_list[0][0][0][-2:] == ["--gas", "65000"]
+        assert mock_run.call_args_list[1][0][0][-4:] == SIMULATE_GAS_FLAGS
+        assert lease_manager.gas_estimator.limit("deployment close") == 130000
+
+if __name__ == "__main__":
+    pytest.main([__file__])
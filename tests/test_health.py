@@ -0,0 +1,109 @@
+import pytest
+import socket
+from broker.health import DegradationDetector, HealthSignals, escrow_risk, lease_status_ok, port_open
+
+FAILING = HealthSignals(probe_ok=False)
+HEALTHY = HealthSignals(probe_ok=True)
+GONE = HealthSignals(probe_ok=False, status_ok=False)
+UNKNOWN = HealthSignals(probe_ok=False, status_ok=None)
+
+
+def scan(detector, signals_by_lease, provider="akash1provA"):
+    return detector.update({lease_id: (provider, f"session-{lease_id}", signals)
+                            for lease_id, signals in signals_by_lease.items()})
+
+
+class TestDegradationDetector:
+
+    @pytest.fixture
+    def detector(self):
+        return DegradationDetector(degraded_score=0.6, recovered_score=0.2, max_concurrent=3,
+                                   max_per_provider=2, retry_seconds=60)
+
+    def test_persistent_probe_failure_degrades(self, detector):
+        """Test a lease degrades on the third failing scan and the first two only raise its score"""
+        healthy_neighbours = {f"n{index}": HEALTHY for index in range(3)}
+
+        assert scan(detector, {"a": FAILING, **healthy_neighbours}) == []
+        assert scan(detector, {"a": FAILING, **healthy_neighbours}) == []
+        degraded = scan(detector, {"a": FAILING, **healthy_neighbours})
+
+        assert [lease.lease_id for lease in degraded] == ["a"]
+        assert detector.leases["a"].signals["provider"] == 0.0
+
+    def test_flapping_probe_never_degrades(self, detector):
+        for _ in range(10):
+            scan(detector, {"a": FAILING})
+            scan(detector, {"a": HEALTHY})
+
+        assert not detector.leases["a"].degraded
+
+    def test_hysteresis_holds_until_recovered(self, detector):
+        """Test one good scan doesn't clear a degraded lease"""
+        scan(detector, {"a": GONE})
+        assert scan(detector, {"a": GONE})
+
+        scan(detector, {"a": HEALTHY})
+        assert detector.leases["a"].degraded
+        scan(detector, {"a": HEALTHY})
+        assert not detector.leases["a"].degraded
+
+    def test_failed_status_query_keeps_last_status(self, detector):
+        """Test an RPC outage neither counts as a closed lease nor clears one"""
+        scan(detector, {"a": UNKNOWN})
+        assert detector.leases["a"].signals["status"] == 0.0
+
+        scan(detector, {"a": GONE})
+        scan(detector, {"a": UNKNOWN})
+        assert detector.leases["a"].signals["status"] == 1.0
+
+    def test_migrations_respect_budgets(self, detector):
+        """Test a failing provider only gets its share of the global migration budget"""
+        for _ in range(2):
+            detector.update({
+                **{f"a{index}": ("akash1provA", f"sa{index}", GONE) for index in range(5)},
+                **{f"b{index}": ("akash1provB", f"sb{index}", GONE) for index in range(5)},
+            })
+
+        selected = detector.select_migrations()
+
+        assert len(selected) == 3
+        by_provider = {}
+        for lease in selected:
+            by_provider[lease.provider] = by_provider.get(lease.provider, 0) + 1
+        assert max(by_provider.values()) == 2
+        assert detector.select_migrations() == []
+
+    def test_failed_migration_waits_to_retry(self, detector):
+        scan(detector, {"a": GONE})
+        scan(detector, {"a": GONE})
+        [lease] = detector.select_migrations(now=1000.0)
+
+        detector.finish("a", migrated=False)
+
+        assert detector.select_migrations(now=1000.0) == []
+        assert detector.select_migrations(now=lease.retry_after + 1) != []
+        detector.finish("a", migrated=True)
+        assert "a" not in detector.leases
+
+    def test_signals(self):
+        assert escrow_risk(None) == 0.0
+        assert escrow_risk(600) == 0.0
+        assert escrow_risk(175) == 0.5
+        assert escrow_risk(10) == 1.0
+        assert lease_status_ok({"deployment": {"state": "active"}, "escrow_account": {"state": "open"}})
+        assert not lease_status_ok({"deployment": {"state": "closed"}})
+        assert lease_status_ok(None) is None
+
+    def test_port_probe(self):
+        """Test the probe is a plain TCP connect to the forwarded port"""
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            port = listener.getsockname()[1]
+
+            assert port_open("127.0.0.1", port, timeout=1)
+        assert not port_open("127.0.0.1", port, timeout=1)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,135 @@
+import pytest
+import asyncio
+from broker.idempotency import IdempotencyStore, IdempotencyKeyReused, fingerprint
+from broker.state import StateStore
+
+REQUEST = fingerprint({"hours": 1, "tier": "standard"})
+
+
+class TestIdempotencyStore:
+
+    @pytest.fixture
+    def state(self, tmp_path):
+        return StateStore(str(tmp_path / "state.db"))
+
+    @pytest.fixture
+    def store(self, state):
+        return IdempotencyStore(state, ttl=60, max_entries=100, in_flight_ttl=60, poll_seconds=0.01)
+
+    def provisioning(self, calls, release=None, result=None):
+        async def operation():
+            calls.append(1)
+            if release is not None:
+                await release.wait()
+            if isinstance(result, Exception):
+                raise result
+            return result or {"session_id": f"s{len(calls)}"}
+        return operation
+
+    def test_retry_during_provisioning_joins_it(self, store):
+        """Test a retry while the first request runs shares its provisioning"""
+        async def scenario():
+            calls = []
+            release = asyncio.Event()
+            operation = self.provisioning(calls, release)
+            first = asyncio.create_task(store.run("key-1", REQUEST, operation))
+            await asyncio.sleep(0)
+            retry = asyncio.create_task(store.run("key-1", REQUEST, operation))
+            await asyncio.sleep(0)
+            release.set()
+            return calls, await first, await retry
+
+        calls, first, retry = asyncio.run(scenario())
+
+        assert calls == [1]
+        assert first == ({"session_id": "s1"}, False)
+        assert retry == ({"session_id": "s1"}, True)
+
+    def test_retry_after_completion_replays(self, store):
+        """Test a retry after the response was sent gets the stored response"""
+        async def scenario():
+            calls = []
+            await store.run("key-1", REQUEST, self.provisioning(calls))
+            return calls, await store.run("key-1", REQUEST, self.provisioning(calls))
+
+        calls, replay = asyncio.run(scenario())
+
+        assert calls == [1]
+        assert replay == ({"session_id": "s1"}, True)
+
+    def test_abandoned_request_keeps_provisioning(self, store):
+        """Test a client giving up doesn't cancel the provisioning its retry joins"""
+        async def scenario():
+            calls = []
+            release = asyncio.Event()
+            operation = self.provisioning(calls, release)
+            first = asyncio.create_task(store.run("key-1", REQUEST, operation))
+            await asyncio.sleep(0)
+            first.cancel()
+            retry = asyncio.create_task(store.run("key-1", REQUEST, operation))
+            await asyncio.sleep(0)
+            release.set()
+            return calls, await retry
+
+        calls, retry = asyncio.run(scenario())
+
+        assert calls == [1]
+        assert retry == ({"session_id": "s1"}, True)
+
+    def test_failure_releases_key(self, store):
+        """Test a failed attempt isn't replayed and the next retry runs again"""
+        async def scenario():
+            calls = []
+            with pytest.raises(RuntimeError):
+                await store.run("key-1", REQUEST, self.provisioning(calls, result=RuntimeError("no bids")))
+            return calls, await store.run("key-1", REQUEST, self.provisioning(calls))
+
+        calls, retry = asyncio.run(scenario())
+
+        assert calls == [1, 1]
+        assert retry == ({"session_id": "s2"}, False)
+
+    def test_key_reused_for_different_request(self, store):
+        """Test a key sent with a different body is rejected"""
+        async def scenario():
+            await store.run("key-1", REQUEST, self.provisioning([]))
+            await store.run("key-1", fingerprint({"hours": 2, "tier": "standard"}), self.provisioning([]))
+
+        with pytest.raises(IdempotencyKeyReused):
+            asyncio.run(scenario())
+
+    def test_waits_for_another_worker(self, state, store):
+        """Test a retry on a second worker waits for the first worker's response"""
+        other_worker = IdempotencyStore(state, ttl=60, max_entries=100, in_flight_ttl=60, poll_seconds=0.01)
+
+        async def scenario():
+            calls = []
+            release = asyncio.Event()
+            first = asyncio.create_task(store.run("key-1", REQUEST, self.provisioning(calls, release)))
+            await asyncio.sleep(0)
+            retry = asyncio.create_task(other_worker.run("key-1", REQUEST, self.provisioning(calls)))
+            await asyncio.sleep(0.05)
+            release.set()
+            return calls, await first, await retry
+
+        calls, first, retry = asyncio.run(scenario())
+
+        assert calls == [1]
+        assert retry == (first[0], True)
+
+    def test_trim_keeps_newest(self, state):
+        """Test stored responses are capped, dropping the oldest first"""
+        store = IdempotencyStore(state, ttl=60, max_entries=2, in_flight_ttl=60)
+
+        async def scenario():
+            for key in ("a", "b", "c"):
+                await store.run(key, REQUEST, self.provisioning([]))
+
+        asyncio.run(scenario())
+
+        assert store.trim() == 1
+        assert state.get(IdempotencyStore.NAMESPACE, "a") is None
+        assert state.count(IdempotencyStore.NAMESPACE) == 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
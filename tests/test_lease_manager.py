@@ -1,8 +1,13 @@
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 import json
+import subprocess
+import threading
+import time
 from broker.lease_manager import LeaseManager, LeaseInfo
 from broker.settings import settings
+from broker.checkpoint import CheckpointManager, CheckpointAgent
+from broker.encoder import EncoderProfile
 
 class TestLeaseManager:
     
@@ -42,17 +47,48 @@ class TestLeaseManager:
                     }
                 }]
             }), stderr=""),  # query market
-            Mock(returncode=0, stdout="", stderr="")  # create lease
+            Mock(returncode=0, stdout="", stderr=""),  # create lease
+            Mock(returncode=0, stdout="", stderr=""),  # send manifest
+            Mock(returncode=0, stdout=json.dumps({"forwarded_ports": {"sunshine": [
+                {"host": "provider.example.com", "port": settings.SUNSHINE_PORT, "externalPort": 31984,
+                 "proto": "TCP"}
+            ]}}), stderr="")  # provider lease status
         ]
         
         result = lease_manager.create_lease()
         
         assert isinstance(result, LeaseInfo)
         assert result.provider == "akash1test"
-        assert result.ip_address == "127.0.0.1"
-        assert result.port == settings.SUNSHINE_PORT
+        assert result.ip_address == "provider.example.com"
+        assert result.port == 31984
         assert result.status == "active"
-        assert mock_subprocess_run.call_count == 3
+        assert mock_subprocess_run.call_count == 5
+        send_manifest = mock_subprocess_run.call_args_list[3][0][0]
+        assert send_manifest[send_manifest.index("provider"):send_manifest.index("provider") + 3] == [
+            "provider", "send-manifest", "sdl/sunshine.yaml"
+        ]
+        assert send_manifest[send_manifest.index("--provider") + 1] == "akash1test"
+    
+    def test_create_lease_publishes_to_session(self, mock_subprocess_run):
+        """Test lifecycle events go to the session the lease is for, not the new deployment"""
+        event_bus = Mock()
+        lease_manager = LeaseManager(event_bus=event_bus)
+        mock_subprocess_run.side_effect = [
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"bids": [{"bid": {"bid_id": {
+                "provider": "akash1test", "gseq": 1, "oseq": 1}}}]}), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"forwarded_ports": {"sunshine": [
+                {"host": "provider.example.com", "port": settings.SUNSHINE_PORT, "externalPort": 31984}
+            ]}}), stderr="")
+        ]
+        
+        lease_manager.create_lease(session_id="session-1")
+        
+        assert [call.args[:2] for call in event_bus.publish.call_args_list] == [
+            ("session-1", "bid_accepted"), ("session-1", "lease_created")
+        ]
     
     def test_create_lease_deployment_fails(self, lease_manager, mock_subprocess_run):
         """Test lease creation failure during deployment"""
@@ -65,21 +101,44 @@ class TestLeaseManager:
         with pytest.raises(Exception, match="Failed to create deployment"):
             lease_manager.create_lease()
     
-    def test_create_lease_no_bids(self, lease_manager, mock_subprocess_run):
-        """Test lease creation failure when no bids are available"""
+    def test_create_lease_no_bids(self, mock_subprocess_run):
+        """Test the bid list is polled until the wait runs out and the deployment is then closed"""
+        sleep = Mock()
+        lease_manager = LeaseManager(sleep=sleep)
         mock_subprocess_run.side_effect = [
             Mock(returncode=0, stdout="", stderr=""),  # create deployment
-            Mock(returncode=0, stdout=json.dumps({"bids": []}), stderr="")  # no bids
+            Mock(returncode=0, stdout=json.dumps({"bids": []}), stderr=""),  # no bids
+            Mock(returncode=0, stdout=json.dumps({"bids": []}), stderr=""),  # a block later
+            Mock(returncode=0, stdout=json.dumps({"bids": []}), stderr=""),  # wait over
+            Mock(returncode=0, stdout="", stderr="")  # close deployment
         ]
         
-        with pytest.raises(Exception, match="No bids available"):
-            lease_manager.create_lease()
+        with patch.object(settings, "BID_WAIT_SECONDS", 12), \
+             patch.object(settings, "BID_POLL_INTERVAL_SECONDS", 6):
+            with pytest.raises(Exception, match="No bids available"):
+                lease_manager.create_lease()
+        
+        assert sleep.call_count == 2
+        assert "close" in mock_subprocess_run.call_args[0][0]
+    
+    def test_query_bids_waits_for_late_bid(self, mock_subprocess_run):
+        """Test a bid landing a block after the first query is still taken"""
+        lease_manager = LeaseManager(sleep=Mock())
+        bid = {"bid": {"bid_id": {"provider": "akash1test", "gseq": 1, "oseq": 1}}}
+        mock_subprocess_run.side_effect = [
+            Mock(returncode=0, stdout=json.dumps({"bids": []}), stderr=""),  # not yet
+            Mock(returncode=0, stdout=json.dumps({"bids": [bid]}), stderr=""),  # a block later
+        ]
+        
+        assert lease_manager._query_bids("42", "create_lease") == [bid]
+        lease_manager.sleep.assert_called_once_with(settings.BID_POLL_INTERVAL_SECONDS)
     
     def test_create_lease_market_query_fails(self, lease_manager, mock_subprocess_run):
         """Test lease creation failure during market query"""
         mock_subprocess_run.side_effect = [
             Mock(returncode=0, stdout="", stderr=""),  # create deployment
-            Mock(returncode=1, stdout="", stderr="market query failed")  # query fails
+            Mock(returncode=1, stdout="", stderr="market query failed"),  # query fails
+            Mock(returncode=0, stdout="", stderr="")  # close deployment
         ]
         
         with pytest.raises(Exception, match="Failed to query market"):
@@ -586,7 +645,8 @@ class TestLeaseManager:
             Mock(returncode=1, stdout="", stderr="S3 restore failed")
         ]
         
-        with patch.object(lease_manager, 'create_lease', return_value=new_lease):
+        with patch.object(lease_manager, 'create_lease', return_value=new_lease), \
+                patch.object(lease_manager, 'close_lease', return_value=True) as close_lease:
             result = lease_manager.migrate_session(
                 current_lease_id="old-lease-123",
                 current_provider="old-provider",
@@ -596,7 +656,29 @@ class TestLeaseManager:
         assert result["status"] == "error"
         assert "Steam data restore failed" in result["message"]
         assert result["new_lease_id"] == "new-lease-123"
+        assert result["new_lease_closed"] is True
         assert result["cleanup_required"] is True
+        close_lease.assert_called_once_with("new-lease-123")
+    
+    def test_migrate_session_error_closes_new_lease(self, lease_manager, mock_subprocess_run):
+        """Test a migration that breaks before the session moves closes the lease it created"""
+        current_lease_status = {"lease": {"services": {"sunshine": {"external_ip": "192.168.1.100"}}}}
+        new_lease = LeaseInfo(lease_id="new-lease-123", provider="new-provider",
+                              ip_address="192.168.1.200", port=47984, status="active")
+        mock_subprocess_run.side_effect = [
+            Mock(returncode=0, stdout=json.dumps(current_lease_status), stderr=""),
+            Mock(returncode=0, stdout="backup complete", stderr=""),
+            Mock(returncode=0, stdout="healthy", stderr=""),
+            subprocess.TimeoutExpired(cmd="ssh", timeout=300)
+        ]
+        
+        with patch.object(lease_manager, 'create_lease', return_value=new_lease), \
+                patch.object(lease_manager, 'close_lease', return_value=True) as close_lease:
+            result = lease_manager.migrate_session("old-lease-123", "old-provider", "gaming-backups")
+        
+        assert result["status"] == "error"
+        assert "timed out" in result["message"]
+        close_lease.assert_called_once_with("new-lease-123")
     
     def test_migrate_session_no_current_lease(self, lease_manager, mock_subprocess_run):
         """Test migration failure when current lease cannot be queried"""
@@ -632,6 +714,337 @@ class TestLeaseManager:
         
         assert result["status"] == "error"
         assert "Could not determine current lease IP" in result["message"]
+    
+    @patch('broker.lease_manager.time.sleep')
+    def test_migrate_session_uses_checkpoint(self, mock_sleep, mock_subprocess_run):
+        """Test migration only ships the delta when the session is checkpointed"""
+        checkpoint_manager = CheckpointManager(s3_bucket="gaming-backups")
+        lease_manager = LeaseManager(checkpoint_manager=checkpoint_manager)
+        
+        current_lease_status = {
+            "lease": {
+                "services": {
+                    "sunshine": {
+                        "external_ip": "192.168.1.100"
+                    }
+                }
+            }
+        }
+        
+        new_lease = LeaseInfo(
+            lease_id="new-lease-123",
+            provider="new-provider",
+            ip_address="192.168.1.200",
+            port=47984,
+            status="active"
+        )
+        
+        with patch.object(CheckpointAgent, 'start'):
+            checkpoint_manager.start("old-lease-123", "192.168.1.100")
+        
+        mock_subprocess_run.side_effect = [
+            # get_lease_status call
+            Mock(returncode=0, stdout=json.dumps(current_lease_status), stderr=""),
+            # Final checkpoint (delta since last background run)
+            Mock(returncode=0, stdout="", stderr=""),
+            # Health check (new lease ready)
+            Mock(returncode=0, stdout="healthy", stderr=""),
+            # S3 restore
+            Mock(returncode=0, stdout="restore complete", stderr=""),
+            # Data integrity verification
+            Mock(returncode=0, stdout="5", stderr="")
+        ]
+        
+        with patch.object(CheckpointAgent, 'start'):
+            with patch.object(lease_manager, 'create_lease', return_value=new_lease):
+                with patch.object(lease_manager, 'close_lease', return_value=True):
+                    result = lease_manager.migrate_session(
+                        current_lease_id="old-lease-123",
+                        current_provider="old-provider",
+                        s3_bucket="gaming-backups",
+                        checkpoint_path="s3://gaming-backups/session-checkpoints/old-lease-123"
+                    )
+        
+        assert result["status"] == "success"
+        assert result["s3_backup_cleaned"] is False
+        assert result["checkpoint_path"] == "s3://gaming-backups/session-checkpoints/old-lease-123"
+        
+        # Final delta checkpoint ran unthrottled against the checkpoint prefix
+        final_sync = mock_subprocess_run.call_args_list[1][0][0][-1]
+        assert "max_bandwidth" not in final_sync
+        assert "session-checkpoints/old-lease-123" in final_sync
+        
+        # Restore reads from the checkpoint prefix
+        restore_call = " ".join(mock_subprocess_run.call_args_list[3][0][0])
+        assert "session-checkpoints/old-lease-123/compatdata" in restore_call
+        
+        # The old lease's agent is stopped; the caller starts the new one from the session record
+        assert checkpoint_manager.get("old-lease-123") is None
+    
+    @patch('broker.lease_manager.time.sleep')
+    def test_migrate_session_checkpointed_in_another_worker(self, mock_sleep, mock_subprocess_run):
+        """Test a worker without the session's agent still ships the delta and keeps the prefix"""
+        lease_manager = LeaseManager(checkpoint_manager=CheckpointManager(s3_bucket="gaming-backups"))
+        current_lease_status = {"lease": {"services": {"sunshine": {"external_ip": "192.168.1.100"}}}}
+        new_lease = LeaseInfo(lease_id="new-lease-123", provider="new-provider",
+                              ip_address="192.168.1.200", port=47984, status="active")
+        mock_subprocess_run.side_effect = [
+            Mock(returncode=0, stdout=json.dumps(current_lease_status), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout="healthy", stderr=""),
+            Mock(returncode=0, stdout="restore complete", stderr=""),
+            Mock(returncode=0, stdout="5", stderr="")
+        ]
+        
+        with patch.object(lease_manager, 'create_lease', return_value=new_lease):
+            with patch.object(lease_manager, 'close_lease', return_value=True):
+                result = lease_manager.migrate_session(
+                    current_lease_id="old-lease-123",
+                    current_provider="old-provider",
+                    s3_bucket="gaming-backups",
+                    session_id="session-123",
+                    checkpoint_path="s3://gaming-backups/session-checkpoints/session-123"
+                )
+        
+        assert result["status"] == "success"
+        assert result["s3_backup_cleaned"] is False
+        assert mock_subprocess_run.call_count == 5
+        final_sync = mock_subprocess_run.call_args_list[1][0][0][-1]
+        assert "max_bandwidth" not in final_sync
+        assert "session-checkpoints/session-123/compatdata" in final_sync
+        assert not any("rm" in call[0][0] for call in mock_subprocess_run.call_args_list)
+    
+    @patch('broker.lease_manager.time.sleep')
+    def test_migrate_session_unverified_still_finishes(self, mock_sleep, mock_subprocess_run):
+        """Test a restore that can't be verified still closes the old lease and stops its agent"""
+        checkpoint_manager = CheckpointManager(s3_bucket="gaming-backups")
+        lease_manager = LeaseManager(checkpoint_manager=checkpoint_manager)
+        current_lease_status = {"lease": {"services": {"sunshine": {"external_ip": "192.168.1.100"}}}}
+        new_lease = LeaseInfo(lease_id="new-lease-123", provider="new-provider",
+                              ip_address="192.168.1.200", port=47984, status="active")
+        with patch.object(CheckpointAgent, 'start'):
+            checkpoint_manager.start("old-lease-123", "192.168.1.100")
+        
+        mock_subprocess_run.side_effect = [
+            Mock(returncode=0, stdout=json.dumps(current_lease_status), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout="healthy", stderr=""),
+            Mock(returncode=0, stdout="restore complete", stderr=""),
+            # Data integrity verification fails
+            Mock(returncode=255, stdout="", stderr="connection reset")
+        ]
+        
+        with patch.object(CheckpointAgent, 'start'):
+            with patch.object(lease_manager, 'create_lease', return_value=new_lease) as create_lease:
+                with patch.object(lease_manager, 'close_lease', return_value=True) as close_lease:
+                    result = lease_manager.migrate_session(
+                        current_lease_id="old-lease-123",
+                        current_provider="old-provider",
+                        s3_bucket="gaming-backups",
+                        sdl_path="/tmp/rendered/gpu-abc.yaml", tier="gpu", region="us-west",
+                        checkpoint_path="s3://gaming-backups/session-checkpoints/old-lease-123"
+                    )
+        
+        assert result["status"] == "warning"
+        assert result["steam_data_verified"] is False
+        assert result["old_lease_closed"] is True
+        close_lease.assert_called_once_with("old-lease-123")
+        assert checkpoint_manager.get("old-lease-123") is None
+        create_lease.assert_called_once_with("/tmp/rendered/gpu-abc.yaml", tier="gpu", region="us-west")
+    
+    def test_restart_slot_applies_encoder_profile(self, lease_manager, mock_subprocess_run):
+        """Test a packed slot restarts with the session's encoder profile"""
+        mock_subprocess_run.return_value = Mock(returncode=0, stdout="", stderr="")
+        profile = EncoderProfile(fps=60, bitrate_kbps=8000, resolution="1600x900", fec_percentage=25)
+        
+        assert lease_manager.restart_slot("192.168.1.100", 2, profile) is True
+        
+        called_args = mock_subprocess_run.call_args[0][0]
+        assert "gamer@192.168.1.100" in called_args
+        assert called_args[-1] == (
+            "SUNSHINE_FPS=60 SUNSHINE_BITRATE=8000 SUNSHINE_RESOLUTION=1600x900 "
+            "SUNSHINE_FEC_PERCENTAGE=25 sunshine-slot restart 2"
+        )
+    
+    def test_stop_slot_failure(self, lease_manager, mock_subprocess_run):
+        """Test stopping a slot on an unreachable lease"""
+        mock_subprocess_run.return_value = Mock(returncode=255, stdout="", stderr="Connection refused")
+        
+        assert lease_manager.stop_slot("192.168.1.100", 1) is False
+        assert mock_subprocess_run.call_args[0][0][-1] == "sunshine-slot stop 1"
+    
+    def test_reset_session(self, lease_manager, mock_subprocess_run):
+        """Test a dedicated lease is wiped for its next player"""
+        mock_subprocess_run.return_value = Mock(returncode=0, stdout="Sunshine ready", stderr="")
+        
+        assert lease_manager.reset_session("192.168.1.100") is True
+        
+        called_args = mock_subprocess_run.call_args[0][0]
+        assert "gamer@192.168.1.100" in called_args
+        assert called_args[-1] == "sunshine-session reset"
+    
+    def test_restart_sunshine_failure(self, lease_manager, mock_subprocess_run):
+        """Test restarting Sunshine on a recycled lease that fails to come up"""
+        mock_subprocess_run.return_value = Mock(returncode=1, stdout="", stderr="ERROR: Sunshine failed to start")
+        
+        assert lease_manager.restart_sunshine("192.168.1.100") is False
+        assert mock_subprocess_run.call_args[0][0][-1] == "sunshine-session restart"
+    
+    def test_get_boot_report(self, lease_manager, mock_subprocess_run):
+        """Test reading the per-phase boot timings from a lease"""
+        report = {
+            "status": "ready",
+            "slots": 1,
+            "total_seconds": 3.412,
+            "phases": [
+                {"phase": "xvfb", "start_offset_seconds": 0.02, "seconds": 0.31, "status": "ok"},
+                {"phase": "sunshine", "start_offset_seconds": 0.94, "seconds": 2.47, "status": "ok"}
+            ]
+        }
+        mock_subprocess_run.return_value = Mock(returncode=0, stdout=json.dumps(report), stderr="")
+        
+        assert lease_manager.get_boot_report("192.168.1.100") == report
+        assert mock_subprocess_run.call_args[0][0][-1] == "cat /tmp/boot-report.json"
+    
+    def test_get_boot_report_missing(self, lease_manager, mock_subprocess_run):
+        """Test a lease whose entrypoint has not finished booting"""
+        mock_subprocess_run.return_value = Mock(returncode=1, stdout="", stderr="No such file or directory")
+        
+        assert lease_manager.get_boot_report("192.168.1.100") is None
+    
+    @staticmethod
+    def make_bid(provider, price):
+        return {"bid": {"bid_id": {"provider": provider, "gseq": 1, "oseq": 1},
+                        "price": {"denom": "uakt", "amount": str(price)}}}
+    
+    @pytest.fixture
+    def hedged_market(self, lease_manager):
+        """Three providers bidding on every deployment, each lease on its own host"""
+        bids = [self.make_bid("akash1slow", 150), self.make_bid("akash1cheap", 100),
+                self.make_bid("akash1pricey", 400)]
+        hosts = {"akash1cheap": "10.0.0.1", "akash1slow": "10.0.0.2", "akash1pricey": "10.0.0.3"}
+        
+        def accept_bid(sdl_path, deployment_id, bid, operation):
+            provider = bid["bid"]["bid_id"]["provider"]
+            return LeaseInfo(deployment_id, provider, hosts[provider], settings.SUNSHINE_PORT, "active")
+        
+        with patch.object(lease_manager, '_create_deployment'), \
+             patch.object(lease_manager, '_query_bids', return_value=bids), \
+             patch.object(lease_manager, '_accept_bid', side_effect=accept_bid), \
+             patch.object(lease_manager, 'close_lease', return_value=True) as close_lease:
+            yield bids, close_lease
+    
+    def test_select_hedge_bids_within_cost_cap(self, lease_manager):
+        """Test backups are the cheapest other providers whose race cost fits the cap"""
+        bids = [self.make_bid("akash1a", 100), self.make_bid("akash1a", 120),
+                self.make_bid("akash1b", 150), self.make_bid("akash1c", 400)]
+        
+        # 120s race = 20 blocks: akash1b costs 3000, akash1c would add 8000
+        selected = lease_manager.select_hedge_bids(bids, 3, max_extra_cost_uakt=5000, race_seconds=120)
+        
+        assert [bid["bid"]["bid_id"]["provider"] for bid in selected] == ["akash1a", "akash1b"]
+        assert lease_manager.select_hedge_bids(bids, 3, max_extra_cost_uakt=0, race_seconds=120) == [bids[0]]
+    
+    def test_create_hedged_lease_keeps_first_ready(self, lease_manager, hedged_market):
+        """Test the first lease to answer wins and the other is closed straight away"""
+        _, close_lease = hedged_market
+        
+        with patch.object(lease_manager, 'is_sunshine_ready', side_effect=lambda ip, ssh_port: ip == "10.0.0.2"):
+            lease = lease_manager.create_hedged_lease("sdl/sunshine.yaml", 2, max_extra_cost_uakt=5000,
+                                                      ready_timeout=10, poll_interval=0)
+        
+        assert lease.provider == "akash1slow"
+        assert lease.ip_address == "10.0.0.2"
+        assert close_lease.call_count == 1
+        assert close_lease.call_args[0][0] != lease.lease_id
+        assert lease.hedge_lease_ids == [close_lease.call_args[0][0]]
+    
+    def test_create_hedged_lease_falls_back_to_cheapest(self, lease_manager, hedged_market):
+        """Test the cheapest lease is kept when none is ready before the race ends"""
+        _, close_lease = hedged_market
+        
+        with patch.object(lease_manager, 'is_sunshine_ready', return_value=False):
+            lease = lease_manager.create_hedged_lease("sdl/sunshine.yaml", 2, max_extra_cost_uakt=5000,
+                                                      ready_timeout=0, poll_interval=0)
+        
+        assert lease.provider == "akash1cheap"
+        assert close_lease.call_count == 1
+    
+    def test_create_hedged_lease_does_not_wait_for_backups(self, lease_manager, hedged_market):
+        """Test a lease is raced as soon as it exists, and a backup created after the win is closed"""
+        _, close_lease = hedged_market
+        accept_bid = lease_manager._accept_bid.side_effect
+        release_backup = threading.Event()
+        
+        def slow_backup(sdl_path, deployment_id, bid, operation):
+            if bid["bid"]["bid_id"]["provider"] == "akash1slow":
+                release_backup.wait(5)
+            return accept_bid(sdl_path, deployment_id, bid, operation)
+        
+        with patch.object(lease_manager, '_accept_bid', side_effect=slow_backup), \
+             patch.object(lease_manager, 'is_sunshine_ready', return_value=True):
+            lease = lease_manager.create_hedged_lease("sdl/sunshine.yaml", 2, max_extra_cost_uakt=5000,
+                                                      ready_timeout=10, poll_interval=0)
+            assert lease.provider == "akash1cheap"
+            assert close_lease.call_count == 0
+            
+            release_backup.set()
+            deadline = time.monotonic() + 5
+            while close_lease.call_count == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        
+        assert close_lease.call_count == 1
+        assert close_lease.call_args[0][0] != lease.lease_id
+    
+    def test_create_hedged_lease_backup_without_bid(self, lease_manager, hedged_market):
+        """Test a backup provider that doesn't bid again is dropped and its deployment closed"""
+        bids, close_lease = hedged_market
+        
+        with patch.object(lease_manager, '_query_bids', side_effect=[bids, bids[1:2]]), \
+             patch.object(lease_manager, 'is_sunshine_ready', return_value=True):
+            lease = lease_manager.create_hedged_lease("sdl/sunshine.yaml", 2, max_extra_cost_uakt=5000,
+                                                      ready_timeout=10, poll_interval=0)
+        
+        assert lease.provider == "akash1cheap"
+        assert close_lease.call_count == 1
+        assert close_lease.call_args[0][0] != lease.lease_id
+    
+    def test_blocks_remaining_by_lease(self, lease_manager, mock_subprocess_run):
+        """Test one list of active leases gives each lease's blocks as its escrow balance over its price"""
+        def entry(dseq, balance):
+            return {"lease": {"lease_id": {"dseq": dseq}, "price": {"denom": "uakt", "amount": "10.5"}},
+                    "escrow_payment": {"balance": {"denom": "uakt", "amount": str(balance)}}}
+        mock_subprocess_run.return_value = Mock(returncode=0, stdout=json.dumps({
+            "leases": [entry("1", 2100), entry("2", 0), {"lease": {"lease_id": {"dseq": "3"}}}],
+            "pagination": {"next_key": None}}), stderr="")
+        
+        assert lease_manager.blocks_remaining_by_lease() == {"1": 200, "2": 0}
+        list_cmd = mock_subprocess_run.call_args[0][0]
+        assert list_cmd[list_cmd.index("--state") + 1] == "active"
+        
+        # A sweep passes the listed value in and no query is made
+        mock_subprocess_run.reset_mock()
+        result = lease_manager.extend_if_needed("1", "test-provider", blocks_remaining=500)
+        assert result["blocks_remaining"] == 500
+        assert mock_subprocess_run.call_count == 0
+    
+    def test_iter_leases_follows_pages(self, lease_manager, mock_subprocess_run):
+        """Test leases are listed page by page, by owner address, until the chain returns no next key"""
+        lease = {"lease": {"lease_id": {"dseq": "1"}}, "escrow_payment": {}}
+        mock_subprocess_run.side_effect = [
+            # AKASH_FROM names a keyring key
+            Mock(returncode=0, stdout="akash1broker\n", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"leases": [lease, lease],
+                                                  "pagination": {"next_key": "AAAB"}}), stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"leases": [lease],
+                                                  "pagination": {"next_key": None}}), stderr="")
+        ]
+        
+        with patch('broker.lease_manager.settings.AKASH_FROM', "broker"):
+            assert len(list(lease_manager.iter_leases(page_size=2))) == 3
+        second_call = mock_subprocess_run.call_args_list[2][0][0]
+        assert second_call[second_call.index("--page-key") + 1] == "AAAB"
+        assert second_call[second_call.index("--owner") + 1] == "akash1broker"
 
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
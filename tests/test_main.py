@@ -0,0 +1,220 @@
+import pytest
+import json
+import threading
+from unittest.mock import Mock, patch
+from fastapi.testclient import TestClient
+from broker import events
+from broker.admission import AdmissionController
+from broker.settings import settings
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    """The API module, importing against a scratch state store and without a chain connection"""
+    root = tmp_path_factory.mktemp("broker")
+    with patch.multiple(settings, STATE_DB_PATH=str(root / "state.db"), CHAIN_EVENTS_ENABLED=False,
+                        MARKET_HISTORY_DIR=str(root / "market-history"), SDL_RENDER_DIR=str(root / "sdl")):
+        from broker import main
+        yield main
+
+
+@pytest.fixture(scope="module")
+def client(main):
+    # Background jobs would call out to the chain; the lifespan still attaches the event loop
+    with patch.object(main.scheduler, "start"):
+        with TestClient(main.app) as client:
+            yield client
+
+
+@pytest.fixture
+def provisioned(main):
+    """Stub out the lease side of provisioning; each call records a dedicated session"""
+    calls = []
+
+    def provision_session(request, ticket):
+        session_id = f"session-{len(calls) + 1}"
+        calls.append(session_id)
+        main.state_store.put("sessions", session_id, {
+            "session_id": session_id, "lease_id": f"lease-{len(calls)}", "provider": "akash1provA",
+            "host": "203.0.113.7", "port": 30111, "web_port": 47990, "tier": request.tier,
+        })
+        return main.SessionResponse(session_id=session_id, moonlight_host="203.0.113.7",
+                                    moonlight_port=30111, status="provisioning", tier=request.tier)
+
+    with patch.object(main, "provision_session", side_effect=provision_session):
+        with patch.object(main, "watch_readiness"):
+            yield calls
+
+
+@pytest.fixture
+def session(main):
+    main.state_store.put("sessions", "watched", {"session_id": "watched", "lease_id": "lease-9",
+                                                 "provider": "akash1provA", "host": "203.0.113.9"})
+    yield "watched"
+    main.state_store.delete("sessions", "watched")
+
+
+class TestAdmission:
+
+    def test_queued_request_gets_ticket_then_session(self, main, client, provisioned):
+        """Test a request with no free slot answers 202 and its ticket later carries the session"""
+        controller = AdmissionController(max_concurrent=1, max_queue=4)
+        with patch.object(main, "admission_controller", controller):
+            held = controller.reserve()
+
+            response = client.post("/sessions", json={"hours": 1})
+
+            assert response.status_code == 202
+            ticket_id = response.json()["ticket_id"]
+            assert response.headers["Location"] == f"/admission/{ticket_id}"
+            status = client.get(f"/admission/{ticket_id}").json()
+            assert status["status"] == "queued"
+            assert status["queue_position"] == 0
+
+            # Freeing the slot admits the queued request on the app's loop
+            client.portal.call(lambda: controller.release(held))
+            for _ in range(50):
+                status = client.get(f"/admission/{ticket_id}").json()
+                if status["status"] != "queued":
+                    break
+                threading.Event().wait(0.05)
+
+        assert status["status"] == "provisioned"
+        assert status["session"]["session_id"] == provisioned[0]
+
+    def test_unknown_ticket(self, client):
+        assert client.get("/admission/missing").status_code == 404
+
+
+class TestIdempotency:
+
+    def test_retry_replays_the_first_response(self, client, provisioned):
+        """Test a retried POST with the same key provisions once and replays the session"""
+        first = client.post("/sessions", json={"hours": 2}, headers={"Idempotency-Key": "retry-1"})
+        retry = client.post("/sessions", json={"hours": 2}, headers={"Idempotency-Key": "retry-1"})
+
+        assert first.status_code == retry.status_code == 200
+        assert retry.json()["session_id"] == first.json()["session_id"]
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        assert len(provisioned) == 1
+
+    def test_key_reused_for_another_request(self, client, provisioned):
+        """Test a key sent with a different body is rejected instead of replayed"""
+        client.post("/sessions", json={"hours": 1}, headers={"Idempotency-Key": "reused-1"})
+        response = client.post("/sessions", json={"hours": 3}, headers={"Idempotency-Key": "reused-1"})
+
+        assert response.status_code == 422
+        assert len(provisioned) == 1
+
+
+class TestEventStreams:
+
+    def test_sse_replays_state_and_ends_on_close(self, main, client, session):
+        """Test the SSE stream starts from the latest state and ends after a terminal event"""
+        main.event_bus.publish(session, events.LEASE_CREATED, lease_id="lease-9")
+        closer = threading.Timer(0.2, main.event_bus.publish, (session, events.CLOSED))
+        closer.start()
+
+        response = client.get(f"/sessions/{session}/events")
+        closer.join()
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        frames = [frame for frame in response.text.split("\n\n") if frame]
+        assert [frame.split("\n")[1] for frame in frames] == ["event: lease_created", "event: closed"]
+        assert json.loads(frames[0].split("data: ", 1)[1])["data"] == {"lease_id": "lease-9"}
+
+    def test_websocket_pushes_transitions(self, main, client, session):
+        """Test the WebSocket stream pushes each transition as JSON and closes after the last"""
+        main.event_bus.publish(session, events.LEASE_CREATED)
+        with client.websocket_connect(f"/sessions/{session}/ws") as websocket:
+            assert websocket.receive_json()["event"] == events.LEASE_CREATED
+            main.event_bus.publish(session, events.SUNSHINE_READY)
+            assert websocket.receive_json()["event"] == events.SUNSHINE_READY
+            main.event_bus.publish(session, events.CLOSED)
+            assert websocket.receive_json()["event"] == events.CLOSED
+
+    def test_unknown_session(self, client):
+        assert client.get("/sessions/missing/events").status_code == 404
+
+
+class TestAdminBulk:
+
+    @pytest.fixture(autouse=True)
+    def admin_token(self):
+        with patch.object(settings, "ADMIN_API_TOKEN", "admin-secret"):
+            yield
+
+    def test_requires_token(self, client):
+        response = client.post("/admin/sessions/close", json={"provider": "akash1provA"})
+
+        assert response.status_code == 401
+
+    def test_close_streams_ndjson(self, main, client, session):
+        """Test a bulk close streams the selection, one line per session and the report"""
+        with patch.object(main, "end_session", return_value=True) as end_session:
+            response = client.post("/admin/sessions/close", json={"session_ids": [session]},
+                                   headers={"Authorization": "Bearer admin-secret"})
+
+        assert response.headers["content-type"] == "application/x-ndjson"
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert [record["type"] for record in records] == ["selected", "item", "report"]
+        assert records[0]["keys"] == [session]
+        assert records[1]["status"] == "ok"
+        assert records[2]["completed"] == 1
+        end_session.assert_called_once_with(session)
+
+    def test_dry_run_only_selects(self, main, client, session):
+        with patch.object(main, "end_session") as end_session:
+            response = client.post("/admin/sessions/close", json={"session_ids": [session], "dry_run": True},
+                                   headers={"Authorization": "Bearer admin-secret"})
+
+        assert [json.loads(line)["type"] for line in response.text.splitlines()] == ["selected"]
+        end_session.assert_not_called()
+
+
+class TestMigrateSessionLease:
+
+    @pytest.fixture(autouse=True)
+    def bucket(self):
+        with patch.object(settings, "CHECKPOINT_S3_BUCKET", "gaming-backups"):
+            yield
+
+    @pytest.fixture
+    def sdl(self, main):
+        with patch.object(main.sdl_registry, "render", return_value="/tmp/rendered.yaml"):
+            yield
+
+    def test_second_migration_is_rejected(self, main, session, sdl):
+        """Test a session another migration has claimed isn't migrated twice"""
+        main.state_store.update("sessions", session, lambda current: {**current, "migrating": 1e12})
+        with patch.object(main.lease_manager, "migrate_session") as migrate_session:
+            result = main.migrate_session_lease(session)
+
+        assert result["status"] == "error"
+        assert "already being migrated" in result["message"]
+        migrate_session.assert_not_called()
+
+    def test_session_moved_meanwhile_closes_new_lease(self, main, session, sdl):
+        """Test a migration finishing after the session moved drops its lease instead of repointing"""
+        def migrate_session(*args, **kwargs):
+            main.state_store.update("sessions", session, lambda current: {**current, "lease_id": "lease-10"})
+            return {"status": "success", "new_lease_id": "lease-11", "new_ip": "203.0.113.11"}
+
+        with patch.object(main.lease_manager, "migrate_session", side_effect=migrate_session):
+            with patch.object(main.lease_manager, "close_lease", return_value=True) as close_lease:
+                result = main.migrate_session_lease(session)
+
+        assert result["status"] == "error"
+        close_lease.assert_called_once_with("lease-11")
+        assert main.state_store.get("sessions", session)["lease_id"] == "lease-10"
+
+    def test_failed_migration_releases_claim(self, main, session, sdl):
+        with patch.object(main.lease_manager, "migrate_session",
+                          return_value={"status": "error", "message": "no bids"}):
+            assert main.migrate_session_lease(session)["status"] == "error"
+
+        assert "migrating" not in main.state_store.get("sessions", session)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,150 @@
+import pytest
+import json
+from array import array
+from unittest.mock import Mock, patch
+from broker.lease_manager import LeaseManager
+from broker.market_history import MarketHistory, READY, READY_TIMEOUT
+
+# 2026-10-19 20:00 UTC
+EVENING = 1792440000.0
+HOUR = 3600.0
+DAY = 86400.0
+
+
+def bid(provider, price):
+    return {"bid": {"bid_id": {"provider": provider, "gseq": 1, "oseq": 1},
+                    "price": {"denom": "uakt", "amount": str(price)}}}
+
+
+class TestMarketHistory:
+
+    @pytest.fixture
+    def history(self, tmp_path):
+        return MarketHistory(str(tmp_path / "history"), retention_days=30)
+
+    def test_price_percentiles_by_provider_and_hour(self, history):
+        """Test bids aggregate per provider and UTC hour, cheapest median first"""
+        history.record_bids([("akash1provA", 100.0, True), ("akash1provB", 140.0, False)],
+                            tier="gpu", region="us-west", now=EVENING)
+        history.record_bids([("akash1provA", 120.0, False), ("akash1provB", 90.0, True)],
+                            tier="gpu", region="us-west", now=EVENING + 60)
+        history.record_bids([("akash1provA", 300.0, True)], tier="gpu", region="us-west", now=EVENING - 12 * HOUR)
+
+        groups = history.price_percentiles(("provider", "hour"), until=EVENING + HOUR, tier="gpu", hour=20)
+
+        assert [(group["provider"], group["hour"], group["bids"]) for group in groups] == [
+            ("akash1provA", 20, 2), ("akash1provB", 20, 2)
+        ]
+        assert groups[0]["p50"] == 120.0
+        assert groups[0]["min"] == 100.0
+
+    def test_filters_and_partitions(self, history):
+        """Test a window spanning days reads each day's partition and filters by its own dictionary"""
+        history.record_bids([("akash1provA", 100.0, True)], tier="gpu", region="us-west", now=EVENING - DAY)
+        history.record_bids([("akash1provB", 200.0, True)], tier="cpu", region="eu-central", now=EVENING)
+
+        assert [group["bids"] for group in history.price_percentiles(until=EVENING + 1)] == [1, 1]
+        assert history.price_percentiles(until=EVENING + 1, region="eu-central")[0]["provider"] == "akash1provB"
+        assert history.price_percentiles(until=EVENING + 1, tier="gpu", region="eu-central") == []
+        with pytest.raises(ValueError, match="gpu_model"):
+            history.price_percentiles(("gpu_model",))
+
+    def test_provider_stats(self, history):
+        history.record_bids([("akash1provA", 100.0, True), ("akash1provB", 150.0, False)], now=EVENING)
+        history.record_lease("akash1provA", READY, ready_seconds=40.0, now=EVENING + 40)
+        history.record_lease("akash1provA", READY_TIMEOUT, now=EVENING + 600)
+
+        stats = history.provider_stats(until=EVENING + DAY)
+
+        assert stats["akash1provA"] == {"bids": 1, "wins": 1, "leases": 2, "ready": 1, "median_price": 100.0,
+                                        "ready_rate": 0.5, "median_ready_seconds": 40.0}
+        assert stats["akash1provB"]["ready_rate"] is None
+
+    def test_sees_rows_from_another_writer(self, history, tmp_path):
+        """Test a reader picks up rows appended to today's partition after it was loaded"""
+        other_worker = MarketHistory(str(tmp_path / "history"))
+        history.record_bids([("akash1provA", 100.0, True)])
+        assert history.provider_stats()["akash1provA"]["bids"] == 1
+
+        other_worker.record_bids([("akash1provA", 110.0, False), ("akash1provC", 90.0, True)])
+
+        stats = history.provider_stats()
+        assert stats["akash1provA"]["bids"] == 2
+        assert stats["akash1provC"]["wins"] == 1
+
+    def test_rank_bids_discounts_unreliable_providers(self, history):
+        """Test a cheap provider whose leases rarely come up ranks below a dearer reliable one"""
+        for _ in range(4):
+            history.record_lease("akash1flaky", READY_TIMEOUT)
+            history.record_lease("akash1steady", READY, ready_seconds=30.0)
+        bids = [bid("akash1flaky", 80), bid("akash1steady", 120), bid("akash1unknown", 100)]
+
+        ranked = history.rank_bids(bids)
+
+        assert [entry["bid"]["bid_id"]["provider"] for entry in ranked] == [
+            "akash1unknown", "akash1steady", "akash1flaky"
+        ]
+
+    def test_append_after_torn_batch(self, history, tmp_path):
+        """Test a batch cut short by a dead writer doesn't shift later rows out of line"""
+        history.record_bids([("akash1provA", 100.0, True)], now=EVENING)
+        day = tmp_path / "history" / "2026-10-19"
+        with open(day / "bids.time", "ab") as f:
+            f.write(array("d", [EVENING]).tobytes())
+        with open(day / "bids.provider", "ab") as f:
+            f.write(b"\x00\x00")
+
+        history.record_bids([("akash1provB", 90.0, False)], now=EVENING + 60)
+
+        assert (day / "bids.time").stat().st_size == 2 * 8
+        assert (day / "bids.provider").stat().st_size == 2 * 4
+        stats = history.provider_stats(until=EVENING + HOUR)
+        assert stats["akash1provB"] == {**stats["akash1provB"], "bids": 1, "wins": 0, "median_price": 90.0}
+
+    def test_ranking_counts_match_provider_stats(self, history):
+        """Test the per-day counts ranking reuses agree with a full scan"""
+        for days_ago, outcome in ((3, READY), (2, READY_TIMEOUT), (2, READY), (0, READY)):
+            history.record_lease("akash1provA", outcome, tier="gpu", now=EVENING - days_ago * DAY)
+        history.record_lease("akash1provA", READY, tier="cpu", now=EVENING - DAY)
+
+        for _ in range(2):
+            counts = history._ready_counts("gpu", None, now=EVENING + 1)
+            stats = history.provider_stats(until=EVENING + 1, tier="gpu")["akash1provA"]
+            assert counts["akash1provA"] == {"leases": stats["leases"], "ready": stats["ready"]}
+        assert counts["akash1provA"] == {"leases": 4, "ready": 3}
+        assert ("2026-10-16", "gpu", None) in history._day_counts
+        assert all(key[0] != "2026-10-19" for key in history._day_counts)
+
+    def test_prune(self, history):
+        history.record_bids([("akash1provA", 100.0, True)], now=EVENING - 60 * DAY)
+        history.record_bids([("akash1provA", 100.0, True)], now=EVENING)
+
+        assert history.prune(now=EVENING) == 1
+        assert history.provider_stats(days=90, until=EVENING + 1)["akash1provA"]["bids"] == 1
+
+
+class TestLeaseManagerMarketHistory:
+
+    def test_create_lease_records_and_ranks_bids(self, tmp_path):
+        """Test bids are recorded and the lease goes to the best ranked bid, not the first"""
+        history = MarketHistory(str(tmp_path / "history"))
+        lease_manager = LeaseManager(market_history=history)
+        bids = {"bids": [bid("akash1dear", 200), bid("akash1cheap", 100)]}
+        with patch('broker.lease_manager.subprocess.run', side_effect=[
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps(bids), stderr=""),
+            Mock(returncode=1, stdout="", stderr="insufficient funds"),
+        ]) as mock_run:
+            with pytest.raises(Exception, match="Failed to create lease"):
+                lease_manager.create_lease(tier="gpu", region="us-west")
+
+        lease_create = mock_run.call_args_list[2][0][0]
+        assert lease_create[lease_create.index("--provider") + 1] == "akash1cheap"
+        stats = history.provider_stats(tier="gpu", region="us-west")
+        assert stats["akash1cheap"]["wins"] == 1
+        assert stats["akash1dear"]["wins"] == 0
+        assert stats["akash1cheap"]["leases"] == 1
+        assert history.provider_stats(tier="cpu") == {}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
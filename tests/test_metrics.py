@@ -0,0 +1,175 @@
+import pytest
+from unittest.mock import Mock, patch
+import json
+from concurrent.futures import ThreadPoolExecutor
+from broker import metrics
+from broker.metrics import MetricsRegistry, akash_subcommand
+from broker.state import StateStore
+from broker.lease_manager import LeaseManager
+
+class TestMetricsRegistry:
+
+    @pytest.fixture
+    def registry(self):
+        return MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self, registry):
+        """Test histogram exposition uses cumulative bucket counts"""
+        histogram = registry.histogram("test_seconds", "Test latency", ["op"], buckets=(0.1, 1.0))
+        child = histogram.labels("create")
+        child.observe(0.05)
+        child.observe(0.5)
+        child.observe(5.0)
+
+        output = registry.render()
+
+        assert '# TYPE test_seconds histogram' in output
+        assert 'test_seconds_bucket{op="create",le="0.1"} 1' in output
+        assert 'test_seconds_bucket{op="create",le="1"} 2' in output
+        assert 'test_seconds_bucket{op="create",le="+Inf"} 3' in output
+        assert 'test_seconds_count{op="create"} 3' in output
+        assert 'test_seconds_sum{op="create"} 5.55' in output
+
+    def test_preallocated_children_render_zero(self, registry):
+        """Test pre-allocated label sets are exported before first use"""
+        histogram = registry.histogram("test_seconds", "Test latency", ["op"], buckets=(1.0,))
+        histogram.preallocate([("close",)])
+
+        assert 'test_seconds_count{op="close"} 0' in registry.render()
+
+    def test_labels_returns_same_child(self, registry):
+        """Test label lookups reuse the pre-allocated child"""
+        histogram = registry.histogram("test_seconds", "Test latency", ["op"])
+
+        assert histogram.labels("create") is histogram.labels("create")
+
+    def test_labels_wrong_arity(self, registry):
+        """Test label arity is validated"""
+        histogram = registry.histogram("test_seconds", "Test latency", ["op"])
+
+        with pytest.raises(ValueError):
+            histogram.labels("create", "extra")
+
+    def test_gauge_function(self, registry):
+        """Test gauges can be computed at scrape time"""
+        gauge = registry.gauge("test_depth", "Queue depth", ["queue"])
+        gauge.set_function(lambda: 7, "admission")
+
+        assert 'test_depth{queue="admission"} 7' in registry.render()
+
+    def test_gauge_inc_dec_across_threads(self, registry):
+        """Test concurrent inc/dec pairs leave an in-flight gauge at zero"""
+        gauge = registry.gauge("test_inflight", "In flight")
+
+        def churn():
+            for _ in range(10000):
+                gauge.inc()
+                gauge.dec()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for _ in range(8):
+                pool.submit(churn)
+
+        assert 'test_inflight 0' in registry.render()
+
+    def test_render_merges_other_workers(self, registry, tmp_path):
+        """Test a scrape sums counters, histograms and per-worker gauges from every worker"""
+        store = StateStore(str(tmp_path / "state.db"))
+        other = MetricsRegistry()
+        for target in (registry, other):
+            target.counter("test_failures", "Failures", ["reason"])
+            target.histogram("test_seconds", "Latency", buckets=(1.0,))
+            target.gauge("test_inflight", "In flight")
+            target.gauge("test_sessions", "Sessions", multiprocess_mode="latest")
+        registry._metrics["test_failures"].labels("timeout").inc(2)
+        other._metrics["test_failures"].labels("timeout").inc(3)
+        other._metrics["test_failures"].labels("denied").inc()
+        registry._metrics["test_seconds"].observe(0.5)
+        other._metrics["test_seconds"].observe(5.0)
+        registry._metrics["test_inflight"].inc()
+        other._metrics["test_inflight"].inc(2)
+        registry._metrics["test_sessions"].set(4)
+        other._metrics["test_sessions"].set(7)
+
+        registry.attach_store(store, publish_interval=3600)
+        other.attach_store(store, publish_interval=3600)
+        other.publish_once()
+        output = registry.render()
+        registry.stop()
+        other.stop()
+
+        assert 'test_failures_total{reason="timeout"} 5' in output
+        assert 'test_failures_total{reason="denied"} 1' in output
+        assert 'test_seconds_bucket{le="1"} 1' in output
+        assert 'test_seconds_bucket{le="+Inf"} 2' in output
+        assert 'test_seconds_count 2' in output
+        assert 'test_inflight 3' in output
+        assert 'test_sessions 7' in output
+
+    def test_counter_and_label_escaping(self, registry):
+        """Test counters render with _total suffix and escaped labels"""
+        counter = registry.counter("test_failures", "Failures", ["reason"])
+        counter.labels('bad "quote"').inc()
+
+        assert 'test_failures_total{reason="bad \\"quote\\""} 1' in registry.render()
+
+    def test_duplicate_registration(self, registry):
+        """Test metric names are unique"""
+        registry.gauge("test_gauge", "Gauge")
+
+        with pytest.raises(ValueError):
+            registry.gauge("test_gauge", "Gauge")
+
+    def test_akash_subcommand(self):
+        """Test akash arguments map to bounded subcommand labels"""
+        assert akash_subcommand(["tx", "deployment", "create", "sdl/sunshine.yaml"]) == "tx deployment create"
+        assert akash_subcommand(["tx", "market", "lease", "create-bid", "--dseq", "1"]) == "tx market lease create-bid"
+        assert akash_subcommand(["query", "block"]) == "query block"
+        assert akash_subcommand(["keys", "list"]) == "other"
+
+class TestLeaseManagerInstrumentation:
+
+    @pytest.fixture
+    def mock_subprocess_run(self):
+        with patch('broker.lease_manager.subprocess.run') as mock_run:
+            yield mock_run
+
+    def test_akash_calls_recorded_by_subcommand(self, mock_subprocess_run):
+        """Test akash CLI latency and failures are recorded per subcommand"""
+        lease_manager = LeaseManager()
+        histogram = metrics.AKASH_COMMAND_SECONDS.labels("tx deployment close")
+        failures = metrics.AKASH_COMMAND_FAILURES.labels("tx deployment close")
+        count_before = histogram.count
+        failures_before = failures.value
+
+        mock_subprocess_run.return_value = Mock(returncode=1, stdout="", stderr="")
+        lease_manager.close_lease("test-lease-id")
+
+        assert histogram.count == count_before + 1
+        assert failures.value == failures_before + 1
+
+    def test_create_lease_phases_recorded(self, mock_subprocess_run):
+        """Test each create_lease phase is timed"""
+        lease_manager = LeaseManager()
+        phases = [metrics.LEASE_PHASE_SECONDS.labels("create_lease", phase)
+                  for phase in metrics.CREATE_LEASE_PHASES]
+        counts_before = [phase.count for phase in phases]
+
+        mock_subprocess_run.side_effect = [
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({
+                "bids": [{"bid": {"bid_id": {"provider": "akash1test", "gseq": 1, "oseq": 1}}}]
+            }), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"forwarded_ports": {"sunshine": [
+                {"host": "provider.example.com", "port": 47984, "externalPort": 31984, "proto": "TCP"}
+            ]}}), stderr="")
+        ]
+        lease_manager.create_lease()
+
+        assert [phase.count for phase in phases] == [count + 1 for count in counts_before]
+        assert metrics.INFLIGHT_PROVISIONS.labels().value == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,219 @@
+import pytest
+import io
+import json
+import time
+from unittest.mock import patch
+from broker.reconciliation import (
+    Reconciler, lease_record, payment_record, stripe_payment_intents, main,
+    PAYMENT_MISSING, PAYMENT_NOT_SUCCEEDED, AMOUNT_MISMATCH, ORPHAN_PAYMENT,
+    LEASE_MISSING, LEASE_OVERSPENT, LEASE_LEFT_OPEN, ORPHAN_LEASE
+)
+from broker.ledger import SessionLedger
+from broker.state import StateStore
+
+WINDOW_START = 1_790_000_000
+WINDOW_END = WINDOW_START + 30 * 86400
+
+
+def intent(payment_intent_id, amount=5, status="succeeded", service="cloud-gaming"):
+    """A Stripe payment intent as the API returns it"""
+    return {"id": payment_intent_id, "object": "payment_intent", "amount": amount, "currency": "usd",
+            "status": status, "created": WINDOW_START + 60, "metadata": {"service": service}}
+
+
+def chain_lease(dseq, withdrawn="90000", balance="0", state="closed"):
+    """One entry of `akash query market lease list`"""
+    return {
+        "lease": {
+            "lease_id": {"owner": "akash1owner", "dseq": dseq, "gseq": 1, "oseq": 1, "provider": "akash1prov"},
+            "state": state,
+            "price": {"denom": "uakt", "amount": "12.5"}
+        },
+        "escrow_payment": {
+            "state": "open" if state == "active" else "closed",
+            "rate": {"denom": "uakt", "amount": "12.5"},
+            "balance": {"denom": "uakt", "amount": balance},
+            "withdrawn": {"denom": "uakt", "amount": withdrawn}
+        }
+    }
+
+
+def ledger_entry(session_id, lease_ids, payment_intent_id, charged_cents=5, charged_uakt=100000,
+                 created_at=WINDOW_START + 60, closed=True):
+    return {"session_id": session_id, "lease_ids": lease_ids, "payment_intent_id": payment_intent_id,
+            "charged_cents": charged_cents, "charged_uakt": charged_uakt, "tier": "standard", "hours": 1,
+            "created_at": created_at, "closed_at": created_at + 3600 if closed else None}
+
+
+class TestReconciler:
+
+    @pytest.fixture
+    def reconciler(self, tmp_path):
+        reconciler = Reconciler(str(tmp_path / "spill.db"))
+        yield reconciler
+        reconciler.close()
+
+    def reconcile(self, reconciler, payments, leases, ledger, held=()):
+        reconciler.load_payments(filter(None, map(payment_record, payments)))
+        reconciler.load_leases(map(lease_record, leases))
+        reconciler.load_ledger(ledger, WINDOW_START, WINDOW_END)
+        reconciler.load_held_leases(held)
+        return list(reconciler.discrepancies())
+
+    def test_matching_records_reconcile(self, reconciler):
+        """Test a charged, paid and fully spent session yields no discrepancies"""
+        found = self.reconcile(reconciler, [intent("pi_1")], [chain_lease("100")],
+                               [ledger_entry("s1", ["100"], "pi_1")])
+
+        assert found == []
+
+    def test_payment_discrepancies(self, reconciler):
+        """Test missing, unpaid, mismatched and orphaned payments are reported"""
+        found = self.reconcile(
+            reconciler,
+            [intent("pi_2", status="requires_payment_method"), intent("pi_3", amount=10),
+             intent("pi_4"), intent("pi_other", service="merch")],
+            [chain_lease("101"), chain_lease("102"), chain_lease("103")],
+            [ledger_entry("s1", ["101"], "pi_1"), ledger_entry("s2", ["102"], "pi_2"),
+             ledger_entry("s3", ["103"], "pi_3")]
+        )
+
+        assert {(d["type"], d.get("session_id"), d["payment_intent_id"]) for d in found} == {
+            (PAYMENT_MISSING, "s1", "pi_1"),
+            (PAYMENT_NOT_SUCCEEDED, "s2", "pi_2"),
+            (AMOUNT_MISMATCH, "s3", "pi_3"),
+            (ORPHAN_PAYMENT, None, "pi_4"),
+        }
+
+    def test_lease_discrepancies(self, reconciler):
+        """Test missing, overspent, forgotten and orphaned leases are reported"""
+        found = self.reconcile(
+            reconciler,
+            [intent("pi_1"), intent("pi_2"), intent("pi_3"), intent("pi_4")],
+            [chain_lease("201", withdrawn="150000"), chain_lease("202", withdrawn="1000", state="active"),
+             chain_lease("203", withdrawn="5000", state="active"), chain_lease("204", state="active"),
+             chain_lease("205", withdrawn="0", balance="4000", state="active")],
+            [ledger_entry("s1", ["200"], "pi_1"), ledger_entry("s2", ["201"], "pi_2"),
+             ledger_entry("s3", ["202"], "pi_3"), ledger_entry("s4", ["204"], "pi_4", closed=False)],
+            held=["203"]
+        )
+
+        assert {(d["type"], d["lease_id"]) for d in found} == {
+            (LEASE_MISSING, "200"),
+            (LEASE_OVERSPENT, "201"),
+            (LEASE_LEFT_OPEN, "202"),
+            (ORPHAN_LEASE, "205"),
+        }
+
+    def test_shared_and_migrated_leases(self, reconciler):
+        """Test packed sessions pool their charges and a migrated session's charge is split"""
+        found = self.reconcile(
+            reconciler,
+            [intent("pi_1"), intent("pi_2"), intent("pi_3")],
+            # Two packed sessions together cover 180000; the migrated one covers 50000 per lease
+            [chain_lease("300", withdrawn="180000"), chain_lease("301", withdrawn="50000"),
+             chain_lease("302", withdrawn="60000")],
+            [ledger_entry("s1", ["300"], "pi_1"), ledger_entry("s2", ["300"], "pi_2"),
+             ledger_entry("s3", ["301", "302"], "pi_3")]
+        )
+
+        assert [(d["type"], d["lease_id"]) for d in found] == [(LEASE_OVERSPENT, "302")]
+
+    def test_hedge_losers_belong_to_their_session(self, reconciler):
+        """Test leases that lost a hedged race aren't orphans, but are flagged if still open"""
+        entry = ledger_entry("s1", ["500"], "pi_1")
+        entry["hedge_lease_ids"] = ["501", "502", "503"]
+        found = self.reconcile(
+            reconciler, [intent("pi_1")],
+            [chain_lease("500"), chain_lease("501", withdrawn="25"), chain_lease("502", state="active")],
+            [entry]
+        )
+
+        assert [(d["type"], d["lease_id"], d.get("session_id")) for d in found] == [
+            (LEASE_LEFT_OPEN, "502", "s1")
+        ]
+
+    def test_sessions_outside_window_still_claim_leases(self, reconciler):
+        """Test last month's leases aren't orphans and last month's charges aren't rechecked"""
+        found = self.reconcile(
+            reconciler, [], [chain_lease("400")],
+            [ledger_entry("s0", ["400"], "pi_old", created_at=WINDOW_START - 86400)]
+        )
+
+        assert found == []
+
+    def test_report_is_written_incrementally(self, reconciler):
+        """Test the report is JSON lines with counts per type"""
+        self.reconcile(reconciler, [intent("pi_9")], [], [])
+        output = io.StringIO()
+
+        counts = reconciler.write_report(output)
+
+        assert counts == {ORPHAN_PAYMENT: 1}
+        assert json.loads(output.getvalue().splitlines()[0])["payment_intent_id"] == "pi_9"
+
+    def test_month_of_sessions(self, reconciler):
+        """Test a month at 2,000 sessions a day reconciles in seconds"""
+        sessions = 60_000
+        started = time.monotonic()
+        found = self.reconcile(
+            reconciler,
+            (intent(f"pi_{i}") for i in range(sessions)),
+            (chain_lease(str(i)) for i in range(sessions)),
+            (ledger_entry(f"s{i}", [str(i)], f"pi_{i}", charged_cents=10 if i % 1000 == 0 else 5)
+             for i in range(sessions))
+        )
+
+        assert len(found) == sessions // 1000
+        assert time.monotonic() - started < 30
+
+    def test_stripe_pages(self):
+        """Test payment intents are listed page by page from the last id seen"""
+        pages = [
+            {"data": [intent("pi_1"), intent("pi_x", service="merch")], "has_more": True},
+            {"data": [intent("pi_2")], "has_more": False},
+        ]
+        with patch('broker.reconciliation.stripe.PaymentIntent.list', side_effect=pages) as list_intents:
+            records = list(stripe_payment_intents(WINDOW_START, WINDOW_END, page_size=2))
+
+        assert [record["payment_intent_id"] for record in records] == ["pi_1", "pi_2"]
+        assert list_intents.call_args_list[1].kwargs["starting_after"] == "pi_x"
+        assert list_intents.call_args_list[0].kwargs["created"] == {"gte": WINDOW_START, "lt": WINDOW_END}
+
+    def test_cli_against_fixtures(self, tmp_path):
+        """Test the command reconciles recorded API responses into a report file"""
+        fixtures = tmp_path / "fixtures"
+        fixtures.mkdir()
+        (fixtures / "payments.jsonl").write_text(json.dumps(intent("pi_1", amount=7)) + "\n")
+        (fixtures / "leases.jsonl").write_text(json.dumps(chain_lease("100")) + "\n")
+        (fixtures / "ledger.jsonl").write_text(json.dumps(ledger_entry("s1", ["100"], "pi_1")) + "\n")
+        report = tmp_path / "report.jsonl"
+
+        main(["--since", "2026-09-21", "--until", "2026-10-21", "--fixtures", str(fixtures),
+              "--output", str(report)])
+
+        assert [json.loads(line)["type"] for line in report.read_text().splitlines()] == [AMOUNT_MISMATCH]
+
+
+class TestSessionLedger:
+
+    @pytest.fixture
+    def ledger(self, tmp_path):
+        return SessionLedger(StateStore(str(tmp_path / "state.db")))
+
+    def test_lifecycle(self, ledger):
+        """Test an entry records the charge, later leases and the close time"""
+        ledger.open("s1", "100", "pi_1", "0.10", "200000", "standard", 2)
+        ledger.add_lease("s1", "101")
+        ledger.add_lease("s1", "101")
+        ledger.close("s1")
+
+        entry = ledger.get("s1")
+        assert entry["charged_cents"] == 10
+        assert entry["charged_uakt"] == 200000
+        assert entry["lease_ids"] == ["100", "101"]
+        assert entry["closed_at"] is not None
+        assert list(ledger.entries()) == [entry]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,84 @@
+import pytest
+from unittest.mock import Mock, patch
+from broker.recycling import LeasePool
+from broker.state import StateStore
+
+class TestLeasePool:
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return StateStore(str(tmp_path / "state.db"))
+
+    @pytest.fixture
+    def pool(self, store):
+        return LeasePool(store, idle_ttl_seconds=600)
+
+    def test_acquire_empty_pool(self, pool):
+        """Test a pool without idle leases asks for a new lease"""
+        assert pool.acquire("standard:us-central") is None
+
+    def test_acquire_reuses_released_lease(self, pool):
+        """Test a released lease is handed to the next session exactly once"""
+        pool.release("standard:us-central", "dseq-1", "akash1p", "10.0.0.1")
+
+        lease = pool.acquire("standard:us-central")
+
+        assert lease["lease_id"] == "dseq-1"
+        assert lease["host"] == "10.0.0.1"
+        assert pool.acquire("standard:us-central") is None
+        assert pool.status()["reused_total"] == 1
+
+    def test_acquire_prefers_most_recent(self, pool):
+        """Test the newest idle lease is reused so older ones can expire"""
+        with patch('broker.recycling.time.time', return_value=1000.0):
+            pool.release("standard:us-central", "dseq-old", "akash1p", "10.0.0.1")
+        with patch('broker.recycling.time.time', return_value=1100.0):
+            pool.release("standard:us-central", "dseq-new", "akash1q", "10.0.0.2")
+            assert pool.acquire("standard:us-central")["lease_id"] == "dseq-new"
+
+    def test_pools_are_isolated(self, pool):
+        """Test leases are only reused for the same tier and region"""
+        pool.release("performance:us-central", "dseq-1", "akash1p", "10.0.0.1")
+
+        assert pool.acquire("standard:us-central") is None
+        assert pool.status()["idle_leases"] == {"performance:us-central": 1}
+
+    def test_expired_lease_not_reused(self, pool):
+        """Test leases idle past the TTL are left for the reaper"""
+        with patch('broker.recycling.time.time', return_value=1000.0):
+            pool.release("standard:us-central", "dseq-1", "akash1p", "10.0.0.1")
+        with patch('broker.recycling.time.time', return_value=1700.0):
+            assert pool.acquire("standard:us-central") is None
+
+    def test_reap_closes_idle_leases(self, pool):
+        """Test the reaper closes only leases idle past the TTL"""
+        close_lease = Mock(return_value=True)
+        with patch('broker.recycling.time.time', return_value=1000.0):
+            pool.release("standard:us-central", "dseq-old", "akash1p", "10.0.0.1")
+        with patch('broker.recycling.time.time', return_value=1500.0):
+            pool.release("standard:us-central", "dseq-new", "akash1q", "10.0.0.2")
+        with patch('broker.recycling.time.time', return_value=1700.0):
+            closed = pool.reap(close_lease)
+
+        assert closed == ["dseq-old"]
+        close_lease.assert_called_once_with("dseq-old")
+        assert pool.status()["idle_leases"] == {"standard:us-central": 1}
+
+    def test_reap_keeps_lease_that_failed_to_close(self, pool):
+        """Test a lease whose close fails stays in the pool for the next reap, but isn't reused"""
+        with patch('broker.recycling.time.time', return_value=1000.0):
+            pool.release("standard:us-central", "dseq-old", "akash1p", "10.0.0.1")
+        with patch('broker.recycling.time.time', return_value=1700.0):
+            assert pool.reap(Mock(return_value=False)) == []
+            assert pool.acquire("standard:us-central") is None
+            assert pool.reap(Mock(return_value=True)) == ["dseq-old"]
+
+    def test_shared_between_workers(self, store):
+        """Test a lease released by one worker is reused by another"""
+        LeasePool(store, 600).release("standard:us-central", "dseq-1", "akash1p", "10.0.0.1")
+
+        other = LeasePool(store, 600)
+        assert other.acquire("standard:us-central")["lease_id"] == "dseq-1"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
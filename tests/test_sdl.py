@@ -0,0 +1,142 @@
+import pytest
+import json
+import os
+from broker.sdl import SDLTemplateRegistry, SDLTemplateError
+from broker.encoder import EncoderProfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestSDLTemplateRegistry:
+
+    @pytest.fixture
+    def registry(self, tmp_path):
+        registry = SDLTemplateRegistry(
+            os.path.join(REPO_ROOT, "sdl", "templates"),
+            os.path.join(REPO_ROOT, "sdl", "tiers.json"),
+            str(tmp_path / "rendered")
+        )
+        registry.load()
+        return registry
+
+    def write_config(self, tmp_path, template, tiers):
+        template_dir = tmp_path / "templates"
+        template_dir.mkdir()
+        (template_dir / "game.yaml.tmpl").write_text(template)
+        tiers_path = tmp_path / "tiers.json"
+        tiers_path.write_text(json.dumps(tiers))
+        return SDLTemplateRegistry(str(template_dir), str(tiers_path), str(tmp_path / "rendered"))
+
+    def test_standard_tier_matches_static_sdl(self, registry):
+        """Test the standard tier renders the original sunshine.yaml profile"""
+        with open(os.path.join(REPO_ROOT, "sdl", "sunshine.yaml")) as f:
+            static = f.read()
+
+        with open(registry.render("standard")) as f:
+            assert f.read() == static
+
+    def test_ssh_key_default(self, tmp_path):
+        """Test the broker's ssh key reaches every tier, and a malformed one fails the load"""
+        key = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIGt0ZXN0"
+        registry = SDLTemplateRegistry(
+            os.path.join(REPO_ROOT, "sdl", "templates"),
+            os.path.join(REPO_ROOT, "sdl", "tiers.json"),
+            str(tmp_path / "rendered"),
+            defaults={"ssh_authorized_key": key}
+        )
+
+        with open(registry.render("lite")) as f:
+            manifest = f.read()
+        assert f'"SSH_AUTHORIZED_KEYS={key}"' in manifest
+        assert "port: 2222" in manifest
+
+        registry.defaults = {"ssh_authorized_key": f"{key}\nevil: true"}
+        with pytest.raises(SDLTemplateError, match="ssh_authorized_key"):
+            registry.load()
+
+    def test_tiers_render_their_resources(self, registry):
+        """Test each tier gets its own CPU, memory, GPU and price"""
+        with open(registry.render("performance")) as f:
+            manifest = f.read()
+
+        assert "units: 8" in manifest
+        assert "size: 32Gi" in manifest
+        assert 'model: "rtx4090"' in manifest
+        assert "amount: 9000" in manifest
+
+    def test_render_is_cached_by_parameters(self, registry):
+        """Test identical parameters reuse one rendered file"""
+        first = registry.render("lite")
+        assert registry.render("lite") == first
+        assert registry.render("lite", region="eu-west") != first
+        assert registry.render("lite", region="eu-west") == registry.render("lite", region="eu-west")
+        assert registry.status()["rendered"] == 2
+
+        with open(registry.render("lite", region="eu-west")) as f:
+            assert "region: eu-west" in f.read()
+
+    def test_encoder_profile_in_env(self, registry):
+        """Test per-session encoder settings reach the container env"""
+        profile = EncoderProfile(fps=60, bitrate_kbps=8000, resolution="1600x900", fec_percentage=25)
+
+        with open(registry.render("standard", **profile.sdl_parameters())) as f:
+            manifest = f.read()
+
+        assert '"SUNSHINE_FPS=60"' in manifest
+        assert '"SUNSHINE_BITRATE=8000"' in manifest
+        assert '"SUNSHINE_RESOLUTION=1600x900"' in manifest
+        assert '"SUNSHINE_FEC_PERCENTAGE=25"' in manifest
+
+    def test_invalid_override_rejected(self, registry):
+        """Test overrides are validated before anything is rendered"""
+        with pytest.raises(SDLTemplateError, match="region"):
+            registry.render("standard", region="us-central\n  evil: true")
+        with pytest.raises(SDLTemplateError, match="region"):
+            registry.validate_overrides(region="US Central")
+        assert registry.validate_overrides(region="eu-west", gpu_units=None) == {"region": "eu-west"}
+
+    def test_unknown_tier(self, registry):
+        """Test requesting an undefined tier"""
+        with pytest.raises(SDLTemplateError, match="Unknown session tier"):
+            registry.render("ultra")
+
+    def test_load_rejects_unknown_placeholder(self, tmp_path):
+        """Test templates referencing undefined parameters fail at load"""
+        registry = self.write_config(
+            tmp_path,
+            "version: '2.0'\nservices:\nprofiles:\n  cpu: $cpu_cores\ndeployment:\n",
+            {}
+        )
+
+        with pytest.raises(SDLTemplateError, match="cpu_cores"):
+            registry.load()
+
+    def test_load_rejects_invalid_tier_value(self, tmp_path):
+        """Test malformed tier parameters fail at load"""
+        registry = self.write_config(
+            tmp_path,
+            "version: '2.0'\nservices:\nprofiles:\n  memory: $memory_size\ndeployment:\n",
+            {"small": {
+                "template": "game", "cpu_units": 1, "memory_size": "16GB", "storage_size": "10Gi",
+                "gpu_units": 1, "gpu_model": "*", "region": "us-central", "max_price_uakt": 1000
+            }}
+        )
+
+        with pytest.raises(SDLTemplateError, match="memory_size"):
+            registry.load()
+    def test_load_rejects_hedged_packed_tier(self, tmp_path):
+        """Test a packed tier cannot also race several leases"""
+        registry = self.write_config(
+            tmp_path,
+            "version: '2.0'\nservices:\nprofiles:\n  memory: $memory_size\ndeployment:\n",
+            {"shared": {
+                "template": "game", "cpu_units": 8, "memory_size": "32Gi", "storage_size": "10Gi",
+                "gpu_units": 1, "gpu_model": "*", "region": "us-central", "max_price_uakt": 1000,
+                "slot_count": 4, "hedge_count": 2
+            }}
+        )
+
+        with pytest.raises(SDLTemplateError, match="cannot be hedged"):
+            registry.load()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,152 @@
+import pytest
+import json
+import subprocess
+from unittest.mock import Mock, patch
+from broker.lease_manager import LeaseManager
+from broker.sequence import SequenceManager, check_tx_failure, sequence_mismatch
+from broker.state import StateStore
+
+ADDRESS = "akash1broker"
+
+
+def tx_result(txhash="ABC", code=0, raw_log=""):
+    return subprocess.CompletedProcess([], 0, json.dumps({"txhash": txhash, "code": code, "raw_log": raw_log}), "")
+
+
+def mismatch(expected, got):
+    return tx_result(txhash="", code=32,
+                     raw_log=f"account sequence mismatch, expected {expected}, got {got}: incorrect account sequence")
+
+
+class TestSequenceManager:
+
+    @pytest.fixture
+    def sequences(self, tmp_path):
+        return SequenceManager(StateStore(str(tmp_path / "state.db")), confirm_timeout=60)
+
+    def test_allocates_locally_after_one_sync(self, sequences):
+        """Test the chain is asked once and later sequences are counted locally"""
+        fetch = Mock(return_value=(7, 5))
+
+        reserved = [sequences.reserve(ADDRESS, fetch) for _ in range(3)]
+
+        assert [r.sequence for r in reserved] == [5, 6, 7]
+        assert reserved[0].flags() == ["--account-number", "7", "--sequence", "5", "--broadcast-mode", "sync"]
+        fetch.assert_called_once_with(ADDRESS)
+
+    def test_mismatch_resyncs_once_per_epoch(self, sequences):
+        """Test txs in flight under a stale counter don't each reset it"""
+        fetch = Mock(return_value=(7, 5))
+        first = sequences.reserve(ADDRESS, fetch)
+        second = sequences.reserve(ADDRESS, fetch)
+
+        sequences.resync(first, 3)
+        retry = sequences.reserve(ADDRESS, fetch)
+        sequences.resync(second, 3)
+
+        assert retry.sequence == 3
+        assert sequences.reserve(ADDRESS, fetch).sequence == 4
+
+    def test_release_only_rewinds_latest(self, sequences):
+        fetch = Mock(return_value=(7, 5))
+        first = sequences.reserve(ADDRESS, fetch)
+        second = sequences.reserve(ADDRESS, fetch)
+
+        sequences.release(first)
+        assert sequences.reserve(ADDRESS, fetch).sequence == 7
+
+        third = sequences.reserve(ADDRESS, fetch)
+        sequences.release(third)
+        assert sequences.reserve(ADDRESS, fetch).sequence == 8
+
+    def test_confirm_settles_and_resyncs_dropped(self, sequences):
+        """Test included txs are reported and one that never lands marks the counter stale"""
+        fetch = Mock(return_value=(7, 5))
+        sequences.track("LANDED", sequences.reserve(ADDRESS, fetch), gas_key="deployment close")
+        sequences.track("DROPPED", sequences.reserve(ADDRESS, fetch), gas_key="deployment close")
+        sequences.confirm_timeout = 0
+        included = []
+
+        counts = sequences.confirm(lambda txhash: {"code": 0, "gas_used": "90000"} if txhash == "LANDED" else None,
+                                   lambda pending, tx: included.append(pending["gas_key"]))
+
+        assert counts == {"confirmed": 1, "failed": 0, "dropped": 1, "pending": 0}
+        assert included == ["deployment close"]
+        assert sequences.pending() == 0
+        fetch.return_value = (7, 6)
+        assert sequences.reserve(ADDRESS, fetch).sequence == 6
+        assert fetch.call_count == 2
+
+    def test_parsing(self):
+        assert sequence_mismatch(mismatch(12, 14)) == 12
+        assert sequence_mismatch(tx_result()) is None
+        assert check_tx_failure(tx_result(code=5, raw_log="insufficient funds")).returncode == 1
+        assert check_tx_failure(tx_result()).returncode == 0
+
+
+class TestLeaseManagerPipelining:
+
+    @pytest.fixture
+    def lease_manager(self, tmp_path):
+        sequences = SequenceManager(StateStore(str(tmp_path / "state.db")))
+        with patch('broker.lease_manager.settings.AKASH_FROM', ADDRESS):
+            yield LeaseManager(sequences=sequences)
+
+    def account(self, sequence):
+        return subprocess.CompletedProcess([], 0, json.dumps(
+            {"account": {"address": ADDRESS, "account_number": "7", "sequence": str(sequence)}}), "")
+
+    def test_closes_share_one_account_lookup(self, lease_manager):
+        """Test consecutive txs carry their own sequences without querying the account again"""
+        with patch('broker.lease_manager.subprocess.run',
+                   side_effect=[self.account(5), tx_result("T1"), tx_result("T2")]) as mock_run:
+            assert lease_manager.close_lease("111")
+            assert lease_manager.close_lease("222")
+
+        commands = [call[0][0] for call in mock_run.call_args_list]
+        assert "auth" in commands[0]
+        assert commands[1][commands[1].index("--sequence") + 1] == "5"
+        assert commands[2][commands[2].index("--sequence") + 1] == "6"
+        assert lease_manager.sequences.pending() == 2
+
+    def test_mismatch_retries_with_expected_sequence(self, lease_manager):
+        """Test a tx rejected for a stale sequence is re-signed with the one the chain expects"""
+        with patch('broker.lease_manager.subprocess.run',
+                   side_effect=[self.account(5), mismatch(9, 5), tx_result("T1")]) as mock_run:
+            assert lease_manager.close_lease("111")
+
+        retried = mock_run.call_args_list[2][0][0]
+        assert retried[retried.index("--sequence") + 1] == "9"
+
+    def test_rejected_tx_fails(self, lease_manager):
+        """Test a tx the mempool refuses is a failure and its sequence is reused"""
+        with patch('broker.lease_manager.subprocess.run',
+                   side_effect=[self.account(5), tx_result(code=5, raw_log="insufficient funds"),
+                                tx_result("T2")]) as mock_run:
+            assert not lease_manager.close_lease("111")
+            assert lease_manager.close_lease("222")
+
+        retried = mock_run.call_args_list[2][0][0]
+        assert retried[retried.index("--sequence") + 1] == "5"
+
+    @patch('broker.lease_manager.time.sleep')
+    def test_deposit_waits_for_its_block(self, mock_sleep, lease_manager):
+        """Test a deposit that fails in its block isn't reported as an extension and keeps its sequence"""
+        not_in_block = subprocess.CompletedProcess([], 1, "", "tx (T1) not found")
+        with patch('broker.lease_manager.subprocess.run',
+                   side_effect=[self.account(5), tx_result("T1"), not_in_block,
+                                tx_result("T1", code=5, raw_log="insufficient funds"),
+                                tx_result("T2")]) as mock_run:
+            result = lease_manager.extend_if_needed("111", "akash1prov", blocks_remaining=10)
+            assert lease_manager.close_lease("222")
+
+        assert result["extended"] is False
+        assert "insufficient funds" in result["message"]
+        assert mock_sleep.call_count == 1
+        close = mock_run.call_args_list[4][0][0]
+        assert close[close.index("--sequence") + 1] == "6"
+        # Only the close is left for confirm_transactions
+        assert lease_manager.sequences.pending() == 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,118 @@
+import pytest
+import json
+from unittest.mock import Mock, patch
+from broker.lease_manager import LeaseManager
+from broker.signers import SignerPool, plan_transfers
+from broker.state import StateStore
+
+KEYS = ["akash1keya", "akash1keyb", "akash1keyc"]
+
+
+def signer_of(cmd):
+    return cmd[cmd.index("--from") + 1]
+
+
+class TestPlanTransfers:
+
+    def test_tops_up_from_richest(self):
+        """Test a key below the minimum is lifted to the average from the best-funded key"""
+        balances = {"a": 20_000_000, "b": 1_000_000, "c": 9_000_000}
+
+        assert plan_transfers(balances, minimum=5_000_000) == [("a", "b", 9_000_000)]
+
+    def test_short_pool_evens_out(self):
+        """Test donors aren't drained below the average when the pool is short overall"""
+        balances = {"a": 6_000_000, "b": 2_000_000}
+
+        assert plan_transfers(balances, minimum=5_000_000) == [("a", "b", 2_000_000)]
+        assert plan_transfers({"a": 9_000_000, "b": 8_000_000}, minimum=5_000_000) == []
+
+
+class TestSignerPool:
+
+    @pytest.fixture
+    def pool(self, tmp_path):
+        return SignerPool(KEYS, StateStore(str(tmp_path / "state.db")), default_key="akash1legacy")
+
+    def test_spreads_by_load(self, pool):
+        """Test deployments go to the least loaded key and a released key is reused first"""
+        owners = [pool.assign(str(dseq)) for dseq in range(6)]
+
+        assert sorted(owners) == sorted(KEYS * 2)
+        pool.release("3")
+        assert pool.assign("6") == owners[3]
+        assert pool.owner("6") == owners[3]
+
+    def test_unassigned_deployments_use_default_key(self, pool):
+        assert pool.owner("created-before-the-pool") == "akash1legacy"
+        pool.release("created-before-the-pool")
+        assert pool.load() == {key: 0 for key in KEYS}
+
+
+class TestLeaseManagerSigners:
+
+    @pytest.fixture
+    def lease_manager(self, tmp_path):
+        pool = SignerPool(KEYS, StateStore(str(tmp_path / "state.db")), default_key="akash1legacy")
+        return LeaseManager(signers=pool)
+
+    def test_deployment_txs_signed_by_owner(self, lease_manager):
+        """Test a deployment's lease and close come from the key that created it"""
+        bids = {"bids": [{"bid": {"bid_id": {"provider": "akash1prov", "gseq": 1, "oseq": 1}}}]}
+        with patch('broker.lease_manager.subprocess.run', side_effect=[
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps(bids), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+            Mock(returncode=0, stdout=json.dumps({"forwarded_ports": {"sunshine": [
+                {"host": "provider.example.com", "port": 47984, "externalPort": 31984, "proto": "TCP"}
+            ]}}), stderr=""),
+            Mock(returncode=0, stdout="", stderr=""),
+        ]) as mock_run:
+            lease = lease_manager.create_lease()
+            assert lease_manager.close_lease(lease.lease_id)
+
+        deploy, bid_list, lease_create, send_manifest, lease_status, close = (
+            call[0][0] for call in mock_run.call_args_list
+        )
+        owner = signer_of(deploy)
+        assert owner in KEYS
+        assert bid_list[bid_list.index("--owner") + 1] == owner
+        assert signer_of(lease_create) == owner
+        assert signer_of(send_manifest) == owner
+        assert signer_of(lease_status) == owner
+        assert signer_of(close) == owner
+        assert lease_manager.signers.load()[owner] == 0
+
+    def test_rebalance_sends_from_richest_key(self, lease_manager):
+        """Test a key running low is funded by a bank send signed by the best-funded key"""
+        def balance(amount):
+            return Mock(returncode=0, stdout=json.dumps({"balances": [{"denom": "uakt", "amount": str(amount)}]}),
+                        stderr="")
+
+        with patch('broker.lease_manager.subprocess.run', side_effect=[
+            balance(40_000_000), balance(1_000_000), balance(16_000_000),
+            Mock(returncode=0, stdout="", stderr=""),
+        ]) as mock_run:
+            transfers = lease_manager.rebalance_signers(minimum_uakt=5_000_000)
+
+        assert transfers == [{"from": "akash1keya", "to": "akash1keyb", "amount_uakt": 18_000_000,
+                              "status": "sent"}]
+        send = mock_run.call_args_list[3][0][0]
+        assert signer_of(send) == "akash1keya"
+        assert send[send.index("send") + 1:send.index("send") + 4] == ["akash1keya", "akash1keyb", "18000000uakt"]
+
+    def test_owner_addresses_resolve_key_names(self, tmp_path):
+        """Test named keys are looked up once and reported as the addresses chain events carry"""
+        pool = SignerPool(["gamer-a", "akash1keyb"], StateStore(str(tmp_path / "named.db")), default_key="gamer-a")
+        lease_manager = LeaseManager(signers=pool)
+        with patch('broker.lease_manager.subprocess.run',
+                   return_value=Mock(returncode=0, stdout="akash1keya\n", stderr="")) as mock_run:
+            assert lease_manager.owner_addresses() == ["akash1keya", "akash1keyb"]
+            assert lease_manager.owner_addresses() == ["akash1keya", "akash1keyb"]
+
+        assert mock_run.call_count == 1
+        assert mock_run.call_args[0][0][:4] == ["akash", "keys", "show", "gamer-a"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,227 @@
+import pytest
+import json
+import time
+from broker.endpoints import SSH_PORT
+from broker.lease_manager import LeaseManager
+from broker.sequence import SequenceManager
+from broker.settings import settings
+from broker.state import StateStore
+from broker.simulator import (
+    MarketConfig, Policy, Simulation, SimulatedChainEvents, SimulatedMarket, parse_command, main,
+    ESCROW_DEPLETED, PROVIDER_FAILURE
+)
+
+
+class TestSimulatedMarket:
+
+    @pytest.fixture
+    def market(self):
+        # Prompt bidders; failures are opted into per test
+        config = MarketConfig(providers=5, bid_probability=1.0, bid_latency_seconds=0.01,
+                              provider_mtbf_hours=1e9)
+        return SimulatedMarket(config, capacity_per_provider=2, seed=7)
+
+    @pytest.fixture
+    def lease_manager(self, market):
+        return LeaseManager(runner=market.run, sleep=market.sleep)
+
+    def lease(self, market, lease_manager):
+        lease_info = lease_manager.create_lease()
+        return market.lease(lease_info.lease_id)
+
+    def test_parse_command(self):
+        """Test subcommand words are separated from flag values"""
+        positional, options = parse_command(["--node", "https://rpc", "tx", "deployment", "create",
+                                             "sdl/sunshine.yaml", "--dseq", "42", "--yes"])
+
+        assert positional == ["tx", "deployment", "create", "sdl/sunshine.yaml"]
+        assert options == {"--node": "https://rpc", "--dseq": "42", "--yes": ""}
+
+    def test_provisions_through_lease_manager(self, market, lease_manager):
+        """Test create_lease runs against the simulated chain and costs blocks of time"""
+        lease = self.lease(market, lease_manager)
+
+        assert lease.active
+        assert lease.provider.active == 1
+        # Bids land in the block after the order, so the list is queried again then
+        assert market.commands == {"tx deployment create": 1, "query market bid list": 2,
+                                   "tx market lease create": 1, "provider send-manifest": 1,
+                                   "provider lease-status": 1}
+        assert market.gas_simulations == 2
+        assert market.now >= 3 * market.config.block_seconds
+
+    def test_lease_endpoint_discovered(self, market, lease_manager):
+        """Test a new lease is reached on its provider's host and forwarded ports"""
+        lease_info = lease_manager.create_lease()
+        lease = market.lease(lease_info.lease_id)
+
+        assert lease_info.ip_address == lease.ip_address
+        assert lease_info.port == lease_info.ports[f"{settings.SUNSHINE_PORT}/tcp"]
+        assert lease_info.port != settings.SUNSHINE_PORT
+        assert f"{settings.SUNSHINE_UDP_PORT}/udp" in lease_info.ports
+
+    def test_ssh_on_forwarded_port(self, market, lease_manager):
+        """Test the container's sshd is only reached through the port its provider forwards"""
+        lease_info = lease_manager.create_lease()
+
+        assert lease_info.ssh_port != SSH_PORT
+        assert lease_manager.reset_session(lease_info.ip_address, ssh_port=lease_info.ssh_port)
+        assert not lease_manager.reset_session(lease_info.ip_address)
+
+    def test_lease_status_needs_manifest(self, market, lease_manager):
+        """Test a provider reports no ports for a lease whose manifest it never got"""
+        market.run(["akash", "tx", "deployment", "create", "sdl/sunshine.yaml", "--dseq", "42"])
+        market.sleep(1)
+        provider = market.deployments["42"].bids[0][1].address
+        lease = ["--dseq", "42", "--gseq", "1", "--oseq", "1", "--provider", provider]
+        market.run(["akash", "tx", "market", "lease", "create", *lease])
+
+        status = market.run(["akash", "provider", "lease-status", *lease])
+        assert status.returncode == 1
+        assert "manifest not found" in status.stderr
+
+        assert market.run(["akash", "provider", "send-manifest", "sdl/sunshine.yaml", *lease]).returncode == 0
+        assert market.run(["akash", "provider", "lease-status", *lease]).returncode == 0
+
+    def test_pipelined_txs_confirm(self, market, tmp_path):
+        """Test provisioning txs wait for their block while a close is found in one later"""
+        sequences = SequenceManager(StateStore(str(tmp_path / "state.db")))
+        lease_manager = LeaseManager(runner=market.run, sleep=market.sleep, sequences=sequences)
+
+        lease = self.lease(market, lease_manager)
+
+        assert lease.active
+        assert market.account_sequence == 2
+        assert market.commands["query tx"] >= 2
+        assert sequences.pending() == 0
+
+        closed_at = market.now
+        assert lease_manager.close_lease(lease.dseq)
+        assert market.now - closed_at < market.config.block_seconds
+        assert sequences.pending() == 1
+        market.sleep(market.config.block_seconds)
+        assert lease_manager.confirm_transactions()["confirmed"] == 1
+        assert sequences.pending() == 0
+
+    def test_extension_tops_up_escrow(self, market, lease_manager):
+        """Test the sweep's extension deposit buys more blocks"""
+        lease = self.lease(market, lease_manager)
+        remaining = lease_manager.get_lease_blocks_remaining(lease.dseq)
+
+        result = lease_manager.extend_if_needed(lease.dseq, lease.provider.address,
+                                                threshold_blocks=remaining + 10, deposit_uakt=10_000)
+
+        assert result["extended"] is True
+        assert lease_manager.get_lease_blocks_remaining(lease.dseq) > remaining
+
+    def test_blocks_remaining_in_one_list(self, market, lease_manager):
+        """Test a sweep reads every lease's escrow from one list query, agreeing with the per-lease query"""
+        leases = [self.lease(market, lease_manager) for _ in range(3)]
+        lease_manager.close_lease(leases[0].dseq)
+        market.commands.clear()
+
+        remaining = lease_manager.blocks_remaining_by_lease()
+
+        assert market.commands == {"query market lease list": 1}
+        assert set(remaining) == {leases[1].dseq, leases[2].dseq}
+        assert abs(remaining[leases[1].dseq] - lease_manager.get_lease_blocks_remaining(leases[1].dseq)) <= 1
+
+    def test_escrow_runs_dry(self, market, lease_manager):
+        """Test the chain closes a lease when its escrow is spent"""
+        lost = []
+        market.closed_listeners.append(lost.append)
+        lease = self.lease(market, lease_manager)
+
+        market.run_until(market.time_at_height(lease.end_height) + 1)
+
+        assert lost == [lease]
+        assert lease.closed_reason == ESCROW_DEPLETED
+        assert lease_manager.get_lease_blocks_remaining(lease.dseq) is None
+        assert market.accrued_uakt() == pytest.approx(lease.funded_blocks * lease.price)
+
+    def test_migrates_off_degraded_provider(self, market, lease_manager):
+        """Test migrate_session moves a session to a new lease before the provider fails"""
+        market.config.provider_mtbf_hours = 1
+        degraded = []
+        market.degraded_listeners.append(degraded.append)
+        lease = self.lease(market, lease_manager)
+        market.run_until(lease.fails_at - 1)
+        assert degraded == [lease]
+
+        result = lease_manager.migrate_session(lease.dseq, lease.provider.address, "sim-bucket")
+
+        assert result["status"] == "success"
+        assert lease.closed_reason == "closed"
+        assert market.lease(result["new_lease_id"]).active
+
+    def test_chain_events_skip_bid_queries(self, market):
+        """Test bids delivered by the event stream need no market query"""
+        lease_manager = LeaseManager(chain_events=SimulatedChainEvents(market), runner=market.run,
+                                     sleep=market.sleep)
+
+        lease_manager.create_lease()
+
+        assert "query market bid list" not in market.commands
+
+
+class TestSimulation:
+
+    def test_policies_trade_cost_for_interruptions(self):
+        """Test a top-up that outlasts the sweep interval stops escrow interruptions"""
+        config = MarketConfig(providers=10, provider_mtbf_hours=1e9, deployment_deposit_uakt=50_000)
+        shallow = Simulation(Policy("shallow", sweep_interval_seconds=600),
+                             sessions=40, hours=8, config=config).run()
+        deep = Simulation(Policy("deep", sweep_interval_seconds=600, threshold_blocks=600, deposit_uakt=100_000),
+                          sessions=40, hours=8, config=config).run()
+
+        assert shallow["interruptions"][ESCROW_DEPLETED] > 0
+        assert deep["interruptions"][ESCROW_DEPLETED] == 0
+        assert deep["interruptions"][PROVIDER_FAILURE] == 0
+        assert deep["chain_queries_by_subcommand"]["query market lease list"] > 0
+        assert "query market lease get" not in deep["chain_queries_by_subcommand"]
+        assert deep["extensions"] > shallow["extensions"] / 10
+
+    def test_migration_avoids_failures(self):
+        """Test migrating on degradation turns provider failures into migrations"""
+        config = MarketConfig(providers=10, provider_mtbf_hours=4)
+        report = Simulation(Policy("migrate", chain_events=True, migrate_on_degradation=True),
+                            sessions=20, hours=6, config=config).run()
+
+        assert report["migrations"]["succeeded"] > 0
+        assert report["interruptions"][PROVIDER_FAILURE] < report["migrations"]["succeeded"]
+
+    def test_default_market_provisions(self):
+        """Test bids landing blocks after the order are waited for and bidless orders are closed"""
+        report = Simulation(Policy("default"), sessions=50, hours=2).run()
+
+        assert report["provision_failures"] < report["sessions_completed"] / 20
+        assert report["orphaned_deployments"] == 0
+        assert report["chain_queries_by_subcommand"]["query market bid list"] > \
+            report["transactions_by_subcommand"]["tx deployment create"]
+
+    def test_is_deterministic(self):
+        """Test the same seed reproduces the same report"""
+        reports = [Simulation(Policy("default"), sessions=20, hours=2, seed=3).run() for _ in range(2)]
+        for report in reports:
+            report.pop("wall_seconds")
+
+        assert reports[0] == reports[1]
+
+    def test_simulated_day_runs_in_seconds(self):
+        """Test a day at 500 concurrent sessions simulates quickly"""
+        started = time.monotonic()
+
+        report = Simulation(Policy("chain-events", chain_events=True), sessions=500, hours=24).run()
+
+        assert report["sessions_completed"] > 500
+        assert time.monotonic() - started < 60
+
+    def test_cli_reports_each_policy(self, capsys):
+        """Test the command prints one JSON report per policy"""
+        main(["--sessions", "10", "--hours", "1", "--policy", "default", "--policy", "chain-events"])
+
+        reports = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [report["policy"] for report in reports] == ["default", "chain-events"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
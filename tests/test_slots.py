@@ -0,0 +1,120 @@
+import pytest
+from unittest.mock import Mock, patch
+from broker.slots import SlotAllocator, SLOT_PORT_STRIDE
+from broker.state import StateStore
+from broker.settings import settings
+
+class TestSlotAllocator:
+
+    @pytest.fixture
+    def allocator(self, tmp_path):
+        return SlotAllocator(StateStore(str(tmp_path / "state.db")))
+
+    def test_claim_without_leases(self, allocator):
+        """Test an empty pool asks for a new lease"""
+        assert allocator.claim("indie:us-central", "session-1") is None
+
+    def test_add_lease_takes_first_slot(self, allocator):
+        """Test a new packed lease starts with its first slot occupied"""
+        assignment = allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 4, "session-1")
+
+        assert assignment.slot_index == 0
+        assert assignment.new_lease
+        assert assignment.port == settings.SUNSHINE_PORT
+        assert allocator.status() == {"indie:us-central": {"leases": 1, "slots": 4, "occupied": 1}}
+
+    def test_claim_fills_lease_before_new_one(self, allocator):
+        """Test sessions pack onto free slots until the lease is full"""
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 3, "session-0")
+
+        first = allocator.claim("indie:us-central", "session-1")
+        second = allocator.claim("indie:us-central", "session-2")
+
+        assert (first.lease_id, first.slot_index) == ("dseq-1", 1)
+        assert (second.lease_id, second.slot_index) == ("dseq-1", 2)
+        assert second.port == settings.SUNSHINE_PORT + 2 * SLOT_PORT_STRIDE
+        assert second.web_port == 47990 + 2 * SLOT_PORT_STRIDE
+        assert not second.new_lease
+        assert allocator.claim("indie:us-central", "session-3") is None
+
+    def test_claim_prefers_fullest_lease(self, allocator):
+        """Test bin-packing onto the busiest lease so idle ones can drain"""
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 4, "session-0")
+        allocator.add_lease("indie:us-central", "dseq-2", "akash1q", "10.0.0.2", 4, "session-1")
+        allocator.release("dseq-1", 0)
+        allocator.claim("indie:us-central", "session-2")
+
+        assert allocator.claim("indie:us-central", "session-3").lease_id == "dseq-2"
+        assert allocator.claim("indie:us-central", "session-4").lease_id == "dseq-2"
+
+    def test_pools_are_isolated(self, allocator):
+        """Test tiers and regions never share leases"""
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 4, "session-0")
+
+        assert allocator.claim("indie:eu-west", "session-1") is None
+
+    def test_release_reuses_slot(self, allocator):
+        """Test a released slot is handed to the next session"""
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 2, "session-0")
+        allocator.claim("indie:us-central", "session-1")
+
+        assert allocator.release("dseq-1", 0) == 1
+        assert allocator.claim("indie:us-central", "session-2").slot_index == 0
+        assert allocator.release("dseq-1", 0) == 1
+        assert allocator.release("dseq-1", 1) == 0
+
+    def test_retired_slot_not_reused(self, allocator):
+        """Test a slot that couldn't be wiped is never given to another session"""
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 2, "session-0")
+        allocator.claim("indie:us-central", "session-1")
+
+        assert allocator.release("dseq-1", 0, retire=True) == 1
+        assert allocator.claim("indie:us-central", "session-2") is None
+        assert allocator.release("dseq-1", 1) == 0
+        assert allocator.status()["indie:us-central"]["occupied"] == 0
+
+    def test_release_unknown_lease(self, allocator):
+        """Test releasing a slot on a lease that is already gone"""
+        assert allocator.release("dseq-missing", 0) is None
+
+    def test_reap_idle_packed_lease(self, allocator):
+        """Test empty packed leases are closed only after the idle TTL"""
+        close_lease = Mock(return_value=True)
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 2, "session-0")
+        allocator.add_lease("indie:us-central", "dseq-2", "akash1q", "10.0.0.2", 2, "session-1")
+        with patch('broker.slots.time.time', return_value=1000.0):
+            allocator.release("dseq-1", 0)
+
+        with patch('broker.slots.time.time', return_value=1300.0):
+            assert allocator.reap(600, close_lease) == []
+        with patch('broker.slots.time.time', return_value=1700.0):
+            assert allocator.reap(600, close_lease) == ["dseq-1"]
+
+        close_lease.assert_called_once_with("dseq-1")
+        assert allocator.status()["indie:us-central"]["leases"] == 1
+
+    def test_reap_keeps_lease_that_failed_to_close(self, allocator):
+        """Test a packed lease whose close fails is retried on the next reap"""
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 2, "session-0")
+        with patch('broker.slots.time.time', return_value=1000.0):
+            allocator.release("dseq-1", 0)
+
+        with patch('broker.slots.time.time', return_value=1700.0):
+            assert allocator.reap(600, Mock(return_value=False)) == []
+            assert allocator.status()["indie:us-central"]["leases"] == 1
+            assert allocator.reap(600, Mock(return_value=True)) == ["dseq-1"]
+        assert allocator.status() == {}
+
+    def test_claim_makes_lease_busy_again(self, allocator):
+        """Test a reused empty lease is no longer reaped"""
+        close_lease = Mock(return_value=True)
+        allocator.add_lease("indie:us-central", "dseq-1", "akash1p", "10.0.0.1", 2, "session-0")
+        with patch('broker.slots.time.time', return_value=1000.0):
+            allocator.release("dseq-1", 0)
+        allocator.claim("indie:us-central", "session-1")
+
+        with patch('broker.slots.time.time', return_value=1700.0):
+            assert allocator.reap(600, close_lease) == []
+
+if __name__ == "__main__":
+    pytest.main([__file__])
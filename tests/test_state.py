@@ -0,0 +1,156 @@
+import pytest
+import multiprocessing
+import time
+from broker.state import StateStore
+from broker.scheduler import Scheduler
+
+def _increment(path, times):
+    store = StateStore(path)
+    for _ in range(times):
+        store.update("counters", "provisions", lambda value: (value or 0) + 1)
+
+class TestStateStore:
+    
+    @pytest.fixture
+    def store(self, tmp_path):
+        return StateStore(str(tmp_path / "state.db"))
+    
+    def test_put_get_delete(self, store):
+        """Test basic document storage per namespace"""
+        store.put("sessions", "dseq-1", {"provider": "akash1test"})
+        
+        assert store.get("sessions", "dseq-1") == {"provider": "akash1test"}
+        assert store.get("pools", "dseq-1") is None
+        assert store.delete("sessions", "dseq-1") is True
+        assert store.delete("sessions", "dseq-1") is False
+        assert store.get("sessions", "dseq-1") is None
+    
+    def test_ttl_expiry(self, store):
+        """Test expired entries are invisible"""
+        store.put("idempotency", "key", {"a": 1}, ttl=-1)
+        
+        assert store.get("idempotency", "key") is None
+        assert store.count("idempotency") == 0
+        assert store.purge_expired() == 1
+    
+    def test_put_if_absent(self, store):
+        """Test only the first writer wins"""
+        assert store.put_if_absent("slots", "lease-1:0", {"session": "a"}) is True
+        assert store.put_if_absent("slots", "lease-1:0", {"session": "b"}) is False
+        assert store.get("slots", "lease-1:0") == {"session": "a"}
+    
+    def test_update_none_deletes(self, store):
+        """Test update can delete an entry"""
+        store.put("sessions", "dseq-1", {"provider": "akash1test"})
+        
+        store.update("sessions", "dseq-1", lambda value: None)
+        
+        assert store.get("sessions", "dseq-1") is None
+    
+    def test_items_paginates_in_key_order(self, store):
+        """Test iteration crosses page boundaries without skipping entries"""
+        for i in range(7):
+            store.put("sessions", f"dseq-{i}", {"i": i})
+        
+        items = list(store.items("sessions", page_size=3))
+        
+        assert [key for key, _ in items] == [f"dseq-{i}" for i in range(7)]
+        assert store.count("sessions") == 7
+    
+    def test_update_is_atomic_across_processes(self, tmp_path):
+        """Test concurrent workers never lose an update"""
+        path = str(tmp_path / "state.db")
+        StateStore(path)
+        # Like uvicorn's workers, spawned rather than forked with the test's connections
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=_increment, args=(path, 50)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=30)
+        
+        assert StateStore(path).get("counters", "provisions") == 150
+    
+    def test_leadership_is_exclusive(self, store):
+        """Test only one holder owns a leadership lease until it expires"""
+        assert store.try_acquire_leadership("scheduler", "worker-a", ttl=60) is True
+        assert store.try_acquire_leadership("scheduler", "worker-b", ttl=60) is False
+        assert store.try_acquire_leadership("scheduler", "worker-a", ttl=60) is True
+        assert store.leader("scheduler")["holder"] == "worker-a"
+        
+        store.release_leadership("scheduler", "worker-a")
+        assert store.try_acquire_leadership("scheduler", "worker-b", ttl=60) is True
+    
+    def test_leadership_expires(self, store):
+        """Test a crashed leader is replaced after its TTL"""
+        store.try_acquire_leadership("scheduler", "worker-a", ttl=0.01)
+        time.sleep(0.02)
+        
+        assert store.try_acquire_leadership("scheduler", "worker-b", ttl=60) is True
+
+class TestScheduler:
+    
+    @pytest.fixture
+    def store(self, tmp_path):
+        return StateStore(str(tmp_path / "state.db"))
+    
+    def test_only_leader_runs_jobs(self, store):
+        """Test singleton jobs run on exactly one worker"""
+        calls = []
+        leader = Scheduler(store, holder_id="worker-a", tick_seconds=1, leadership_ttl=60)
+        follower = Scheduler(store, holder_id="worker-b", tick_seconds=1, leadership_ttl=60)
+        leader.register("extension_sweep", 60, lambda: calls.append("a"))
+        follower.register("extension_sweep", 60, lambda: calls.append("b"))
+        
+        assert leader.tick() == ["extension_sweep"]
+        assert follower.tick() == []
+        assert leader.is_leader is True
+        assert follower.is_leader is False
+        assert calls == ["a"]
+    
+    def test_cadence_survives_failover(self, store):
+        """Test a new leader does not re-run a job that just ran"""
+        calls = []
+        first = Scheduler(store, holder_id="worker-a", tick_seconds=1, leadership_ttl=60)
+        second = Scheduler(store, holder_id="worker-b", tick_seconds=1, leadership_ttl=60)
+        for scheduler in (first, second):
+            scheduler.register("extension_sweep", 60, lambda: calls.append(1))
+        
+        first.tick()
+        first.stop()
+        
+        assert second.tick() == []
+        assert second.is_leader is True
+        assert len(calls) == 1
+    
+    def test_long_job_is_not_rerun_after_takeover(self, store):
+        """Test a worker taking over mid-job sees the claim and the old leader stops at its next job"""
+        calls = []
+        first = Scheduler(store, holder_id="worker-a", tick_seconds=1, leadership_ttl=60)
+        second = Scheduler(store, holder_id="worker-b", tick_seconds=1, leadership_ttl=60)
+
+        def slow_deposit():
+            calls.append("deposit")
+            # Leadership lapses while the job is still running
+            store.release_leadership(Scheduler.LEADERSHIP, "worker-a")
+            assert second.tick() == []
+
+        first.register("deposit_sweep", 60, slow_deposit)
+        first.register("extension_sweep", 60, lambda: calls.append("a"))
+        for name in ("deposit_sweep", "extension_sweep"):
+            second.register(name, 60, lambda name=name: calls.append(f"b:{name}"))
+
+        assert first.tick() == ["deposit_sweep"]
+        assert first.is_leader is False
+        assert calls == ["deposit", "b:extension_sweep"]
+
+    def test_job_errors_are_recorded(self, store):
+        """Test a failing job does not stop the scheduler"""
+        scheduler = Scheduler(store, holder_id="worker-a", tick_seconds=1, leadership_ttl=60)
+        scheduler.register("extension_sweep", 0, lambda: 1 / 0)
+        
+        assert scheduler.tick() == ["extension_sweep"]
+        assert "division by zero" in store.get("scheduler", "extension_sweep")["last_error"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
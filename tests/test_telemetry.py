@@ -0,0 +1,74 @@
+import pytest
+from broker.telemetry import RingBuffer, TelemetryAggregator, RTT_MS, DROPPED_FRAMES, ENCODE_LATENCY_MS
+
+
+class TestRingBuffer:
+
+    def test_keeps_last_values(self):
+        """Test the oldest values are overwritten once the buffer is full"""
+        buffer = RingBuffer(4)
+        buffer.extend([100.0, 1.0, 2.0, 3.0, 4.0])
+
+        assert buffer.count == 4
+        assert buffer.summary() == {"p50": 3.0, "p95": 4.0, "p99": 4.0, "mean": 2.5, "max": 4.0}
+
+    def test_partial_buffer(self):
+        buffer = RingBuffer(100)
+        assert buffer.summary() is None
+
+        buffer.extend(float(value) for value in range(1, 11))
+
+        summary = buffer.summary()
+        assert summary["p50"] == 6.0
+        assert summary["max"] == 10.0
+
+
+class TestTelemetryAggregator:
+
+    @pytest.fixture
+    def aggregator(self):
+        return TelemetryAggregator(session_capacity=8, provider_capacity=32, max_sessions=2)
+
+    def test_session_and_provider_summaries(self, aggregator):
+        """Test samples roll up per session and across a provider's sessions"""
+        assert aggregator.ingest("s1", "akash1provA", {RTT_MS: [20.0, 22.0], DROPPED_FRAMES: [0.0, 3.0]}) == 4
+        aggregator.ingest("s2", "akash1provA", {RTT_MS: [80.0]})
+
+        session = aggregator.session_summary("s1")
+        assert session["provider"] == "akash1provA"
+        assert session["samples"] == 4
+        assert session["signals"][DROPPED_FRAMES]["max"] == 3.0
+        assert session["signals"][ENCODE_LATENCY_MS] is None
+
+        provider = aggregator.provider_summaries()["akash1provA"]
+        assert provider["sessions"] == 2
+        assert provider["signals"][RTT_MS]["max"] == 80.0
+
+    def test_unknown_signal_rejected(self, aggregator):
+        with pytest.raises(ValueError, match="fps"):
+            aggregator.ingest("s1", "akash1provA", {"fps": [120.0], RTT_MS: [20.0]})
+
+        assert aggregator.session_summary("s1") is None
+
+    def test_non_finite_values_rejected(self, aggregator):
+        with pytest.raises(ValueError, match=RTT_MS):
+            aggregator.ingest("s1", "akash1provA", {DROPPED_FRAMES: [0.0], RTT_MS: [20.0, float("nan")]})
+        with pytest.raises(ValueError, match=DROPPED_FRAMES):
+            aggregator.ingest("s1", "akash1provA", {DROPPED_FRAMES: [float("inf")]})
+
+        assert aggregator.session_summary("s1") is None
+
+    def test_evicts_least_recently_reporting(self, aggregator):
+        """Test the session that reported longest ago is dropped past max_sessions"""
+        aggregator.ingest("s1", "akash1provA", {RTT_MS: [20.0]})
+        aggregator.ingest("s2", "akash1provA", {RTT_MS: [20.0]})
+        aggregator.ingest("s1", "akash1provA", {RTT_MS: [21.0]})
+        aggregator.ingest("s3", "akash1provB", {RTT_MS: [20.0]})
+
+        assert aggregator.session_summary("s2") is None
+        assert aggregator.session_summary("s1")["samples"] == 2
+        aggregator.forget("s1")
+        assert aggregator.session_summary("s1") is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
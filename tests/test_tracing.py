@@ -0,0 +1,190 @@
+import pytest
+from unittest.mock import Mock, patch
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from broker import tracing
+from broker.tracing import (
+    Tracer, BatchSpanProcessor, SpanExporter, FileSpanExporter, OTLPHttpExporter
+)
+from broker.lease_manager import LeaseManager
+
+class InMemoryExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    """Stand-in for an OTLP/HTTP collector"""
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        CollectorHandler.received.append((self.path, json.loads(body)))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class TestTracing:
+
+    @pytest.fixture
+    def exporter(self):
+        exporter = InMemoryExporter()
+        processor = BatchSpanProcessor(exporter)
+        processor._thread = object()  # export synchronously via force_flush
+        with patch.object(tracing, 'tracer', Tracer(processor)):
+            yield exporter
+            processor.force_flush()
+
+    def flush(self):
+        tracing.tracer.processor.force_flush()
+
+    def test_nested_spans_share_trace(self, exporter):
+        """Test child spans inherit trace id and session identity"""
+        with tracing.span("create_session", session_id="dseq-1", provider="akash1p") as root:
+            with tracing.span("create_lease.bids") as child:
+                pass
+        self.flush()
+
+        assert child.trace_id == root.trace_id
+        assert child.parent_span_id == root.span_id
+        assert child.attributes["session_id"] == "dseq-1"
+        assert child.attributes["provider"] == "akash1p"
+        assert {span.name for span in exporter.spans} == {"create_session", "create_lease.bids"}
+
+    def test_span_records_exception(self, exporter):
+        """Test exceptions mark the span as failed"""
+        with pytest.raises(ValueError):
+            with tracing.span("close_lease"):
+                raise ValueError("boom")
+        self.flush()
+
+        span = exporter.spans[0]
+        assert span.status == tracing.STATUS_ERROR
+        assert span.status_message == "boom"
+
+    def test_disabled_records_nothing(self, exporter):
+        """Test spans opened while tracing is disabled are neither exported nor made current"""
+        with tracing.disabled():
+            with tracing.span("create_lease.bids", dseq="42") as span:
+                span.set_error("no bids")
+                assert tracing.current_span() is None
+        with tracing.span("close_lease"):
+            pass
+        self.flush()
+
+        assert [span.name for span in exporter.spans] == ["close_lease"]
+
+    def test_traced_records_result_status(self, exporter):
+        """Test dict results with error status mark the span failed"""
+        @tracing.traced("extend_if_needed")
+        def extend():
+            return {"status": "error", "message": "Could not query lease status"}
+
+        extend()
+        self.flush()
+
+        span = exporter.spans[0]
+        assert span.attributes["result.status"] == "error"
+        assert span.status == tracing.STATUS_ERROR
+
+    def test_wrap_propagates_into_threads(self, exporter):
+        """Test background work stays in the originating trace"""
+        with tracing.span("create_session") as root:
+            background = tracing.wrap(lambda: tracing.current_span())
+        result = []
+        thread = threading.Thread(target=lambda: result.append(background()))
+        thread.start()
+        thread.join()
+
+        assert result[0] is root
+
+    def test_processor_drops_when_full(self):
+        """Test a full export queue drops spans instead of blocking"""
+        processor = BatchSpanProcessor(InMemoryExporter(), max_queue_size=1)
+        processor._thread = object()  # keep the export thread from draining
+
+        processor.on_end(Mock())
+        processor.on_end(Mock())
+
+        assert processor.dropped == 1
+
+    def test_shutdown_exports_queued_spans(self):
+        """Test shutdown stops the export thread and exports what it hadn't picked up"""
+        exporter = InMemoryExporter()
+        processor = BatchSpanProcessor(exporter, flush_interval=0.05)
+        spans = [Mock() for _ in range(3)]
+        for span in spans:
+            processor.on_end(span)
+
+        processor.shutdown(timeout=1)
+        processor.on_end(Mock())
+
+        assert exporter.spans == spans
+        assert not processor._thread.is_alive()
+
+    def test_file_exporter(self, tmp_path):
+        """Test spans are written as JSON lines"""
+        path = tmp_path / "traces.jsonl"
+        span = tracing.Span("close_lease", attributes={"dseq": "123"})
+        span.end()
+
+        FileSpanExporter(str(path)).export([span])
+
+        record = json.loads(path.read_text().splitlines()[0])
+        assert record["name"] == "close_lease"
+        assert record["attributes"] == {"dseq": "123"}
+        assert record["status"] == "ok"
+
+    def test_otlp_exporter_posts_to_collector(self):
+        """Test OTLP/JSON export against a local collector stand-in"""
+        CollectorHandler.received = []
+        server = HTTPServer(("127.0.0.1", 0), CollectorHandler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+
+        span = tracing.Span("create_lease", attributes={"dseq": "123", "bid_count": 3})
+        span.end()
+        OTLPHttpExporter(f"http://127.0.0.1:{server.server_port}").export([span])
+        thread.join(timeout=5)
+        server.server_close()
+
+        path, payload = CollectorHandler.received[0]
+        exported = payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert path == "/v1/traces"
+        assert exported["name"] == "create_lease"
+        assert exported["traceId"] == span.trace_id
+        assert {"key": "bid_count", "value": {"intValue": "3"}} in exported["attributes"]
+
+    def test_create_lease_spans(self, exporter):
+        """Test create_lease emits a span per stage tagged with dseq and provider"""
+        with patch('broker.lease_manager.subprocess.run') as mock_run:
+            mock_run.side_effect = [
+                Mock(returncode=0, stdout="", stderr=""),
+                Mock(returncode=0, stdout=json.dumps({
+                    "bids": [{"bid": {"bid_id": {"provider": "akash1test", "gseq": 1, "oseq": 1}}}]
+                }), stderr=""),
+                Mock(returncode=0, stdout="", stderr=""),
+                Mock(returncode=0, stdout="", stderr=""),
+                Mock(returncode=0, stdout=json.dumps({"forwarded_ports": {"sunshine": [
+                    {"host": "provider.example.com", "port": 47984, "externalPort": 31984, "proto": "TCP"}
+                ]}}), stderr="")
+            ]
+            lease = LeaseManager().create_lease()
+        self.flush()
+
+        spans = {span.name: span for span in exporter.spans}
+        root = spans["create_lease"]
+        assert root.attributes["dseq"] == lease.lease_id
+        assert root.attributes["provider"] == "akash1test"
+        for name in ("create_lease.deployment", "create_lease.bids", "create_lease.lease", "create_lease.manifest"):
+            assert spans[name].trace_id == root.trace_id
+            assert spans[name].attributes["dseq"] == lease.lease_id
+        assert spans["akash tx market lease create"].attributes["provider"] == "akash1test"
+
+if __name__ == "__main__":
+    pytest.main([__file__])